@@ -0,0 +1,313 @@
+"""
+Fair-share scheduling of the app-wide Strava API quota.
+
+Strava limits the whole application (not each athlete) to a number of calls
+per 15-minute window and per day. ApiBudget hands out those calls:
+
+* Interactive calls (made while serving a page load) may use the whole
+  window; background calls (backfill pages, enrichment) stop short of it,
+  keeping `interactive_reserve` of every window for page loads.
+* Background calls are shared in proportion to weight between the athletes
+  known to want them: those that made background calls this window or the
+  previous one, or are waiting for one. Until the last `release_fraction` of
+  the window one more default-weight share is held back for an athlete not
+  seen yet, so the first athlete to backfill cannot spend everyone's window.
+* Calls that have to wait are served interactive first, then by start-time
+  fair queuing across athletes (smallest virtual start tag first).
+
+Usage is counted locally and reconciled with Strava's X-RateLimit-Usage
+headers, which also covers calls made by other worker processes. Callers say
+who they are with `scope()`; strava_get acquires a call before every request.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITY_RANK = {INTERACTIVE: 0, BACKGROUND: 1}
+SHORT_WINDOW_SECONDS = 900
+DAY_SECONDS = 86400
+
+
+@dataclass(frozen=True)
+class BudgetScope:
+    tenant: str = "app"
+    segment_id: Optional[int] = None
+    priority: str = INTERACTIVE
+    weight: float = 1.0
+
+
+_scope: ContextVar[BudgetScope] = ContextVar("api_budget_scope", default=BudgetScope())
+
+
+def enter_scope(
+    tenant: Optional[str] = None,
+    segment_id: Optional[int] = None,
+    priority: Optional[str] = None,
+    weight: Optional[float] = None,
+) -> Token:
+    """Attribute Strava calls from now on; unset fields are inherited. Undo with exit_scope(token)."""
+    outer = _scope.get()
+    return _scope.set(
+        BudgetScope(
+            tenant=tenant if tenant is not None else outer.tenant,
+            segment_id=segment_id if segment_id is not None else outer.segment_id,
+            priority=priority or outer.priority,
+            weight=weight if weight is not None else outer.weight,
+        )
+    )
+
+
+def exit_scope(token: Token) -> None:
+    _scope.reset(token)
+
+
+@contextmanager
+def scope(**fields) -> Iterator[BudgetScope]:
+    """enter_scope() for the duration of a with-block."""
+    token = enter_scope(**fields)
+    try:
+        yield _scope.get()
+    finally:
+        exit_scope(token)
+
+
+def current_scope() -> BudgetScope:
+    return _scope.get()
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@dataclass
+class _Waiter:
+    key: Tuple[int, float, int]
+    scope: BudgetScope
+    granted: bool = False
+
+
+@dataclass
+class _TenantUsage:
+    window_calls: Dict[str, int] = field(default_factory=lambda: {INTERACTIVE: 0, BACKGROUND: 0})
+    total_calls: Dict[str, int] = field(default_factory=lambda: {INTERACTIVE: 0, BACKGROUND: 0})
+    segments: Dict[Optional[int], int] = field(default_factory=dict)
+    waited_seconds: float = 0.0
+    denied: int = 0
+    previous_background: int = 0
+    finish_tag: float = 0.0
+    weight: float = 1.0
+
+
+class ApiBudget:
+    def __init__(
+        self,
+        short_limit: int = 200,
+        daily_limit: int = 2000,
+        interactive_reserve: float = 0.25,
+        max_wait_seconds: float = 5.0,
+        window_seconds: int = SHORT_WINDOW_SECONDS,
+        max_window_calls: Optional[int] = None,
+        release_fraction: float = 0.1,
+        clock=time.time,
+    ):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.interactive_reserve = interactive_reserve
+        self.max_wait_seconds = max_wait_seconds
+        self.window_seconds = window_seconds
+        # Optional cap on this process's own calls per window, e.g. for a bulk sync sharing the quota.
+        self.max_window_calls = max_window_calls
+        # Share of the window at its end in which the newcomer share is released.
+        self.release_fraction = release_fraction
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._short_window = self._window_start(self.window_seconds)
+        self._day = self._window_start(DAY_SECONDS)
+        self._short_used = 0
+        self._daily_used = 0
+        self._local_window_calls = 0
+        self._tenants: Dict[str, _TenantUsage] = {}
+        self._waiters: List[_Waiter] = []
+        self._virtual_time = 0.0
+        self._sequence = 0
+
+    def _window_start(self, length: int) -> int:
+        now = int(self._clock())
+        return now - now % length
+
+    def _roll_windows(self) -> None:
+        short_window = self._window_start(self.window_seconds)
+        if short_window != self._short_window:
+            consecutive = short_window == self._short_window + self.window_seconds
+            self._short_window = short_window
+            self._short_used = 0
+            self._local_window_calls = 0
+            for usage in self._tenants.values():
+                usage.previous_background = usage.window_calls[BACKGROUND] if consecutive else 0
+                usage.window_calls = {INTERACTIVE: 0, BACKGROUND: 0}
+        day = self._window_start(DAY_SECONDS)
+        if day != self._day:
+            self._day = day
+            self._daily_used = 0
+
+    def seconds_until_reset(self) -> float:
+        with self._cond:
+            self._roll_windows()
+            return self._seconds_until_reset()
+
+    def _seconds_until_reset(self) -> float:
+        if self._daily_used >= self.daily_limit:
+            return self._day + DAY_SECONDS - self._clock()
+        return self._short_window + self.window_seconds - self._clock()
+
+    def _background_limit(self) -> int:
+        short = int(self.short_limit * (1 - self.interactive_reserve))
+        daily = int(self.daily_limit * (1 - self.interactive_reserve))
+        return min(short, self._short_used + max(0, daily - self._daily_used))
+
+    def _fair_share(self, tenant: str) -> int:
+        """Background calls the tenant may make this window: its weighted share of the known demand."""
+        waiting = {waiter.scope.tenant for waiter in self._waiters if waiter.scope.priority == BACKGROUND}
+        active = {
+            name: usage.weight
+            for name, usage in self._tenants.items()
+            if usage.window_calls[BACKGROUND] or usage.previous_background or name in waiting or name == tenant
+        }
+        total = sum(active.values())
+        until_reset = self._short_window + self.window_seconds - self._clock()
+        if until_reset > self.window_seconds * self.release_fraction:
+            total += 1.0
+        pool = self._background_limit()
+        if self.max_window_calls is not None:
+            pool = min(pool, self.max_window_calls)
+        return max(1, int(pool * active[tenant] / total))
+
+    def _blocked_reason(self, scope: BudgetScope) -> Optional[str]:
+        if self._daily_used >= self.daily_limit:
+            return "daily limit reached"
+        if self._short_used >= self.short_limit:
+            return "15-minute limit reached"
+        if self.max_window_calls is not None and self._local_window_calls >= self.max_window_calls:
+            return "this process's per-window call budget is spent"
+        if scope.priority == BACKGROUND:
+            if self._short_used >= self._background_limit():
+                return "remaining calls are reserved for interactive requests"
+            if self._tenants[scope.tenant].window_calls[BACKGROUND] >= self._fair_share(scope.tenant):
+                return "fair share of background calls used"
+        return None
+
+    def acquire(self, scope_: Optional[BudgetScope] = None, timeout: Optional[float] = None) -> None:
+        """
+        Take one call for the scope (default: the current one), waiting in fair
+        order while the window is full. Raises BudgetExceeded if the call cannot
+        be granted within `timeout` (default max_wait_seconds).
+        """
+        scope_ = scope_ or current_scope()
+        timeout = self.max_wait_seconds if timeout is None else timeout
+        started = self._clock()
+        with self._cond:
+            self._roll_windows()
+            usage = self._tenants.setdefault(scope_.tenant, _TenantUsage())
+            usage.weight = scope_.weight
+            start_tag = max(self._virtual_time, usage.finish_tag)
+            usage.finish_tag = start_tag + 1 / max(scope_.weight, 1e-6)
+            self._sequence += 1
+            waiter = _Waiter((PRIORITY_RANK[scope_.priority], start_tag, self._sequence), scope_)
+            self._waiters.append(waiter)
+            try:
+                while True:
+                    self._roll_windows()
+                    self._grant_waiters()
+                    if waiter.granted:
+                        break
+                    # Nothing frees up a call before the window resets, so only wait if that is soon enough.
+                    until_reset = self._seconds_until_reset()
+                    remaining = started + timeout - self._clock()
+                    if until_reset > remaining:
+                        usage.denied += 1
+                        raise BudgetExceeded(until_reset, self._blocked_reason(scope_) or "budget exhausted")
+                    self._cond.wait(max(0.01, until_reset))
+            finally:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    usage.finish_tag = start_tag
+            usage.waited_seconds += self._clock() - started
+
+    def _grant_waiters(self) -> None:
+        """Grant calls in (priority, start tag) order; a blocked waiter does not hold up other classes or tenants."""
+        for waiter in sorted(self._waiters, key=lambda waiter: waiter.key):
+            if waiter.granted or self._blocked_reason(waiter.scope):
+                continue
+            waiter.granted = True
+            self._waiters.remove(waiter)
+            self._virtual_time = max(self._virtual_time, waiter.key[1])
+            self._short_used += 1
+            self._daily_used += 1
+            self._local_window_calls += 1
+            usage = self._tenants[waiter.scope.tenant]
+            usage.window_calls[waiter.scope.priority] += 1
+            usage.total_calls[waiter.scope.priority] += 1
+            usage.segments[waiter.scope.segment_id] = usage.segments.get(waiter.scope.segment_id, 0) + 1
+            self._cond.notify_all()
+
+    def observe_headers(self, headers) -> None:
+        """
+        Reconcile with Strava's rate-limit headers ("15-minute,daily" limit and
+        usage). Every call here is a read, so the read limit wins when sent.
+        """
+        limit = headers.get("X-ReadRateLimit-Limit") or headers.get("X-RateLimit-Limit")
+        usage = headers.get("X-ReadRateLimit-Usage") or headers.get("X-RateLimit-Usage")
+        with self._cond:
+            self._roll_windows()
+            try:
+                if limit:
+                    self.short_limit, self.daily_limit = (int(value) for value in limit.split(",")[:2])
+                if usage:
+                    short_used, daily_used = (int(value) for value in usage.split(",")[:2])
+                    self._short_used = max(self._short_used, short_used)
+                    self._daily_used = max(self._daily_used, daily_used)
+            except ValueError:
+                return
+            self._cond.notify_all()
+
+    def mark_exhausted(self) -> None:
+        """Strava answered 429: treat the current window as used up."""
+        with self._cond:
+            self._roll_windows()
+            self._short_used = max(self._short_used, self.short_limit)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            self._roll_windows()
+            return {
+                "short_limit": self.short_limit,
+                "daily_limit": self.daily_limit,
+                "short_used": self._short_used,
+                "daily_used": self._daily_used,
+                "background_limit": self._background_limit(),
+                "seconds_until_reset": round(self._short_window + self.window_seconds - self._clock(), 1),
+                "waiting": len(self._waiters),
+                "tenants": {
+                    tenant: {
+                        "weight": usage.weight,
+                        "window_calls": dict(usage.window_calls),
+                        "total_calls": dict(usage.total_calls),
+                        "calls_by_segment": {
+                            str(segment_id): calls for segment_id, calls in sorted(usage.segments.items(), key=str)
+                        },
+                        "background_share": self._fair_share(tenant),
+                        "waited_seconds": round(usage.waited_seconds, 3),
+                        "denied": usage.denied,
+                    }
+                    for tenant, usage in sorted(self._tenants.items())
+                },
+            }
@@ -1,13 +1,47 @@
+import hashlib
 import json
 import logging
+import math
 import os
+import threading
 import time
-from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import click
 import requests
 from dotenv import load_dotenv
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_from_directory,
+    session,
+    stream_with_context,
+    url_for,
+)
 
+import api_budget
+import bulk_export
+import bulk_sync
+import columnar
+import enrichment
+import fitness
+import metrics
+import payload_cache
+import profiling
+import segment_matcher
+import streams
+from payload_cache import PayloadCache
+from query_stats import QueryProfiler
 from storage import StravaRepository
 
 
@@ -23,28 +57,66 @@ app.secret_key = os.getenv("SECRET_KEY", "fallback-secret-key-for-cloud-deployme
 STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
 STRAVA_REDIRECT_URI = os.getenv("STRAVA_REDIRECT_URI", "http://localhost:8000/auth/callback")
-STRAVA_API_BASE = "https://www.strava.com/api/v3"
-STRAVA_AUTH_URL = "https://www.strava.com/oauth/authorize"
-STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
+# Overridable so the sync can run against a local mock (benchmarks/mock_strava.py).
+STRAVA_API_BASE = os.getenv("STRAVA_API_BASE", "https://www.strava.com/api/v3").rstrip("/")
+STRAVA_AUTH_URL = os.getenv("STRAVA_AUTH_URL", "https://www.strava.com/oauth/authorize")
+STRAVA_TOKEN_URL = os.getenv("STRAVA_TOKEN_URL", "https://www.strava.com/oauth/token")
 RECENT_REFRESH_PAGES = max(1, int(os.getenv("RECENT_REFRESH_PAGES", "2")))
 BACKFILL_PAGES_PER_RUN = max(1, int(os.getenv("BACKFILL_PAGES_PER_RUN", "25")))
-MAX_ACTIVITY_FETCHES_PER_PAGE = max(1, int(os.getenv("MAX_ACTIVITY_FETCHES_PER_PAGE", "25")))
 RATE_LIMIT_COOLDOWN_SECONDS = max(60, int(os.getenv("RATE_LIMIT_COOLDOWN_SECONDS", "900")))
 MAX_MISSING_BIKE_REFRESH_PER_RUN = max(1, int(os.getenv("MAX_MISSING_BIKE_REFRESH_PER_RUN", "40")))
+# Activity details are fetched from a prioritised backlog (enrichment.py), not while paging all_efforts.
+ENRICHMENT_BATCH_SIZE = max(1, int(os.getenv("ENRICHMENT_BATCH_SIZE", "20")))
+ENRICHMENT_MAX_FETCHES_PER_JOB = max(1, int(os.getenv("ENRICHMENT_MAX_FETCHES_PER_JOB", "100")))
 RECENT_ACTIVITY_SCAN_PAGES = max(1, int(os.getenv("RECENT_ACTIVITY_SCAN_PAGES", "2")))
 MAX_ACTIVITY_IMPORTS_PER_RUN = max(1, int(os.getenv("MAX_ACTIVITY_IMPORTS_PER_RUN", "3")))
+MAX_STREAM_FETCHES_PER_RUN = max(0, int(os.getenv("MAX_STREAM_FETCHES_PER_RUN", "10")))
+EFFORTS_CACHE_MAX_ENTRIES = max(1, int(os.getenv("EFFORTS_CACHE_MAX_ENTRIES", "64")))
+COMPARE_MAX_SEGMENTS = max(1, int(os.getenv("COMPARE_MAX_SEGMENTS", "50")))
+COMPARE_MAX_EFFORTS = max(1, int(os.getenv("COMPARE_MAX_EFFORTS", "20000")))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Athletes allowed to use the /admin endpoints.
+ADMIN_ATHLETE_IDS = {int(value) for value in os.getenv("ADMIN_ATHLETE_IDS", "").split(",") if value.strip().isdigit()}
+# Unset disables statement profiling; otherwise statements slower than this are logged with their plan.
+SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS")
+# App-wide Strava quota shared fairly between athletes (api_budget.py); corrected from X-RateLimit headers.
+STRAVA_RATE_LIMIT_15MIN = max(1, int(os.getenv("STRAVA_RATE_LIMIT_15MIN", "200")))
+STRAVA_RATE_LIMIT_DAILY = max(1, int(os.getenv("STRAVA_RATE_LIMIT_DAILY", "2000")))
+API_INTERACTIVE_RESERVE = min(0.9, max(0.0, float(os.getenv("API_INTERACTIVE_RESERVE", "0.25"))))
+API_BUDGET_MAX_WAIT_SECONDS = max(0.0, float(os.getenv("API_BUDGET_MAX_WAIT_SECONDS", "5")))
+
+# Admin requests sent with X-Profile: 1 (or ?profile=1) are profiled into PROFILE_DIR.
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(
+    os.path.dirname(os.getenv("STRAVA_DB_PATH", "data/strava.db")) or ".", "profiles"
+)
+PROFILE_SAMPLE_MS = max(0.5, float(os.getenv("PROFILE_SAMPLE_MS", "2")))
+PROFILE_MAX_FILES = max(1, int(os.getenv("PROFILE_MAX_FILES", "100")))
 
-repository = StravaRepository(os.getenv("STRAVA_DB_PATH", "data/strava.db"))
+query_profiler = QueryProfiler(slow_ms=float(SLOW_QUERY_MS)) if SLOW_QUERY_MS else None
+repository = StravaRepository(os.getenv("STRAVA_DB_PATH", "data/strava.db"), query_profiler=query_profiler)
 rate_limit_cooldowns: Dict[str, float] = {}
+efforts_payload_cache = PayloadCache(max_entries=EFFORTS_CACHE_MAX_ENTRIES)
+repository.efforts_changed_listeners.append(efforts_payload_cache.invalidate)
+fitness_index = fitness.FitnessIndex(repository.get_fitness_columns, repository.get_efforts_versions)
+repository.connection_listeners.append(metrics.record_db)
+enrichment_scheduler = enrichment.EnrichmentScheduler()
+strava_budget = api_budget.ApiBudget(
+    short_limit=STRAVA_RATE_LIMIT_15MIN,
+    daily_limit=STRAVA_RATE_LIMIT_DAILY,
+    interactive_reserve=API_INTERACTIVE_RESERVE,
+    max_wait_seconds=API_BUDGET_MAX_WAIT_SECONDS,
+)
 logger.info(
-    "Sync config db_path=%s recent_refresh_pages=%s backfill_pages_per_run=%s max_activity_fetches_per_page=%s max_missing_bike_refresh_per_run=%s recent_activity_scan_pages=%s max_activity_imports_per_run=%s rate_limit_cooldown_seconds=%s",
+    "Sync config db_path=%s recent_refresh_pages=%s backfill_pages_per_run=%s max_missing_bike_refresh_per_run=%s enrichment_batch_size=%s enrichment_max_fetches_per_job=%s recent_activity_scan_pages=%s max_activity_imports_per_run=%s max_stream_fetches_per_run=%s rate_limit_cooldown_seconds=%s",
     repository.db_path,
     RECENT_REFRESH_PAGES,
     BACKFILL_PAGES_PER_RUN,
-    MAX_ACTIVITY_FETCHES_PER_PAGE,
     MAX_MISSING_BIKE_REFRESH_PER_RUN,
+    ENRICHMENT_BATCH_SIZE,
+    ENRICHMENT_MAX_FETCHES_PER_JOB,
     RECENT_ACTIVITY_SCAN_PAGES,
     MAX_ACTIVITY_IMPORTS_PER_RUN,
+    MAX_STREAM_FETCHES_PER_RUN,
     RATE_LIMIT_COOLDOWN_SECONDS,
 )
 
@@ -56,6 +128,31 @@ class StravaAPIError(Exception):
         super().__init__(message)
 
 
+class ApiBudgetDeferred(StravaAPIError):
+    """The fair-share budget refused a call before it reached Strava; callers retry after `retry_after` instead of starting a cooldown."""
+
+    def __init__(self, exc: api_budget.BudgetExceeded):
+        super().__init__(429, f"Strava API budget exhausted ({exc.reason}), retry in {int(exc.retry_after)}s")
+        self.retry_after = exc.retry_after
+
+
+def budget_tenant(athlete_id) -> str:
+    return f"athlete:{athlete_id}"
+
+
+def budget_deferred_response(exc: ApiBudgetDeferred):
+    """429 for an interactive call the local budget refused; it frees up sooner than a Strava cooldown."""
+    return (
+        jsonify(
+            {
+                "error": "Strava API budget is busy. Please retry shortly.",
+                "retry_after_seconds": max(1, math.ceil(exc.retry_after)),
+            }
+        ),
+        429,
+    )
+
+
 def parse_strava_error_response(response_text: str, status_code: int) -> str:
     """Parse Strava API error JSON into a user-friendly message."""
     if not response_text or not response_text.strip().startswith("{"):
@@ -88,6 +185,10 @@ def normalize_athlete_id(value):
         return None
 
 
+def is_admin() -> bool:
+    return normalize_athlete_id(session.get("athlete_id")) in ADMIN_ATHLETE_IDS
+
+
 def cooldown_key(segment_id: int, athlete_id: int) -> str:
     return f"{segment_id}:{athlete_id}"
 
@@ -102,6 +203,7 @@ def get_cooldown_remaining_seconds(segment_id: int, athlete_id: int) -> int:
 def set_rate_limit_cooldown(segment_id: int, athlete_id: int) -> None:
     key = cooldown_key(segment_id, athlete_id)
     rate_limit_cooldowns[key] = time.time() + RATE_LIMIT_COOLDOWN_SECONDS
+    metrics.RATE_LIMIT_COOLDOWNS.inc()
     logger.warning(
         "Set rate-limit cooldown segment=%s athlete=%s for %ss",
         segment_id,
@@ -116,9 +218,142 @@ def add_cache_headers(response, max_age=300):
     return response
 
 
-def refresh_access_token() -> bool:
+EFFORTS_FORMATS = ("json", "columnar")
+
+
+def efforts_response(segment_id: int, athlete_id: int, wire_format: str = "json"):
+    """Serve the efforts list from the payload cache, serialising and compressing it once per data version."""
+    cache_key = (segment_id, athlete_id, wire_format)
+    version = repository.get_efforts_version(segment_id, athlete_id)
+    cached = efforts_payload_cache.get(cache_key, version)
+    if cached is None:
+        efforts = repository.get_efforts(segment_id, athlete_id)
+        with metrics.timed("analytics"):
+            compute_decoupling(efforts)
+        with metrics.timed("serialize"):
+            payload = columnar.to_columnar(efforts) if wire_format == "columnar" else efforts
+            cached = efforts_payload_cache.put(cache_key, version, payload_cache.dumps(payload))
+        logger.info(
+            "Efforts payload cached segment=%s athlete=%s version=%s format=%s count=%s bytes=%s",
+            segment_id,
+            athlete_id,
+            version,
+            wire_format,
+            len(efforts),
+            len(cached.body),
+        )
+
+    # Clients revalidate every time; an unchanged dataset answers 304 with no body.
+    if request.if_none_match.contains_weak(cached.etag):
+        response = app.response_class(status=304)
+        response.set_etag(cached.etag, weak=True)
+        return add_cache_headers(response, max_age=0)
+
+    with metrics.timed("serialize"):
+        body, encoding = cached.encoded(payload_cache.negotiate_encoding(request.headers.get("Accept-Encoding")))
+    response = app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(cached.etag, weak=True)
+    return add_cache_headers(response, max_age=0)
+
+
+_static_manifest_lock = threading.Lock()
+_static_manifest: Dict[str, Any] = {}
+
+
+def static_asset_manifest() -> Tuple[str, List[str]]:
+    """Return (version, urls) for the static assets the service worker precaches.
+
+    The tree is only re-hashed when a file is added, removed or changes mtime or size.
+    """
+    files = []
+    for root, dirs, names in os.walk(app.static_folder):
+        dirs.sort()
+        for filename in sorted(names):
+            if filename.startswith("."):
+                continue
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            relative = os.path.relpath(path, app.static_folder).replace(os.sep, "/")
+            files.append((relative, stat.st_mtime_ns, stat.st_size))
+    signature = tuple(files)
+    with _static_manifest_lock:
+        if _static_manifest.get("signature") != signature:
+            digest = hashlib.sha1()
+            for relative, _, _ in files:
+                digest.update(relative.encode("utf-8"))
+                with open(os.path.join(app.static_folder, relative), "rb") as handle:
+                    digest.update(handle.read())
+            _static_manifest.update(signature=signature, version=digest.hexdigest()[:12])
+        version = _static_manifest["version"]
+    return version, [url_for("static", filename=relative) for relative, _, _ in files]
+
+
+@dataclass
+class StravaCredentials:
+    """OAuth tokens of one athlete, for Strava calls made outside a browser session (see use_credentials)."""
+
+    athlete_id: Optional[int]
+    access_token: Optional[str]
+    refresh_token: Optional[str]
+    expires_at: Optional[int] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+
+_strava_credentials: ContextVar[Optional[StravaCredentials]] = ContextVar("strava_credentials", default=None)
+
+
+@contextmanager
+def use_credentials(credentials: StravaCredentials) -> Iterator[StravaCredentials]:
+    """Make strava_get (and token refreshes) use `credentials` instead of the session."""
+    token = _strava_credentials.set(credentials)
+    try:
+        yield credentials
+    finally:
+        _strava_credentials.reset(token)
+
+
+def current_credentials() -> Optional[StravaCredentials]:
+    credentials = _strava_credentials.get()
+    if credentials is not None:
+        return credentials
+    if has_request_context() and "access_token" in session:
+        return StravaCredentials(
+            athlete_id=normalize_athlete_id(session.get("athlete_id")),
+            access_token=session["access_token"],
+            refresh_token=session.get("refresh_token"),
+        )
+    return None
+
+
+def save_credentials(credentials: StravaCredentials) -> None:
+    """Write refreshed tokens back to where they came from, and keep them for headless syncs."""
+    if _strava_credentials.get() is None and has_request_context():
+        session["access_token"] = credentials.access_token
+        session["refresh_token"] = credentials.refresh_token
+        if credentials.athlete_id is not None:
+            session["athlete_id"] = credentials.athlete_id
+    if credentials.athlete_id is not None and credentials.refresh_token:
+        repository.upsert_athlete_tokens(
+            credentials.athlete_id, credentials.access_token, credentials.refresh_token, credentials.expires_at
+        )
+
+
+def refresh_access_token(failed_access_token: Optional[str] = None) -> bool:
+    credentials = current_credentials()
+    if credentials is None:
+        return False
+    with credentials.lock:
+        if failed_access_token and credentials.access_token != failed_access_token:
+            # Another thread sharing these credentials already refreshed them.
+            return True
+        return _refresh_credentials(credentials)
+
+
+def _refresh_credentials(credentials: StravaCredentials) -> bool:
     logger.info("Refreshing Strava access token")
-    refresh_token = session.get("refresh_token")
+    refresh_token = credentials.refresh_token
     if not refresh_token or not STRAVA_CLIENT_ID or not STRAVA_CLIENT_SECRET:
         logger.warning("Cannot refresh token: missing refresh token or client credentials")
         return False
@@ -140,22 +375,25 @@ def refresh_access_token() -> bool:
         logger.warning("Refresh response missing token fields: %s", token_info)
         return False
 
-    session["access_token"] = token_info["access_token"]
-    session["refresh_token"] = token_info["refresh_token"]
+    credentials.access_token = token_info["access_token"]
+    credentials.refresh_token = token_info["refresh_token"]
+    credentials.expires_at = token_info.get("expires_at")
 
     athlete = token_info.get("athlete")
     if isinstance(athlete, dict) and athlete.get("id"):
-        session["athlete_id"] = athlete["id"]
-        logger.info("Access token refreshed successfully for athlete=%s", session["athlete_id"])
+        credentials.athlete_id = athlete["id"]
+        save_credentials(credentials)
+        logger.info("Access token refreshed successfully for athlete=%s", credentials.athlete_id)
         return True
 
     # Some refresh responses may not include athlete details.
-    if session.get("athlete_id"):
-        logger.info("Access token refreshed; reusing athlete_id from session=%s", session["athlete_id"])
+    if credentials.athlete_id:
+        save_credentials(credentials)
+        logger.info("Access token refreshed; reusing athlete_id=%s", credentials.athlete_id)
         return True
 
     try:
-        headers = {"Authorization": f"Bearer {session['access_token']}"}
+        headers = {"Authorization": f"Bearer {credentials.access_token}"}
         athlete_response = requests.get(
             f"{STRAVA_API_BASE}/athlete", headers=headers, timeout=20
         )
@@ -163,7 +401,8 @@ def refresh_access_token() -> bool:
             athlete_data = athlete_response.json()
             athlete_id = athlete_data.get("id")
             if athlete_id:
-                session["athlete_id"] = athlete_id
+                credentials.athlete_id = athlete_id
+                save_credentials(credentials)
                 logger.info("Access token refreshed; athlete_id loaded from /athlete=%s", athlete_id)
                 return True
         logger.warning(
@@ -178,14 +417,30 @@ def refresh_access_token() -> bool:
 
 
 def strava_get(path: str, params: Dict | None = None, retry_on_auth=True):
-    if "access_token" not in session:
+    credentials = current_credentials()
+    if credentials is None or not credentials.access_token:
         raise StravaAPIError(401, "Not authenticated")
 
-    headers = {"Authorization": f"Bearer {session['access_token']}"}
+    access_token = credentials.access_token
+    headers = {"Authorization": f"Bearer {access_token}"}
     url = f"{STRAVA_API_BASE}{path}"
+    try:
+        strava_budget.acquire()
+    except api_budget.BudgetExceeded as exc:
+        metrics.API_BUDGET_DEFERRED.inc(priority=api_budget.current_scope().priority)
+        logger.info("Strava GET %s deferred by API budget scope=%s: %s", path, api_budget.current_scope(), exc.reason)
+        raise ApiBudgetDeferred(exc) from exc
     started = time.time()
-    response = requests.get(url, headers=headers, params=params, timeout=30)
+    try:
+        response = requests.get(url, headers=headers, params=params, timeout=30)
+    except requests.exceptions.RequestException:
+        metrics.record_strava_call(path, 0, time.time() - started)
+        raise
     duration_ms = int((time.time() - started) * 1000)
+    metrics.record_strava_call(path, response.status_code, duration_ms / 1000)
+    strava_budget.observe_headers(response.headers)
+    if response.status_code == 429:
+        strava_budget.mark_exhausted()
     logger.info(
         "Strava GET %s status=%s duration_ms=%s params=%s",
         path,
@@ -196,10 +451,11 @@ def strava_get(path: str, params: Dict | None = None, retry_on_auth=True):
 
     if response.status_code == 401 and retry_on_auth:
         logger.warning("Strava auth expired on %s, attempting token refresh", path)
-        if refresh_access_token():
+        if refresh_access_token(access_token):
             logger.info("Retrying Strava GET %s after token refresh", path)
             return strava_get(path, params=params, retry_on_auth=False)
-        session.clear()
+        if _strava_credentials.get() is None:
+            session.clear()
         raise StravaAPIError(401, "Authentication expired. Please login again.")
 
     if response.status_code != 200:
@@ -260,9 +516,10 @@ def build_effort_payload(segment: Dict, raw_efforts: List[Dict], activities: Dic
             {
                 "id": effort.get("id"),
                 "start_date": effort.get("start_date"),
+                "start_date_local": effort.get("start_date_local"),
                 "bike_id": activity.get("bike_id") or activity.get("gear_id"),
                 "bike_name": activity.get("bike_name")
-                or activity.get("gear", {}).get("name")
+                or (activity.get("gear") or {}).get("name")
                 or (f"Bike {activity.get('gear_id')}" if activity.get("gear_id") else "Unknown"),
                 "elapsed_time": elapsed,
                 "moving_time": effort.get("moving_time") or elapsed,
@@ -276,6 +533,8 @@ def build_effort_payload(segment: Dict, raw_efforts: List[Dict], activities: Dic
                 "vam": vam,
                 "name": activity.get("name") or f"Activity {activity_id}",
                 "activity_id": activity_id,
+                "start_index": effort.get("start_index"),
+                "end_index": effort.get("end_index"),
             }
         )
 
@@ -363,48 +622,224 @@ def compute_decoupling(efforts: List[Dict]) -> None:
             e["decoupling_pct"] = decoupling_pct
 
 
-def refresh_missing_bike_activities(segment_id: int, athlete_id: int) -> int:
-    missing_activity_ids = repository.get_missing_bike_activity_ids(
-        segment_id=segment_id,
-        athlete_id=athlete_id,
-        limit=MAX_MISSING_BIKE_REFRESH_PER_RUN,
-    )
-    if not missing_activity_ids:
+def parse_enrichment_window(start: Optional[str], end: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Epoch bounds of the dates being viewed (YYYY-MM-DD, either may be open); None when unset or invalid."""
+    if not start and not end:
+        return None
+    try:
+        start_epoch = int(datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) if start else 0
+        end_epoch = (
+            int(datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) + 86400
+            if end
+            else 2**62
+        )
+    except ValueError:
+        return None
+    return start_epoch, end_epoch
+
+
+def enrich_activity_backlog(
+    segment_id: int,
+    athlete_id: int,
+    window: Optional[Tuple[int, int]] = None,
+    max_fetches: int = MAX_MISSING_BIKE_REFRESH_PER_RUN,
+) -> Tuple[int, bool]:
+    """
+    Fetch never-fetched activities of a segment's efforts in backlog order (inside
+    `window` first, then most recent) and copy their details onto the efforts.
+    Returns (activities fetched, rate limited).
+    """
+    fetched_count = 0
+    while fetched_count < max_fetches:
+        batch_size = min(ENRICHMENT_BATCH_SIZE, max_fetches - fetched_count)
+        activity_ids = repository.get_missing_bike_activity_ids(segment_id, athlete_id, limit=batch_size, window=window)
+        if not activity_ids:
+            break
+
+        fetched: Dict[int, Dict] = {}
+        unavailable: Dict[int, int] = {}
+        rate_limited = False
+        deferred = False
+        for activity_id in activity_ids:
+            try:
+                fetched[activity_id] = strava_get(f"/activities/{activity_id}")
+            except ApiBudgetDeferred:
+                deferred = True
+                break
+            except StravaAPIError as exc:
+                if exc.status_code == 429:
+                    rate_limited = True
+                    logger.warning(
+                        "Rate limited while enriching activities segment=%s at activity=%s fetched=%s",
+                        segment_id,
+                        activity_id,
+                        fetched_count + len(fetched),
+                    )
+                    break
+                if exc.status_code in (403, 404):
+                    # Deleted or private activities are recorded so that no later run asks for them again.
+                    logger.warning("Skipping activity=%s during enrichment status=%s", activity_id, exc.status_code)
+                    unavailable[activity_id] = exc.status_code
+                    continue
+                raise
+
+        repository.mark_activities_unavailable(athlete_id, unavailable)
+        if fetched:
+            repository.upsert_activities(athlete_id, fetched)
+            updated = repository.apply_activities_to_efforts(athlete_id, list(fetched))
+            fetched_count += len(fetched)
+            logger.info(
+                "Enriched activities segment=%s athlete=%s fetched=%s efforts_updated=%s total_fetched=%s",
+                segment_id,
+                athlete_id,
+                len(fetched),
+                updated,
+                fetched_count,
+            )
+        if rate_limited:
+            return fetched_count, True
+        if deferred:
+            logger.info("Enrichment paused by API budget segment=%s athlete=%s fetched=%s", segment_id, athlete_id, fetched_count)
+            break
+        if len(activity_ids) < batch_size:
+            break
+        time.sleep(0.3)
+    return fetched_count, False
+
+
+def refresh_missing_bike_activities(
+    segment_id: int,
+    athlete_id: int,
+    window: Optional[Tuple[int, int]] = None,
+    max_fetches: int = MAX_MISSING_BIKE_REFRESH_PER_RUN,
+) -> int:
+    refreshed, rate_limited = enrich_activity_backlog(segment_id, athlete_id, window=window, max_fetches=max_fetches)
+    if rate_limited:
+        set_rate_limit_cooldown(segment_id, athlete_id)
+        return refreshed
+    return refreshed + refresh_gear_names(athlete_id)
+
+
+def schedule_enrichment(segment_id: int, athlete_id: int, window: Optional[Tuple[int, int]] = None) -> bool:
+    """Top up the segment's enrichment backlog on the background thread with this request's tokens."""
+    if get_cooldown_remaining_seconds(segment_id, athlete_id) > 0:
+        return False
+    # The job outlives the request: it must not read or write the session, so it gets its own copy of the tokens.
+    credentials = current_credentials()
+    if credentials is None:
+        return False
+
+    def job():
+        try:
+            with use_credentials(credentials), api_budget.scope(
+                tenant=budget_tenant(athlete_id), segment_id=segment_id, priority=api_budget.BACKGROUND
+            ):
+                refresh_missing_bike_activities(segment_id, athlete_id, window, max_fetches=ENRICHMENT_MAX_FETCHES_PER_JOB)
+        except StravaAPIError as exc:
+            logger.warning("Background enrichment stopped segment=%s athlete=%s: %s", segment_id, athlete_id, exc)
+        except requests.exceptions.RequestException as exc:
+            logger.warning("Background enrichment could not reach Strava segment=%s: %s", segment_id, exc)
+
+    return enrichment_scheduler.submit((segment_id, athlete_id), job)
+
+
+def refresh_gear_names(athlete_id: int) -> int:
+    """Resolve bike names for stored gear ids: one /athlete call plus one /gear/{id} per unknown bike."""
+    gear_ids = repository.get_unresolved_gear_ids(athlete_id, limit=MAX_MISSING_BIKE_REFRESH_PER_RUN)
+    if not gear_ids:
+        return 0
+
+    logger.info("Resolving gear names athlete=%s unresolved=%s", athlete_id, len(gear_ids))
+    resolved: Dict[str, Dict] = {}
+    try:
+        # The athlete profile lists every active bike, so most ids resolve without /gear calls.
+        profile = strava_get("/athlete")
+        for bike in profile.get("bikes") or []:
+            if bike.get("id"):
+                resolved[str(bike["id"])] = bike
+
+        for gear_id in gear_ids:
+            if gear_id in resolved:
+                continue
+            try:
+                resolved[gear_id] = strava_get(f"/gear/{gear_id}")
+            except StravaAPIError as exc:
+                if exc.status_code == 404:
+                    # Retired or foreign gear: remember the attempt so it is not requested again.
+                    resolved[gear_id] = {"id": gear_id}
+                    continue
+                raise
+    except StravaAPIError as exc:
+        if exc.status_code != 429:
+            raise
+        logger.warning("Rate limited while resolving gear names athlete=%s resolved=%s", athlete_id, len(resolved))
+
+    if resolved:
+        repository.upsert_gear(athlete_id, list(resolved.values()))
+    resolved_count = sum(1 for gear_id in gear_ids if resolved.get(gear_id, {}).get("name"))
+    logger.info("Gear names resolved athlete=%s resolved=%s/%s", athlete_id, resolved_count, len(gear_ids))
+    return resolved_count
+
+
+def ingest_activity_streams(activity_id: int, athlete_id: int, payload: Dict) -> int:
+    """Store compact streams for an activity and compute stream metrics for each of its efforts."""
+    blobs, point_count = streams.encode_streams(payload)
+    repository.upsert_streams(activity_id, athlete_id, blobs, point_count)
+    if not point_count:
+        return 0
+
+    decoded = streams.decode_streams(blobs)
+    metrics_by_effort: Dict[int, Dict] = {}
+    for effort in repository.get_effort_indices_for_activity(activity_id):
+        metrics = streams.compute_effort_metrics(decoded, effort["start_index"], effort["end_index"])
+        if metrics:
+            metrics_by_effort[effort["id"]] = metrics
+    repository.update_effort_stream_metrics(metrics_by_effort)
+    return len(metrics_by_effort)
+
+
+def refresh_missing_streams(segment_id: int, athlete_id: int, limit: int = MAX_STREAM_FETCHES_PER_RUN) -> int:
+    activity_ids = repository.get_activity_ids_missing_streams(segment_id, athlete_id, limit=limit)
+    if not activity_ids:
         return 0
 
     logger.info(
-        "Refreshing missing bike metadata for segment=%s athlete=%s count=%s",
+        "Fetching activity streams for segment=%s athlete=%s count=%s",
         segment_id,
         athlete_id,
-        len(missing_activity_ids),
+        len(activity_ids),
     )
-
-    refreshed: Dict[int, Dict] = {}
-    for idx, activity_id in enumerate(missing_activity_ids, start=1):
+    efforts_updated = 0
+    for idx, activity_id in enumerate(activity_ids, start=1):
         try:
-            refreshed[activity_id] = strava_get(f"/activities/{activity_id}")
+            payload = strava_get(
+                f"/activities/{activity_id}/streams",
+                params={"keys": ",".join(streams.STREAM_KEYS), "key_by_type": "true"},
+            )
         except StravaAPIError as exc:
             if exc.status_code == 429:
                 logger.warning(
-                    "Rate limited while refreshing bike metadata at activity=%s progress=%s/%s",
+                    "Rate limited while fetching streams at activity=%s progress=%s/%s",
                     activity_id,
                     idx,
-                    len(missing_activity_ids),
+                    len(activity_ids),
                 )
                 break
-            raise
-        if idx % 20 == 0 or idx == len(missing_activity_ids):
-            logger.info(
-                "Bike metadata refresh progress=%s/%s",
-                idx,
-                len(missing_activity_ids),
-            )
-        if idx % 20 == 0:
-            time.sleep(0.3)
+            if exc.status_code == 404:
+                # Manual or private activities have no streams; store an empty row so they are skipped.
+                payload = {}
+            else:
+                raise
+        efforts_updated += ingest_activity_streams(activity_id, athlete_id, payload)
 
-    if refreshed:
-        repository.upsert_activities(athlete_id, refreshed)
-    return len(refreshed)
+    logger.info(
+        "Stream ingestion finished segment=%s athlete=%s activities=%s efforts_updated=%s",
+        segment_id,
+        athlete_id,
+        len(activity_ids),
+        efforts_updated,
+    )
+    return efforts_updated
 
 
 def sync_recent_efforts(segment_id: int, athlete_id: int, pages: int = 1) -> int:
@@ -423,9 +858,8 @@ def sync_recent_efforts(segment_id: int, athlete_id: int, pages: int = 1) -> int
         if not page_data:
             break
 
-        page_rows, page_rate_limited = sync_efforts_page(segment_meta, athlete_id, page_data, page)
-        rows_written += page_rows
-        if page_rate_limited or len(page_data) < 200:
+        rows_written += sync_efforts_page(segment_meta, athlete_id, page_data, page)
+        if len(page_data) < 200:
             break
 
     return rows_written
@@ -504,13 +938,15 @@ def import_missing_recent_activities(
     return imported_efforts
 
 
-def sync_efforts_page(segment: Dict, athlete_id: int, page_data: List[Dict], page: int) -> Tuple[int, bool]:
+def sync_efforts_page(segment: Dict, athlete_id: int, page_data: List[Dict], page: int) -> int:
     athlete_id_int = normalize_athlete_id(athlete_id)
     athlete_efforts = [
         effort
         for effort in page_data
         if normalize_athlete_id(effort.get("athlete", {}).get("id")) == athlete_id_int
     ]
+    metrics.SYNC_PAGES.inc()
+    metrics.SYNC_EFFORTS.inc(len(athlete_efforts))
     logger.info(
         "Page %s filtered for athlete=%s count=%s/%s",
         page,
@@ -532,92 +968,29 @@ def sync_efforts_page(segment: Dict, athlete_id: int, page_data: List[Dict], pag
             sample_ids,
         )
 
-    # Keep activities ordered by the recency of their associated efforts.
-    latest_effort_date_by_activity: Dict[int, str] = {}
-    for effort in athlete_efforts:
-        activity_id = effort.get("activity", {}).get("id")
-        if not activity_id:
-            continue
-        start_date = effort.get("start_date") or ""
-        previous = latest_effort_date_by_activity.get(activity_id, "")
-        if start_date > previous:
-            latest_effort_date_by_activity[activity_id] = start_date
-
-    activity_ids = sorted(
-        latest_effort_date_by_activity.keys(),
-        key=lambda activity_id: latest_effort_date_by_activity.get(activity_id, ""),
-        reverse=True,
-    )
-
+    activity_ids = sorted({effort.get("activity", {}).get("id") for effort in athlete_efforts} - {None})
     existing_activities = repository.get_activities_by_ids(activity_ids)
-    missing_activity_ids = [activity_id for activity_id in activity_ids if activity_id not in existing_activities]
-    logger.info(
-        "Page %s activity details: total=%s existing=%s missing=%s",
-        page,
-        len(activity_ids),
-        len(existing_activities),
-        len(missing_activity_ids),
-    )
-
-    # Persist page efforts immediately so UI can display data even if enrichment is interrupted.
-    base_payload = build_effort_payload(segment, athlete_efforts, {})
-    repository.upsert_efforts(segment_id=segment["id"], athlete_id=athlete_id_int, efforts=base_payload)
-    rows_written = len(base_payload)
-    logger.info("Page %s stored base effort rows=%s before activity enrichment", page, rows_written)
-
-    fetched_activities: Dict[int, Dict] = {}
-    rate_limited = False
-    activity_ids_to_fetch = missing_activity_ids[:MAX_ACTIVITY_FETCHES_PER_PAGE]
-    if len(missing_activity_ids) > len(activity_ids_to_fetch):
-        logger.info(
-            "Page %s limiting activity enrichment to %s/%s this run",
-            page,
-            len(activity_ids_to_fetch),
-            len(missing_activity_ids),
-        )
-
-    for idx, activity_id in enumerate(activity_ids_to_fetch, start=1):
-        try:
-            fetched_activities[activity_id] = strava_get(f"/activities/{activity_id}")
-        except StravaAPIError as exc:
-            if exc.status_code == 429:
-                rate_limited = True
-                logger.warning(
-                    "Rate limited while enriching page=%s at activity=%s progress=%s/%s",
-                    page,
-                    activity_id,
-                    idx,
-                    len(activity_ids_to_fetch),
-                )
-                break
-            raise
-        if idx % 20 == 0 or idx == len(activity_ids_to_fetch):
-            logger.info(
-                "Page %s fetched missing activity details progress=%s/%s",
-                page,
-                idx,
-                len(activity_ids_to_fetch),
-            )
-        if idx % 20 == 0:
-            time.sleep(0.3)
-
-    if fetched_activities:
-        repository.upsert_activities(athlete_id_int, fetched_activities)
-
-    all_activities = {**existing_activities, **fetched_activities}
-    effort_payload = build_effort_payload(segment, athlete_efforts, all_activities)
+    missing_activity_count = len(activity_ids) - len(existing_activities)
+
+    # Activity details come only from what is already stored; the rest waits in the
+    # enrichment backlog so backfill pages do not spend API calls on old efforts.
+    # Upserts skip unchanged rows, so a page seen before does not touch the data version.
+    existing_effort_ids = repository.get_existing_effort_ids([effort.get("id") for effort in athlete_efforts])
+    rows_written = sum(1 for effort in athlete_efforts if effort.get("id") not in existing_effort_ids)
+    effort_payload = build_effort_payload(segment, athlete_efforts, existing_activities)
     repository.upsert_efforts(segment_id=segment["id"], athlete_id=athlete_id_int, efforts=effort_payload)
     logger.info(
-        "Page %s updated enriched effort rows=%s fetched_activities=%s rate_limited=%s",
+        "Page %s stored efforts=%s new=%s activities stored=%s left to enrichment backlog=%s",
         page,
         len(effort_payload),
-        len(fetched_activities),
-        rate_limited,
+        rows_written,
+        len(existing_activities),
+        missing_activity_count,
     )
-    return rows_written, rate_limited
+    return rows_written
 
 
-def sync_segment_batch(segment_id: int, athlete_id: int) -> List[Dict]:
+def sync_segment_batch(segment_id: int, athlete_id: int, window: Optional[Tuple[int, int]] = None) -> List[Dict]:
     athlete_id_int = normalize_athlete_id(athlete_id)
     if athlete_id_int is None:
         raise StravaAPIError(401, "Invalid athlete id in session. Please login again.")
@@ -654,11 +1027,7 @@ def sync_segment_batch(segment_id: int, athlete_id: int) -> List[Dict]:
             logger.info("Reached end of efforts during recent refresh at page=%s", page)
             break
 
-        page_rows, page_rate_limited = sync_efforts_page(segment, athlete_id_int, page_data, page)
-        total_rows_written += page_rows
-        if page_rate_limited:
-            logger.warning("Stopping sync early after rate-limit in recent phase at page=%s", page)
-            break
+        total_rows_written += sync_efforts_page(segment, athlete_id_int, page_data, page)
         if len(page_data) < 200:
             reached_end = True
             logger.info("Reached final efforts page during recent refresh at page=%s", page)
@@ -678,20 +1047,21 @@ def sync_segment_batch(segment_id: int, athlete_id: int) -> List[Dict]:
         page = start_page
         processed_pages = 0
         while processed_pages < BACKFILL_PAGES_PER_RUN:
-            page_data = fetch_efforts_page(segment_id, page, athlete_id_int)
+            try:
+                # Backfill yields to interactive requests and to other athletes' fair share.
+                with api_budget.scope(priority=api_budget.BACKGROUND):
+                    page_data = fetch_efforts_page(segment_id, page, athlete_id_int)
+            except ApiBudgetDeferred as exc:
+                logger.info("Backfill deferred by API budget at page=%s: %s", page, exc.message)
+                break
             if not page_data:
                 reached_end = True
                 logger.info("Reached end of efforts during backfill at page=%s", page)
                 break
 
-            page_rows, page_rate_limited = sync_efforts_page(segment, athlete_id_int, page_data, page)
-            total_rows_written += page_rows
+            total_rows_written += sync_efforts_page(segment, athlete_id_int, page_data, page)
             processed_pages += 1
 
-            if page_rate_limited:
-                logger.warning("Stopping sync early after rate-limit in backfill at page=%s", page)
-                break
-
             if len(page_data) < 200:
                 reached_end = True
                 logger.info("Reached final efforts page during backfill at page=%s", page)
@@ -723,21 +1093,154 @@ def sync_segment_batch(segment_id: int, athlete_id: int) -> List[Dict]:
             )
             effort_payload = repository.get_efforts(segment_id, athlete_id_int)
 
-    bike_refresh_count = refresh_missing_bike_activities(segment_id, athlete_id_int)
-    if bike_refresh_count:
+    with api_budget.scope(priority=api_budget.BACKGROUND):
+        bike_refresh_count = refresh_missing_bike_activities(segment_id, athlete_id_int, window)
+        stream_effort_count = refresh_missing_streams(segment_id, athlete_id_int)
+    if bike_refresh_count or stream_effort_count:
         effort_payload = repository.get_efforts(segment_id, athlete_id_int)
 
     logger.info(
-        "Batch sync complete for segment=%s athlete=%s total_efforts_now=%s rows_written_this_run=%s bike_activities_refreshed=%s",
+        "Batch sync complete for segment=%s athlete=%s total_efforts_now=%s rows_written_this_run=%s bike_activities_refreshed=%s stream_efforts_updated=%s",
         segment_id,
         athlete_id_int,
         len(effort_payload),
         total_rows_written,
         bike_refresh_count,
+        stream_effort_count,
     )
     return effort_payload
 
 
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    return metrics.finish_request(response, route, request.method)
+
+
+@app.before_request
+def enter_api_budget_scope():
+    # Strava calls made while serving a request are interactive and billed to the signed-in athlete.
+    athlete_id = normalize_athlete_id(session.get("athlete_id"))
+    segment_id = (request.view_args or {}).get("segment_id")
+    g.api_budget_token = api_budget.enter_scope(
+        tenant=budget_tenant(athlete_id) if athlete_id is not None else "anonymous",
+        segment_id=segment_id,
+        priority=api_budget.INTERACTIVE,
+    )
+
+
+@app.teardown_request
+def exit_api_budget_scope(exc):
+    token = g.pop("api_budget_token", None)
+    if token is not None:
+        try:
+            api_budget.exit_scope(token)
+        except ValueError:
+            # Token created in another context (e.g. a streamed response); the context is discarded anyway.
+            pass
+
+
+@app.before_request
+def start_request_profile():
+    if request.headers.get("X-Profile") != "1" and request.args.get("profile") != "1":
+        return None
+    if not is_admin():
+        return None
+    profile = profiling.RequestProfile(
+        PROFILE_DIR,
+        request.method,
+        request.path,
+        normalize_athlete_id(session.get("athlete_id")),
+        interval=PROFILE_SAMPLE_MS / 1000,
+    )
+    try:
+        profile.start()
+    except profiling.ProfilerBusy:
+        return jsonify({"error": "Another request is being profiled; retry without X-Profile or later"}), 409
+    g.request_profile = profile
+    return None
+
+
+@app.after_request
+def finish_request_profile(response):
+    profile = g.get("request_profile")
+    if profile is not None and profile.running:
+        profile.stop(response.status_code, max_profiles=PROFILE_MAX_FILES)
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+@app.teardown_request
+def abandon_request_profile(exc):
+    # after_request is skipped when the view raises; still write what was collected.
+    profile = g.get("request_profile")
+    if profile is not None and profile.running:
+        profile.stop(500, max_profiles=PROFILE_MAX_FILES)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for this worker process."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Not authorized"}), 401
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/api-budget")
+def admin_api_budget():
+    """Strava quota use in the current windows, per athlete and segment, for this worker process."""
+    if not is_admin():
+        return jsonify({"error": "Not authorized"}), 403
+    return jsonify(strava_budget.snapshot())
+
+
+@app.route("/admin/query-stats", methods=["GET", "DELETE"])
+def admin_query_stats():
+    """Per-statement SQL timings and query plans (needs SLOW_QUERY_MS); DELETE resets them."""
+    if not is_admin():
+        return jsonify({"error": "Not authorized"}), 403
+    if query_profiler is None:
+        return jsonify({"error": "Query profiling is disabled; set SLOW_QUERY_MS to enable it"}), 404
+    if request.method == "DELETE":
+        query_profiler.reset()
+        return jsonify({"message": "Query stats reset"})
+
+    sort = request.args.get("sort", "total_ms")
+    if sort not in ("total_ms", "max_ms", "mean_ms", "count", "slow_count"):
+        return jsonify({"error": "sort must be one of total_ms, max_ms, mean_ms, count, slow_count"}), 400
+    try:
+        limit = max(1, int(request.args.get("limit", "50")))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(query_profiler.snapshot(sort=sort, limit=limit))
+
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    """Recent request profiles, newest first."""
+    if not is_admin():
+        return jsonify({"error": "Not authorized"}), 403
+    try:
+        limit = max(1, int(request.args.get("limit", "50")))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({"directory": PROFILE_DIR, "profiles": profiling.list_profiles(PROFILE_DIR, limit=limit)})
+
+
+@app.route("/admin/profiles/<path:filename>")
+def admin_profile_file(filename):
+    if not is_admin():
+        return jsonify({"error": "Not authorized"}), 403
+    if not filename.endswith(profiling.PROFILE_SUFFIXES):
+        return jsonify({"error": "Unknown profile file"}), 404
+    return send_from_directory(os.path.abspath(PROFILE_DIR), filename, as_attachment=True)
+
+
 @app.route("/")
 def index():
     if "access_token" not in session:
@@ -783,11 +1286,29 @@ def auth_callback():
     session["access_token"] = token_info["access_token"]
     session["refresh_token"] = token_info["refresh_token"]
     session["athlete_id"] = token_info["athlete"]["id"]
+    repository.upsert_athlete_tokens(
+        session["athlete_id"], token_info["access_token"], token_info["refresh_token"], token_info.get("expires_at")
+    )
     return redirect(url_for("index"))
 
 
+@app.route("/service-worker.js")
+def service_worker():
+    asset_version, precache_urls = static_asset_manifest()
+    response = app.response_class(
+        render_template("service-worker.js", asset_version=asset_version, precache_urls=precache_urls),
+        mimetype="application/javascript",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @app.route("/logout")
 def logout():
+    # Logging out also withdraws the tokens stored for headless syncs.
+    athlete_id = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id is not None:
+        repository.delete_athlete_tokens(athlete_id)
     session.clear()
     return redirect(url_for("login"))
 
@@ -816,8 +1337,11 @@ def sync_segment(segment_id):
         )
 
     try:
-        efforts = sync_segment_batch(segment_id, athlete_id_int)
+        window = parse_enrichment_window(request.args.get("window_start"), request.args.get("window_end"))
+        efforts = sync_segment_batch(segment_id, athlete_id_int, window)
         return jsonify({"message": "Sync completed", "effort_count": len(efforts)})
+    except ApiBudgetDeferred as exc:
+        return budget_deferred_response(exc)
     except StravaAPIError as exc:
         if exc.status_code == 401:
             return jsonify({"error": exc.message, "needs_reauth": True}), 401
@@ -837,6 +1361,34 @@ def sync_segment(segment_id):
         return jsonify({"error": "Failed to connect to Strava API"}), 502
 
 
+@app.route("/segment/<int:segment_id>/enrich", methods=["POST"])
+def enrich_segment(segment_id):
+    """Queue a background top-up of the enrichment backlog, window_start/window_end (YYYY-MM-DD) first."""
+    if "access_token" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    athlete_id_int = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id_int is None:
+        session.clear()
+        return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
+
+    window = parse_enrichment_window(request.args.get("window_start"), request.args.get("window_end"))
+    backlog = repository.count_missing_activities(segment_id, athlete_id_int, window)
+    queued = bool(backlog["total"]) and schedule_enrichment(segment_id, athlete_id_int, window)
+    return (
+        jsonify(
+            {
+                "queued": queued,
+                "running": enrichment_scheduler.is_pending((segment_id, athlete_id_int)),
+                "backlog": backlog["total"],
+                "backlog_in_window": backlog["in_window"] if window else None,
+                "retry_after_seconds": get_cooldown_remaining_seconds(segment_id, athlete_id_int) or None,
+            }
+        ),
+        202 if queued else 200,
+    )
+
+
 @app.route("/segment/<int:segment_id>/debug/raw-efforts")
 def debug_raw_efforts(segment_id):
     """Temporary debug: fetch Strava page 1 raw and return all effort IDs/dates."""
@@ -932,28 +1484,37 @@ def get_segment_efforts(segment_id):
         session.clear()
         return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
 
+    # The service worker caches efforts per ?athlete=; a page left open across a re-login must not fill it.
+    requested_athlete = request.args.get("athlete")
+    if requested_athlete is not None and normalize_athlete_id(requested_athlete) != athlete_id_int:
+        return jsonify({"error": "Efforts requested for another athlete", "needs_reload": True}), 403
+
     force_refresh = request.args.get("refresh", "false").lower() == "true"
+    window = parse_enrichment_window(request.args.get("window_start"), request.args.get("window_end"))
+    wire_format = request.args.get("format", "json").lower()
+    if wire_format not in EFFORTS_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EFFORTS_FORMATS)}"}), 400
     logger.info(
-        "Efforts requested segment=%s athlete=%s force_refresh=%s",
+        "Efforts requested segment=%s athlete=%s force_refresh=%s format=%s",
         segment_id,
         athlete_id_int,
         force_refresh,
+        wire_format,
     )
 
-    efforts = repository.get_efforts(segment_id, athlete_id_int)
-    logger.info("DB lookup returned efforts=%s segment=%s athlete=%s", len(efforts), segment_id, athlete_id_int)
+    effort_count = repository.count_efforts(segment_id, athlete_id_int)
+    logger.info("DB lookup returned efforts=%s segment=%s athlete=%s", effort_count, segment_id, athlete_id_int)
 
-    if force_refresh or not efforts:
+    if force_refresh or not effort_count:
         cooldown_remaining = get_cooldown_remaining_seconds(segment_id, athlete_id_int)
         if cooldown_remaining > 0:
-            if efforts:
+            if effort_count:
                 logger.warning(
                     "Cooldown active; returning cached efforts count=%s remaining=%ss",
-                    len(efforts),
+                    effort_count,
                     cooldown_remaining,
                 )
-                compute_decoupling(efforts)
-                return add_cache_headers(jsonify(efforts))
+                return efforts_response(segment_id, athlete_id_int, wire_format)
             return (
                 jsonify(
                     {
@@ -967,20 +1528,26 @@ def get_segment_efforts(segment_id):
         reason = "force_refresh" if force_refresh else "db_empty"
         logger.info("Running sync for segment=%s athlete=%s reason=%s", segment_id, athlete_id_int, reason)
         try:
-            efforts = sync_segment_batch(segment_id, athlete_id_int)
+            sync_segment_batch(segment_id, athlete_id_int, window)
+        except ApiBudgetDeferred as exc:
+            # No cooldown: the budget frees up within the window, Strava has not refused anything.
+            partial_count = repository.count_efforts(segment_id, athlete_id_int)
+            if partial_count:
+                logger.info("API budget busy during sync; returning partial DB efforts count=%s", partial_count)
+                return efforts_response(segment_id, athlete_id_int, wire_format)
+            return budget_deferred_response(exc)
         except StravaAPIError as exc:
             if exc.status_code == 401:
                 return jsonify({"error": exc.message, "needs_reauth": True}), 401
             if exc.status_code == 429:
                 set_rate_limit_cooldown(segment_id, athlete_id_int)
-                partial_efforts = repository.get_efforts(segment_id, athlete_id_int)
-                if partial_efforts:
+                partial_count = repository.count_efforts(segment_id, athlete_id_int)
+                if partial_count:
                     logger.warning(
                         "Rate limited during sync; returning partial DB efforts count=%s",
-                        len(partial_efforts),
+                        partial_count,
                     )
-                    compute_decoupling(partial_efforts)
-                    return add_cache_headers(jsonify(partial_efforts))
+                    return efforts_response(segment_id, athlete_id_int, wire_format)
                 return (
                     jsonify(
                         {
@@ -992,24 +1559,21 @@ def get_segment_efforts(segment_id):
                 )
             return jsonify({"error": f"Failed to fetch efforts: {exc.message}"}), exc.status_code
         except requests.exceptions.RequestException:
-            if efforts:
-                logger.warning("Strava unavailable, returning stale DB efforts count=%s", len(efforts))
-                compute_decoupling(efforts)
-                return add_cache_headers(jsonify(efforts))
+            if effort_count:
+                logger.warning("Strava unavailable, returning stale DB efforts count=%s", effort_count)
+                return efforts_response(segment_id, athlete_id_int, wire_format)
             return jsonify({"error": "Failed to connect to Strava API"}), 502
     else:
         # Lightweight recent sync on regular loads to pick up newest efforts.
         cooldown_remaining = get_cooldown_remaining_seconds(segment_id, athlete_id_int)
         if cooldown_remaining == 0:
             try:
-                initial_effort_count = len(efforts)
                 recent_rows = sync_recent_efforts(segment_id, athlete_id_int, pages=1)
                 if recent_rows:
                     logger.info("Recent lightweight sync inserted/updated rows=%s", recent_rows)
-                    efforts = repository.get_efforts(segment_id, athlete_id_int)
 
                 # If effort count did not increase, fallback to recent activity scan/import.
-                if len(efforts) <= initial_effort_count:
+                if repository.count_efforts(segment_id, athlete_id_int) <= effort_count:
                     imported_from_activities = import_missing_recent_activities(
                         segment_id=segment_id,
                         athlete_id=athlete_id_int,
@@ -1021,25 +1585,268 @@ def get_segment_efforts(segment_id):
                             segment_id,
                             athlete_id_int,
                         )
-                        efforts = repository.get_efforts(segment_id, athlete_id_int)
-
-                # Opportunistic bike enrichment for previously synced efforts.
-                refreshed_bikes = refresh_missing_bike_activities(segment_id, athlete_id_int)
-                if refreshed_bikes:
-                    logger.info(
-                        "Refreshed missing bike metadata during read path count=%s",
-                        refreshed_bikes,
-                    )
-                    efforts = repository.get_efforts(segment_id, athlete_id_int)
+
+                # Activity details for efforts still missing them are fetched in the background,
+                # starting with the window being viewed.
+                if schedule_enrichment(segment_id, athlete_id_int, window):
+                    logger.info("Queued background enrichment segment=%s athlete=%s", segment_id, athlete_id_int)
+            except ApiBudgetDeferred as exc:
+                logger.info("Recent sync skipped by API budget segment=%s athlete=%s: %s", segment_id, athlete_id_int, exc.message)
             except StravaAPIError as exc:
                 if exc.status_code == 429:
                     set_rate_limit_cooldown(segment_id, athlete_id_int)
                 elif exc.status_code == 401:
                     return jsonify({"error": exc.message, "needs_reauth": True}), 401
 
-    logger.info("Returning efforts response count=%s segment=%s athlete=%s", len(efforts), segment_id, athlete_id_int)
-    compute_decoupling(efforts)
-    return add_cache_headers(jsonify(efforts))
+    logger.info("Returning efforts response segment=%s athlete=%s", segment_id, athlete_id_int)
+    return efforts_response(segment_id, athlete_id_int, wire_format)
+
+
+STATS_MAX_BINS = 100
+
+
+@app.route("/segment/<int:segment_id>/stats")
+def get_segment_stats(segment_id):
+    """Summary statistics for the filtered efforts, computed in SQL (no effort list download needed)."""
+    if "access_token" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    athlete_id_int = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id_int is None:
+        session.clear()
+        return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
+
+    filters = {}
+    for name in ("min_hr", "max_hr", "min_power", "max_power"):
+        raw = request.args.get(name)
+        if raw in (None, ""):
+            continue
+        try:
+            filters[name] = float(raw)
+        except ValueError:
+            return jsonify({"error": f"{name} must be a number"}), 400
+    for name in ("start_date", "end_date"):
+        raw = request.args.get(name)
+        if not raw:
+            continue
+        try:
+            datetime.strptime(raw, "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": f"{name} must be YYYY-MM-DD"}), 400
+        filters[name] = raw
+    if request.args.get("bike"):
+        filters["bike"] = request.args["bike"]
+
+    bins = request.args.get("bins", default=20, type=int)
+    if bins is None or not 1 <= bins <= STATS_MAX_BINS:
+        return jsonify({"error": f"bins must be between 1 and {STATS_MAX_BINS}"}), 400
+
+    stats = repository.get_effort_stats(segment_id, athlete_id_int, filters, bins=bins)
+    stats["filters"] = filters
+    return add_cache_headers(jsonify(stats), max_age=0)
+
+
+COMPARE_SERIES_FIELDS = (
+    "start_date",
+    "elapsed_time",
+    "average_heartrate",
+    "average_watts",
+    "efficiency",
+    "vam",
+    "bike_name",
+    "activity_id",
+)
+COMPARE_FLUSH_BYTES = 64 * 1024
+
+
+def compare_summary(acc: Dict) -> Dict:
+    def mean(name):
+        count = acc[f"{name}_n"]
+        return round(acc[f"{name}_sum"] / count, 3 if name == "efficiency" else 1) if count else None
+
+    return {
+        "count": acc["count"],
+        "first_date": acc["first_date"],
+        "last_date": acc["last_date"],
+        "best_time": acc["best_time"],
+        "mean_time": mean("elapsed_time"),
+        "mean_heartrate": mean("average_heartrate"),
+        "mean_watts": mean("average_watts"),
+        "mean_efficiency": mean("efficiency"),
+    }
+
+
+def stream_segment_comparison(athlete_id: int, segment_ids: List[int], start_date, end_date, max_efforts: int):
+    """
+    Yield the comparison document as JSON chunks while reading the efforts cursor.
+    Series rows are [field values...] in COMPARE_SERIES_FIELDS order; once
+    max_efforts rows have been written, series stop (truncated) but summaries
+    still cover every effort.
+    """
+    names = repository.get_segment_names(segment_ids)
+    buffer: List[bytes] = [
+        b'{"fields":',
+        payload_cache.dumps(list(COMPARE_SERIES_FIELDS)),
+        b',"max_efforts":',
+        str(max_efforts).encode(),
+        b',"segments":[',
+    ]
+    buffered = 0
+    emitted = 0
+    truncated = False
+    seen: List[int] = []
+    acc: Optional[Dict] = None
+
+    def close_segment():
+        return b'],"summary":' + payload_cache.dumps(compare_summary(acc)) + b"}"
+
+    for row in repository.iter_efforts_for_segments(athlete_id, segment_ids, start_date, end_date):
+        if acc is None or row["segment_id"] != acc["segment_id"]:
+            if acc is not None:
+                buffer.append(close_segment())
+            buffer.append(b"," if seen else b"")
+            buffer.append(
+                b'{"segment_id":%d,"name":%s,"efforts":['
+                % (row["segment_id"], payload_cache.dumps(names.get(row["segment_id"])))
+            )
+            seen.append(row["segment_id"])
+            acc = {"segment_id": row["segment_id"], "count": 0, "best_time": None, "first_date": None, "last_date": None}
+            for name in ("elapsed_time", "average_heartrate", "average_watts", "efficiency"):
+                acc[f"{name}_n"] = 0
+                acc[f"{name}_sum"] = 0.0
+
+        acc["count"] += 1
+        acc["first_date"] = acc["first_date"] or row["start_date"]
+        acc["last_date"] = row["start_date"]
+        if row["elapsed_time"] is not None and (acc["best_time"] is None or row["elapsed_time"] < acc["best_time"]):
+            acc["best_time"] = row["elapsed_time"]
+        for name in ("elapsed_time", "average_heartrate", "average_watts", "efficiency"):
+            if row[name] is not None:
+                acc[f"{name}_n"] += 1
+                acc[f"{name}_sum"] += row[name]
+
+        if emitted < max_efforts:
+            chunk = payload_cache.dumps([row[field] for field in COMPARE_SERIES_FIELDS])
+            buffer.append(chunk if acc["count"] == 1 else b"," + chunk)
+            buffered += len(chunk)
+            emitted += 1
+        else:
+            truncated = True
+
+        if buffered >= COMPARE_FLUSH_BYTES:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+
+    if acc is not None:
+        buffer.append(close_segment())
+    missing = [segment_id for segment_id in segment_ids if segment_id not in seen]
+    buffer.append(b'],"segments_without_efforts":' + payload_cache.dumps(missing))
+    buffer.append(b',"effort_rows":%d,"truncated":%s}' % (emitted, b"true" if truncated else b"false"))
+    yield b"".join(buffer)
+
+
+@app.route("/athlete/fitness")
+def athlete_fitness():
+    """Athlete-wide daily Forme% series across every stored segment."""
+    if "access_token" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    athlete_id_int = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id_int is None:
+        session.clear()
+        return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
+
+    rolling_days = request.args.get("rolling_days", default=fitness.DEFAULT_ROLLING_DAYS, type=int)
+    if not 1 <= rolling_days <= 365:
+        return jsonify({"error": "rolling_days must be between 1 and 365"}), 400
+    dates = {}
+    for name in ("start_date", "end_date"):
+        raw = request.args.get(name)
+        if raw:
+            try:
+                datetime.strptime(raw, "%Y-%m-%d")
+            except ValueError:
+                return jsonify({"error": f"{name} must be YYYY-MM-DD"}), 400
+        dates[name] = raw
+
+    with metrics.timed("analytics"):
+        result = fitness_index.get(athlete_id_int, rolling_days=rolling_days)
+    series = [
+        point
+        for point in result["series"]
+        if (not dates["start_date"] or point["date"] >= dates["start_date"])
+        and (not dates["end_date"] or point["date"] <= dates["end_date"])
+    ]
+    return add_cache_headers(jsonify({**result, "series": series}), max_age=0)
+
+
+@app.route("/segments/compare")
+def compare_segments():
+    """Summaries and effort series for several segments in one streamed response."""
+    if "access_token" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    athlete_id_int = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id_int is None:
+        session.clear()
+        return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
+
+    raw_ids = ",".join(request.args.getlist("segment_ids") + request.args.getlist("segment_id"))
+    try:
+        segment_ids = sorted({int(part) for part in raw_ids.split(",") if part.strip()})
+    except ValueError:
+        return jsonify({"error": "segment_ids must be a comma-separated list of integers"}), 400
+    if not segment_ids:
+        return jsonify({"error": "segment_ids is required"}), 400
+    if len(segment_ids) > COMPARE_MAX_SEGMENTS:
+        return jsonify({"error": f"At most {COMPARE_MAX_SEGMENTS} segments can be compared at once"}), 400
+
+    dates = {}
+    for name in ("start_date", "end_date"):
+        raw = request.args.get(name)
+        if raw:
+            try:
+                datetime.strptime(raw, "%Y-%m-%d")
+            except ValueError:
+                return jsonify({"error": f"{name} must be YYYY-MM-DD"}), 400
+        dates[name] = raw or None
+
+    max_efforts = min(request.args.get("max_efforts", default=COMPARE_MAX_EFFORTS, type=int), COMPARE_MAX_EFFORTS)
+    logger.info(
+        "Segment comparison athlete=%s segments=%s max_efforts=%s", athlete_id_int, segment_ids, max_efforts
+    )
+    body = stream_segment_comparison(
+        athlete_id_int, segment_ids, dates["start_date"], dates["end_date"], max(0, max_efforts)
+    )
+    response = app.response_class(stream_with_context(body), mimetype="application/json")
+    return add_cache_headers(response, max_age=0)
+
+
+@app.route("/segment/<int:segment_id>/trends")
+def get_segment_trends(segment_id):
+    """Weekly or monthly trend series read from the rollup table."""
+    if "access_token" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    athlete_id_int = normalize_athlete_id(session.get("athlete_id"))
+    if athlete_id_int is None:
+        session.clear()
+        return jsonify({"error": "Session athlete id missing/invalid", "needs_reauth": True}), 401
+
+    period = request.args.get("period", "month").lower()
+    by_bike = request.args.get("by_bike", "false").lower() == "true"
+    try:
+        series = repository.get_rollups(
+            segment_id,
+            athlete_id_int,
+            period=period,
+            start_date=request.args.get("start_date") or None,
+            end_date=request.args.get("end_date") or None,
+            by_bike=by_bike,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return add_cache_headers(jsonify({"period": period, "by_bike": by_bike, "series": series}), max_age=0)
 
 
 @app.route("/segment/<int:segment_id>")
@@ -1066,7 +1873,7 @@ def segment_analyzer(segment_id):
                         message=exc.message,
                         segment_id=segment_id,
                         is_rate_limit=True,
-                        retry_after_seconds=900,
+                        retry_after_seconds=math.ceil(exc.retry_after) if isinstance(exc, ApiBudgetDeferred) else 900,
                     ),
                     429,
                 )
@@ -1094,7 +1901,11 @@ def segment_analyzer(segment_id):
     else:
         logger.info("Segment %s loaded from DB", segment_id)
 
-    return render_template("segment_analyzer.html", segment=segment)
+    return render_template(
+        "segment_analyzer.html",
+        segment=segment,
+        athlete_id=normalize_athlete_id(session.get("athlete_id")),
+    )
 
 
 @app.route("/db/stats")
@@ -1124,6 +1935,169 @@ def clear_db():
     return jsonify({"message": "All database entries cleared"})
 
 
+@app.cli.command("rebuild-rollups")
+@click.option("--segment-id", type=int, default=None, help="Only rebuild this segment.")
+@click.option("--athlete-id", type=int, default=None, help="Only rebuild this athlete.")
+def rebuild_rollups_command(segment_id, athlete_id):
+    """Recompute the weekly/monthly effort rollups from the efforts table."""
+    rows = repository.rebuild_rollups(segment_id=segment_id, athlete_id=athlete_id)
+    click.echo(f"Rebuilt {rows} rollup rows")
+
+
+def bulk_sync_segment(job: bulk_sync.SyncJob, credentials: StravaCredentials) -> bulk_sync.SyncProgress:
+    """One resumable sync_segment_batch run with stored credentials, as background API use."""
+    before = repository.get_sync_state(job.segment_id, job.athlete_id)
+    backlog_before = repository.count_missing_activities(job.segment_id, job.athlete_id)["total"]
+    with use_credentials(credentials), api_budget.scope(
+        tenant=budget_tenant(job.athlete_id), segment_id=job.segment_id, priority=api_budget.BACKGROUND
+    ):
+        if credentials.expires_at and credentials.expires_at < time.time() + 60:
+            refresh_access_token(credentials.access_token)
+        try:
+            efforts = sync_segment_batch(job.segment_id, job.athlete_id)
+        except ApiBudgetDeferred as exc:
+            raise bulk_sync.RetryLater(exc.retry_after, "API budget spent") from exc
+        except StravaAPIError as exc:
+            if exc.status_code == 429:
+                raise bulk_sync.RetryLater(strava_budget.seconds_until_reset(), "rate limited by Strava") from exc
+            raise
+    after = repository.get_sync_state(job.segment_id, job.athlete_id)
+    # A segment is done once its backfill is complete and no activity is left to enrich.
+    backlog = repository.count_missing_activities(job.segment_id, job.athlete_id)["total"]
+    completed = bool(after["full_sync_completed"]) and backlog == 0
+    progressed = (
+        after["next_page"] != before["next_page"]
+        or after["full_sync_completed"] != before["full_sync_completed"]
+        or backlog < backlog_before
+    )
+    if not completed and not progressed:
+        # Neither a page nor an activity was fetched: the budget ran out for this window.
+        raise bulk_sync.RetryLater(strava_budget.seconds_until_reset(), "API budget spent")
+    return bulk_sync.SyncProgress(completed, after["next_page"], len(efforts), backlog)
+
+
+@app.cli.command("bulk-sync")
+@click.option("--athlete-id", "athlete_ids", type=int, multiple=True, help="Athlete to sync (repeatable; default: every athlete with stored tokens).")
+@click.option("--segment-id", "segment_ids", type=int, multiple=True, help="Segment to sync (repeatable; default: every segment the athlete has synced).")
+@click.option("--concurrency", type=int, default=2, show_default=True, help="Segments synced in parallel.")
+@click.option("--rate-budget", type=int, default=None, help="Most Strava calls this run may make per 15-minute window.")
+@click.option("--max-runs", type=int, default=50, show_default=True, help="Sync runs per segment before leaving it partial.")
+@click.option("--wait/--no-wait", default=True, show_default=True, help="Wait for the next window when the budget is spent.")
+def bulk_sync_command(athlete_ids, segment_ids, concurrency, rate_budget, max_runs, wait):
+    """Sync segments for athletes with stored tokens, without a browser session."""
+    token_rows = repository.get_athlete_tokens(list(athlete_ids))
+    missing = set(athlete_ids) - {row["athlete_id"] for row in token_rows}
+    if missing:
+        click.echo(f"No stored tokens for athletes {sorted(missing)}; they need to log in once", err=True)
+
+    jobs: List[bulk_sync.SyncJob] = []
+    credentials_by_athlete: Dict[int, StravaCredentials] = {}
+    for row in token_rows:
+        athlete_id = row["athlete_id"]
+        credentials_by_athlete[athlete_id] = StravaCredentials(
+            athlete_id, row["access_token"], row["refresh_token"], row["expires_at"]
+        )
+        for segment_id in segment_ids or repository.get_synced_segment_ids(athlete_id):
+            jobs.append(bulk_sync.SyncJob(athlete_id, segment_id))
+    if not jobs:
+        click.echo("Nothing to sync")
+        return
+
+    if rate_budget is not None:
+        strava_budget.max_window_calls = max(1, rate_budget)
+    calls_before = sum(sum(tenant["total_calls"].values()) for tenant in strava_budget.snapshot()["tenants"].values())
+    click.echo(f"Syncing {len(jobs)} segments for {len(credentials_by_athlete)} athletes, concurrency={concurrency}")
+    runner = bulk_sync.BulkSync(
+        lambda job: bulk_sync_segment(job, credentials_by_athlete[job.athlete_id]),
+        concurrency=concurrency,
+        max_runs=max_runs,
+        wait=wait,
+        progress=click.echo,
+    )
+    results = runner.run(jobs)
+    calls = sum(sum(tenant["total_calls"].values()) for tenant in strava_budget.snapshot()["tenants"].values())
+    click.echo(bulk_sync.summarize(results, api_calls=calls - calls_before))
+    if any(result.status == bulk_sync.FAILED for result in results):
+        raise SystemExit(1)
+
+
+@app.cli.command("import-export")
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False))
+@click.option("--athlete-id", type=int, default=None, help="Athlete the export belongs to (default: from its profile.csv).")
+@click.option("--workers", type=int, default=None, help="Processes parsing activity files (default: CPU count - 1).")
+@click.option("--no-files", is_flag=True, help="Only read activities.csv, skip the GPX/TCX/FIT files.")
+@click.option("--chunk-size", type=int, default=1000, show_default=True, help="Activities stored per transaction.")
+def import_export_command(archive, athlete_id, workers, no_files, chunk_size):
+    """Import activities from a Strava bulk-export zip without API calls."""
+    try:
+        result = bulk_export.import_archive(
+            archive,
+            repository,
+            athlete_id=athlete_id,
+            workers=workers or bulk_export.default_workers(),
+            parse_files=not no_files,
+            chunk_size=chunk_size,
+            progress=click.echo,
+        )
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from exc
+    click.echo(
+        f"Imported {result.activities} activities for athlete={result.athlete_id} in {result.seconds:.1f}s"
+        f" ({result.skipped} already stored, {result.files_parsed} files parsed, {result.files_failed} unreadable,"
+        f" {result.efforts_updated} efforts updated)"
+    )
+
+
+@app.cli.command("match-efforts")
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False))
+@click.option("--segment-id", "segment_ids", type=int, multiple=True, required=True, help="Stored segment to detect (repeatable).")
+@click.option("--athlete-id", type=int, default=None, help="Athlete the export belongs to (default: from its profile.csv).")
+@click.option("--workers", type=int, default=None, help="Processes matching activity files (default: CPU count - 1).")
+def match_efforts_command(archive, segment_ids, athlete_id, workers):
+    """Detect segment efforts in a bulk export's GPS tracks and store them, without API calls."""
+    try:
+        result = segment_matcher.match_archive(
+            archive,
+            repository,
+            segment_ids,
+            athlete_id=athlete_id,
+            workers=workers or bulk_export.default_workers(),
+            progress=click.echo,
+        )
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from exc
+    store_matched_efforts(result, segment_ids)
+    click.echo(
+        f"Matched {result.files_scanned} activity files for athlete={result.athlete_id} in {result.seconds:.1f}s"
+        f" ({result.skipped} already matched by Strava, {result.files_failed} unreadable)"
+    )
+
+
+@app.cli.command("match-stored-efforts")
+@click.option("--athlete-id", type=int, required=True, help="Athlete whose stored activity streams are matched.")
+@click.option("--segment-id", "segment_ids", type=int, multiple=True, required=True, help="Stored segment to detect (repeatable).")
+def match_stored_efforts_command(athlete_id, segment_ids):
+    """Detect segment efforts in the GPS tracks of activities whose streams are stored, without API calls."""
+    try:
+        result = segment_matcher.match_stored_activities(repository, segment_ids, athlete_id, progress=click.echo)
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from exc
+    store_matched_efforts(result, segment_ids)
+    click.echo(
+        f"Matched {result.files_scanned} stored activity tracks for athlete={result.athlete_id} in {result.seconds:.1f}s"
+        f" ({result.skipped} already matched by Strava, {result.undated} without a stored activity,"
+        f" {result.files_failed} without a time stream)"
+    )
+
+
+def store_matched_efforts(result: segment_matcher.MatchResult, segment_ids) -> None:
+    for segment_id in segment_ids:
+        raw_efforts = result.efforts.get(segment_id, [])
+        payload = build_effort_payload(repository.get_segment(segment_id), raw_efforts, result.activities)
+        repository.upsert_efforts(segment_id=segment_id, athlete_id=result.athlete_id, efforts=payload)
+        click.echo(f"segment={segment_id}: {len(payload)} efforts detected")
+
+
 @app.route("/health")
 def health_check():
     return jsonify(
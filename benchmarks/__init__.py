@@ -0,0 +1 @@
+"""Performance benchmarks for the Strava Segment Analyzer (not run by pytest)."""
@@ -0,0 +1,190 @@
+"""
+Microbenchmarks for the effort pipeline at several dataset sizes.
+
+Times payload building, decoupling, the SQLite repository (insert, unchanged
+re-sync, read, effort stats, /db/stats), the readiness baseline and JSON
+serialisation of the efforts response on synthetic data, and writes the
+timings as JSON. Given a stored baseline, every timing is compared with it and
+regressions beyond --tolerance are reported.
+
+    python -m benchmarks.bench_suite --sizes 1000,10000,100000,1000000 --output bench.json
+    python -m benchmarks.bench_suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json --fail-on-regression
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import columnar
+import payload_cache
+import readiness
+from benchmarks.synthetic import generate_strava_payload
+from storage import StravaRepository
+
+ATHLETE_ID = 4242
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+
+
+def _time(fn: Callable, repeat: int, setup: Optional[Callable] = None) -> Dict:
+    """Run fn `repeat` times (setup, untimed, before each run; its result is fn's argument)."""
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(runs), 3),
+        "min_ms": round(min(runs), 3),
+        "runs": len(runs),
+    }
+
+
+def bench_size(app_module, size: int, repeat: int, workdir: str) -> Dict[str, Dict]:
+    segment, raw_efforts, activities = generate_strava_payload(size)
+    segment_id = segment["id"]
+    results: Dict[str, Dict] = {}
+
+    results["build_effort_payload"] = _time(
+        lambda: app_module.build_effort_payload(segment, raw_efforts, activities), repeat
+    )
+    prepared = app_module.build_effort_payload(segment, raw_efforts, activities)
+    results["compute_decoupling"] = _time(
+        app_module.compute_decoupling, repeat, setup=lambda: [dict(effort) for effort in prepared]
+    )
+
+    databases = iter(range(repeat + 1))
+
+    def fresh_repository() -> StravaRepository:
+        repo = StravaRepository(os.path.join(workdir, f"bench-{size}-{next(databases)}.db"))
+        repo.upsert_segment(segment)
+        repo.upsert_activities(ATHLETE_ID, activities)
+        return repo
+
+    results["upsert_efforts_insert"] = _time(
+        lambda repo: repo.upsert_efforts(segment_id, ATHLETE_ID, prepared), repeat, setup=fresh_repository
+    )
+    repo = fresh_repository()
+    repo.upsert_efforts(segment_id, ATHLETE_ID, prepared)
+    results["upsert_efforts_unchanged"] = _time(lambda: repo.upsert_efforts(segment_id, ATHLETE_ID, prepared), repeat)
+    results["get_efforts"] = _time(lambda: repo.get_efforts(segment_id, ATHLETE_ID), repeat)
+    results["get_effort_stats"] = _time(lambda: repo.get_effort_stats(segment_id, ATHLETE_ID), repeat)
+    # /db/stats for the viewed segment: database-wide counts plus the segment's sync and enrichment state.
+    results["stats"] = _time(lambda: repo.stats(segment_id=segment_id, athlete_id=ATHLETE_ID), repeat)
+
+    efforts = repo.get_efforts(segment_id, ATHLETE_ID)
+    results["compute_baseline"] = _time(lambda: readiness.compute_baseline(efforts), repeat)
+    results["json_rows"] = _time(lambda: payload_cache.dumps(efforts), repeat)
+    results["json_columnar"] = _time(lambda: payload_cache.dumps(columnar.to_columnar(efforts)), repeat)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """
+    Best-vs-best ratio for every size/benchmark present in both runs; the
+    fastest run is the least noisy estimate of a benchmark's cost.
+    """
+    rows = []
+    for size, benchmarks in results.items():
+        for name, timing in benchmarks.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous or not previous.get("min_ms"):
+                continue
+            ratio = timing["min_ms"] / previous["min_ms"]
+            if ratio > 1 + tolerance:
+                status = "regression"
+            elif ratio < 1 / (1 + tolerance):
+                status = "improvement"
+            else:
+                status = "ok"
+            rows.append(
+                {
+                    "size": int(size),
+                    "benchmark": name,
+                    "baseline_ms": previous["min_ms"],
+                    "min_ms": timing["min_ms"],
+                    "ratio": round(ratio, 3),
+                    "status": status,
+                }
+            )
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="also write the results to this path as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression (0.25 = 25%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="strava-bench-") as workdir:
+        # app.py opens its repository at import time; keep it away from the real database.
+        os.environ["STRAVA_DB_PATH"] = os.path.join(workdir, "app.db")
+        import app as app_module
+
+        logging.getLogger("app").setLevel(logging.WARNING)
+
+        results = {}
+        for size in (int(value) for value in args.sizes.split(",")):
+            print(f"benchmarking {size} efforts...", file=sys.stderr)
+            results[str(size)] = bench_size(app_module, size, args.repeat, workdir)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "orjson": payload_cache.orjson is not None,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        report["baseline"] = {"path": args.baseline, "created_at": baseline.get("meta", {}).get("created_at")}
+        report["comparison"] = compare(results, baseline.get("results", {}), args.tolerance)
+        regressions = [row for row in report["comparison"] if row["status"] == "regression"]
+
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(body + "\n")
+    else:
+        print(body)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as handle:
+            handle.write(json.dumps({"meta": report["meta"], "results": results}, indent=2) + "\n")
+
+    print(f"{'efforts':>8} {'benchmark':<26} {'best ms':>10} {'baseline':>10} {'ratio':>6}", file=sys.stderr)
+    for size, benchmarks in results.items():
+        for name, timing in benchmarks.items():
+            row = next(
+                (r for r in report.get("comparison", []) if str(r["size"]) == size and r["benchmark"] == name), None
+            )
+            baseline_ms = f"{row['baseline_ms']:.1f}" if row else "-"
+            ratio = f"{row['ratio']:.2f}" + (" !" if row["status"] == "regression" else "") if row else ""
+            print(f"{size:>8} {name:<26} {timing['min_ms']:>10.1f} {baseline_ms:>10} {ratio:>6}", file=sys.stderr)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+End-to-end sync benchmark against the mock Strava server.
+
+Starts benchmarks.mock_strava in-process, points app.py at it
+(STRAVA_API_BASE / STRAVA_TOKEN_URL) with a scratch database, and runs
+sync_segment_batch until the backfill is complete and the enrichment backlog
+is empty (the rule bulk_sync_segment uses), as repeated page loads would.
+When the mock rate-limits, the harness waits for the window to reset, like
+the app's cooldown. Reports time to complete, pages/sec, API calls per
+effort and calls per endpoint as JSON.
+
+    python -m benchmarks.bench_sync --efforts 5000 --latency-ms 40
+    python -m benchmarks.bench_sync --efforts 20000 --short-limit 300 --window-seconds 20 --output sync.json
+    python -m benchmarks.bench_sync --mode replay --recordings recordings/ --athlete-id 123 --segment-id 456
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_strava import DEFAULT_ATHLETE_ID, SEGMENT_ID, MockServer, add_mock_arguments, create_app_from_args
+
+
+def _backlog(app_module, args: argparse.Namespace) -> int:
+    return app_module.repository.count_missing_activities(args.segment_id, args.athlete_id)["total"]
+
+
+def run(args: argparse.Namespace) -> dict:
+    mock = create_app_from_args(args, args.athlete_id)
+    state = mock.config["MOCK"]
+    with MockServer(mock) as server, tempfile.TemporaryDirectory(prefix="strava-sync-bench-") as workdir:
+        os.environ.update(server.env)
+        os.environ["STRAVA_DB_PATH"] = os.path.join(workdir, "sync.db")
+        os.environ.setdefault("STRAVA_CLIENT_ID", "mock")
+        os.environ.setdefault("STRAVA_CLIENT_SECRET", "mock")
+        import app as app_module
+
+        logging.getLogger("app").setLevel(logging.INFO if args.verbose else logging.WARNING)
+        # Budget windows follow the mock's (shortened) rate-limit window.
+        app_module.strava_budget = app_module.api_budget.ApiBudget(
+            short_limit=args.short_limit,
+            interactive_reserve=app_module.API_INTERACTIVE_RESERVE,
+            max_wait_seconds=0,
+            window_seconds=args.window_seconds,
+        )
+
+        runs = 0
+        rate_limit_wait = 0.0
+        started = time.perf_counter()
+        with app_module.app.test_request_context():
+            app_module.session["access_token"] = args.token or f"mock-{args.athlete_id}"
+            app_module.session["refresh_token"] = f"refresh-{args.athlete_id}"
+            app_module.session["athlete_id"] = args.athlete_id
+            while runs < args.max_runs:
+                runs += 1
+                limited_before = state["calls"]["429"]
+                try:
+                    app_module.sync_segment_batch(args.segment_id, args.athlete_id)
+                except app_module.StravaAPIError as exc:
+                    if exc.status_code != 429:
+                        raise
+                sync_state = app_module.repository.get_sync_state(args.segment_id, args.athlete_id)
+                completed = bool(sync_state["full_sync_completed"]) and _backlog(app_module, args) == 0
+                if completed and state["calls"]["429"] == limited_before:
+                    break
+                budget = app_module.strava_budget.snapshot()
+                if state["calls"]["429"] > limited_before or budget["short_used"] >= budget["background_limit"]:
+                    wait = state["limiter"].seconds_until_reset() + 0.05
+                    reason = "rate limited" if state["calls"]["429"] > limited_before else "API budget spent"
+                    print(f"run {runs}: {reason}, waiting {wait:.1f}s", file=sys.stderr)
+                    time.sleep(wait)
+                    rate_limit_wait += wait
+        elapsed = time.perf_counter() - started
+
+        efforts = app_module.repository.get_efforts(args.segment_id, args.athlete_id)
+        sync_state = app_module.repository.get_sync_state(args.segment_id, args.athlete_id)
+        backlog = _backlog(app_module, args)
+
+    calls = dict(state["calls"])
+    pages = calls.get("/segments/<id>/all_efforts", 0)
+    total = calls.get("total", 0)
+    return {
+        "config": {
+            "mode": args.mode,
+            "efforts": args.efforts,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "short_limit": args.short_limit,
+            "window_seconds": args.window_seconds,
+            "recent_refresh_pages": app_module.RECENT_REFRESH_PAGES,
+            "backfill_pages_per_run": app_module.BACKFILL_PAGES_PER_RUN,
+            "max_missing_bike_refresh_per_run": app_module.MAX_MISSING_BIKE_REFRESH_PER_RUN,
+        },
+        "completed": bool(sync_state["full_sync_completed"]) and backlog == 0,
+        "backfill_completed": bool(sync_state["full_sync_completed"]),
+        "backlog": backlog,
+        "runs": runs,
+        "seconds": round(elapsed, 3),
+        "rate_limit_wait_seconds": round(rate_limit_wait, 3),
+        "efforts_stored": len(efforts),
+        "efforts_with_bike": sum(1 for effort in efforts if effort.get("bike_name") not in (None, "Unknown")),
+        "pages": pages,
+        "pages_per_second": round(pages / (elapsed - rate_limit_wait), 2) if elapsed > rate_limit_wait else None,
+        "api_calls": total,
+        "api_calls_per_effort": round(total / len(efforts), 3) if efforts else None,
+        "rate_limited_responses": calls.get("429", 0),
+        "calls_by_endpoint": {key: value for key, value in sorted(calls.items()) if key.startswith("/")},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_mock_arguments(parser)
+    parser.add_argument("--athlete-id", type=int, default=DEFAULT_ATHLETE_ID)
+    parser.add_argument("--segment-id", type=int, default=SEGMENT_ID)
+    parser.add_argument("--token", help="access token to send (replay of recorded data ignores it)")
+    parser.add_argument("--max-runs", type=int, default=200, help="give up after this many sync runs")
+    parser.add_argument("--output", help="write the report JSON here (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="show the app's sync logging")
+    args = parser.parse_args()
+
+    report = run(args)
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(body + "\n")
+    else:
+        print(body)
+    print(
+        f"{'complete' if report['completed'] else 'INCOMPLETE'} in {report['seconds']}s over {report['runs']} run(s): "
+        f"{report['efforts_stored']} efforts ({report['backlog']} awaiting enrichment), {report['pages']} pages ({report['pages_per_second']} pages/s), "
+        f"{report['api_calls']} API calls ({report['api_calls_per_effort']} per effort), "
+        f"{report['rate_limited_responses']} rate-limited",
+        file=sys.stderr,
+    )
+    return 0 if report["completed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
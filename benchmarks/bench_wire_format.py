@@ -0,0 +1,96 @@
+"""
+Compare the row-object and columnar /efforts wire formats.
+
+Reports payload size (raw and gzip), the server-side json.loads time, and,
+when Node.js is installed, the client-side cost (wire_format_parse.js):
+JSON.parse alone, and JSON.parse plus loading the payload into the query
+columns with the analyzer's own effort-columns.js and effort-query.js.
+
+    python -m benchmarks.bench_wire_format --sizes 1000,10000,50000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import columnar
+import payload_cache
+from benchmarks.synthetic import generate_efforts
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _node_timings(bodies: List[bytes], repeat: int) -> Optional[List[Dict]]:
+    """Client-side timings from wire_format_parse.js, or None without Node.js."""
+    node = shutil.which("node")
+    if node is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index, body in enumerate(bodies):
+            paths.append(os.path.join(directory, f"{index}.json"))
+            with open(paths[-1], "wb") as handle:
+                handle.write(body)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wire_format_parse.js")
+        output = subprocess.run([node, script, str(repeat), *paths], check=True, capture_output=True, text=True).stdout
+    return [json.loads(line) for line in output.splitlines()]
+
+
+def bench(size: int, repeat: int = 5) -> dict:
+    efforts = generate_efforts(size)
+    payloads = (("rows", efforts), ("columnar", columnar.to_columnar(efforts)))
+    bodies = [payload_cache.dumps(payload) for _, payload in payloads]
+    client = _node_timings(bodies, repeat)
+    results = {}
+    for index, ((name, _), body) in enumerate(zip(payloads, bodies)):
+        results[name] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+            "py_loads_ms": round(_best_of(lambda: json.loads(body), repeat) * 1000, 2),
+            "js_parse_ms": round(client[index]["parse_ms"], 2) if client else None,
+            "js_load_ms": round(client[index]["load_ms"], 2) if client else None,
+        }
+    return {"size": size, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'efforts':>8} {'format':>9} {'bytes':>11} {'gzip':>9} {'py loads':>9} {'js parse':>9} {'js load':>9}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        result = bench(size, args.repeat)
+        for name in ("rows", "columnar"):
+            row = result[name]
+            print(
+                f"{size:>8} {name:>9} {row['bytes']:>11} {row['gzip_bytes']:>9} {row['py_loads_ms']:>9}"
+                f" {row['js_parse_ms'] if row['js_parse_ms'] is not None else '-':>9}"
+                f" {row['js_load_ms'] if row['js_load_ms'] is not None else '-':>9}"
+            )
+        ratio = result["rows"]["bytes"] / result["columnar"]["bytes"]
+        summary = f"{'':>8} columnar is {ratio:.2f}x smaller"
+        if result["rows"]["js_parse_ms"] is not None:
+            parse = result["rows"]["js_parse_ms"] / max(result["columnar"]["js_parse_ms"], 1e-6)
+            load = result["rows"]["js_load_ms"] / max(result["columnar"]["js_load_ms"], 1e-6)
+            summary += f"; rows/columnar time in Node: JSON.parse {parse:.2f}x, parse + load {load:.2f}x"
+        else:
+            summary += " (install Node.js for client-side timings)"
+        print(summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Concurrent HTTP load test for the read path.
+
+Seeds a database with synthetic athletes, starts the mock Strava server
+(benchmarks/mock_strava.py) and a gunicorn box on top of both, logs every
+athlete in through the real OAuth callback, then drives mixed traffic at a
+target request rate from several client processes:
+
+    page     GET  /segment/<id>
+    efforts  GET  /segment/<id>/efforts   (includes the inline recent sync)
+    stats    GET  /segment/<id>/stats
+    sync     POST /segment/<id>/sync
+
+Arrivals are open-loop (a fixed schedule per client process), and latency is
+measured from each request's scheduled time, so client-side queueing behind a
+slow server is counted instead of hidden. Reports p50/p95/p99 latency,
+throughput and error rate per endpoint as JSON.
+
+    python -m benchmarks.load_test --athletes 50 --rate 40 --duration 30 --app-workers 4
+    python -m benchmarks.load_test --mix efforts=1 --rate 100 --processes 4 --concurrency 64
+    python -m benchmarks.load_test --target http://127.0.0.1:8000 --mock-port 8001 --seed-db data/load.db
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+import requests.adapters
+
+from benchmarks.mock_strava import SEGMENT_ID, MockServer, add_mock_arguments, create_app_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_ATHLETE_ID = 20001
+ENDPOINTS = {
+    "page": ("GET", "/segment/{segment_id}"),
+    "efforts": ("GET", "/segment/{segment_id}/efforts"),
+    "stats": ("GET", "/segment/{segment_id}/stats"),
+    "sync": ("POST", "/segment/{segment_id}/sync"),
+}
+DEFAULT_MIX = "page=1,efforts=6,stats=2,sync=1"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def seed_database(db_path: str, mock_data, athlete_ids: List[int]) -> None:
+    """Store each synthetic athlete's efforts as a completed sync would (same ids as the mock serves)."""
+    os.environ["STRAVA_DB_PATH"] = db_path
+    from app import build_effort_payload
+    from storage import StravaRepository
+
+    repo = StravaRepository(db_path)
+    repo.upsert_segment(mock_data.segment)
+    for athlete_id in athlete_ids:
+        data = mock_data.athlete(athlete_id)
+        activities = {
+            activity_id: {**activity, "bike_name": activity["gear"]["name"]}
+            for activity_id, activity in data["activities"].items()
+        }
+        repo.upsert_activities(athlete_id, activities)
+        repo.upsert_efforts(SEGMENT_ID, athlete_id, build_effort_payload(mock_data.segment, data["efforts"], activities))
+        repo.upsert_sync_state(SEGMENT_ID, athlete_id, next_page=1, full_sync_completed=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(env: Dict[str, str], workers: int, threads: int) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--threads", str(threads),
+            "--worker-class", "gthread" if threads > 1 else "sync",
+            "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return process, url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not become healthy within 30s")
+
+
+def login(target: str, athlete_id: int, pool_size: int) -> requests.Session:
+    """Create an app session through the OAuth callback; the mock turns the code into a token."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    response = session.get(f"{target}/auth/callback", params={"code": f"athlete-{athlete_id}"}, allow_redirects=False, timeout=30)
+    if response.status_code != 302 or "session" not in session.cookies:
+        raise RuntimeError(f"login failed for athlete {athlete_id}: {response.status_code} {response.text[:200]}")
+    return session
+
+
+def client_process(worker: int, args: argparse.Namespace, athlete_ids: List[int], start_at: float, results) -> None:
+    rng = random.Random(worker)
+    sessions = {athlete_id: login(args.target, athlete_id, args.concurrency) for athlete_id in athlete_ids}
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    rate = args.rate / args.processes
+    count = int(rate * args.duration)
+    samples: List[Tuple[str, int, float, float]] = []
+
+    def send(name: str, athlete_id: int, scheduled: float) -> None:
+        method, path = ENDPOINTS[name]
+        try:
+            response = sessions[athlete_id].request(
+                method, args.target + path.format(segment_id=SEGMENT_ID), allow_redirects=False, timeout=args.timeout
+            )
+            status = response.status_code
+        except requests.exceptions.RequestException:
+            status = 0
+        finished = time.time()
+        samples.append((name, status, (finished - scheduled) * 1000, finished))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for index in range(count):
+            scheduled = start_at + index / rate
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, rng.choices(names, weights)[0], rng.choice(athlete_ids), scheduled)
+    results.put(samples)
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return round(values[index], 1)
+
+
+def summarise(samples: List[Tuple[str, int, float, float]], start_at: float) -> Dict:
+    by_endpoint: Dict[str, List] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+    elapsed = max((sample[3] for sample in samples), default=start_at) - start_at
+
+    def stats(rows: List) -> Dict:
+        latencies = sorted(row[2] for row in rows)
+        statuses = Counter(str(row[1]) for row in rows)
+        errors = sum(count for status, count in statuses.items() if status == "0" or int(status) >= 400)
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2) if elapsed > 0 else None,
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 1) if latencies else None,
+            "statuses": dict(sorted(statuses.items())),
+        }
+
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "overall": stats(samples),
+        "endpoints": {name: stats(rows) for name, rows in sorted(by_endpoint.items())},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="URL of a running app already pointed at the mock (default: start gunicorn)")
+    parser.add_argument("--seed-db", help="database to seed (default: a scratch database for the started app)")
+    parser.add_argument("--mock-port", type=int, default=0, help="port of the mock Strava server (0 = any)")
+    parser.add_argument("--app-workers", type=int, default=2, help="gunicorn workers when starting the app")
+    parser.add_argument("--app-threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--athletes", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=20.0, help="target requests per second, all processes")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic")
+    parser.add_argument("--processes", type=int, default=2, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client process")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--output", help="write the report JSON here (default: stdout)")
+    add_mock_arguments(parser)
+    # The box is under test here, not the Strava quota.
+    parser.set_defaults(efforts=1000, short_limit=1_000_000, daily_limit=10_000_000)
+    args = parser.parse_args()
+
+    athlete_ids = list(range(FIRST_ATHLETE_ID, FIRST_ATHLETE_ID + args.athletes))
+    mock = create_app_from_args(args)
+    state = mock.config["MOCK"]
+    gunicorn = None
+    with MockServer(mock, port=args.mock_port) as server, tempfile.TemporaryDirectory(prefix="strava-load-") as workdir:
+        db_path = args.seed_db or (None if args.target else os.path.join(workdir, "load.db"))
+        if db_path:
+            print(f"seeding {args.athletes} athletes x {args.efforts} efforts into {db_path}", file=sys.stderr)
+            seed_database(db_path, state["data"], athlete_ids)
+        if not args.target:
+            env = {
+                **server.env,
+                "STRAVA_DB_PATH": db_path,
+                "STRAVA_CLIENT_ID": "mock",
+                "STRAVA_CLIENT_SECRET": "mock",
+                "SECRET_KEY": "load-test",
+                "LOG_LEVEL": "WARNING",
+            }
+            gunicorn, args.target = start_gunicorn(env, args.app_workers, args.app_threads)
+        else:
+            print("target app must run with: " + " ".join(f"{k}={v}" for k, v in server.env.items()), file=sys.stderr)
+
+        try:
+            calls_before = dict(state["calls"])
+            start_at = time.time() + 2 + args.athletes * 0.02
+            results = multiprocessing.Queue()
+            shares = [athlete_ids[worker :: args.processes] for worker in range(args.processes)]
+            processes = [
+                multiprocessing.Process(target=client_process, args=(worker, args, shares[worker], start_at, results))
+                for worker in range(args.processes)
+                if shares[worker]
+            ]
+            for process in processes:
+                process.start()
+            samples = []
+            for _ in processes:
+                samples.extend(results.get())
+            for process in processes:
+                process.join()
+        finally:
+            if gunicorn:
+                gunicorn.terminate()
+                gunicorn.wait()
+
+        strava_calls = {key: value - calls_before.get(key, 0) for key, value in state["calls"].items()}
+
+    report = {
+        "config": {
+            "target": args.target,
+            "app_workers": args.app_workers if gunicorn else None,
+            "app_threads": args.app_threads if gunicorn else None,
+            "athletes": args.athletes,
+            "efforts_per_athlete": args.efforts,
+            "rate": args.rate,
+            "duration": args.duration,
+            "processes": args.processes,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "strava_latency_ms": args.latency_ms,
+        },
+        **summarise(samples, start_at),
+        "strava_calls": dict(sorted(strava_calls.items())),
+    }
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(body + "\n")
+    else:
+        print(body)
+
+    print(f"{'endpoint':<10} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}", file=sys.stderr)
+    for name, row in [*report["endpoints"].items(), ("all", report["overall"])]:
+        print(
+            f"{name:<10} {row['requests']:>6} {row['throughput_rps']:>7} {row['error_rate'] * 100:>5.1f}% "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
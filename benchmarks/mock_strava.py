@@ -0,0 +1,434 @@
+"""
+Local stand-in for the Strava API, for sync and load benchmarks.
+
+Serves the endpoints the app uses, with configurable latency, Strava-style
+rate-limit headers (X-RateLimit-Limit / X-RateLimit-Usage, 429 past the
+limit), random 429 injection and per_page/page pagination:
+
+    GET  /oauth/authorize          redirects back with a code for --athlete-id
+    POST /oauth/token              authorization_code and refresh_token grants
+    GET  /api/v3/athlete, /api/v3/athlete/activities, /api/v3/gear/<id>
+    GET  /api/v3/segments/<id>, /api/v3/segments/<id>/all_efforts
+    GET  /api/v3/activities/<id>, /api/v3/activities/<id>/streams
+    GET  /mock/stats               call counters; POST /mock/reset clears them
+
+Modes:
+    synthetic  every athlete gets --efforts generated efforts on one segment
+    record     proxy GETs to the real API and save each response under --recordings
+    replay     serve saved responses; anything not recorded is a 404
+
+Tokens are "mock-<athlete_id>", and the code "athlete-<id>" logs in as that
+athlete, so any number of synthetic athletes can get sessions.
+
+    python -m benchmarks.mock_strava --port 8001 --efforts 5000 --latency-ms 40
+    STRAVA_API_BASE=http://127.0.0.1:8001/api/v3 STRAVA_TOKEN_URL=http://127.0.0.1:8001/oauth/token \\
+        STRAVA_AUTH_URL=http://127.0.0.1:8001/oauth/authorize python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from flask import Flask, g, jsonify, redirect, request
+from werkzeug.serving import make_server
+
+from benchmarks.synthetic import BIKES, generate_strava_payload
+
+SEGMENT_ID = 7_000_001
+DEFAULT_ATHLETE_ID = 1001
+STRAVA_ORIGIN = "https://www.strava.com"
+ID_STRIDE = 100_000_000  # keeps effort/activity ids distinct across synthetic athletes
+
+
+class RateLimiter:
+    """Application-wide 15-minute and daily request counters, like Strava's."""
+
+    def __init__(self, short_limit: int = 200, daily_limit: int = 2000, window_seconds: int = 900):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window = None
+        self._day = None
+        self._short_usage = 0
+        self._daily_usage = 0
+
+    def hit(self) -> Tuple[bool, Dict[str, str]]:
+        """Count one request; returns (allowed, rate-limit headers)."""
+        now = time.time()
+        with self._lock:
+            window, day = int(now // self.window_seconds), int(now // 86400)
+            if window != self._window:
+                self._window, self._short_usage = window, 0
+            if day != self._day:
+                self._day, self._daily_usage = day, 0
+            self._short_usage += 1
+            self._daily_usage += 1
+            allowed = self._short_usage <= self.short_limit and self._daily_usage <= self.daily_limit
+            headers = {
+                "X-RateLimit-Limit": f"{self.short_limit},{self.daily_limit}",
+                "X-RateLimit-Usage": f"{self._short_usage},{self._daily_usage}",
+            }
+        return allowed, headers
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"short": self._short_usage, "daily": self._daily_usage}
+
+    def seconds_until_reset(self) -> float:
+        return self.window_seconds - time.time() % self.window_seconds
+
+
+class SyntheticStrava:
+    """Deterministic per-athlete data built from benchmarks.synthetic."""
+
+    def __init__(self, efforts_per_athlete: int, streams: bool = True):
+        self.efforts_per_athlete = efforts_per_athlete
+        self.streams = streams
+        self._athletes: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+        segment, _, _ = generate_strava_payload(0)
+        self.segment = {**segment, "id": SEGMENT_ID, "activity_type": "Ride"}
+
+    def athlete(self, athlete_id: int) -> Dict:
+        with self._lock:
+            data = self._athletes.get(athlete_id)
+            if data is None:
+                data = self._athletes[athlete_id] = self._generate(athlete_id)
+            return data
+
+    def _generate(self, athlete_id: int) -> Dict:
+        _, raw_efforts, raw_activities = generate_strava_payload(self.efforts_per_athlete, seed=athlete_id)
+        offset = (athlete_id % 1000) * ID_STRIDE
+        efforts = []
+        activities: Dict[int, Dict] = {}
+        for raw in raw_efforts:
+            activity_id = raw["activity"]["id"] + offset
+            effort = {
+                **raw,
+                "id": raw["id"] + offset,
+                "activity": {"id": activity_id},
+                "athlete": {"id": athlete_id},
+                "segment": {"id": SEGMENT_ID},
+            }
+            efforts.append(effort)
+            activity = activities.get(activity_id)
+            if activity is None:
+                source = raw_activities[raw["activity"]["id"]]
+                activity = activities[activity_id] = {
+                    "id": activity_id,
+                    "name": source["name"],
+                    "type": "Ride",
+                    "start_date": source["start_date"],
+                    "gear_id": source["gear_id"],
+                    "gear": {"id": source["gear_id"], "name": source["bike_name"]},
+                    "device_watts": True,
+                    "athlete": {"id": athlete_id},
+                    "segment_efforts": [],
+                }
+            activity["segment_efforts"].append(effort)
+        activity_list = sorted(activities.values(), key=lambda item: item["start_date"], reverse=True)
+        return {"efforts": efforts, "activities": activities, "activity_list": activity_list}
+
+    def streams_for(self, activity: Dict) -> Dict:
+        length = max(effort["end_index"] for effort in activity["segment_efforts"]) + 60
+        efforts = activity["segment_efforts"]
+        watts = efforts[0].get("average_watts") or 0
+        hr = efforts[0].get("average_heartrate") or 0
+        return {
+            "time": {"data": list(range(length))},
+            "watts": {"data": [round(watts + 15 * ((i % 7) - 3)) for i in range(length)]},
+            "heartrate": {"data": [round(hr + (i * 6) / length) for i in range(length)]},
+            "distance": {"data": [round(i * 5.8, 1) for i in range(length)]},
+            # Due north from 45N 6E at 5.8 m/s.
+            "latlng": {"data": [[round(45.0 + i * 5.8 / 111_195, 6), 6.0] for i in range(length)]},
+        }
+
+
+def _page(items: List, default_per_page: int = 30) -> List:
+    per_page = min(max(request.args.get("per_page", default_per_page, type=int), 1), 200)
+    page = max(request.args.get("page", 1, type=int), 1)
+    return items[(page - 1) * per_page : page * per_page]
+
+
+def _recording_path(directory: str, path: str, query: Dict) -> str:
+    key = path + "?" + urlencode(sorted(query.items()))
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")
+    return os.path.join(directory, f"{slug}-{hashlib.sha1(key.encode()).hexdigest()[:12]}.json")
+
+
+def create_app(
+    mode: str = "synthetic",
+    efforts: int = 2000,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    short_limit: int = 200,
+    daily_limit: int = 2000,
+    window_seconds: int = 900,
+    recordings: Optional[str] = None,
+    athlete_id: int = DEFAULT_ATHLETE_ID,
+    streams: bool = True,
+    seed: int = 7,
+) -> Flask:
+    if mode not in ("synthetic", "record", "replay"):
+        raise ValueError(f"Unknown mode: {mode}")
+    if mode != "synthetic" and not recordings:
+        raise ValueError(f"{mode} mode needs a recordings directory")
+    if recordings:
+        os.makedirs(recordings, exist_ok=True)
+
+    mock = Flask(__name__)
+    data = SyntheticStrava(efforts, streams=streams)
+    limiter = RateLimiter(short_limit, daily_limit, window_seconds)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    calls: Counter = Counter()
+    mock.config["MOCK"] = {"data": data, "limiter": limiter, "calls": calls}
+
+    def error(status: int, message: str, headers: Optional[Dict] = None):
+        response = jsonify({"message": message, "errors": [{"resource": "Mock", "code": str(status)}]})
+        response.status_code = status
+        response.headers.update(headers or {})
+        return response
+
+    def current_athlete() -> Optional[int]:
+        match = re.fullmatch(r"Bearer mock-(\d+)", request.headers.get("Authorization", ""))
+        return int(match.group(1)) if match else None
+
+    @mock.before_request
+    def simulate_api():
+        if not request.path.startswith("/api/v3/"):
+            return None
+        endpoint = re.sub(r"/\d+", "/<id>", request.path[len("/api/v3") :])
+        calls["total"] += 1
+        calls[endpoint] += 1
+        if latency_ms or jitter_ms:
+            with rng_lock:
+                delay = latency_ms + rng.uniform(0, jitter_ms)
+            time.sleep(delay / 1000)
+        if mode == "record":
+            return None
+        allowed, headers = limiter.hit()
+        with rng_lock:
+            injected = error_rate and rng.random() < error_rate
+        if not allowed or injected:
+            calls["429"] += 1
+            return error(429, "Rate Limit Exceeded", headers)
+        g.rate_limit_headers = headers
+        if mode == "synthetic" and current_athlete() is None:
+            calls["401"] += 1
+            return error(401, "Authorization Error")
+        return None
+
+    @mock.after_request
+    def add_rate_limit_headers(response):
+        response.headers.update(g.get("rate_limit_headers", {}))
+        return response
+
+    @mock.route("/oauth/authorize")
+    def authorize():
+        redirect_uri = request.args.get("redirect_uri", "")
+        return redirect(f"{redirect_uri}?{urlencode({'code': f'athlete-{athlete_id}', 'scope': request.args.get('scope', '')})}")
+
+    @mock.route("/oauth/token", methods=["POST"])
+    def token():
+        grant = request.form.get("grant_type")
+        if grant == "authorization_code":
+            match = re.fullmatch(r"athlete-(\d+)", request.form.get("code", ""))
+            token_athlete = int(match.group(1)) if match else athlete_id
+        elif grant == "refresh_token":
+            match = re.fullmatch(r"refresh-(\d+)", request.form.get("refresh_token", ""))
+            if not match:
+                return error(400, "Bad Request")
+            token_athlete = int(match.group(1))
+        else:
+            return error(400, "Bad Request")
+        return jsonify(
+            {
+                "token_type": "Bearer",
+                "access_token": f"mock-{token_athlete}",
+                "refresh_token": f"refresh-{token_athlete}",
+                "expires_at": int(time.time()) + 6 * 3600,
+                "athlete": {"id": token_athlete, "firstname": "Mock", "lastname": f"Athlete {token_athlete}"},
+            }
+        )
+
+    @mock.route("/api/v3/<path:path>")
+    def api(path):
+        if mode == "synthetic":
+            return synthetic(path)
+        location = _recording_path(recordings, request.path, request.args.to_dict())
+        if mode == "replay":
+            if not os.path.exists(location):
+                return error(404, "Record Not Found")
+            with open(location) as handle:
+                recorded = json.load(handle)
+            response = jsonify(recorded["body"])
+            response.status_code = recorded["status"]
+            return response
+
+        upstream = requests.get(
+            f"{STRAVA_ORIGIN}{request.path}",
+            params=request.args,
+            headers={"Authorization": request.headers.get("Authorization", "")},
+            timeout=30,
+        )
+        try:
+            body = upstream.json()
+        except ValueError:
+            body = {"message": upstream.text}
+        if upstream.status_code != 429:
+            with open(location, "w") as handle:
+                json.dump({"status": upstream.status_code, "path": request.path, "query": request.args.to_dict(), "body": body}, handle)
+        response = jsonify(body)
+        response.status_code = upstream.status_code
+        for header in ("X-RateLimit-Limit", "X-RateLimit-Usage", "X-ReadRateLimit-Limit", "X-ReadRateLimit-Usage"):
+            if header in upstream.headers:
+                response.headers[header] = upstream.headers[header]
+        return response
+
+    def synthetic(path: str):
+        athlete = current_athlete()
+        athlete_data = data.athlete(athlete)
+        parts = path.strip("/").split("/")
+
+        if parts == ["athlete"]:
+            return jsonify(
+                {
+                    "id": athlete,
+                    "firstname": "Mock",
+                    "bikes": [{"id": bike_id, "name": name, "primary": index == 0} for index, (bike_id, name) in enumerate(BIKES)],
+                }
+            )
+        if parts == ["athlete", "activities"]:
+            summaries = [
+                {key: value for key, value in activity.items() if key != "segment_efforts"}
+                for activity in _page(athlete_data["activity_list"])
+            ]
+            return jsonify(summaries)
+        if len(parts) == 2 and parts[0] == "gear":
+            name = dict(BIKES).get(parts[1])
+            return jsonify({"id": parts[1], "name": name}) if name else error(404, "Record Not Found")
+        if len(parts) >= 2 and parts[0] == "segments" and parts[1].isdigit():
+            if int(parts[1]) != SEGMENT_ID:
+                return error(404, "Record Not Found")
+            if len(parts) == 2:
+                return jsonify(data.segment)
+            if parts[2:] == ["all_efforts"]:
+                return jsonify(_page(athlete_data["efforts"]))
+        if len(parts) >= 2 and parts[0] == "activities" and parts[1].isdigit():
+            activity = athlete_data["activities"].get(int(parts[1]))
+            if activity is None:
+                return error(404, "Record Not Found")
+            if len(parts) == 2:
+                return jsonify(activity)
+            if parts[2:] == ["streams"]:
+                return jsonify(data.streams_for(activity)) if data.streams else error(404, "Record Not Found")
+        return error(404, "Record Not Found")
+
+    @mock.route("/mock/stats")
+    def stats():
+        return jsonify({"calls": dict(calls), "rate_limit_usage": limiter.usage()})
+
+    @mock.route("/mock/reset", methods=["POST"])
+    def reset():
+        calls.clear()
+        return jsonify({"ok": True})
+
+    return mock
+
+
+class MockServer:
+    """Run a mock app on a background thread: `with MockServer(app) as server: server.url`."""
+
+    def __init__(self, mock: Flask, host: str = "127.0.0.1", port: int = 0, quiet: bool = True):
+        self.app = mock
+        if quiet:
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._server = make_server(host, port, mock, threaded=True)
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """Environment for app.py to use this server instead of Strava."""
+        return {
+            "STRAVA_API_BASE": f"{self.url}/api/v3",
+            "STRAVA_TOKEN_URL": f"{self.url}/oauth/token",
+            "STRAVA_AUTH_URL": f"{self.url}/oauth/authorize",
+        }
+
+    def wait(self) -> None:
+        self._thread.join()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """Mock server options, shared with the harnesses that start one."""
+    parser.add_argument("--mode", choices=("synthetic", "record", "replay"), default="synthetic")
+    parser.add_argument("--efforts", type=int, default=2000, help="synthetic efforts per athlete")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--short-limit", type=int, default=200, help="requests per rate-limit window")
+    parser.add_argument("--daily-limit", type=int, default=2000)
+    parser.add_argument("--window-seconds", type=int, default=900, help="rate-limit window length")
+    parser.add_argument("--recordings", help="directory of recorded responses (record/replay modes)")
+    parser.add_argument("--no-streams", action="store_true", help="answer /streams with 404")
+
+
+def create_app_from_args(args: argparse.Namespace, athlete_id: int = DEFAULT_ATHLETE_ID) -> Flask:
+    return create_app(
+        mode=args.mode,
+        efforts=args.efforts,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        short_limit=args.short_limit,
+        daily_limit=args.daily_limit,
+        window_seconds=args.window_seconds,
+        recordings=args.recordings,
+        athlete_id=athlete_id,
+        streams=not args.no_streams,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--athlete-id", type=int, default=DEFAULT_ATHLETE_ID, help="athlete for /oauth/authorize")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(create_app_from_args(args, args.athlete_id), args.host, args.port, quiet=False)
+    for name, value in server.env.items():
+        print(f"{name}={value}")
+    print(f"Segment id: {SEGMENT_ID}")
+    with server:
+        try:
+            server.wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Synthetic effort generator shared by the benchmarks.
+
+Efforts look like rows returned by StravaRepository.get_efforts: a rider with a
+handful of bikes repeating one climb over several years.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+BIKES = [("b1001", "Tarmac SL7"), ("b1002", "Aethos"), ("b1003", "Crux Gravel"), ("b1004", "Turbo Trainer")]
+
+
+def generate_efforts(count: int, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    start = datetime(2016, 1, 1, 7, 0, tzinfo=timezone.utc)
+    efforts = []
+    for index in range(count):
+        bike_id, bike_name = rng.choice(BIKES)
+        hr = rng.gauss(142, 9) if rng.random() > 0.05 else None
+        watts = rng.gauss(245, 35) if rng.random() > 0.1 else None
+        elapsed = max(240, int(rng.gauss(420, 45)))
+        started = start + timedelta(minutes=index * 97 + rng.randint(0, 60))
+        efforts.append(
+            {
+                "id": 3_000_000_000 + index,
+                "start_date": started.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "start_epoch": int(started.timestamp()),
+                "local_date": (started + timedelta(hours=1)).strftime("%Y-%m-%d"),
+                "bike_id": bike_id,
+                "bike_name": bike_name,
+                "elapsed_time": elapsed,
+                "moving_time": elapsed - rng.randint(0, 5),
+                "distance": 2450.3,
+                "average_heartrate": round(hr, 1) if hr else None,
+                "max_heartrate": round(hr + rng.uniform(5, 15), 1) if hr else None,
+                "average_watts": round(watts, 1) if watts else None,
+                "normalized_watts": round(watts * 1.03, 1) if watts else None,
+                "efficiency": round(watts / hr, 3) if hr and watts else None,
+                "vam": round(210.0 / elapsed * 3600, 0),
+                "name": rng.choice(["Morning Ride", "Lunch Ride", "Hill repeats", "Z2 endurance"]),
+                "activity_id": 9_000_000_000 + index // 2,
+                "hr_drift_pct": round(rng.gauss(3, 2), 1) if hr else None,
+                "time_in_zones": [0, rng.randint(0, 60), rng.randint(60, 200), rng.randint(0, 200), 0] if hr else None,
+            }
+        )
+    efforts.sort(key=lambda effort: effort["start_date"], reverse=True)
+    return efforts
+
+
+def generate_strava_payload(count: int, seed: int = 42) -> Tuple[Dict, List[Dict], Dict[int, Dict]]:
+    """
+    The same efforts as raw Strava API data: (segment, /all_efforts items,
+    activities by id), i.e. the inputs of app.build_effort_payload.
+    """
+    segment = {"id": 7_000_001, "name": "Synthetic Climb", "distance": 2450.3, "total_elevation_gain": 210.0}
+    raw_efforts = []
+    activities: Dict[int, Dict] = {}
+    for effort in generate_efforts(count, seed):
+        activity_id = effort["activity_id"]
+        raw_efforts.append(
+            {
+                "id": effort["id"],
+                "activity": {"id": activity_id},
+                "segment": {"id": segment["id"]},
+                "start_date": effort["start_date"],
+                "elapsed_time": effort["elapsed_time"],
+                "moving_time": effort["moving_time"],
+                "distance": effort["distance"],
+                "average_heartrate": effort["average_heartrate"],
+                "max_heartrate": effort["max_heartrate"],
+                "average_watts": effort["average_watts"],
+                "weighted_average_watts": effort["normalized_watts"],
+                "device_watts": effort["average_watts"] is not None,
+                "start_index": 120,
+                "end_index": 120 + effort["elapsed_time"],
+            }
+        )
+        activities.setdefault(
+            activity_id,
+            {
+                "id": activity_id,
+                "name": effort["name"],
+                "gear_id": effort["bike_id"],
+                "bike_name": effort["bike_name"],
+                "start_date": effort["start_date"],
+            },
+        )
+    return segment, raw_efforts, activities
@@ -0,0 +1,43 @@
+// Client-side cost of an /efforts payload, for bench_wire_format.py.
+//
+//     node benchmarks/wire_format_parse.js REPEAT BODY_FILE...
+//
+// For each body prints {"parse_ms", "load_ms"} as one JSON line: JSON.parse
+// alone, and what the analyzer does before it can filter: JSON.parse,
+// effortsFromPayload() and buildEffortQueryColumns().
+
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+
+const context = vm.createContext({});
+const scripts = ['effort-columns.js', 'effort-query.js']
+    .map(name => fs.readFileSync(path.join(__dirname, '..', 'static', 'js', name), 'utf8'));
+vm.runInContext(
+    scripts.join('\n')
+        + '\nthis.effortsFromPayload = effortsFromPayload; this.buildEffortQueryColumns = buildEffortQueryColumns;',
+    context,
+);
+
+function bestOf(repeat, fn) {
+    let best = Infinity;
+    for (let i = 0; i < repeat; i++) {
+        const started = process.hrtime.bigint();
+        fn();
+        best = Math.min(best, Number(process.hrtime.bigint() - started) / 1e6);
+    }
+    return best;
+}
+
+function load(body) {
+    return context.buildEffortQueryColumns(context.effortsFromPayload(JSON.parse(body)));
+}
+
+const repeat = Number(process.argv[2]);
+for (const file of process.argv.slice(3)) {
+    const body = fs.readFileSync(file, 'utf8');
+    console.log(JSON.stringify({
+        parse_ms: bestOf(repeat, () => JSON.parse(body)),
+        load_ms: bestOf(repeat, () => load(body)),
+    }));
+}
@@ -0,0 +1,531 @@
+"""
+Offline import of a Strava bulk-export archive (Settings > My Account >
+Download or Delete Your Account).
+
+The archive holds activities.csv (one row per activity, including name, gear,
+start date, distance, heart rate and power) and the original activity files
+under activities/ as GPX, TCX or FIT, optionally gzipped. import_archive turns
+them into the same activity rows /activities/{id} would give, without API
+calls:
+
+* activities.csv is authoritative for every field it has;
+* activity files fill what it lacks (normalized power, averages of older
+  exports), parsed on a process pool since decoding tracks is CPU bound;
+* rows are upserted in chunks of `chunk_size`, one transaction each, and
+  copied onto the athlete's stored efforts like fetched activities are.
+
+Gear is exported by name only; names are matched against gear already
+stored for the athlete to recover gear ids.
+"""
+
+import csv
+import gzip
+import io
+import logging
+import math
+import os
+import struct
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import streams
+
+logger = logging.getLogger(__name__)
+
+FIT_EPOCH_OFFSET = 631065600  # 1989-12-31T00:00:00Z, the FIT timestamp origin
+SEMICIRCLES_TO_DEGREES = 180.0 / 2**31
+EARTH_RADIUS_M = 6371008.8
+MOVING_SPEED_MPS = 0.5
+CSV_DATE_FORMAT = "%b %d, %Y, %I:%M:%S %p"
+
+
+@dataclass
+class Track:
+    """Samples of one activity file; missing values are NaN, time is epoch seconds."""
+
+    time: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    altitude: np.ndarray
+    distance: np.ndarray
+    heartrate: np.ndarray
+    watts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+@dataclass
+class ImportResult:
+    athlete_id: int
+    activities: int = 0
+    skipped: int = 0
+    files_parsed: int = 0
+    files_failed: int = 0
+    efforts_updated: int = 0
+    seconds: float = 0.0
+
+
+def _track_from_columns(columns: Dict[str, List[float]]) -> Track:
+    order = np.argsort(np.asarray(columns["time"], dtype=np.float64), kind="stable")
+    return Track(**{key: np.asarray(values, dtype=np.float64)[order] for key, values in columns.items()})
+
+
+def _empty_columns() -> Dict[str, List[float]]:
+    return {key: [] for key in ("time", "lat", "lng", "altitude", "distance", "heartrate", "watts")}
+
+
+def _iso_epoch(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _float(value: Optional[str]) -> float:
+    try:
+        return float(value) if value not in (None, "") else math.nan
+    except ValueError:
+        return math.nan
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_points(data: bytes, point_tag: str, fields: Dict[str, str]) -> Track:
+    """GPX/TCX: one sample per `point_tag` element, from descendants named in `fields` (local name -> column)."""
+    columns = _empty_columns()
+    for _, element in ET.iterparse(io.BytesIO(data), events=("end",)):
+        if _local_name(element.tag) != point_tag:
+            continue
+        values = {"lat": _float(element.get("lat")), "lng": _float(element.get("lon"))}
+        timestamp = None
+        for child in element.iter():
+            name = _local_name(child.tag)
+            if name == "time" or name == "Time":
+                timestamp = _iso_epoch(child.text)
+            elif name in fields and child.text and child.text.strip():
+                values[fields[name]] = _float(child.text)
+        element.clear()
+        if timestamp is None:
+            continue
+        columns["time"].append(timestamp)
+        for key in ("lat", "lng", "altitude", "distance", "heartrate", "watts"):
+            columns[key].append(values.get(key, math.nan))
+    return _track_from_columns(columns)
+
+
+GPX_FIELDS = {"ele": "altitude", "hr": "heartrate", "heartrate": "heartrate", "power": "watts", "watts": "watts"}
+TCX_FIELDS = {
+    "LatitudeDegrees": "lat",
+    "LongitudeDegrees": "lng",
+    "AltitudeMeters": "altitude",
+    "DistanceMeters": "distance",
+    "Value": "heartrate",  # HeartRateBpm/Value
+    "Watts": "watts",
+}
+
+
+def parse_gpx(data: bytes) -> Track:
+    return _parse_points(data, "trkpt", GPX_FIELDS)
+
+
+def parse_tcx(data: bytes) -> Track:
+    # Some exporters pad TCX files with leading whitespace, which the XML parser rejects.
+    return _parse_points(data.lstrip(), "Trackpoint", TCX_FIELDS)
+
+
+# FIT base type number -> (struct format, invalid value)
+_FIT_BASE_TYPES = {
+    0x00: ("B", 0xFF), 0x01: ("b", 0x7F), 0x02: ("B", 0xFF), 0x83: ("h", 0x7FFF), 0x84: ("H", 0xFFFF),
+    0x85: ("i", 0x7FFFFFFF), 0x86: ("I", 0xFFFFFFFF), 0x88: ("f", None), 0x89: ("d", None), 0x0A: ("B", 0),
+    0x8B: ("H", 0), 0x8C: ("I", 0), 0x8E: ("q", 0x7FFFFFFFFFFFFFFF), 0x8F: ("Q", 0xFFFFFFFFFFFFFFFF),
+    0x90: ("Q", 0),
+}
+FIT_RECORD_MESSAGE = 20
+# record field number -> (column, scale, offset)
+FIT_RECORD_FIELDS = {
+    253: ("time", 1, -FIT_EPOCH_OFFSET),
+    0: ("lat", 1 / SEMICIRCLES_TO_DEGREES, 0),
+    1: ("lng", 1 / SEMICIRCLES_TO_DEGREES, 0),
+    2: ("altitude", 5, 500),
+    78: ("altitude", 5, 500),  # enhanced_altitude
+    5: ("distance", 100, 0),
+    3: ("heartrate", 1, 0),
+    7: ("watts", 1, 0),
+}
+
+
+def parse_fit(data: bytes) -> Track:
+    """
+    Decode the record messages of a FIT file: definition and data messages,
+    compressed-timestamp headers and developer fields (skipped). Other
+    messages are skipped by size.
+    """
+    if len(data) < 12 or data[8:12] != b".FIT":
+        raise ValueError("not a FIT file")
+    header_size = data[0]
+    end = min(len(data), header_size + struct.unpack_from("<I", data, 4)[0])
+    position = header_size
+    definitions: Dict[int, Tuple] = {}
+    columns = _empty_columns()
+    last_timestamp = 0
+
+    while position < end:
+        record_header = data[position]
+        position += 1
+        if record_header & 0x80:
+            # Compressed timestamp header: a data message whose timestamp is a 5-bit offset.
+            local_type = (record_header >> 5) & 0x03
+            offset = record_header & 0x1F
+            timestamp = (last_timestamp & ~0x1F) + offset
+            if offset < (last_timestamp & 0x1F):
+                timestamp += 0x20
+        elif record_header & 0x40:
+            local_type = record_header & 0x0F
+            architecture = data[position + 1]
+            endian = ">" if architecture == 1 else "<"
+            global_number = struct.unpack_from(endian + "H", data, position + 2)[0]
+            field_count = data[position + 4]
+            position += 5
+            formats, fields = [], []
+            for _ in range(field_count):
+                number, size, base_type = data[position], data[position + 1], data[position + 2]
+                position += 3
+                type_format, invalid = _FIT_BASE_TYPES.get(base_type, (None, None))
+                if type_format and struct.calcsize("<" + type_format) == size:
+                    formats.append(type_format)
+                    fields.append((number, invalid))
+                else:
+                    formats.append(f"{size}s")
+                    fields.append((None, None))
+            if record_header & 0x20:
+                developer_count = data[position]
+                position += 1
+                developer_size = sum(data[position + 3 * index + 1] for index in range(developer_count))
+                position += 3 * developer_count
+                if developer_size:
+                    formats.append(f"{developer_size}s")
+                    fields.append((None, None))
+            layout = struct.Struct(endian + "".join(formats))
+            definitions[local_type] = (global_number, layout, fields)
+            continue
+        else:
+            local_type = record_header & 0x0F
+            timestamp = None
+
+        if local_type not in definitions:
+            raise ValueError(f"FIT data message without definition (local type {local_type})")
+        global_number, layout, fields = definitions[local_type]
+        values = layout.unpack_from(data, position)
+        position += layout.size
+
+        decoded: Dict[int, float] = {}
+        for (number, invalid), value in zip(fields, values):
+            if number is not None and value != invalid:
+                decoded[number] = value
+        if 253 in decoded:
+            last_timestamp = int(decoded[253])
+        elif timestamp is not None:
+            last_timestamp = timestamp
+            decoded[253] = timestamp
+        if global_number != FIT_RECORD_MESSAGE or 253 not in decoded:
+            continue
+
+        row = {key: math.nan for key in columns}
+        for number, (column, scale, offset) in FIT_RECORD_FIELDS.items():
+            if number in decoded:
+                row[column] = decoded[number] / scale - offset
+        for key, value in row.items():
+            columns[key].append(value)
+
+    return _track_from_columns(columns)
+
+
+def parse_activity_file(name: str, data: bytes) -> Track:
+    """Parse a .gpx/.tcx/.fit file, gunzipping *.gz first."""
+    lowered = name.lower()
+    if lowered.endswith(".gz"):
+        data = gzip.decompress(data)
+        lowered = lowered[:-3]
+    if lowered.endswith(".gpx"):
+        return parse_gpx(data)
+    if lowered.endswith(".tcx"):
+        return parse_tcx(data)
+    if lowered.endswith(".fit"):
+        return parse_fit(data)
+    raise ValueError(f"unsupported activity file {name}")
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (vectorised)."""
+    lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def track_distance(track: Track) -> np.ndarray:
+    """Cumulative distance per sample: the recorded distance where present, else integrated from positions."""
+    if len(track) and np.isfinite(track.distance).any():
+        return np.fmax.accumulate(np.nan_to_num(track.distance, nan=0.0))
+    has_position = np.isfinite(track.lat) & np.isfinite(track.lng)
+    steps = np.zeros(len(track))
+    if has_position.sum() > 1:
+        index = np.flatnonzero(has_position)
+        steps[index[1:]] = haversine_m(track.lat[index[:-1]], track.lng[index[:-1]], track.lat[index[1:]], track.lng[index[1:]])
+    return np.cumsum(steps)
+
+
+def summarize_track(track: Track) -> Dict:
+    """Activity summary fields (as in /activities/{id}) computed from a parsed file."""
+    if len(track) == 0:
+        return {}
+    distance = track_distance(track)
+    dt = np.diff(track.time)
+    moving = dt[(np.diff(distance) / np.where(dt > 0, dt, np.inf)) >= MOVING_SPEED_MPS]
+    summary: Dict = {
+        "start_date": datetime.fromtimestamp(track.time[0], tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "elapsed_time": int(round(track.time[-1] - track.time[0])),
+        "moving_time": int(round(moving.sum())),
+        "distance": round(float(distance[-1]), 1),
+    }
+    heartrate = track.heartrate[np.isfinite(track.heartrate) & (track.heartrate > 0)]
+    if len(heartrate):
+        summary["average_heartrate"] = round(float(heartrate.mean()), 1)
+        summary["max_heartrate"] = float(heartrate.max())
+    has_watts = np.isfinite(track.watts)
+    if has_watts.any():
+        watts = np.nan_to_num(track.watts, nan=0.0)
+        summary["average_watts"] = round(float(watts.mean()), 1)
+        summary["weighted_average_watts"] = round(streams.normalized_power(watts, track.time), 1)
+    return summary
+
+
+def _columns(header: List[str]) -> Dict[str, List[int]]:
+    positions: Dict[str, List[int]] = {}
+    for index, name in enumerate(header):
+        positions.setdefault(name.strip(), []).append(index)
+    return positions
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    if value is None or not value.strip():
+        return None
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_activities_csv(text: str) -> List[Dict]:
+    """
+    Rows of activities.csv as activity dicts. Strava repeats some column
+    names: the first Distance is in km and the last in metres, so the last
+    occurrence of a repeated column is used.
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, None)
+    if not header:
+        return []
+    positions = _columns(header)
+
+    def cell(row: List[str], name: str) -> Optional[str]:
+        for index in reversed(positions.get(name, [])):
+            if index < len(row) and row[index].strip():
+                return row[index].strip()
+        return None
+
+    activities = []
+    for row in reader:
+        activity_id = _number(cell(row, "Activity ID"))
+        if activity_id is None:
+            continue
+        start_date = None
+        if cell(row, "Activity Date"):
+            try:
+                start_date = datetime.strptime(cell(row, "Activity Date"), CSV_DATE_FORMAT).strftime("%Y-%m-%dT%H:%M:%SZ")
+            except ValueError:
+                start_date = None
+        distance = _number(cell(row, "Distance"))
+        if distance is not None and len(positions.get("Distance", [])) == 1:
+            distance *= 1000  # exports with a single Distance column report km
+        elapsed = _number(cell(row, "Elapsed Time"))
+        moving = _number(cell(row, "Moving Time"))
+        activity = {
+            "id": int(activity_id),
+            "name": cell(row, "Activity Name"),
+            "type": cell(row, "Activity Type"),
+            "start_date": start_date,
+            "distance": distance,
+            "elapsed_time": int(elapsed) if elapsed is not None else None,
+            "moving_time": int(moving) if moving is not None else None,
+            "average_heartrate": _number(cell(row, "Average Heart Rate")),
+            "max_heartrate": _number(cell(row, "Max Heart Rate")),
+            "average_watts": _number(cell(row, "Average Watts")),
+            "weighted_average_watts": _number(cell(row, "Weighted Average Power")),
+            "gear_name": cell(row, "Activity Gear"),
+            "filename": cell(row, "Filename"),
+        }
+        activities.append(activity)
+    return activities
+
+
+def _find_member(archive: zipfile.ZipFile, name: str) -> Optional[str]:
+    for member in archive.namelist():
+        if member == name or member.endswith("/" + name):
+            return member
+    return None
+
+
+def read_athlete_id(archive: zipfile.ZipFile) -> Optional[int]:
+    member = _find_member(archive, "profile.csv")
+    if member is None:
+        return None
+    rows = list(csv.DictReader(io.StringIO(archive.read(member).decode("utf-8-sig"))))
+    value = _number(rows[0].get("Athlete ID")) if rows else None
+    return int(value) if value is not None else None
+
+
+# Per-process open archives; keyed by pid too, since forked workers must not share the parent's file offset.
+_worker_archives: Dict[Tuple[int, str], zipfile.ZipFile] = {}
+
+
+def read_member(archive_path: str, member: str) -> bytes:
+    """Read an archive member through this process's cached ZipFile (for process-pool tasks)."""
+    key = (os.getpid(), archive_path)
+    archive = _worker_archives.get(key)
+    if archive is None:
+        archive = _worker_archives[key] = zipfile.ZipFile(archive_path)
+    return archive.read(member)
+
+
+def close_member_archive(archive_path: str) -> None:
+    archive = _worker_archives.pop((os.getpid(), archive_path), None)
+    if archive is not None:
+        archive.close()
+
+
+def _summarize_member(task: Tuple[str, str]) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """Process-pool task: parse one archive member. Returns (member, summary, error)."""
+    archive_path, member = task
+    try:
+        return member, summarize_track(parse_activity_file(member, read_member(archive_path, member))), None
+    except Exception as exc:  # corrupt files are reported, not fatal
+        return member, None, f"{type(exc).__name__}: {exc}"
+
+
+def summarize_files(archive_path: str, members: List[str], workers: Optional[int] = None) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """Parse activity files in parallel (workers=1 parses in this process); yields in `members` order."""
+    tasks = [(archive_path, member) for member in members]
+    if workers == 1 or len(tasks) < 2:
+        try:
+            yield from map(_summarize_member, tasks)
+        finally:
+            close_member_archive(archive_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_summarize_member, tasks, chunksize=8)
+
+
+def read_archive_index(archive_path: str, athlete_id: Optional[int] = None) -> Tuple[int, List[Dict], Dict[int, str]]:
+    """(athlete id, activities.csv rows, activity id -> archive member of its file) of a bulk export."""
+    with zipfile.ZipFile(archive_path) as archive:
+        athlete_id = athlete_id or read_athlete_id(archive)
+        if athlete_id is None:
+            raise ValueError("The archive has no profile.csv with an Athlete ID; pass the athlete id")
+        csv_member = _find_member(archive, "activities.csv")
+        if csv_member is None:
+            raise ValueError("The archive has no activities.csv")
+        activities = parse_activities_csv(archive.read(csv_member).decode("utf-8-sig"))
+        members = set(archive.namelist())
+    prefix = csv_member[: -len("activities.csv")]
+    files = {
+        activity["id"]: prefix + activity["filename"]
+        for activity in activities
+        if activity.get("filename") and prefix + activity["filename"] in members
+    }
+    return athlete_id, activities, files
+
+
+def resolve_gear(activity: Dict, gear_ids: Dict[str, str]) -> Dict:
+    """Replace an activities.csv gear name with gear_id/gear as /activities/{id} has them."""
+    gear_name = activity.pop("gear_name", None)
+    gear_id = gear_ids.get(gear_name) if gear_name else None
+    activity["gear_id"] = gear_id
+    activity["gear"] = {"id": gear_id, "name": gear_name} if gear_name else None
+    return activity
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def import_archive(
+    archive_path: str,
+    repository,
+    athlete_id: Optional[int] = None,
+    workers: Optional[int] = None,
+    parse_files: bool = True,
+    chunk_size: int = 1000,
+    progress: Optional[Callable[[str], None]] = None,
+) -> ImportResult:
+    """Import activities from a bulk-export zip into `repository` (a StravaRepository)."""
+    started = time.perf_counter()
+    progress = progress or (lambda message: None)
+    athlete_id, activities, files = read_archive_index(archive_path, athlete_id)
+
+    # Activities already fetched from the API carry more detail than the export; leave them alone.
+    stored = repository.get_activity_ids(athlete_id)
+    result = ImportResult(athlete_id=athlete_id, skipped=sum(1 for activity in activities if activity["id"] in stored))
+    activities = [activity for activity in activities if activity["id"] not in stored]
+    gear_ids = repository.get_gear_ids_by_name(athlete_id)
+    by_member = {files[activity["id"]]: activity for activity in activities if parse_files and activity["id"] in files}
+    progress(f"{len(activities)} new activities ({result.skipped} already stored), {len(by_member)} activity files to parse")
+
+    if by_member:
+        for done, (member, summary, error) in enumerate(
+            summarize_files(archive_path, list(by_member), workers=workers), start=1
+        ):
+            if error:
+                result.files_failed += 1
+                logger.warning("Could not parse %s: %s", member, error)
+                continue
+            result.files_parsed += 1
+            activity = by_member[member]
+            for key, value in (summary or {}).items():
+                if activity.get(key) is None:
+                    activity[key] = value
+            if done % 500 == 0:
+                progress(f"parsed {done}/{len(by_member)} files")
+
+    for chunk in _chunks(activities, max(1, chunk_size)):
+        payloads: Dict[int, Dict] = {}
+        for activity in chunk:
+            resolve_gear(activity, gear_ids)
+            activity["source"] = "bulk_export"
+            payloads[activity["id"]] = activity
+        repository.upsert_activities(athlete_id, payloads)
+        result.efforts_updated += repository.apply_activities_to_efforts(athlete_id, list(payloads))
+        result.activities += len(payloads)
+        progress(f"stored {result.activities}/{len(activities)} activities")
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
@@ -0,0 +1,138 @@
+"""
+Headless batch syncs of many (athlete, segment) pairs, for cron jobs.
+
+BulkSync runs `sync_once(job)` for every job on a thread pool, repeating it
+until the segment's backfill is complete: each call is one resumable
+sync_segment_batch run, whose progress is kept in sync_state, so an
+interrupted bulk sync picks up where it stopped. A segment is complete once
+its backfill is done and its enrichment backlog is empty. When `sync_once` raises
+RetryLater (API budget spent, Strava 429) the job waits for the next window
+or, with wait disabled, stops as "partial".
+
+The Strava-specific parts (credentials, the sync itself) live in app.py's
+`bulk-sync` command; this module only schedules and reports.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+COMPLETE = "complete"
+PARTIAL = "partial"
+FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class SyncJob:
+    athlete_id: int
+    segment_id: int
+
+
+@dataclass
+class SyncProgress:
+    completed: bool
+    next_page: int
+    efforts: int
+    # Activities still waiting for their details (the enrichment backlog).
+    backlog: int = 0
+
+
+@dataclass
+class JobResult:
+    job: SyncJob
+    status: str = PARTIAL
+    runs: int = 0
+    efforts: int = 0
+    next_page: int = 1
+    backlog: int = 0
+    waited_seconds: float = 0.0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class RetryLater(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@dataclass
+class BulkSync:
+    sync_once: Callable[[SyncJob], SyncProgress]
+    concurrency: int = 2
+    max_runs: int = 50
+    wait: bool = True
+    max_wait_seconds: float = 900.0
+    progress: Callable[[str], None] = print
+    sleep: Callable[[float], None] = time.sleep
+    _done: int = field(default=0, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def run(self, jobs: Sequence[SyncJob]) -> List[JobResult]:
+        self._done = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="bulk-sync") as pool:
+            return list(pool.map(lambda job: self._run_job(job, len(jobs)), jobs))
+
+    def _run_job(self, job: SyncJob, total: int) -> JobResult:
+        result = JobResult(job)
+        started = time.perf_counter()
+        while result.runs < self.max_runs:
+            result.runs += 1
+            try:
+                progress = self.sync_once(job)
+            except RetryLater as exc:
+                if not self.wait or exc.retry_after > self.max_wait_seconds:
+                    result.error = exc.reason
+                    break
+                self.progress(
+                    f"athlete={job.athlete_id} segment={job.segment_id}: {exc.reason}, waiting {exc.retry_after:.0f}s"
+                )
+                self.sleep(exc.retry_after)
+                result.waited_seconds += exc.retry_after
+                continue
+            except Exception as exc:
+                result.status = FAILED
+                result.error = str(exc) or type(exc).__name__
+                break
+            result.efforts, result.next_page, result.backlog = progress.efforts, progress.next_page, progress.backlog
+            if progress.completed:
+                result.status = COMPLETE
+                result.error = None
+                break
+        result.seconds = time.perf_counter() - started
+        with self._lock:
+            self._done += 1
+            done = self._done
+        self.progress(f"[{done}/{total}] {describe(result)}")
+        return result
+
+
+def describe(result: JobResult) -> str:
+    text = (
+        f"athlete={result.job.athlete_id} segment={result.job.segment_id} {result.status}"
+        f" runs={result.runs} efforts={result.efforts} {result.seconds:.1f}s"
+    )
+    if result.status != COMPLETE:
+        text += f" next_page={result.next_page} backlog={result.backlog}"
+    if result.error:
+        text += f" ({result.error})"
+    return text
+
+
+def summarize(results: Sequence[JobResult], api_calls: Optional[int] = None) -> str:
+    counts: Dict[str, int] = {COMPLETE: 0, PARTIAL: 0, FAILED: 0}
+    for result in results:
+        counts[result.status] += 1
+    lines = [
+        f"{len(results)} segment syncs: {counts[COMPLETE]} complete, {counts[PARTIAL]} partial, {counts[FAILED]} failed",
+        f"efforts stored: {sum(result.efforts for result in results)}"
+        f", sync runs: {sum(result.runs for result in results)}"
+        f", waited for budget: {sum(result.waited_seconds for result in results):.0f}s",
+    ]
+    if api_calls is not None:
+        lines.append(f"Strava API calls: {api_calls}")
+    lines.extend(f"  {describe(result)}" for result in results if result.status != COMPLETE)
+    return "\n".join(lines)
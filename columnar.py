@@ -0,0 +1,84 @@
+"""
+Columnar wire format for effort lists (`/efforts?format=columnar`).
+
+Instead of one object per effort repeating every key, the payload holds one
+array per field. Dates travel as epoch seconds and low-cardinality strings
+(bike ids and names) are dictionary-encoded into integer codes, so the
+client can load numeric columns straight into typed arrays. Fields without a
+compact encoding (names, per-effort lists such as time_in_zones) are plain
+arrays of their row values, so every field of the row format is carried.
+"""
+
+from typing import Dict, List, Optional
+
+from dates import epoch_to_iso, iso_to_epoch
+
+FORMAT_VERSION = 1
+
+NUMERIC_FIELDS = (
+    "id",
+    "activity_id",
+    "start_epoch",
+    "elapsed_time",
+    "moving_time",
+    "distance",
+    "average_heartrate",
+    "max_heartrate",
+    "average_watts",
+    "normalized_watts",
+    "efficiency",
+    "vam",
+    "decoupling_pct",
+    "hr_drift_pct",
+)
+EPOCH_FIELDS = ("start_date",)
+DICTIONARY_FIELDS = ("bike_id", "bike_name")
+STRING_FIELDS = ("name", "local_date")
+LIST_FIELDS = ("time_in_zones",)
+
+
+def to_columnar(efforts: List[Dict]) -> Dict:
+    """Encode a list of effort dicts (as returned by get_efforts) into the columnar payload."""
+    columns: Dict[str, List] = {}
+    for field in NUMERIC_FIELDS:
+        columns[field] = [effort.get(field) for effort in efforts]
+    for field in EPOCH_FIELDS:
+        columns[field] = [iso_to_epoch(effort.get(field)) for effort in efforts]
+    for field in STRING_FIELDS + LIST_FIELDS:
+        columns[field] = [effort.get(field) for effort in efforts]
+
+    dictionaries: Dict[str, List] = {}
+    for field in DICTIONARY_FIELDS:
+        codes: Dict[Optional[str], int] = {}
+        encoded = []
+        for effort in efforts:
+            value = effort.get(field)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            encoded.append(code)
+        columns[field] = encoded
+        dictionaries[field] = list(codes)
+
+    return {
+        "format": "columnar",
+        "version": FORMAT_VERSION,
+        "count": len(efforts),
+        "columns": columns,
+        "dictionaries": dictionaries,
+    }
+
+
+def from_columnar(payload: Dict) -> List[Dict]:
+    """Decode a columnar payload back to effort dicts (dates as UTC ISO strings)."""
+    columns = payload["columns"]
+    dictionaries = payload["dictionaries"]
+    efforts = []
+    for index in range(payload["count"]):
+        effort = {field: columns[field][index] for field in NUMERIC_FIELDS + STRING_FIELDS + LIST_FIELDS}
+        for field in EPOCH_FIELDS:
+            effort[field] = epoch_to_iso(columns[field][index])
+        for field in DICTIONARY_FIELDS:
+            effort[field] = dictionaries[field][columns[field][index]]
+        efforts.append(effort)
+    return efforts
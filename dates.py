@@ -0,0 +1,21 @@
+"""Date conversions shared by storage and the wire formats."""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def iso_to_epoch(value: Optional[str]) -> Optional[int]:
+    """UTC epoch seconds of an ISO 8601 timestamp (a trailing Z is accepted); None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+def epoch_to_iso(value: Optional[float]) -> Optional[str]:
+    """Strava-style UTC timestamp (2025-03-01T08:30:00Z) for epoch seconds."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -0,0 +1,65 @@
+"""
+Background top-ups of the activity enrichment backlog.
+
+Efforts are stored as soon as their all_efforts page arrives. The activity
+details that complete them (bike, activity name, normalized power) cost one
+API call per activity, so they are fetched later from a backlog ordered by
+what users look at: activities with efforts inside the date window being
+viewed first, then the most recent ones
+(StravaRepository.get_missing_bike_activity_ids).
+
+EnrichmentScheduler runs those top-ups on one background thread per process,
+at most one queued job per (segment, athlete), so repeated page loads do not
+stack up duplicate work or API calls.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Hashable, Set
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentScheduler:
+    def __init__(self, max_pending: int = 256):
+        self._queue: "queue.Queue" = queue.Queue(max_pending)
+        self._pending: Set[Hashable] = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, key: Hashable, job: Callable[[], None]) -> bool:
+        """Queue `job` unless a job for `key` is already waiting or running; returns whether it was queued."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((key, job))
+            except queue.Full:
+                logger.warning("Enrichment queue full, dropping job key=%s", key)
+                return False
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="enrichment", daemon=True)
+                self._thread.start()
+        return True
+
+    def is_pending(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def join(self) -> None:
+        """Block until every queued job has finished."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            key, job = self._queue.get()
+            try:
+                job()
+            except Exception:
+                logger.exception("Enrichment job failed key=%s", key)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
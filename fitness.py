@@ -0,0 +1,227 @@
+"""
+Athlete-wide fitness index.
+
+Readiness (readiness.py) compares an effort's EF with the baseline of its own
+segment. The fitness index does that for every segment of an athlete at once:
+each segment's baseline follows the compute_baseline rule, every Z2-strict
+effort is scored as Forme% against its segment's baseline, and the scores are
+averaged per day into one dated series.
+
+The computation works on column arrays with numpy group-bys (sort + segment
+boundaries), so its cost depends on the number of efforts, not on the number
+of segments. FitnessIndex keeps the columns per athlete and reloads only the
+segments whose efforts changed.
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from readiness import DEFAULT_CONFIG
+
+FITNESS_COLUMNS = ("segment_id", "start_epoch", "average_heartrate", "average_watts", "normalized_watts", "efficiency")
+DEFAULT_ROLLING_DAYS = 28
+
+
+def _floats(values: list) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def columns_to_arrays(columns: Dict[str, list]) -> Dict[str, np.ndarray]:
+    """
+    Typed arrays for the index: segment id, UTC day, HR, power used and EF.
+    Power and EF follow readiness.get_power_used / get_ef.
+    """
+    hr = _floats(columns["average_heartrate"])
+    normalized = _floats(columns["normalized_watts"])
+    average = _floats(columns["average_watts"])
+    # `normalized_watts or average_watts`: a missing or zero NP falls back to the average.
+    power = np.where(np.nan_to_num(normalized) != 0, normalized, average)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derived_ef = np.where(hr > 0, power / hr, np.nan)
+    efficiency = _floats(columns["efficiency"])
+    epochs = _floats(columns["start_epoch"])
+    known = ~np.isnan(epochs)
+    days = np.full(len(epochs), "NaT", dtype="datetime64[D]")
+    days[known] = (epochs[known] // 86400).astype(np.int64).astype("datetime64[D]")
+    return {
+        "segment_id": np.asarray(columns["segment_id"], dtype=np.int64),
+        "day": days,
+        "hr": hr,
+        "power": power,
+        "ef": np.where(np.isnan(efficiency), derived_ef, efficiency),
+    }
+
+
+def concat_arrays(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def z2_strict_mask(arrays: Dict[str, np.ndarray], config: Optional[dict] = None) -> np.ndarray:
+    """Vectorised readiness.is_z2_strict, additionally requiring a positive EF."""
+    config = config or DEFAULT_CONFIG
+    hr = arrays["hr"]
+    with np.errstate(invalid="ignore"):
+        return (
+            (hr >= config.get("z2HrMin", 132))
+            & (hr <= config.get("z2HrMax", 138))
+            & (arrays["power"] > 0)
+            & (arrays["ef"] > 0)
+        )
+
+
+def segment_baselines(arrays: Dict[str, np.ndarray], today: np.datetime64, config: Optional[dict] = None):
+    """
+    Baseline of every segment as of `today`: median of the top N EF among the
+    Z2-strict efforts of the last baselineWindowDays (readiness.compute_baseline).
+    Returns (segment_ids, baselines), segment ids ascending.
+    """
+    config = config or DEFAULT_CONFIG
+    cutoff = today - np.timedelta64(int(config.get("baselineWindowDays", 120)), "D")
+    top_n = int(config.get("baselineTopN", 10))
+
+    mask = z2_strict_mask(arrays, config) & (arrays["day"] >= cutoff)
+    segments = arrays["segment_id"][mask]
+    ef = arrays["ef"][mask]
+    if segments.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    # Group by segment with EF descending inside each group.
+    order = np.lexsort((-ef, segments))
+    segments, ef = segments[order], ef[order]
+    segment_ids, starts, sizes = np.unique(segments, return_index=True, return_counts=True)
+
+    # The top k = min(size, N) values are the first k of each group; their
+    # median sits at positions (k - 1) // 2 and k // 2.
+    k = np.minimum(sizes, top_n)
+    baselines = (ef[starts + (k - 1) // 2] + ef[starts + k // 2]) / 2
+    return segment_ids, baselines
+
+
+def compute_fitness_index(
+    arrays: Dict[str, np.ndarray],
+    config: Optional[dict] = None,
+    today: Optional[np.datetime64] = None,
+    rolling_days: int = DEFAULT_ROLLING_DAYS,
+) -> Dict:
+    """
+    Daily fitness series for one athlete.
+
+    Each Z2-strict effort on a segment with a baseline gets
+    Forme% = (EF / baseline - 1) * 100. Per day the series holds the number of
+    scored efforts and segments, their mean Forme%, and the effort-weighted
+    mean over the trailing `rolling_days` days.
+    """
+    config = config or DEFAULT_CONFIG
+    if today is None:
+        today = np.datetime64(datetime.now(timezone.utc).date(), "D")
+    segment_ids, baselines = segment_baselines(arrays, today, config)
+
+    result = {
+        "as_of": str(today),
+        "rolling_days": rolling_days,
+        "segments_with_baseline": int(segment_ids.size),
+        "scored_efforts": 0,
+        "series": [],
+    }
+    if segment_ids.size == 0:
+        return result
+
+    # Position of each effort's segment in segment_ids; efforts on segments without a baseline are not scored.
+    position = np.searchsorted(segment_ids, arrays["segment_id"])
+    position = np.minimum(position, segment_ids.size - 1)
+    has_baseline = segment_ids[position] == arrays["segment_id"]
+    scored = z2_strict_mask(arrays, config) & has_baseline & ~np.isnat(arrays["day"])
+    if not scored.any():
+        return result
+
+    days = arrays["day"][scored]
+    segments = arrays["segment_id"][scored]
+    forme = (arrays["ef"][scored] / baselines[position[scored]] - 1) * 100
+
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=forme)
+    # Distinct (day, segment) pairs, packed into one int64 key per effort.
+    stride = int(segments.max()) + 1
+    day_segment_keys = np.unique(inverse.astype(np.int64) * stride + segments)
+    segment_counts = np.bincount(day_segment_keys // stride, minlength=unique_days.size)
+
+    # Trailing window (day - rolling_days, day] from cumulative sums.
+    cumulative_sums = np.concatenate(([0.0], np.cumsum(sums)))
+    cumulative_counts = np.concatenate(([0], np.cumsum(counts)))
+    window_start = np.searchsorted(unique_days, unique_days - np.timedelta64(rolling_days - 1, "D"))
+    end = np.arange(1, unique_days.size + 1)
+    rolling = (cumulative_sums[end] - cumulative_sums[window_start]) / (
+        cumulative_counts[end] - cumulative_counts[window_start]
+    )
+
+    result["scored_efforts"] = int(scored.sum())
+    result["series"] = [
+        {
+            "date": str(day),
+            "count": int(count),
+            "segments": int(segment_count),
+            "forme_pct": round(float(total / count), 1),
+            "rolling_pct": round(float(window), 1),
+        }
+        for day, count, segment_count, total, window in zip(unique_days, counts, segment_counts, sums, rolling)
+    ]
+    return result
+
+
+class FitnessIndex:
+    """
+    Per-athlete fitness index with incremental refresh.
+
+    `load_columns(athlete_id, segment_ids)` returns FITNESS_COLUMNS lists for
+    the athlete (all segments when segment_ids is None); `load_versions(athlete_id)`
+    returns {segment_id: efforts data version}. The cached columns are keyed on
+    those versions, which are committed with the efforts they describe, so a
+    write from another process or repository shows up on the next get(); only
+    segments whose version moved are reloaded.
+    """
+
+    def __init__(
+        self,
+        load_columns: Callable[[int, Optional[List[int]]], Dict[str, list]],
+        load_versions: Callable[[int], Dict[int, int]],
+        config: Optional[dict] = None,
+    ):
+        self._load_columns = load_columns
+        self._load_versions = load_versions
+        self.config = config or DEFAULT_CONFIG
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Dict] = {}
+
+    def get(self, athlete_id: int, today: Optional[np.datetime64] = None, rolling_days: int = DEFAULT_ROLLING_DAYS) -> Dict:
+        if today is None:
+            today = np.datetime64(datetime.now(timezone.utc).date(), "D")
+        key = (str(today), rolling_days)
+        # Versions are read before the columns: rows loaded below are at least this new.
+        versions = self._load_versions(athlete_id)
+        with self._lock:
+            entry = self._entries.get(athlete_id)
+        if entry is not None and entry["versions"] == versions and entry["key"] == key:
+            return entry["result"]
+
+        if entry is None:
+            arrays = columns_to_arrays(self._load_columns(athlete_id, None))
+        else:
+            changed = sorted(
+                segment_id
+                for segment_id in versions.keys() | entry["versions"].keys()
+                if versions.get(segment_id) != entry["versions"].get(segment_id)
+            )
+            arrays = entry["arrays"]
+            if changed:
+                fresh = columns_to_arrays(self._load_columns(athlete_id, changed))
+                keep = ~np.isin(arrays["segment_id"], changed)
+                arrays = concat_arrays([{name: values[keep] for name, values in arrays.items()}, fresh])
+        result = compute_fitness_index(arrays, self.config, today, rolling_days)
+
+        with self._lock:
+            self._entries[athlete_id] = {"versions": versions, "arrays": arrays, "key": key, "result": result}
+        return result
@@ -0,0 +1,223 @@
+"""
+Per-request timing breakdown and Prometheus metrics.
+
+Each request adds up the time and call count of its components (Strava API
+calls, SQLite, analytics, serialisation) in flask.g. The totals go back to the
+client as a Server-Timing header and are observed into per-route histograms;
+/metrics renders all counters and histograms in the Prometheus text format.
+
+Metrics live in process memory, so with several gunicorn workers each worker
+reports its own values.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import g, has_request_context
+
+COMPONENTS = ("strava", "db", "analytics", "serialize")
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                    cumulative += count
+                    le = 'le="{}"'.format("+Inf" if bound == "+Inf" else _number(bound))
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request handling time by route.", ("route", "method", "status")
+)
+HTTP_COMPONENT_SECONDS = REGISTRY.histogram(
+    "http_request_component_seconds",
+    "Time per request spent in Strava calls, SQLite, analytics and serialisation, by route.",
+    ("route", "component"),
+)
+STRAVA_REQUEST_SECONDS = REGISTRY.histogram(
+    "strava_request_duration_seconds", "Strava API call time by endpoint and status.", ("endpoint", "status")
+)
+STRAVA_RATE_LIMITED = REGISTRY.counter(
+    "strava_rate_limited_total", "Strava responses with status 429, by endpoint.", ("endpoint",)
+)
+API_BUDGET_DEFERRED = REGISTRY.counter(
+    "api_budget_deferred_total", "Strava calls refused by the fair-share API budget, by priority.", ("priority",)
+)
+RATE_LIMIT_COOLDOWNS = REGISTRY.counter("rate_limit_cooldowns_total", "Segment/athlete sync cooldowns started.")
+SYNC_PAGES = REGISTRY.counter("sync_pages_total", "all_efforts pages processed by the sync.")
+SYNC_EFFORTS = REGISTRY.counter("sync_efforts_total", "Athlete efforts seen on processed sync pages.")
+SQLITE_STATEMENTS = REGISTRY.counter("sqlite_statements_total", "SQL statements executed.")
+
+
+def strava_endpoint(path: str) -> str:
+    """Collapse ids so /activities/123/streams becomes /activities/{id}/streams."""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+def start_request() -> None:
+    g.metrics_started = time.perf_counter()
+    g.metrics_components = {component: [0.0, 0] for component in COMPONENTS}
+
+
+def record(component: str, seconds: float, count: int = 1) -> None:
+    """Add time to the current request's component total (no-op outside a request)."""
+    if not has_request_context():
+        return
+    components = g.get("metrics_components")
+    if components is not None:
+        totals = components[component]
+        totals[0] += seconds
+        totals[1] += count
+
+
+@contextmanager
+def timed(component: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, time.perf_counter() - started)
+
+
+def record_strava_call(path: str, status: int, seconds: float) -> None:
+    endpoint = strava_endpoint(path)
+    STRAVA_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+    if status == 429:
+        STRAVA_RATE_LIMITED.inc(endpoint=endpoint)
+    record("strava", seconds)
+
+
+def record_db(seconds: float, statements: int) -> None:
+    """StravaRepository connection listener: one call per connection block."""
+    SQLITE_STATEMENTS.inc(statements)
+    record("db", seconds, statements)
+
+
+def server_timing(total_seconds: Optional[float] = None) -> str:
+    """Server-Timing header value for the current request."""
+    components = g.get("metrics_components") or {}
+    units = {"strava": "calls", "db": "queries", "analytics": "runs", "serialize": "runs"}
+    entries = [
+        f'{component};dur={seconds * 1000:.1f};desc="{count} {units[component]}"'
+        for component, (seconds, count) in components.items()
+        if count
+    ]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def finish_request(response, route: str, method: str):
+    """Observe the request into the histograms and attach its Server-Timing header."""
+    started = g.get("metrics_started")
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    HTTP_REQUEST_SECONDS.observe(total, route=route, method=method, status=response.status_code)
+    for component, (seconds, count) in g.metrics_components.items():
+        if count:
+            HTTP_COMPONENT_SECONDS.observe(seconds, route=route, component=component)
+    response.headers["Server-Timing"] = server_timing(total)
+    return response
@@ -0,0 +1,136 @@
+"""
+In-process cache of serialised API payloads.
+
+Entries are keyed by scope (e.g. segment and athlete) and tagged with the
+repository's efforts data version, so a write in any worker process makes the
+cached bytes unreachable. Bodies are serialised once and compressed lazily
+per content-coding, so repeat reads are a lookup plus a byte copy.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this size compression costs more than it saves on the wire.
+MIN_COMPRESS_BYTES = 1024
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def dumps(obj) -> bytes:
+    """Serialise to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content-coding from an Accept-Encoding header (None = identity)."""
+    if not accept_encoding:
+        return None
+
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CachedPayload:
+    __slots__ = ("body", "version", "etag", "_encoded", "_lock")
+
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.version = version
+        # Content-derived, so it stays valid across restarts and database rebuilds.
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """Return (bytes, applied encoding); small bodies are always sent as identity."""
+        if encoding is None or len(self.body) < MIN_COMPRESS_BYTES:
+            return self.body, None
+
+        cached = self._encoded.get(encoding)
+        if cached is not None:
+            return cached, encoding
+        with self._lock:
+            cached = self._encoded.get(encoding)
+            if cached is None:
+                if encoding == "br":
+                    cached = brotli.compress(self.body, quality=5)
+                else:
+                    cached = gzip.compress(self.body, compresslevel=6, mtime=0)
+                self._encoded[encoding] = cached
+        return cached, encoding
+
+
+class PayloadCache:
+    """Bounded LRU of CachedPayload keyed by (scope..., variant)."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedPayload]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedPayload]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, version: int, body: bytes) -> CachedPayload:
+        entry = CachedPayload(body, version)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, segment_id: Optional[int] = None, athlete_id: Optional[int] = None) -> None:
+        """Drop entries whose key starts with (segment_id, athlete_id); None matches anything."""
+        with self._lock:
+            for key in list(self._entries):
+                if segment_id is not None and key[0] != segment_id:
+                    continue
+                if athlete_id is not None and key[1] != athlete_id:
+                    continue
+                del self._entries[key]
@@ -0,0 +1,144 @@
+"""
+Opt-in profiling of single requests.
+
+A RequestProfile runs the request thread under cProfile and, alongside it, a
+sampling thread that records the request thread's stack every few
+milliseconds. Stopping it writes three files named after the profile id:
+
+    <id>.pstats     cProfile stats (python -m pstats, snakeviz, ...)
+    <id>.collapsed  "frame;frame;frame count" lines for flamegraph.pl / speedscope
+    <id>.json       request metadata listed by list_profiles
+
+Both collectors run at once, so sampled stacks include cProfile's overhead;
+relative weights stay meaningful, absolute times are inflated. Only one
+profile runs per process at a time: cProfile hooks the interpreter, and on
+Python 3.12+ enabling it while another profiler is active raises.
+"""
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROFILE_SUFFIXES = (".json", ".pstats", ".collapsed")
+
+_active = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is running in this process."""
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack on a background thread into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float = 0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    def __init__(self, directory: str, method: str, path: str, athlete_id: Optional[int], interval: float = 0.002):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug}-{uuid.uuid4().hex[:6]}"
+        self.directory = Path(directory)
+        self.meta: Dict = {"id": self.id, "method": method, "path": path, "athlete_id": athlete_id}
+        self._profiler = cProfile.Profile()
+        self._sampler = StackSampler(threading.get_ident(), interval)
+        self._started = 0.0
+        self.running = False
+
+    def start(self) -> None:
+        """Start collecting; raises ProfilerBusy when another profile is running."""
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            self._profiler.enable()
+        except ValueError as exc:
+            # Python 3.12+: a profiler outside this module (sys.monitoring) holds the hook.
+            _active.release()
+            raise ProfilerBusy(str(exc)) from exc
+        self.meta["started_at"] = time.time()
+        self._started = time.perf_counter()
+        self._sampler.start()
+        self.running = True
+
+    def stop(self, status: Optional[int] = None, max_profiles: Optional[int] = None) -> Dict:
+        """Stop collecting and write the profile files; returns the metadata."""
+        try:
+            self._profiler.disable()
+            self._sampler.stop()
+        finally:
+            self.running = False
+            _active.release()
+        self.meta.update(
+            status=status,
+            duration_ms=round((time.perf_counter() - self._started) * 1000, 3),
+            samples=self._sampler.samples,
+            sample_interval_ms=self._sampler.interval * 1000,
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._profiler.dump_stats(self.directory / f"{self.id}.pstats")
+        (self.directory / f"{self.id}.collapsed").write_text(self._sampler.collapsed())
+        (self.directory / f"{self.id}.json").write_text(json.dumps(self.meta))
+        if max_profiles:
+            prune_profiles(self.directory, max_profiles)
+        return self.meta
+
+
+def list_profiles(directory: str, limit: int = 50) -> List[Dict]:
+    """Metadata of the most recent profiles, newest first."""
+    path = Path(directory)
+    if not path.is_dir():
+        return []
+    profiles = []
+    for meta_path in sorted(path.glob("*.json"), reverse=True)[:limit]:
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            continue
+        meta["files"] = [f"{meta_path.stem}{suffix}" for suffix in PROFILE_SUFFIXES[1:]]
+        profiles.append(meta)
+    return profiles
+
+
+def prune_profiles(directory: Path, keep: int) -> None:
+    for meta_path in sorted(directory.glob("*.json"), reverse=True)[keep:]:
+        for suffix in PROFILE_SUFFIXES:
+            meta_path.with_suffix(suffix).unlink(missing_ok=True)
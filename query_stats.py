@@ -0,0 +1,249 @@
+"""
+Opt-in SQL statement profiling for StravaRepository.
+
+With a QueryProfiler attached, the repository opens its connections as
+ProfiledConnection, whose cursors time each statement from execute() until its
+rows have been fetched. Times are aggregated per statement (whitespace
+collapsed, so one entry per call site rather than per parameter set), and
+each statement's EXPLAIN QUERY PLAN is captured the first time it runs, so
+full scans show up before they get slow. Statements slower than the threshold
+are logged together with their plan.
+
+Profiling is off unless a profiler is passed to the repository, so the normal
+path keeps plain sqlite3 connections.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+PLAN_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms: float = 100.0, max_statements: int = 500):
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self._stats: Dict[str, Dict] = {}
+        self._plans: Dict[str, Optional[List[str]]] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def needs_plan(self, key: str) -> bool:
+        return key not in self._plans
+
+    def record(self, key: str, seconds: float, rows: int, plan: Optional[List[str]] = None) -> None:
+        elapsed_ms = seconds * 1000
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            if plan is not None:
+                self._plans[key] = plan
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_statements:
+                    return
+                entry = self._stats[key] = {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "slow_count": 0,
+                    "last_slow_at": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows
+            if slow:
+                entry["slow_count"] += 1
+                entry["last_slow_at"] = time.time()
+            plan = self._plans.get(key)
+        if slow:
+            logger.warning(
+                "Slow query %.1fms rows=%s: %s\n  plan: %s",
+                elapsed_ms,
+                rows,
+                key,
+                "\n        ".join(plan) if plan else "n/a",
+            )
+
+    def snapshot(self, sort: str = "total_ms", limit: int = 50) -> Dict:
+        """Aggregates for the slowest statements, sorted by total_ms, max_ms, mean_ms, count or slow_count."""
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._stats.items()]
+            plans = dict(self._plans)
+        statements = []
+        for key, entry in items:
+            entry["sql"] = key
+            entry["mean_ms"] = round(entry["total_ms"] / entry["count"], 3) if entry["count"] else 0.0
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+            entry["plan"] = plans.get(key)
+            entry["full_scan"] = any(line.strip().startswith("SCAN") for line in entry["plan"] or ())
+            statements.append(entry)
+        statements.sort(key=lambda entry: entry[sort], reverse=True)
+        return {
+            "slow_ms": self.slow_ms,
+            "since": self.started_at,
+            "statement_count": len(statements),
+            "statements": statements[:limit],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+            self.started_at = time.time()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Times a statement across execute() and its fetches; records when it is exhausted or replaced."""
+
+    profiler: QueryProfiler
+    _pending: Optional[list] = None
+
+    def _begin(self, sql: str, parameters, many: bool) -> None:
+        self.finish()
+        self._pending = [sql, parameters, many, 0.0, 0]
+        self.connection._unfinished.add(self)
+
+    def _add(self, seconds: float, rows: int = 0) -> None:
+        if self._pending is not None:
+            self._pending[3] += seconds
+            self._pending[4] += rows
+
+    def finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        self.connection._unfinished.discard(self)
+        sql, parameters, many, seconds, rows = pending
+        if not self.description and self.rowcount > 0:
+            rows = self.rowcount
+        key = normalize_sql(sql)
+        plan = None
+        if self.profiler.needs_plan(key):
+            if many:
+                parameters = next(iter(parameters), ())
+            plan = explain(self.connection, sql, parameters)
+        self.profiler.record(key, seconds, rows, plan)
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        self._begin(sql, parameters, False)
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._add(time.perf_counter() - started)
+        if not self.description:
+            self.finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        self._begin(sql, seq_of_parameters, True)
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._add(time.perf_counter() - started)
+        self.finish()
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, 0 if row is None else 1)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size: int = -1):
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size >= 0 else super().fetchmany()
+        self._add(time.perf_counter() - started, len(rows))
+        if not rows:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        self.finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - started)
+            self.finish()
+            raise
+        self._add(time.perf_counter() - started, 1)
+        return row
+
+    def close(self) -> None:
+        self.finish()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose execute helpers return ProfiledCursor."""
+
+    profiler: QueryProfiler
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only cursors with a statement not yet recorded; each drops out as it finishes.
+        self._unfinished: Set[ProfiledCursor] = set()
+
+    def cursor(self, factory=None):
+        cursor = super().cursor(factory or ProfiledCursor)
+        if isinstance(cursor, ProfiledCursor):
+            cursor.profiler = self.profiler
+        return cursor
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):
+        started = time.perf_counter()
+        cursor = super().executescript(sql_script)
+        self.profiler.record(normalize_sql(sql_script), time.perf_counter() - started, 0, [])
+        return cursor
+
+    def finish_statements(self) -> None:
+        """Record statements whose rows were not read to the end (e.g. a single fetchone)."""
+        for cursor in list(self._unfinished):
+            cursor.finish()
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters: Sequence = ()) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN detail lines, indented by depth; None for statements without a plan."""
+    if not normalize_sql(sql).upper().startswith(PLAN_STATEMENTS):
+        return None
+    try:
+        cursor = sqlite3.Connection.cursor(conn, sqlite3.Cursor)
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as exc:
+        logger.debug("EXPLAIN QUERY PLAN failed for %s: %s", normalize_sql(sql), exc)
+        return None
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
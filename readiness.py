@@ -66,11 +66,17 @@ def compute_baseline(efforts: list, config: Optional[dict] = None) -> dict:
     window_days = config.get("baselineWindowDays", 120)
     top_n = config.get("baselineTopN", 10)
     from datetime import datetime, timedelta, timezone
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=window_days)).strftime("%Y-%m-%d")
+    cutoff_day = (datetime.now(timezone.utc) - timedelta(days=window_days)).date()
+    cutoff = cutoff_day.isoformat()
+    cutoff_epoch = (cutoff_day - datetime(1970, 1, 1).date()).days * 86400
     valid = []
     for e in efforts:
-        sd = (e.get("start_date") or "")[:10]
-        if sd < cutoff:
+        # Stored efforts carry start_epoch; plain Strava payloads only the ISO start_date.
+        epoch = e.get("start_epoch")
+        if epoch is not None:
+            if epoch < cutoff_epoch:
+                continue
+        elif (e.get("start_date") or "")[:10] < cutoff:
             continue
         if not is_z2_strict(e, config)["valid"]:
             continue
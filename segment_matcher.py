@@ -0,0 +1,478 @@
+"""
+Offline detection of segment efforts in GPS tracks.
+
+Strava only reports which segments an activity crossed through its API.
+match_track finds the same efforts locally, from a segment's stored
+/segments/{id} payload (its map polyline, or start/end coordinates without
+one) and an activity's track: a bulk_export.Track parsed from an export file
+(match_archive) or built from the streams stored for an activity, whose
+latlng series is fetched with the others (match_stored_activities):
+
+* a bounding box around the segment rejects tracks that never come near it,
+  and only steps and points inside the box are compared with the segment;
+* the start and end gates are lines across the segment's first and last
+  metres. A gate is crossed by a track step passing the line in the segment's
+  direction within `gate_radius` of the gate point, at a time interpolated
+  between the step's two samples;
+* every end crossing is paired with the start crossings since the previous
+  effort, keeping the traversal that follows the segment most closely:
+  DEVIATION_QUANTILE of its points within `max_deviation` of the polyline,
+  and every part of the segment within `max_deviation` of the traversal.
+
+Matches are /segments/{id}/all_efforts-shaped dicts, so build_effort_payload
+turns them into effort rows like fetched efforts. Their ids are negative
+(local_effort_id) and cannot collide with Strava's; upsert_efforts drops them
+once Strava's own effort for the activity is stored. They carry no
+start/end_index: those are only trusted from Strava, so stream metrics are
+never computed from sample positions of a different file.
+"""
+
+import hashlib
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bulk_export
+import dates
+import streams
+from bulk_export import EARTH_RADIUS_M, MOVING_SPEED_MPS, Track
+
+logger = logging.getLogger(__name__)
+
+GATE_RADIUS_M = 25.0
+MAX_DEVIATION_M = 40.0
+DEVIATION_QUANTILE = 0.9
+GATE_DIRECTION_M = 20.0  # the gate lines are perpendicular to the segment's first/last 20 m
+COVERAGE_SPACING_M = 20.0
+PAIRWISE_BLOCK = 250_000  # point x polyline-edge pairs per distance block
+
+
+def decode_polyline(encoded: str) -> np.ndarray:
+    """Decode a Google encoded polyline (precision 5) into an (n, 2) array of lat, lng."""
+    chars = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if len(chars) == 0:
+        return np.empty((0, 2))
+    if chars.min() < 0 or chars[-1] >= 0x20:
+        raise ValueError("Malformed polyline")
+    # Each value is a run of 5-bit chunks, least significant first; chunks below 0x20 end a run.
+    ends = np.flatnonzero(chars < 0x20)
+    if len(ends) % 2:
+        raise ValueError("Malformed polyline")
+    value_of_char = np.zeros(len(chars), dtype=np.int64)
+    value_of_char[ends[:-1] + 1] = 1
+    value_of_char = np.cumsum(value_of_char)
+    run_starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = 5 * (np.arange(len(chars)) - run_starts[value_of_char])
+    values = np.zeros(len(ends), dtype=np.int64)
+    np.add.at(values, value_of_char, (chars & 0x1F) << shifts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 1e5
+
+
+def _project(lat: np.ndarray, lng: np.ndarray, origin: Tuple[float, float]) -> np.ndarray:
+    """Equirectangular projection to metres around `origin`; accurate over a segment's few kilometres."""
+    x = EARTH_RADIUS_M * np.radians(lng - origin[1]) * math.cos(math.radians(origin[0]))
+    y = EARTH_RADIUS_M * np.radians(lat - origin[0])
+    return np.column_stack([x, y])
+
+
+def _point_along(xy: np.ndarray, cumulative: np.ndarray, distance) -> np.ndarray:
+    return np.column_stack([np.interp(distance, cumulative, xy[:, 0]), np.interp(distance, cumulative, xy[:, 1])])
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.hypot(vector[0], vector[1]))
+    if norm == 0:
+        raise ValueError("Segment has no length")
+    return vector / norm
+
+
+def distance_to_polyline(points: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """Planar distance of each of `points` (k, 2) to the polyline through `vertices` (n, 2)."""
+    if len(vertices) == 1:
+        return np.hypot(*(points - vertices[0]).T)
+    a = vertices[:-1]
+    ab = vertices[1:] - a
+    ab_squared = np.maximum((ab**2).sum(axis=1), 1e-12)
+    distances = np.empty(len(points))
+    block = max(1, PAIRWISE_BLOCK // len(a))
+    for start in range(0, len(points), block):
+        p = points[start : start + block, None, :]
+        t = np.clip(((p - a) * ab).sum(axis=2) / ab_squared, 0.0, 1.0)
+        nearest = a + t[..., None] * ab
+        distances[start : start + block] = np.sqrt(((p - nearest) ** 2).sum(axis=2).min(axis=1))
+    return distances
+
+
+@dataclass
+class SegmentGeometry:
+    segment_id: int
+    name: Optional[str]
+    origin: Tuple[float, float]
+    xy: np.ndarray  # polyline vertices in metres around `origin`
+    length: float
+    samples: np.ndarray  # points every COVERAGE_SPACING_M along the polyline
+    start_direction: np.ndarray
+    end_direction: np.ndarray
+    bounds: Tuple[float, float, float, float]  # min lat, min lng, max lat, max lng, with margin
+
+    @classmethod
+    def from_segment(cls, segment: Dict, margin_m: float = GATE_RADIUS_M + MAX_DEVIATION_M) -> "SegmentGeometry":
+        """Geometry of a /segments/{id} payload; raises ValueError when it has no coordinates."""
+        polyline = (segment.get("map") or {}).get("polyline")
+        if polyline:
+            latlng = decode_polyline(polyline)
+        elif segment.get("start_latlng") and segment.get("end_latlng"):
+            latlng = np.array([segment["start_latlng"], segment["end_latlng"]], dtype=float)
+        else:
+            raise ValueError(f"Segment {segment.get('id')} has no polyline or start/end coordinates")
+        if len(latlng):
+            latlng = latlng[np.concatenate([[True], np.any(np.diff(latlng, axis=0) != 0, axis=1)])]
+        if len(latlng) < 2:
+            raise ValueError(f"Segment {segment.get('id')} has no length")
+
+        origin = (float(latlng[0, 0]), float(latlng[0, 1]))
+        xy = _project(latlng[:, 0], latlng[:, 1], origin)
+        cumulative = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+        length = float(cumulative[-1])
+        sample_count = max(2, int(math.ceil(length / COVERAGE_SPACING_M)) + 1)
+        gate_length = min(GATE_DIRECTION_M, length)
+        margin_lat = math.degrees(margin_m / EARTH_RADIUS_M)
+        margin_lng = margin_lat / max(math.cos(math.radians(float(np.abs(latlng[:, 0]).max()) + margin_lat)), 1e-6)
+        return cls(
+            segment_id=segment.get("id"),
+            name=segment.get("name"),
+            origin=origin,
+            xy=xy,
+            length=length,
+            samples=_point_along(xy, cumulative, np.linspace(0.0, length, sample_count)),
+            start_direction=_unit(_point_along(xy, cumulative, gate_length)[0] - xy[0]),
+            end_direction=_unit(xy[-1] - _point_along(xy, cumulative, length - gate_length)[0]),
+            bounds=(
+                float(latlng[:, 0].min()) - margin_lat,
+                float(latlng[:, 1].min()) - margin_lng,
+                float(latlng[:, 0].max()) + margin_lat,
+                float(latlng[:, 1].max()) + margin_lng,
+            ),
+        )
+
+    def project(self, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        return _project(lat, lng, self.origin)
+
+
+def _gate_crossings(
+    xy: np.ndarray, steps: np.ndarray, gate: np.ndarray, direction: np.ndarray, radius: float
+) -> np.ndarray:
+    """Positions (sample index + fraction of the step) where steps i -> i+1 cross the gate line forwards."""
+    relative = xy - gate
+    along = relative @ direction
+    across = relative[:, 0] * direction[1] - relative[:, 1] * direction[0]
+    before, after = along[steps], along[steps + 1]
+    forward = (before < 0) & (after >= 0)
+    index = steps[forward]
+    fraction = -before[forward] / (after[forward] - before[forward])
+    offset = across[index] + fraction * (across[index + 1] - across[index])
+    hit = np.abs(offset) <= radius
+    return index[hit] + fraction[hit]
+
+
+def _at(values: np.ndarray, position: float) -> float:
+    """Linear interpolation of `values` at a fractional sample position."""
+    index = min(int(position), len(values) - 2)
+    fraction = position - index
+    return float(values[index] + fraction * (values[index + 1] - values[index]))
+
+
+def _traversal_score(
+    geometry: SegmentGeometry, xy: np.ndarray, near: np.ndarray, start: float, end: float, max_deviation: float
+) -> Optional[float]:
+    """Mean distance between the traversal and the segment, or None when it does not follow the segment."""
+    first, last = int(start) + 1, int(end)
+    inside = near[first : last + 1]
+    total = len(inside) + 2
+    # Points outside the box are further than max_deviation from the segment by construction.
+    if (inside.sum() + 2) / total < DEVIATION_QUANTILE:
+        return None
+    endpoints = np.vstack([[_at(xy[:, 0], start), _at(xy[:, 1], start)], [_at(xy[:, 0], end), _at(xy[:, 1], end)]])
+    inner = xy[first : last + 1]
+    deviation = distance_to_polyline(np.vstack([endpoints, inner[inside]]), geometry.xy)
+    if (deviation <= max_deviation).sum() / total < DEVIATION_QUANTILE:
+        return None
+    path = np.vstack([endpoints[:1], inner, endpoints[1:]])
+    coverage = distance_to_polyline(geometry.samples, path)
+    if coverage.max() > max_deviation:
+        return None
+    return float(deviation.mean() + coverage.mean())
+
+
+def local_effort_id(segment_id: int, activity_id: int, start_epoch: float) -> int:
+    """Id of a locally detected effort: stable across runs, negative so it never collides with Strava's."""
+    digest = hashlib.blake2b(f"{segment_id}:{activity_id}:{int(start_epoch)}".encode(), digest_size=8).digest()
+    return -(int.from_bytes(digest, "big") >> 1) - 1
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(round(epoch), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _effort(
+    geometry: SegmentGeometry, track: Track, index: np.ndarray, start: float, end: float, activity_id: int
+) -> Dict:
+    times = track.time[index]
+    start_epoch, end_epoch = _at(times, start), _at(times, end)
+    elapsed = end_epoch - start_epoch
+    distance = bulk_export.track_distance(track)
+    cumulative = distance[index]
+    # Samples inside the effort, and the samples bracketing it, as indices into the whole track.
+    first, last = int(index[int(start) + 1]), int(index[max(int(end), int(start) + 1)])
+    bracket = slice(int(index[int(start)]), int(index[min(int(end) + 1, len(index) - 1)]) + 1)
+    dt = np.diff(track.time[bracket])
+    speed = np.diff(distance[bracket]) / np.where(dt > 0, dt, np.inf)
+    effort: Dict = {
+        "id": local_effort_id(geometry.segment_id, activity_id, start_epoch),
+        "name": geometry.name,
+        "activity": {"id": activity_id},
+        "segment": {"id": geometry.segment_id},
+        "start_date": _iso(start_epoch),
+        "elapsed_time": int(round(elapsed)),
+        "moving_time": int(round(min(elapsed, float(dt[speed >= MOVING_SPEED_MPS].sum())))),
+        "distance": round(_at(cumulative, end) - _at(cumulative, start), 1),
+        # Strava's start/end_index point into its own streams, which need not sample like the file.
+        "start_index": None,
+        "end_index": None,
+        "average_heartrate": None,
+        "max_heartrate": None,
+        "average_watts": None,
+        "weighted_average_watts": None,
+        "device_watts": None,
+    }
+    window = slice(first, last + 1)
+    heartrate = track.heartrate[window]
+    heartrate = heartrate[np.isfinite(heartrate) & (heartrate > 0)]
+    if len(heartrate):
+        effort["average_heartrate"] = round(float(heartrate.mean()), 1)
+        effort["max_heartrate"] = float(heartrate.max())
+    if np.isfinite(track.watts[window]).any():
+        watts = np.nan_to_num(track.watts[window], nan=0.0)
+        effort["average_watts"] = round(float(watts.mean()), 1)
+        effort["weighted_average_watts"] = round(streams.normalized_power(watts, track.time[window]), 1)
+        effort["device_watts"] = True
+    return effort
+
+
+def match_track(
+    geometry: SegmentGeometry,
+    track: Track,
+    activity_id: int,
+    gate_radius: float = GATE_RADIUS_M,
+    max_deviation: float = MAX_DEVIATION_M,
+) -> List[Dict]:
+    """Efforts on the segment in the track, in time order, as /all_efforts-shaped dicts."""
+    index = np.flatnonzero(np.isfinite(track.lat) & np.isfinite(track.lng) & np.isfinite(track.time))
+    if len(index) < 2:
+        return []
+    lat, lng = track.lat[index], track.lng[index]
+    min_lat, min_lng, max_lat, max_lng = geometry.bounds
+    near = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+    steps = np.flatnonzero(near[:-1] | near[1:])
+    if len(steps) == 0:
+        return []
+
+    xy = geometry.project(lat, lng)
+    starts = _gate_crossings(xy, steps, geometry.xy[0], geometry.start_direction, gate_radius)
+    ends = _gate_crossings(xy, steps, geometry.xy[-1], geometry.end_direction, gate_radius)
+
+    efforts = []
+    previous_end = -1.0
+    for end in ends:
+        best: Optional[Tuple[float, float]] = None
+        for start in starts[(starts >= previous_end) & (starts < end)][::-1]:
+            score = _traversal_score(geometry, xy, near, start, end, max_deviation)
+            if score is not None and (best is None or score < best[0]):
+                best = (score, start)
+        if best is None:
+            continue
+        efforts.append(_effort(geometry, track, index, best[1], end, activity_id))
+        previous_end = end
+    return efforts
+
+
+def track_from_streams(decoded: Dict[str, np.ndarray], start_epoch: float) -> Track:
+    """Track of an activity's stored streams (streams.decode_streams, including latlng); times start at `start_epoch`."""
+    times = decoded["time"] + start_epoch
+    nan = np.full(len(times), np.nan)
+    latlng = decoded.get("latlng")
+    if latlng is None or len(latlng) != len(times):
+        latlng = np.column_stack([nan, nan])
+
+    def column(key: str) -> np.ndarray:
+        values = decoded.get(key)
+        return values if values is not None and len(values) == len(times) else nan.copy()
+
+    return Track(
+        time=times,
+        lat=latlng[:, 0],
+        lng=latlng[:, 1],
+        altitude=nan.copy(),
+        distance=column("distance"),
+        heartrate=column("heartrate"),
+        watts=column("watts"),
+    )
+
+
+@dataclass
+class MatchResult:
+    athlete_id: int
+    files_scanned: int = 0  # activity files, or stored activity streams
+    files_failed: int = 0
+    skipped: int = 0
+    undated: int = 0  # stored streams whose activity (and so start time) is not stored yet
+    efforts: Dict[int, List[Dict]] = field(default_factory=dict)  # segment id -> detected efforts
+    activities: Dict[int, Dict] = field(default_factory=dict)  # activities.csv rows of the matched activities
+    seconds: float = 0.0
+
+
+# Geometries of the segments being matched, set once per worker process.
+_worker_geometries: Dict[int, SegmentGeometry] = {}
+
+
+def _init_worker(geometries: Dict[int, SegmentGeometry]) -> None:
+    _worker_geometries.clear()
+    _worker_geometries.update(geometries)
+
+
+def _match_member(task: Tuple[str, str, int, Tuple[int, ...]]) -> Tuple[int, List[Dict], Optional[str]]:
+    """Process-pool task: match one archive member against segments. Returns (activity id, efforts, error)."""
+    archive_path, member, activity_id, segment_ids = task
+    try:
+        track = bulk_export.parse_activity_file(member, bulk_export.read_member(archive_path, member))
+        efforts = []
+        for segment_id in segment_ids:
+            efforts.extend(match_track(_worker_geometries[segment_id], track, activity_id))
+        return activity_id, efforts, None
+    except Exception as exc:  # corrupt files are reported, not fatal
+        return activity_id, [], f"{type(exc).__name__}: {exc}"
+
+
+def _match_files(
+    archive_path: str, tasks: List[Tuple[str, str, int, Tuple[int, ...]]], geometries: Dict[int, SegmentGeometry], workers: Optional[int]
+) -> Iterable[Tuple[int, List[Dict], Optional[str]]]:
+    if workers == 1 or len(tasks) < 2:
+        _init_worker(geometries)
+        try:
+            yield from map(_match_member, tasks)
+        finally:
+            bulk_export.close_member_archive(archive_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(geometries,)) as pool:
+        yield from pool.map(_match_member, tasks, chunksize=8)
+
+
+def _load_geometries(repository, segment_ids: Sequence[int]) -> Dict[int, SegmentGeometry]:
+    geometries = {}
+    for segment_id in segment_ids:
+        segment = repository.get_segment_payload(segment_id)
+        if segment is None:
+            raise ValueError(f"Segment {segment_id} is not stored; open it in the app once to fetch it")
+        geometries[segment_id] = SegmentGeometry.from_segment(segment)
+    return geometries
+
+
+def match_archive(
+    archive_path: str,
+    repository,
+    segment_ids: Sequence[int],
+    athlete_id: Optional[int] = None,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> MatchResult:
+    """
+    Detect efforts on stored segments in the activity files of a bulk export.
+    Activities Strava already reported an effort for are not matched again.
+    """
+    started = time.perf_counter()
+    progress = progress or (lambda message: None)
+    geometries = _load_geometries(repository, segment_ids)
+
+    athlete_id, activities, files = bulk_export.read_archive_index(archive_path, athlete_id)
+    result = MatchResult(athlete_id=athlete_id)
+    fetched = {segment_id: repository.get_fetched_effort_activity_ids(segment_id, athlete_id) for segment_id in geometries}
+    tasks = []
+    for activity in activities:
+        if activity["id"] not in files:
+            continue
+        pending = tuple(segment_id for segment_id in geometries if activity["id"] not in fetched[segment_id])
+        if pending:
+            tasks.append((archive_path, files[activity["id"]], activity["id"], pending))
+        else:
+            result.skipped += 1
+    progress(f"{len(tasks)} activity files to match against {len(geometries)} segments ({result.skipped} already on Strava)")
+
+    gear_ids = repository.get_gear_ids_by_name(athlete_id)
+    by_id = {activity["id"]: activity for activity in activities}
+    for done, (activity_id, efforts, error) in enumerate(_match_files(archive_path, tasks, geometries, workers), start=1):
+        if error:
+            result.files_failed += 1
+            logger.warning("Could not parse the file of activity %s: %s", activity_id, error)
+            continue
+        result.files_scanned += 1
+        if efforts:
+            result.activities[activity_id] = bulk_export.resolve_gear(by_id[activity_id], gear_ids)
+        for effort in efforts:
+            result.efforts.setdefault(effort["segment"]["id"], []).append(effort)
+        if done % 500 == 0:
+            progress(f"matched {done}/{len(tasks)} files")
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def match_stored_activities(
+    repository,
+    segment_ids: Sequence[int],
+    athlete_id: int,
+    progress: Optional[Callable[[str], None]] = None,
+) -> MatchResult:
+    """
+    Detect efforts on stored segments in the activities whose streams, with
+    positions, are stored. Activities Strava already reported an effort for
+    are not matched again.
+    """
+    started = time.perf_counter()
+    progress = progress or (lambda message: None)
+    geometries = _load_geometries(repository, segment_ids)
+    result = MatchResult(athlete_id=athlete_id)
+    fetched = {segment_id: repository.get_fetched_effort_activity_ids(segment_id, athlete_id) for segment_id in geometries}
+
+    rows = repository.get_activity_tracks(athlete_id)
+    progress(f"{len(rows)} stored activity tracks to match against {len(geometries)} segments")
+    for row in rows:
+        activity_id = row["activity_id"]
+        pending = [segment_id for segment_id in geometries if activity_id not in fetched[segment_id]]
+        if not pending:
+            result.skipped += 1
+            continue
+        start_epoch = dates.iso_to_epoch(row["start_date"])
+        if start_epoch is None:
+            result.undated += 1
+            continue
+        decoded = streams.decode_streams(row)
+        if "time" not in decoded:
+            result.files_failed += 1
+            continue
+        track = track_from_streams(decoded, start_epoch)
+        result.files_scanned += 1
+        for segment_id in pending:
+            for effort in match_track(geometries[segment_id], track, activity_id):
+                result.efforts.setdefault(segment_id, []).append(effort)
+
+    matched = sorted({effort["activity"]["id"] for efforts in result.efforts.values() for effort in efforts})
+    result.activities = repository.get_activities_by_ids(matched)
+    result.seconds = time.perf_counter() - started
+    return result
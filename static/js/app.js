@@ -81,4 +81,14 @@ function debounce(func, wait) {
         clearTimeout(timeout);
         timeout = setTimeout(later, wait);
     };
-} 
\ No newline at end of file
+} 
+/**
+ * Register the service worker (cached assets, offline efforts)
+ */
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/service-worker.js').catch(error => {
+            console.warn('Service worker registration failed:', error);
+        });
+    });
+}
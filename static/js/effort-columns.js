@@ -0,0 +1,141 @@
+// Columnar effort loader (/segment/<id>/efforts?format=columnar)
+
+const EFFORT_NUMERIC_FIELDS = [
+    'id', 'activity_id', 'start_epoch', 'elapsed_time', 'moving_time', 'distance',
+    'average_heartrate', 'max_heartrate', 'average_watts', 'normalized_watts',
+    'efficiency', 'vam', 'decoupling_pct', 'hr_drift_pct',
+];
+const EFFORT_DICTIONARY_FIELDS = ['bike_id', 'bike_name'];
+const EFFORT_STRING_FIELDS = ['name', 'local_date'];
+// Per-effort arrays (HR seconds per zone), kept as the parsed JSON values.
+const EFFORT_LIST_FIELDS = ['time_in_zones'];
+
+/**
+ * Column store for efforts: numeric fields in Float64Arrays (NaN = null),
+ * start dates as epoch seconds, bikes as dictionary codes.
+ */
+class EffortColumns {
+    constructor(count) {
+        this.length = count;
+        this.numeric = {};
+        EFFORT_NUMERIC_FIELDS.forEach(field => { this.numeric[field] = new Float64Array(count).fill(NaN); });
+        this.startEpoch = new Float64Array(count).fill(NaN);
+        this.codes = {};
+        this.dictionaries = {};
+        this.strings = {};
+        this.lists = {};
+        this._isoCache = new Array(count);
+    }
+
+    static fromPayload(payload) {
+        const columns = new EffortColumns(payload.count);
+        const src = payload.columns;
+        EFFORT_NUMERIC_FIELDS.forEach(field => {
+            const values = src[field];
+            if (!values) return;
+            const target = columns.numeric[field];
+            for (let i = 0; i < values.length; i++) {
+                if (values[i] != null) target[i] = values[i];
+            }
+        });
+        const epochs = src.start_date || [];
+        for (let i = 0; i < epochs.length; i++) {
+            if (epochs[i] != null) columns.startEpoch[i] = epochs[i];
+        }
+        EFFORT_DICTIONARY_FIELDS.forEach(field => {
+            columns.codes[field] = Int32Array.from(src[field] || []);
+            columns.dictionaries[field] = payload.dictionaries?.[field] || [];
+        });
+        EFFORT_STRING_FIELDS.forEach(field => { columns.strings[field] = src[field] || []; });
+        EFFORT_LIST_FIELDS.forEach(field => { columns.lists[field] = src[field] || []; });
+        return columns;
+    }
+
+    startDateIso(index) {
+        let iso = this._isoCache[index];
+        if (iso === undefined) {
+            const epoch = this.startEpoch[index];
+            iso = Number.isNaN(epoch) ? null : new Date(epoch * 1000).toISOString().replace('.000Z', 'Z');
+            this._isoCache[index] = iso;
+        }
+        return iso;
+    }
+
+    rows() {
+        const rows = new Array(this.length);
+        for (let i = 0; i < this.length; i++) rows[i] = new EffortRow(this, i);
+        return rows;
+    }
+}
+
+/**
+ * Lightweight view over one effort in an EffortColumns store.
+ * Exposes the same fields as the row-object format via getters.
+ */
+class EffortRow {
+    constructor(columns, index) {
+        this._columns = columns;
+        this._index = index;
+    }
+
+    get start_date() {
+        return this._columns.startDateIso(this._index);
+    }
+
+    toJSON() {
+        const plain = {};
+        EFFORT_NUMERIC_FIELDS.forEach(field => { plain[field] = this[field]; });
+        EFFORT_DICTIONARY_FIELDS.forEach(field => { plain[field] = this[field]; });
+        EFFORT_STRING_FIELDS.forEach(field => { plain[field] = this[field]; });
+        EFFORT_LIST_FIELDS.forEach(field => { plain[field] = this[field]; });
+        plain.start_date = this.start_date;
+        return plain;
+    }
+}
+
+EFFORT_NUMERIC_FIELDS.forEach(field => {
+    Object.defineProperty(EffortRow.prototype, field, {
+        get() {
+            const value = this._columns.numeric[field][this._index];
+            return Number.isNaN(value) ? null : value;
+        },
+        set(value) {
+            this._columns.numeric[field][this._index] = value == null ? NaN : value;
+        },
+    });
+});
+EFFORT_DICTIONARY_FIELDS.forEach(field => {
+    Object.defineProperty(EffortRow.prototype, field, {
+        get() {
+            return this._columns.dictionaries[field][this._columns.codes[field][this._index]] ?? null;
+        },
+    });
+});
+EFFORT_STRING_FIELDS.forEach(field => {
+    Object.defineProperty(EffortRow.prototype, field, {
+        get() {
+            return this._columns.strings[field][this._index] ?? null;
+        },
+    });
+});
+EFFORT_LIST_FIELDS.forEach(field => {
+    Object.defineProperty(EffortRow.prototype, field, {
+        get() {
+            return this._columns.lists[field][this._index] ?? null;
+        },
+    });
+});
+
+/**
+ * Accept either wire format and return an array of effort rows.
+ */
+function effortsFromPayload(payload) {
+    if (payload && payload.format === 'columnar') {
+        return EffortColumns.fromPayload(payload).rows();
+    }
+    return Array.isArray(payload) ? payload : [];
+}
+
+function toPlainEffort(effort) {
+    return typeof effort.toJSON === 'function' ? effort.toJSON() : effort;
+}
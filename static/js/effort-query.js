@@ -0,0 +1,512 @@
+// Effort filtering, sorting and statistics over typed-array columns.
+// Runs inside effort-worker.js; the same engine is used in-thread when
+// Web Workers are unavailable.
+
+const DAY_MS = 86400000;
+
+/**
+ * Flatten efforts into the columns the query engine needs.
+ * Numeric fields use NaN for null; bikes are dictionary codes.
+ * The typed arrays are transferable, so posting them to a worker is a move.
+ */
+function buildEffortQueryColumns(efforts) {
+    const store = backingColumnStore(efforts);
+    if (store) return queryColumnsFromStore(store);
+
+    const count = efforts.length;
+    const startMs = new Float64Array(count);
+    const hr = new Float64Array(count);
+    const watts = new Float64Array(count);
+    const elapsed = new Float64Array(count);
+    const vam = new Float64Array(count);
+    const decoupling = new Float64Array(count);
+    const bikeCodes = new Int32Array(count);
+    const bikeNames = [];
+    const bikeIndex = new Map();
+
+    const num = (value) => (value == null || value === '' ? NaN : Number(value));
+    for (let i = 0; i < count; i++) {
+        const effort = efforts[i];
+        // Stored efforts carry start_epoch; parse the ISO date only for rows without it.
+        startMs[i] = effort.start_epoch != null
+            ? effort.start_epoch * 1000
+            : (effort.start_date ? Date.parse(effort.start_date) : NaN);
+        hr[i] = num(effort.average_heartrate);
+        watts[i] = num(effort.average_watts);
+        elapsed[i] = num(effort.elapsed_time);
+        vam[i] = num(effort.vam);
+        decoupling[i] = num(effort.decoupling_pct);
+
+        const bike = effort.bike_name ?? null;
+        let code = bikeIndex.get(bike);
+        if (code === undefined) {
+            code = bikeNames.length;
+            bikeIndex.set(bike, code);
+            bikeNames.push(bike);
+        }
+        bikeCodes[i] = code;
+    }
+
+    return { count, startMs, hr, watts, elapsed, vam, decoupling, bikeCodes, bikeNames };
+}
+
+/**
+ * The EffortColumns store behind `efforts` when they are exactly its rows, in
+ * order (what effortsFromPayload returns for a columnar payload); else null.
+ */
+function backingColumnStore(efforts) {
+    const store = efforts.length ? efforts[0]._columns : null;
+    if (!store || store.length !== efforts.length || store.codes.bike_name?.length !== efforts.length) return null;
+    for (let i = 0; i < efforts.length; i++) {
+        if (efforts[i]._columns !== store || efforts[i]._index !== i) return null;
+    }
+    return store;
+}
+
+/** Query columns copied straight from a column store, without reading each row. */
+function queryColumnsFromStore(store) {
+    const { numeric } = store;
+    const count = store.length;
+    const startMs = new Float64Array(count);
+    for (let i = 0; i < count; i++) {
+        const epoch = numeric.start_epoch[i];
+        startMs[i] = (Number.isNaN(epoch) ? store.startEpoch[i] : epoch) * 1000;
+    }
+    // Copies: the buffers are transferred to the worker, the store keeps its own.
+    return {
+        count,
+        startMs,
+        hr: numeric.average_heartrate.slice(),
+        watts: numeric.average_watts.slice(),
+        elapsed: numeric.elapsed_time.slice(),
+        vam: numeric.vam.slice(),
+        decoupling: numeric.decoupling_pct.slice(),
+        bikeCodes: store.codes.bike_name.slice(),
+        bikeNames: store.dictionaries.bike_name.slice(),
+    };
+}
+
+function effortQueryTransferList(columns) {
+    return ['startMs', 'hr', 'watts', 'elapsed', 'vam', 'decoupling', 'bikeCodes'].map(key => columns[key].buffer);
+}
+
+function parseDayFilter(value) {
+    if (!value) return null;
+    const ms = Date.parse(value);
+    return Number.isNaN(ms) ? null : Math.floor(ms / DAY_MS);
+}
+
+function truthy(value) {
+    return !Number.isNaN(value) && value !== 0;
+}
+
+/**
+ * Sorted row order over the rows of `values` that pass `include`.
+ * `sorted` holds the values in that order for binary search.
+ */
+function buildRangeIndex(values, include) {
+    const rows = [];
+    for (let i = 0; i < values.length; i++) {
+        if (include(values[i])) rows.push(i);
+    }
+    const order = Uint32Array.from(rows).sort((a, b) => values[a] - values[b] || a - b);
+    const sorted = new Float64Array(order.length);
+    for (let k = 0; k < order.length; k++) sorted[k] = values[order[k]];
+    return { order, sorted };
+}
+
+/** First position whose value is >= x (or > x when `strict`). */
+function lowerBound(sorted, x, strict = false) {
+    let lo = 0;
+    let hi = sorted.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >>> 1;
+        if (sorted[mid] < x || (strict && sorted[mid] === x)) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+function bitsetFor(count) {
+    return new Uint32Array((count + 31) >>> 5);
+}
+
+/** Call fn(row) for every set bit, in ascending row order. */
+function forEachBit(bits, fn) {
+    for (let w = 0; w < bits.length; w++) {
+        let word = bits[w];
+        while (word !== 0) {
+            const low = word & -word;
+            fn((w << 5) + 31 - Math.clz32(low));
+            word ^= low;
+        }
+    }
+}
+
+/**
+ * Normalise UI filters into per-dimension [lo, hi] ranges (null = inactive).
+ */
+function filterConstraints(filters) {
+    const range = (min, max) => (min || max ? [min || -Infinity, max || Infinity] : null);
+    const startDay = parseDayFilter(filters.startDate);
+    const endDay = parseDayFilter(filters.endDate);
+    return {
+        hr: range(filters.minHR, filters.maxHR),
+        power: range(filters.minPower, filters.maxPower),
+        day: startDay !== null || endDay !== null ? [startDay ?? -Infinity, endDay ?? Infinity] : null,
+        bike: filters.bike || null,
+    };
+}
+
+/** True when every row matching `next` also matches `previous`. */
+function isNarrowing(previous, next) {
+    const within = (a, b) => a === null || (b !== null && b[0] >= a[0] && b[1] <= a[1]);
+    return within(previous.hr, next.hr)
+        && within(previous.power, next.power)
+        && within(previous.day, next.day)
+        && (previous.bike === null || previous.bike === next.bike);
+}
+
+class EffortQueryEngine {
+    constructor() {
+        this.columns = null;
+        this._sortKeys = {};
+        this._sortOrders = {};
+        this._last = null;
+    }
+
+    load(columns) {
+        this.columns = columns;
+        this._sortOrders = {};
+        this._last = null;
+        const { count, hr, watts, startMs, bikeNames, bikeCodes } = columns;
+
+        // Derived columns computed once per dataset, not per keystroke.
+        const ef = new Float64Array(count);
+        const day = new Float64Array(count);
+        for (let i = 0; i < count; i++) {
+            ef[i] = truthy(hr[i]) && hr[i] > 0 && !Number.isNaN(watts[i]) ? watts[i] / hr[i] : NaN;
+            day[i] = Math.floor(startMs[i] / DAY_MS);
+        }
+        this.ef = ef;
+        this.day = day;
+
+        // Range indexes: rows lacking a value never match an active filter, so they are left out.
+        this._rangeIndexes = {
+            hr: buildRangeIndex(hr, truthy),
+            power: buildRangeIndex(watts, truthy),
+            day: buildRangeIndex(day, value => !Number.isNaN(value)),
+        };
+
+        // One bitset per bike as shown in the filter (null and 'Unknown' are the same option).
+        this._bikeBits = new Map();
+        this._bikeCounts = new Map();
+        const bitsByCode = bikeNames.map((name) => {
+            const label = name || 'Unknown';
+            if (!this._bikeBits.has(label)) {
+                this._bikeBits.set(label, bitsetFor(count));
+                this._bikeCounts.set(label, 0);
+            }
+            return label;
+        });
+        for (let i = 0; i < count; i++) {
+            const label = bitsByCode[bikeCodes[i]];
+            this._bikeBits.get(label)[i >>> 5] |= 1 << (i & 31);
+            this._bikeCounts.set(label, this._bikeCounts.get(label) + 1);
+        }
+
+        // Bike names sort case-insensitively; rank the dictionary once.
+        const order = bikeNames
+            .map((name, code) => ({ code, key: name == null ? null : String(name).toLowerCase() }))
+            .filter(entry => entry.key !== null)
+            .sort((a, b) => (a.key < b.key ? -1 : a.key > b.key ? 1 : 0));
+        const rankByCode = new Float64Array(bikeNames.length).fill(NaN);
+        order.forEach((entry, rank) => { rankByCode[entry.code] = rank; });
+        const bikeRank = new Float64Array(count);
+        for (let i = 0; i < count; i++) bikeRank[i] = rankByCode[bikeCodes[i]];
+
+        this._sortKeys = {
+            start_date: startMs,
+            bike_name: bikeRank,
+            elapsed_time: columns.elapsed,
+            average_heartrate: hr,
+            average_watts: watts,
+            efficiency: ef,
+            vam: columns.vam,
+            decoupling_pct: columns.decoupling,
+        };
+        this._sortOrder('start_date', startMs);
+    }
+
+    /**
+     * Run one query: filter, baseline, sort, statistics.
+     * Returns the matching row indices (Uint32Array) in display order.
+     */
+    query({ filters = {}, sort = { field: 'start_date', direction: 'desc' }, readinessConfig, useBaseline = true, now } = {}) {
+        if (!this.columns) {
+            return { indices: new Uint32Array(0), stats: null, baseline: { baseline: null, count: 0 } };
+        }
+        const { bits, count } = this.filterBits(filters);
+        const rows = new Uint32Array(count);
+        let n = 0;
+        forEachBit(bits, (row) => { rows[n++] = row; });
+
+        const baseline = useBaseline
+            ? this.baseline(rows, readinessConfig || READINESS_CONFIG, now ?? Date.now())
+            : { baseline: null, count: 0 };
+        const indices = this.order(bits, rows, sort, baseline.baseline);
+        return { indices, stats: this.statistics(indices), baseline };
+    }
+
+    /**
+     * Matching rows as a bitset. Candidates come from the smallest of: the
+     * previous result (when the filter only narrowed), a binary-searched slice
+     * of a range index, or a bike bitset; each candidate is then checked
+     * against the remaining predicates.
+     */
+    filterBits(filters) {
+        const { count, hr, watts } = this.columns;
+        const day = this.day;
+        const constraints = filterConstraints(filters);
+        const bikeBits = constraints.bike !== null ? this._bikeBits.get(constraints.bike) : null;
+        const bits = bitsetFor(count);
+
+        if (constraints.bike !== null && !bikeBits) {
+            this._last = { constraints, bits, count: 0 };
+            return this._last;
+        }
+
+        let best = { size: count, each: (fn) => { for (let i = 0; i < count; i++) fn(i); } };
+        const consider = (size, each) => { if (size < best.size) best = { size, each }; };
+
+        if (this._last && isNarrowing(this._last.constraints, constraints)) {
+            const previous = this._last.bits;
+            consider(this._last.count, fn => forEachBit(previous, fn));
+        }
+        for (const key of ['hr', 'power', 'day']) {
+            const range = constraints[key];
+            if (range === null) continue;
+            const { order, sorted } = this._rangeIndexes[key];
+            const start = lowerBound(sorted, range[0]);
+            const end = lowerBound(sorted, range[1], true);
+            consider(Math.max(0, end - start), (fn) => { for (let k = start; k < end; k++) fn(order[k]); });
+        }
+        if (bikeBits) consider(this._bikeCounts.get(constraints.bike), fn => forEachBit(bikeBits, fn));
+
+        const hrRange = constraints.hr;
+        const powerRange = constraints.power;
+        const dayRange = constraints.day;
+        let matched = 0;
+        best.each((i) => {
+            if (hrRange !== null) {
+                const h = hr[i];
+                if (!truthy(h) || h < hrRange[0] || h > hrRange[1]) return;
+            }
+            if (powerRange !== null) {
+                const p = watts[i];
+                if (!truthy(p) || p < powerRange[0] || p > powerRange[1]) return;
+            }
+            if (dayRange !== null) {
+                const d = day[i];
+                if (Number.isNaN(d) || d < dayRange[0] || d > dayRange[1]) return;
+            }
+            if (bikeBits && !(bikeBits[i >>> 5] & (1 << (i & 31)))) return;
+            bits[i >>> 5] |= 1 << (i & 31);
+            matched++;
+        });
+
+        this._last = { constraints, bits, count: matched };
+        return this._last;
+    }
+
+    /**
+     * Baseline = median of top N EFF among Z2-strict-valid efforts in the window
+     * (same rules as computeBaseline in readiness.js).
+     */
+    baseline(indices, config, now) {
+        const { hr, watts } = this.columns;
+        const windowDays = config.baselineWindowDays ?? 120;
+        const topN = config.baselineTopN ?? 10;
+        const hrMin = config.z2HrMin ?? 132;
+        const hrMax = config.z2HrMax ?? 138;
+        const cutoff = new Date(now);
+        cutoff.setDate(cutoff.getDate() - windowDays);
+        const cutoffDay = Math.floor(cutoff.getTime() / DAY_MS);
+
+        const candidates = [];
+        for (let k = 0; k < indices.length; k++) {
+            const i = indices[k];
+            if (!(this.day[i] >= cutoffDay)) continue;
+            const h = hr[i];
+            const p = watts[i];
+            if (!(h > 0) || !(p > 0) || h < hrMin || h > hrMax) continue;
+            const ef = this.ef[i];
+            if (ef > 0) candidates.push(ef);
+        }
+        if (candidates.length === 0) return { baseline: null, count: 0 };
+        candidates.sort((a, b) => b - a);
+        const top = candidates.slice(0, topN);
+        return { baseline: median(top), count: top.length };
+    }
+
+    /**
+     * Matching rows in display order. Each sort field's full row order is
+     * computed once per dataset; a query walks it and keeps the rows in
+     * `bits`, so re-sorting costs O(n) instead of a comparison sort.
+     */
+    order(bits, rows, { field, direction }, baseline) {
+        let keyField = field;
+        if (field === 'forme_pct') {
+            // Forme% is monotonic in EFF for a fixed baseline; rows without it go last.
+            if (baseline == null || !(baseline > 0)) return rows;
+            keyField = 'efficiency';
+        }
+        const key = this._sortKeys[keyField];
+        if (!key) return rows;
+
+        const { order, present } = this._sortOrder(keyField, key);
+        const out = new Uint32Array(rows.length);
+        let n = 0;
+        const take = (row) => {
+            if (bits[row >>> 5] & (1 << (row & 31))) out[n++] = row;
+        };
+        const positive = field === 'forme_pct';
+        if (direction === 'asc') {
+            for (let k = 0; k < present; k++) {
+                if (!positive || key[order[k]] > 0) take(order[k]);
+            }
+        } else {
+            for (let k = present - 1; k >= 0; k--) {
+                if (!positive || key[order[k]] > 0) take(order[k]);
+            }
+        }
+        // Missing values go last in both directions, in row order.
+        for (let k = present; k < order.length; k++) take(order[k]);
+        if (positive) {
+            for (let k = 0; k < present; k++) {
+                if (!(key[order[k]] > 0)) take(order[k]);
+            }
+        }
+        return out;
+    }
+
+    _sortOrder(field, key) {
+        let cached = this._sortOrders[field];
+        if (!cached) {
+            const { order: valued } = buildRangeIndex(key, value => !Number.isNaN(value));
+            const order = new Uint32Array(key.length);
+            order.set(valued);
+            let n = valued.length;
+            for (let i = 0; i < key.length; i++) {
+                if (Number.isNaN(key[i])) order[n++] = i;
+            }
+            cached = this._sortOrders[field] = { order, present: valued.length };
+        }
+        return cached;
+    }
+
+    statistics(indices) {
+        if (indices.length === 0) return null;
+        const { hr, watts, elapsed, vam } = this.columns;
+        let bestTime = Infinity;
+        let timeSum = 0;
+        let timeCount = 0;
+        let hrSum = 0;
+        let hrCount = 0;
+        let powerSum = 0;
+        let powerCount = 0;
+        let vamSum = 0;
+        let vamCount = 0;
+        for (let k = 0; k < indices.length; k++) {
+            const i = indices[k];
+            const t = elapsed[i];
+            if (!Number.isNaN(t)) {
+                if (t < bestTime) bestTime = t;
+                timeSum += t;
+                timeCount++;
+            }
+            if (truthy(hr[i])) { hrSum += hr[i]; hrCount++; }
+            if (truthy(watts[i])) { powerSum += watts[i]; powerCount++; }
+            if (truthy(vam[i])) { vamSum += vam[i]; vamCount++; }
+        }
+        return {
+            totalEfforts: indices.length,
+            bestTime: timeCount > 0 ? bestTime : null,
+            avgTime: timeCount > 0 ? Math.round(timeSum / timeCount) : null,
+            avgHeartRate: hrCount > 0 ? Math.round(hrSum / hrCount) : null,
+            avgPower: powerCount > 0 ? Math.round(powerSum / powerCount) : null,
+            avgVAM: vamCount > 0 ? Math.round(vamSum / vamCount) : null,
+        };
+    }
+}
+
+/**
+ * Promise-based front for EffortQueryEngine. Uses a dedicated worker when
+ * available so large datasets never block input handling; otherwise runs the
+ * engine on the calling thread.
+ */
+class EffortQueryClient {
+    constructor(workerUrl) {
+        this._pending = new Map();
+        this._nextId = 1;
+        this.worker = null;
+        this.engine = null;
+        if (workerUrl && typeof Worker !== 'undefined') {
+            try {
+                this.worker = new Worker(workerUrl);
+                this.worker.onmessage = (event) => this._settle(event.data);
+                this.worker.onerror = (event) => {
+                    console.warn('Effort worker failed, filtering in page:', event.message);
+                    this._fallBackToPage();
+                };
+            } catch (error) {
+                console.warn('Could not start effort worker:', error);
+                this.worker = null;
+            }
+        }
+        if (!this.worker) this.engine = new EffortQueryEngine();
+    }
+
+    load(efforts) {
+        const columns = buildEffortQueryColumns(efforts);
+        this._lastEfforts = efforts;
+        if (!this.worker) {
+            this.engine.load(columns);
+            return Promise.resolve();
+        }
+        return this._post({ type: 'load', columns }, effortQueryTransferList(columns));
+    }
+
+    query(params) {
+        if (!this.worker) return Promise.resolve(this.engine.query(params));
+        return this._post({ type: 'query', params });
+    }
+
+    _post(message, transfer = []) {
+        const id = this._nextId++;
+        return new Promise((resolve, reject) => {
+            this._pending.set(id, { resolve, reject, message });
+            this.worker.postMessage({ ...message, id }, transfer);
+        });
+    }
+
+    _settle({ id, result, error }) {
+        const pending = this._pending.get(id);
+        if (!pending) return;
+        this._pending.delete(id);
+        if (error) pending.reject(new Error(error));
+        else pending.resolve(result);
+    }
+
+    _fallBackToPage() {
+        if (this.worker) this.worker.terminate();
+        this.worker = null;
+        this.engine = new EffortQueryEngine();
+        if (this._lastEfforts) this.engine.load(buildEffortQueryColumns(this._lastEfforts));
+        const pending = Array.from(this._pending.values());
+        this._pending.clear();
+        pending.forEach(({ resolve, message }) => {
+            resolve(message.type === 'query' ? this.engine.query(message.params) : undefined);
+        });
+    }
+}
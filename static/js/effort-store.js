@@ -0,0 +1,125 @@
+// Client-side effort store (IndexedDB), scoped per segment and athlete.
+
+const EFFORT_STORE_DB = 'stravaEfforts';
+const EFFORT_STORE_VERSION = 1;
+const LEGACY_EFFORT_CACHE_DB = 'stravaCache';
+
+/**
+ * Efforts are stored one record per effort under the key
+ * [segment_id, athlete_id, id], with a [segment_id, athlete_id, start_date]
+ * index so a segment's efforts come back in date order from one range read.
+ * Each record carries a signature of its payload; merges only write records
+ * whose signature changed.
+ */
+class EffortStore {
+    constructor() {
+        this._db = null;
+    }
+
+    static isSupported() {
+        return typeof indexedDB !== 'undefined';
+    }
+
+    open() {
+        if (!this._db) {
+            this._db = new Promise((resolve, reject) => {
+                const request = indexedDB.open(EFFORT_STORE_DB, EFFORT_STORE_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    if (!db.objectStoreNames.contains('efforts')) {
+                        const store = db.createObjectStore('efforts', { keyPath: ['segment_id', 'athlete_id', 'id'] });
+                        store.createIndex('scope_start_date', ['segment_id', 'athlete_id', 'start_date']);
+                    }
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+            // The old cache wrote every effort on each load and was never read.
+            indexedDB.deleteDatabase(LEGACY_EFFORT_CACHE_DB);
+        }
+        return this._db;
+    }
+
+    /**
+     * Efforts for one segment/athlete, newest first (matches the API order).
+     */
+    async load(segmentId, athleteId) {
+        const db = await this.open();
+        const range = EffortStore._scopeRange(segmentId, athleteId);
+        const records = await EffortStore._request(
+            db.transaction('efforts').objectStore('efforts').index('scope_start_date').getAll(range)
+        );
+        return records.reverse().map(EffortStore._toEffort);
+    }
+
+    /**
+     * Write new or changed efforts for a scope.
+     * With replace=true the given list is authoritative and stored efforts
+     * missing from it are deleted. Resolves to the number of records written.
+     */
+    async merge(segmentId, athleteId, efforts, { replace = true } = {}) {
+        const db = await this.open();
+        const scope = EffortStore._scope(segmentId, athleteId);
+        const tx = db.transaction('efforts', 'readwrite');
+        const store = tx.objectStore('efforts');
+        const range = EffortStore._scopeRange(segmentId, athleteId);
+
+        const existing = new Map();
+        const records = await EffortStore._request(store.index('scope_start_date').getAll(range));
+        records.forEach(record => existing.set(record.id, record.sig));
+
+        let written = 0;
+        const seen = new Set();
+        efforts.forEach(effort => {
+            if (effort.id == null) return;
+            const sig = JSON.stringify(effort);
+            seen.add(effort.id);
+            if (existing.get(effort.id) === sig) return;
+            store.put({ ...effort, segment_id: scope[0], athlete_id: scope[1], sig });
+            written++;
+        });
+        if (replace) {
+            existing.forEach((sig, id) => {
+                if (!seen.has(id)) store.delete([scope[0], scope[1], id]);
+            });
+        }
+
+        await new Promise((resolve, reject) => {
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+        return written;
+    }
+
+    async clear() {
+        const db = await this.open();
+        const tx = db.transaction('efforts', 'readwrite');
+        tx.objectStore('efforts').clear();
+        await new Promise((resolve, reject) => {
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    static _scope(segmentId, athleteId) {
+        return [Number(segmentId), Number(athleteId) || 0];
+    }
+
+    static _scopeRange(segmentId, athleteId) {
+        const [segment, athlete] = EffortStore._scope(segmentId, athleteId);
+        return IDBKeyRange.bound([segment, athlete, ''], [segment, athlete, '\uffff']);
+    }
+
+    static _toEffort(record) {
+        const { segment_id, athlete_id, sig, ...effort } = record;
+        return effort;
+    }
+
+    static _request(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+}
@@ -0,0 +1,22 @@
+// Dedicated worker running EffortQueryEngine off the UI thread.
+
+importScripts('readiness.js', 'effort-query.js');
+
+const engine = new EffortQueryEngine();
+
+self.onmessage = (event) => {
+    const { id, type } = event.data;
+    try {
+        if (type === 'load') {
+            engine.load(event.data.columns);
+            self.postMessage({ id, result: null });
+        } else if (type === 'query') {
+            const result = engine.query(event.data.params);
+            self.postMessage({ id, result }, [result.indices.buffer]);
+        } else {
+            self.postMessage({ id, error: `Unknown message type: ${type}` });
+        }
+    } catch (error) {
+        self.postMessage({ id, error: error.message });
+    }
+};
@@ -0,0 +1,122 @@
+// Baseline / Readiness helpers shared by the analyzer page and the effort query worker
+
+// --- Baseline / Readiness (Forme%) - configurable defaults ---
+const READINESS_CONFIG = {
+    z2HrMin: 128,
+    z2HrMax: 138,
+    baselineWindowDays: 120,
+    baselineTopN: 10,
+};
+
+/**
+ * EFF (Efficiency Factor) = Pavg(segment) / HRavg in W/bpm.
+ * Used for baseline and Forme% calculations.
+ */
+function getEF(effort) {
+    const hr = effort.average_heartrate;
+    const p = effort.average_watts;
+    if (hr && hr > 0 && p != null) return p / hr;
+    return null;
+}
+
+function getPowerUsed(effort) {
+    return effort.average_watts;
+}
+
+/**
+ * Is effort "Z2 strict valid" for baseline calculation.
+ * Rules: HR in [z2HrMin, z2HrMax], HR and power non-null/non-zero.
+ * Optional: lowConfidence if Pw:Hr variance would fail (power ±3%, time ±5%).
+ */
+function isZ2Strict(effort, config = READINESS_CONFIG) {
+    const hr = effort.average_heartrate;
+    const power = getPowerUsed(effort);
+    if (hr == null || hr <= 0 || power == null || power <= 0) return { valid: false };
+    const hrMin = config.z2HrMin ?? 132;
+    const hrMax = config.z2HrMax ?? 138;
+    if (hr < hrMin || hr > hrMax) return { valid: false };
+    return { valid: true };
+}
+
+/**
+ * Compute median of a sorted array of numbers.
+ */
+function median(values) {
+    if (!values || values.length === 0) return null;
+    const sorted = [...values].sort((a, b) => a - b);
+    const mid = Math.floor(sorted.length / 2);
+    return sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+}
+
+/**
+ * Baseline = median of top N EFF among Z2-strict-valid efforts in the last windowDays.
+ */
+function computeBaseline(efforts, config = READINESS_CONFIG) {
+    const windowDays = config.baselineWindowDays ?? 120;
+    const topN = config.baselineTopN ?? 10;
+    const cutoff = new Date();
+    cutoff.setDate(cutoff.getDate() - windowDays);
+    const cutoffStr = cutoff.toISOString().slice(0, 10);
+    const valid = efforts.filter(e => {
+        const sd = (e.start_date || '').slice(0, 10);
+        if (sd < cutoffStr) return false;
+        const { valid: ok } = isZ2Strict(e, config);
+        if (!ok) return false;
+        const ef = getEF(e);
+        return ef != null && ef > 0;
+    });
+    if (valid.length === 0) return { baseline: null, count: 0, efforts: [] };
+    const withEF = valid.map(e => ({ e, ef: getEF(e) })).sort((a, b) => b.ef - a.ef);
+    const top = withEF.slice(0, topN).map(x => x.ef);
+    const baseline = median(top);
+    return { baseline, count: top.length, efforts: withEF.slice(0, topN) };
+}
+
+/**
+ * Forme% = (EFF_today / baseline - 1) * 100
+ * ΔEFF = EFF_today - baseline
+ */
+function computeReadiness(effortEF, baseline) {
+    if (baseline == null || baseline <= 0 || effortEF == null || effortEF <= 0) return null;
+    const formePct = Math.round((effortEF / baseline - 1) * 1000) / 10;
+    const deltaEF = Math.round((effortEF - baseline) * 1000) / 1000;
+    return { formePct, deltaEF };
+}
+
+/**
+ * Compute decoupling % for efforts from the same activity (2+ efforts).
+ * Efforts sorted by start_date. EF_i = (NP_i or Pavg_i) / HRavg_i
+ * DEC_session = (EF_first - EF_last) / EF_first * 100
+ * Valid only when: |P_last-P_first|/P_first <= 0.03 AND |time_last-time_first|/time_first <= 0.05
+ */
+function computeDecoupling(efforts) {
+    const byActivity = {};
+    efforts.forEach(e => {
+        const aid = e.activity_id;
+        if (aid) {
+            if (!byActivity[aid]) byActivity[aid] = [];
+            byActivity[aid].push(e);
+        }
+    });
+    Object.values(byActivity).forEach(group => {
+        if (group.length < 2) return;
+        const sorted = [...group].sort((a, b) => (a.start_date || '').localeCompare(b.start_date || ''));
+        const first = sorted[0];
+        const last = sorted[sorted.length - 1];
+        const efFirst = getEF(first);
+        const efLast = getEF(last);
+        if (efFirst == null || efLast == null || efFirst <= 0) return;
+        const pFirst = getPowerUsed(first);
+        const pLast = getPowerUsed(last);
+        const timeFirst = first.elapsed_time ?? first.moving_time ?? 0;
+        const timeLast = last.elapsed_time ?? last.moving_time ?? 0;
+        let valid = true;
+        if (pFirst == null || pFirst <= 0 || pLast == null) valid = false;
+        else if (Math.abs(pLast - pFirst) / pFirst > 0.03) valid = false;
+        if (timeFirst <= 0 || timeLast == null) valid = false;
+        else if (Math.abs(timeLast - timeFirst) / timeFirst > 0.05) valid = false;
+        if (!valid) return;
+        const pct = Math.round((efFirst - efLast) / efFirst * 1000) / 10;
+        group.forEach(e => { e.decoupling_pct = pct; });
+    });
+}
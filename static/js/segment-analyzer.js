@@ -1,126 +1,5 @@
 // Segment Analyzer JavaScript
 
-// --- Baseline / Readiness (Forme%) - configurable defaults ---
-const READINESS_CONFIG = {
-    z2HrMin: 128,
-    z2HrMax: 138,
-    baselineWindowDays: 120,
-    baselineTopN: 10,
-};
-
-/**
- * EFF (Efficiency Factor) = Pavg(segment) / HRavg in W/bpm.
- * Used for baseline and Forme% calculations.
- */
-function getEF(effort) {
-    const hr = effort.average_heartrate;
-    const p = effort.average_watts;
-    if (hr && hr > 0 && p != null) return p / hr;
-    return null;
-}
-
-function getPowerUsed(effort) {
-    return effort.average_watts;
-}
-
-/**
- * Is effort "Z2 strict valid" for baseline calculation.
- * Rules: HR in [z2HrMin, z2HrMax], HR and power non-null/non-zero.
- * Optional: lowConfidence if Pw:Hr variance would fail (power ±3%, time ±5%).
- */
-function isZ2Strict(effort, config = READINESS_CONFIG) {
-    const hr = effort.average_heartrate;
-    const power = getPowerUsed(effort);
-    if (hr == null || hr <= 0 || power == null || power <= 0) return { valid: false };
-    const hrMin = config.z2HrMin ?? 132;
-    const hrMax = config.z2HrMax ?? 138;
-    if (hr < hrMin || hr > hrMax) return { valid: false };
-    return { valid: true };
-}
-
-/**
- * Compute median of a sorted array of numbers.
- */
-function median(values) {
-    if (!values || values.length === 0) return null;
-    const sorted = [...values].sort((a, b) => a - b);
-    const mid = Math.floor(sorted.length / 2);
-    return sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
-}
-
-/**
- * Baseline = median of top N EFF among Z2-strict-valid efforts in the last windowDays.
- */
-function computeBaseline(efforts, config = READINESS_CONFIG) {
-    const windowDays = config.baselineWindowDays ?? 120;
-    const topN = config.baselineTopN ?? 10;
-    const cutoff = new Date();
-    cutoff.setDate(cutoff.getDate() - windowDays);
-    const cutoffStr = cutoff.toISOString().slice(0, 10);
-    const valid = efforts.filter(e => {
-        const sd = (e.start_date || '').slice(0, 10);
-        if (sd < cutoffStr) return false;
-        const { valid: ok } = isZ2Strict(e, config);
-        if (!ok) return false;
-        const ef = getEF(e);
-        return ef != null && ef > 0;
-    });
-    if (valid.length === 0) return { baseline: null, count: 0, efforts: [] };
-    const withEF = valid.map(e => ({ e, ef: getEF(e) })).sort((a, b) => b.ef - a.ef);
-    const top = withEF.slice(0, topN).map(x => x.ef);
-    const baseline = median(top);
-    return { baseline, count: top.length, efforts: withEF.slice(0, topN) };
-}
-
-/**
- * Forme% = (EFF_today / baseline - 1) * 100
- * ΔEFF = EFF_today - baseline
- */
-function computeReadiness(effortEF, baseline) {
-    if (baseline == null || baseline <= 0 || effortEF == null || effortEF <= 0) return null;
-    const formePct = Math.round((effortEF / baseline - 1) * 1000) / 10;
-    const deltaEF = Math.round((effortEF - baseline) * 1000) / 1000;
-    return { formePct, deltaEF };
-}
-
-/**
- * Compute decoupling % for efforts from the same activity (2+ efforts).
- * Efforts sorted by start_date. EF_i = (NP_i or Pavg_i) / HRavg_i
- * DEC_session = (EF_first - EF_last) / EF_first * 100
- * Valid only when: |P_last-P_first|/P_first <= 0.03 AND |time_last-time_first|/time_first <= 0.05
- */
-function computeDecoupling(efforts) {
-    const byActivity = {};
-    efforts.forEach(e => {
-        const aid = e.activity_id;
-        if (aid) {
-            if (!byActivity[aid]) byActivity[aid] = [];
-            byActivity[aid].push(e);
-        }
-    });
-    Object.values(byActivity).forEach(group => {
-        if (group.length < 2) return;
-        const sorted = [...group].sort((a, b) => (a.start_date || '').localeCompare(b.start_date || ''));
-        const first = sorted[0];
-        const last = sorted[sorted.length - 1];
-        const efFirst = getEF(first);
-        const efLast = getEF(last);
-        if (efFirst == null || efLast == null || efFirst <= 0) return;
-        const pFirst = getPowerUsed(first);
-        const pLast = getPowerUsed(last);
-        const timeFirst = first.elapsed_time ?? first.moving_time ?? 0;
-        const timeLast = last.elapsed_time ?? last.moving_time ?? 0;
-        let valid = true;
-        if (pFirst == null || pFirst <= 0 || pLast == null) valid = false;
-        else if (Math.abs(pLast - pFirst) / pFirst > 0.03) valid = false;
-        if (timeFirst <= 0 || timeLast == null) valid = false;
-        else if (Math.abs(timeLast - timeFirst) / timeFirst > 0.05) valid = false;
-        if (!valid) return;
-        const pct = Math.round((efFirst - efLast) / efFirst * 1000) / 10;
-        group.forEach(e => { e.decoupling_pct = pct; });
-    });
-}
-
 class SegmentAnalyzer {
     constructor() {
         this.allEfforts = [];
@@ -129,6 +8,10 @@ class SegmentAnalyzer {
         this.fallbackMode = false;
         this.selectedEffortId = null;
         this.baselineResult = null;
+        this.stats = null;
+        this.querySeq = 0;
+        this.queryClient = new EffortQueryClient(window.effortWorkerUrl);
+        this.effortStore = EffortStore.isSupported() ? new EffortStore() : null;
         
         this.init();
     }
@@ -162,6 +45,9 @@ class SegmentAnalyzer {
                 debounce(() => this.applyFilters(), 500)
             );
         });
+        ['startDate', 'endDate'].forEach(id => {
+            document.getElementById(id).addEventListener('change', () => this.requestEnrichment());
+        });
         const bikeFilterSelect = document.getElementById('bikeFilter');
         if (bikeFilterSelect) {
             bikeFilterSelect.addEventListener('change', () => this.applyFilters());
@@ -186,6 +72,13 @@ class SegmentAnalyzer {
             refreshEffortsBtn.addEventListener('click', () => this.refreshEfforts());
         }
 
+        // The service worker served cached efforts and found newer data on revalidation.
+        navigator.serviceWorker?.addEventListener('message', (event) => {
+            if (event.data?.type === 'efforts-updated' && event.data.segmentId === String(window.segmentData.id)) {
+                this.loadEfforts();
+            }
+        });
+
         const importActivityBtn = document.getElementById('importActivityBtn');
         if (importActivityBtn) {
             importActivityBtn.addEventListener('click', () => this.importFromActivity());
@@ -193,10 +86,7 @@ class SegmentAnalyzer {
 
         const z2Toggle = document.getElementById('useZ2StrictBaseline');
         if (z2Toggle) {
-            z2Toggle.addEventListener('change', () => {
-                this.updateReadinessUI();
-                this.renderEfforts();
-            });
+            z2Toggle.addEventListener('change', () => this.runQuery());
         }
 
         document.getElementById('effortsTable')?.addEventListener('click', (e) => {
@@ -217,16 +107,10 @@ class SegmentAnalyzer {
         const errorPanel = document.getElementById('errorPanel');
         
         // First, try to load from client-side cache for instant display
-        const cachedData = forceRefresh ? null : this.getCachedEfforts();
+        const cachedData = forceRefresh ? null : await this.getCachedEfforts();
         if (cachedData && cachedData.length > 0) {
             console.log('Loading from cache for instant display');
-            this.allEfforts = cachedData;
-            computeDecoupling(this.allEfforts);
-            this.filteredEfforts = [...this.allEfforts];
-            this.updateBikeFilterOptions();
-            this.renderEfforts();
-            this.updateStatistics();
-            this.applyFilters();
+            await this.setEfforts(cachedData);
             
             // Show cache info banner
             this.showCacheInfoBanner();
@@ -236,36 +120,33 @@ class SegmentAnalyzer {
         } else {
             // No cache or force refresh, show full loading
             loadingIndicator.classList.remove('hidden');
+            // The summary panel only needs aggregates; show them before the full list arrives.
+            this.loadServerStatistics();
         }
         
         // Then fetch fresh data in the background
         try {
             errorPanel.classList.add('hidden');
             
-            const queryParams = [];
+            const queryParams = ['format=columnar', ...this.athleteParams()];
             if (this.fallbackMode) {
                 queryParams.push('fallback=true');
             }
             if (forceRefresh) {
                 queryParams.push('refresh=true');
             }
-            const queryString = queryParams.length ? `?${queryParams.join('&')}` : '';
+            // The server enriches efforts inside the viewed date range first.
+            queryParams.push(...this.enrichmentWindowParams());
+            const queryString = `?${queryParams.join('&')}`;
             const response = await axios.get(`/segment/${window.segmentData.id}/efforts${queryString}`);
-            const freshData = response.data;
+            const freshData = effortsFromPayload(response.data);
             
             // Update with fresh data (compute decoupling in case backend didn't or cache)
-            this.allEfforts = freshData;
-            computeDecoupling(this.allEfforts);
-            this.filteredEfforts = [...this.allEfforts];
-            this.updateBikeFilterOptions();
+            await this.setEfforts(freshData);
             
             // Cache the fresh data
             this.setCachedEfforts(freshData);
             
-            this.renderEfforts();
-            this.updateStatistics();
-            this.applyFilters();
-            
             if (this.allEfforts.length === 0) {
                 this.showNoEffortsMessage();
             }
@@ -282,20 +163,22 @@ class SegmentAnalyzer {
         } catch (error) {
             console.error('Error loading efforts:', error);
 
+            // Another athlete logged in since this page was rendered.
+            if (error.response?.status === 403 && error.response?.data?.needs_reload) {
+                window.location.reload();
+                return;
+            }
+
             // If forced refresh is rate-limited, fall back to plain DB read endpoint
             // so user still sees latest persisted data.
             if (forceRefresh && error.response?.status === 429) {
                 try {
-                    const fallbackResponse = await axios.get(`/segment/${window.segmentData.id}/efforts`);
-                    const fallbackData = fallbackResponse.data;
-                    this.allEfforts = fallbackData;
-                    computeDecoupling(this.allEfforts);
-                    this.filteredEfforts = [...this.allEfforts];
-                    this.updateBikeFilterOptions();
+                    const fallbackResponse = await axios.get(
+                        `/segment/${window.segmentData.id}/efforts?${['format=columnar', ...this.athleteParams()].join('&')}`
+                    );
+                    const fallbackData = effortsFromPayload(fallbackResponse.data);
+                    await this.setEfforts(fallbackData);
                     this.setCachedEfforts(fallbackData);
-                    this.renderEfforts();
-                    this.updateStatistics();
-                    this.applyFilters();
                     showNotification('Sync limited by rate limit. Showing latest database data.', 'warning');
                     return;
                 } catch (fallbackError) {
@@ -328,52 +211,84 @@ class SegmentAnalyzer {
         }
     }
     
-    applyFilters() {
-        const minHR = parseFloat(document.getElementById('minHeartRate').value) || null;
-        const maxHR = parseFloat(document.getElementById('maxHeartRate').value) || null;
-        const minPower = parseFloat(document.getElementById('minPower').value) || null;
-        const maxPower = parseFloat(document.getElementById('maxPower').value) || null;
-        const startDate = document.getElementById('startDate').value || null;
-        const endDate = document.getElementById('endDate').value || null;
-        const bikeFilter = document.getElementById('bikeFilter').value || null;
-        
-        this.filteredEfforts = this.allEfforts.filter(effort => {
-            // Heart rate filter
-            if (effort.average_heartrate) {
-                if (minHR && effort.average_heartrate < minHR) return false;
-                if (maxHR && effort.average_heartrate > maxHR) return false;
-            } else if (minHR || maxHR) {
-                // Exclude efforts without heart rate data if HR filter is active
-                return false;
-            }
-            
-            // Power filter
-            if (effort.average_watts) {
-                if (minPower && effort.average_watts < minPower) return false;
-                if (maxPower && effort.average_watts > maxPower) return false;
-            } else if (minPower || maxPower) {
-                // Exclude efforts without power data if power filter is active
-                return false;
-            }
-            
-            // Date filter
-            const effortDate = new Date(effort.start_date).toISOString().split('T')[0];
-            if (startDate && effortDate < startDate) return false;
-            if (endDate && effortDate > endDate) return false;
-
-            // Bike filter
-            const effortBike = effort.bike_name || 'Unknown';
-            if (bikeFilter && effortBike !== bikeFilter) return false;
-            
-            return true;
+    /**
+     * Replace the dataset and hand it to the query worker.
+     */
+    async setEfforts(efforts) {
+        this.allEfforts = efforts;
+        computeDecoupling(this.allEfforts);
+        this.updateBikeFilterOptions();
+        await this.queryClient.load(this.allEfforts);
+        await this.applyFilters();
+    }
+
+    enrichmentWindowParams() {
+        const { startDate, endDate } = this.readFilters();
+        const params = [];
+        if (startDate) params.push(`window_start=${encodeURIComponent(startDate)}`);
+        if (endDate) params.push(`window_end=${encodeURIComponent(endDate)}`);
+        return params;
+    }
+
+    /** Names the athlete in efforts URLs, so the service worker keeps one cache per athlete. */
+    athleteParams() {
+        return window.athleteId ? [`athlete=${encodeURIComponent(window.athleteId)}`] : [];
+    }
+
+    /** Ask the server to enrich the newly selected date range before the rest of the backlog. */
+    async requestEnrichment() {
+        const params = this.enrichmentWindowParams();
+        if (params.length === 0 || this.fallbackMode) return;
+        try {
+            await axios.post(`/segment/${window.segmentData.id}/enrich?${params.join('&')}`);
+        } catch (error) {
+            console.warn('Enrichment request failed:', error.response?.status || error.message);
+        }
+    }
+
+    readFilters() {
+        return {
+            minHR: parseFloat(document.getElementById('minHeartRate').value) || null,
+            maxHR: parseFloat(document.getElementById('maxHeartRate').value) || null,
+            minPower: parseFloat(document.getElementById('minPower').value) || null,
+            maxPower: parseFloat(document.getElementById('maxPower').value) || null,
+            startDate: document.getElementById('startDate').value || null,
+            endDate: document.getElementById('endDate').value || null,
+            bike: document.getElementById('bikeFilter').value || null,
+        };
+    }
+
+    /**
+     * Filter, sort and summarise in the query worker, then render.
+     * Results from superseded queries are dropped.
+     */
+    async runQuery() {
+        const seq = ++this.querySeq;
+        const toggle = document.getElementById('useZ2StrictBaseline');
+        const result = await this.queryClient.query({
+            filters: this.readFilters(),
+            sort: this.currentSort,
+            readinessConfig: READINESS_CONFIG,
+            useBaseline: !toggle || toggle.checked,
+            now: Date.now(),
         });
-        
-        this.sortEfforts(this.currentSort.field, this.currentSort.direction);
+        if (seq !== this.querySeq) return;
+
+        const efforts = this.allEfforts;
+        this.filteredEfforts = Array.from(result.indices, i => efforts[i]);
+        this.queryBaseline = result.baseline;
+        this.stats = result.stats;
+
         this.updateReadinessUI();
         this.renderEfforts();
         this.updateStatistics();
+        this.updateSortIndicators(this.currentSort.field, this.currentSort.direction);
         this.updateFilterIndicators();
     }
+
+    applyFilters() {
+        return this.runQuery();
+    }
     
     clearFilters() {
         document.getElementById('minHeartRate').value = '';
@@ -384,11 +299,7 @@ class SegmentAnalyzer {
         document.getElementById('endDate').value = '';
         document.getElementById('bikeFilter').value = '';
         
-        this.filteredEfforts = [...this.allEfforts];
-        this.updateReadinessUI();
-        this.renderEfforts();
-        this.updateStatistics();
-        this.updateFilterIndicators();
+        return this.runQuery();
     }
     
     resetToDefaults() {
@@ -416,46 +327,13 @@ class SegmentAnalyzer {
         }
         
         this.currentSort = { field, direction };
-        
-        this.filteredEfforts.sort((a, b) => {
-            let aVal = a[field];
-            let bVal = b[field];
-
-            if (field === 'efficiency') {
-                aVal = getEF(a);
-                bVal = getEF(b);
-            } else if (field === 'forme_pct') {
-                const base = this.baselineResult?.baseline;
-                aVal = base && getEF(a) ? computeReadiness(getEF(a), base)?.formePct : null;
-                bVal = base && getEF(b) ? computeReadiness(getEF(b), base)?.formePct : null;
-            } else if (field === 'start_date') {
-                aVal = new Date(aVal);
-                bVal = new Date(bVal);
-            } else if (typeof aVal === 'string') {
-                aVal = aVal.toLowerCase();
-                bVal = bVal.toLowerCase();
-            }
-
-            // Handle null values
-            if (aVal === null || aVal === undefined) aVal = direction === 'asc' ? Infinity : -Infinity;
-            if (bVal === null || bVal === undefined) bVal = direction === 'asc' ? Infinity : -Infinity;
-            
-            if (direction === 'asc') {
-                return aVal > bVal ? 1 : -1;
-            } else {
-                return aVal < bVal ? 1 : -1;
-            }
-        });
-
-        this.updateReadinessUI();
-        this.renderEfforts();
-        this.updateSortIndicators(field, direction);
+        return this.runQuery();
     }
     
     renderEfforts() {
-        const tableBody = document.getElementById('effortsTableBody');
         const effortsPanel = document.getElementById('effortsPanel');
         const effortsCount = document.getElementById('effortsCount');
+        const table = this.getEffortsTable();
         
         if (this.filteredEfforts.length === 0) {
             if (this.allEfforts.length === 0) {
@@ -465,51 +343,82 @@ class SegmentAnalyzer {
 
             effortsPanel.classList.remove('hidden');
             effortsCount.textContent = `(0 shown / ${this.allEfforts.length} total)`;
-            tableBody.innerHTML = `
-                <tr>
-                    <td colspan="11" class="px-6 py-10 text-center text-sm text-gray-500">
-                        No efforts match your current filters. Click <strong>Clear Filters</strong> to see all efforts.
-                    </td>
-                </tr>
-            `;
+            table?.showMessage('No efforts match your current filters. Click <strong>Clear Filters</strong> to see all efforts.');
             return;
         }
         
         effortsPanel.classList.remove('hidden');
         effortsCount.textContent = `(${this.filteredEfforts.length} shown / ${this.allEfforts.length} total)`;
 
+        if (!table) return;
+        if (table.items === this.filteredEfforts) {
+            table.refresh();
+        } else {
+            table.setItems(this.filteredEfforts);
+        }
+    }
+
+    getEffortsTable() {
+        if (!this.effortsTable) {
+            const viewport = document.getElementById('effortsViewport');
+            const tbody = document.getElementById('effortsTableBody');
+            if (!viewport || !tbody) return null;
+            this.effortsTable = new VirtualTable({
+                viewport,
+                tbody,
+                columns: 11,
+                renderRow: (tr, effort) => this.renderEffortRow(tr, effort),
+            });
+        }
+        return this.effortsTable;
+    }
+
+    /**
+     * Fill a pooled table row for one effort.
+     */
+    renderEffortRow(tr, effort) {
+        const effortId = String(effort.id ?? `${effort.activity_id}_${effort.start_date}`);
+        const selected = effortId === this.selectedEffortId;
+        const { valid: z2Valid } = isZ2Strict(effort);
+        const eff = getEF(effort);
         const baseline = this.baselineResult?.baseline;
-        
-        tableBody.innerHTML = this.filteredEfforts.map(effort => {
-            const effortId = String(effort.id ?? `${effort.activity_id}_${effort.start_date}`);
-            const selected = effortId === this.selectedEffortId;
-            const { valid: z2Valid } = isZ2Strict(effort);
-            const eff = getEF(effort);
-            const r = baseline && eff ? computeReadiness(eff, baseline) : null;
-            const formeCell = r != null ? (r.formePct >= 0 ? '+' : '') + r.formePct + '%' : '—';
-            return `
-            <tr class="effort-row ${selected ? 'bg-orange-50 ring-1 ring-orange-200' : ''}" data-effort-id="${effortId}">
-                <td class="text-gray-900" title="${formatDate(effort.start_date)}">${formatDate(effort.start_date)}</td>
-                <td class="text-gray-900">
-                    <a href="https://www.strava.com/activities/${effort.activity_id}" target="_blank" class="text-orange-600 hover:text-orange-900 truncate block max-w-[3.5rem]" title="${(effort.name || '').replace(/"/g, '&quot;')} (View on Strava)">${effort.name || '—'}</a>
-                </td>
-                <td class="text-gray-900">${effort.bike_name || '—'}</td>
-                <td class="text-gray-900 font-mono">${formatTime(effort.elapsed_time)}</td>
-                <td class="text-gray-900">${effort.average_heartrate ? Math.round(effort.average_heartrate) + ' bpm' : '—'}</td>
-                <td class="text-gray-900">${eff != null ? eff.toFixed(2) : '—'}</td>
-                <td class="text-gray-900">${effort.average_watts ? Math.round(effort.average_watts) + ' W' : '—'}</td>
-                <td class="text-gray-900">${effort.vam ? effort.vam + ' m/h' : '—'}</td>
-                <td class="text-gray-900">${effort.decoupling_pct != null ? effort.decoupling_pct + '%' : '—'}</td>
-                <td class="text-gray-900 col-z2" title="${z2Valid ? 'Z2 strict valid' : 'Not Z2 strict'}">${z2Valid ? '<i class="fas fa-check text-green-600"></i>' : '—'}</td>
-                <td class="text-gray-900 col-forme">${formeCell}</td>
-            </tr>
-        `;
-        }).join('');
+        const r = baseline && eff ? computeReadiness(eff, baseline) : null;
+        const formeCell = r != null ? (r.formePct >= 0 ? '+' : '') + r.formePct + '%' : '—';
+        const cells = tr.cells;
+
+        tr.className = `effort-row ${selected ? 'bg-orange-50 ring-1 ring-orange-200' : ''}`;
+        tr.dataset.effortId = effortId;
+
+        const date = formatDate(effort.start_date);
+        cells[0].className = 'text-gray-900';
+        cells[0].title = date;
+        cells[0].textContent = date;
+        cells[1].className = 'text-gray-900';
+        cells[1].innerHTML = `<a href="https://www.strava.com/activities/${effort.activity_id}" target="_blank" class="text-orange-600 hover:text-orange-900 truncate block max-w-[3.5rem]" title="${(effort.name || '').replace(/"/g, '&quot;')} (View on Strava)">${effort.name || '—'}</a>`;
+        cells[2].className = 'text-gray-900';
+        cells[2].textContent = effort.bike_name || '—';
+        cells[3].className = 'text-gray-900 font-mono';
+        cells[3].textContent = formatTime(effort.elapsed_time);
+        cells[4].className = 'text-gray-900';
+        cells[4].textContent = effort.average_heartrate ? Math.round(effort.average_heartrate) + ' bpm' : '—';
+        cells[5].className = 'text-gray-900';
+        cells[5].textContent = eff != null ? eff.toFixed(2) : '—';
+        cells[6].className = 'text-gray-900';
+        cells[6].textContent = effort.average_watts ? Math.round(effort.average_watts) + ' W' : '—';
+        cells[7].className = 'text-gray-900';
+        cells[7].textContent = effort.vam ? effort.vam + ' m/h' : '—';
+        cells[8].className = 'text-gray-900';
+        cells[8].textContent = effort.decoupling_pct != null ? effort.decoupling_pct + '%' : '—';
+        cells[9].className = 'text-gray-900 col-z2';
+        cells[9].title = z2Valid ? 'Z2 strict valid' : 'Not Z2 strict';
+        cells[9].innerHTML = z2Valid ? '<i class="fas fa-check text-green-600"></i>' : '—';
+        cells[10].className = 'text-gray-900 col-forme';
+        cells[10].textContent = formeCell;
     }
     
     /**
      * Update Readiness/Forme block: baseline, EFF today, Forme%, badge, note.
-     * Toggle off = hide block. Toggle on = compute baseline from Z2-strict efforts, show values.
+     * Toggle off = hide block. Toggle on = show the baseline computed by the query worker.
      */
     updateReadinessUI() {
         const block = document.getElementById('readinessBlock');
@@ -525,7 +434,7 @@ class SegmentAnalyzer {
         }
 
         block.classList.remove('hidden');
-        this.baselineResult = computeBaseline(this.filteredEfforts, READINESS_CONFIG);
+        this.baselineResult = this.queryBaseline || { baseline: null, count: 0 };
 
         const effortToday = this.selectedEffortId
             ? this.filteredEfforts.find(e => String(e.id) === this.selectedEffortId)
@@ -580,36 +489,14 @@ class SegmentAnalyzer {
         const statsPanel = document.getElementById('statisticsPanel');
         const statsContent = document.getElementById('statsContent');
         
-        if (this.filteredEfforts.length === 0) {
+        if (!this.stats || this.stats.totalEfforts === 0) {
             statsPanel.classList.add('hidden');
             return;
         }
         
         statsPanel.classList.remove('hidden');
         
-        // Calculate statistics
-        const times = this.filteredEfforts.map(e => e.elapsed_time);
-        const heartRates = this.filteredEfforts
-            .filter(e => e.average_heartrate)
-            .map(e => e.average_heartrate);
-        const powers = this.filteredEfforts
-            .filter(e => e.average_watts)
-            .map(e => e.average_watts);
-        const vams = this.filteredEfforts
-            .filter(e => e.vam)
-            .map(e => e.vam);
-        
-        const stats = {
-            totalEfforts: this.filteredEfforts.length,
-            bestTime: Math.min(...times),
-            avgTime: Math.round(times.reduce((a, b) => a + b, 0) / times.length),
-            avgHeartRate: heartRates.length > 0 ? 
-                Math.round(heartRates.reduce((a, b) => a + b, 0) / heartRates.length) : null,
-            avgPower: powers.length > 0 ? 
-                Math.round(powers.reduce((a, b) => a + b, 0) / powers.length) : null,
-            avgVAM: vams.length > 0 ? 
-                Math.round(vams.reduce((a, b) => a + b, 0) / vams.length) : null
-        };
+        const stats = this.stats;
         
         statsContent.innerHTML = `
             <div class="stat-card">
@@ -639,6 +526,39 @@ class SegmentAnalyzer {
         `;
     }
     
+    /**
+     * Summary statistics computed server-side (/segment/<id>/stats) for the current filters.
+     * Used until the effort list has loaded; the query worker takes over after that.
+     */
+    async loadServerStatistics() {
+        const filters = this.readFilters();
+        const params = new URLSearchParams();
+        const mapping = {
+            minHR: 'min_hr', maxHR: 'max_hr', minPower: 'min_power', maxPower: 'max_power',
+            startDate: 'start_date', endDate: 'end_date', bike: 'bike',
+        };
+        Object.entries(mapping).forEach(([key, param]) => {
+            if (filters[key] != null) params.set(param, filters[key]);
+        });
+        try {
+            const response = await axios.get(`/segment/${window.segmentData.id}/stats?${params}`);
+            if (this.allEfforts.length > 0) return;
+            const { count, metrics } = response.data;
+            const mean = (metric) => (metrics[metric].mean != null ? Math.round(metrics[metric].mean) : null);
+            this.stats = {
+                totalEfforts: count,
+                bestTime: metrics.elapsed_time.best,
+                avgTime: mean('elapsed_time'),
+                avgHeartRate: mean('average_heartrate'),
+                avgPower: mean('average_watts'),
+                avgVAM: mean('vam'),
+            };
+            this.updateStatistics();
+        } catch (error) {
+            console.warn('Could not load summary statistics:', error);
+        }
+    }
+
     updateSortIndicators(activeField, direction) {
         // Remove all sort classes
         document.querySelectorAll('[data-sort]').forEach(header => {
@@ -762,11 +682,8 @@ class SegmentAnalyzer {
             await axios.post('/db/clear', { confirm_text: 'CLEAR' });
             // Clear browser storage
             localStorage.clear();
-            if (window.indexedDB) {
-                const request = indexedDB.deleteDatabase('stravaCache');
-                request.onsuccess = () => {
-                    console.log('IndexedDB cleared');
-                };
+            if (this.effortStore) {
+                await this.effortStore.clear();
             }
             showNotification('Database cleared', 'success');
             this.loadCacheStats(); // Refresh stats
@@ -814,16 +731,10 @@ class SegmentAnalyzer {
             if (imported.length > 0) {
                 const byId = new Map(this.allEfforts.map(e => [String(e.id), e]));
                 imported.forEach(effort => byId.set(String(effort.id), effort));
-                this.allEfforts = Array.from(byId.values()).sort(
+                await this.setEfforts(Array.from(byId.values()).sort(
                     (a, b) => new Date(b.start_date) - new Date(a.start_date)
-                );
-                computeDecoupling(this.allEfforts);
-                this.filteredEfforts = [...this.allEfforts];
-                this.updateBikeFilterOptions();
-                this.renderEfforts();
-                this.updateStatistics();
-                this.applyFilters();
-                this.setCachedEfforts(this.allEfforts);
+                ));
+                this.setCachedEfforts(imported, { replace: false });
             }
             showNotification(`Imported ${data.imported} effort(s)`, 'success');
             // Then request latest DB view without forcing a heavy refresh path.
@@ -842,60 +753,31 @@ class SegmentAnalyzer {
         return parseFloat((bytes / Math.pow(k, i)).toFixed(1)) + ' ' + sizes[i];
     }
     
-    getCachedEfforts() {
+    /**
+     * Efforts for this segment from the IndexedDB store (first paint), or null.
+     */
+    async getCachedEfforts() {
+        // Drop the localStorage blob written by earlier versions of this page.
+        localStorage.removeItem(`efforts_${window.segmentData.id}`);
+        if (!this.effortStore) return null;
         try {
-            const cacheKey = `efforts_${window.segmentData.id}`;
-            const cached = localStorage.getItem(cacheKey);
-            if (cached) {
-                const data = JSON.parse(cached);
-                // Check if cache is still valid (less than 1 hour old)
-                const cacheTime = new Date(data.timestamp);
-                const now = new Date();
-                const ageHours = (now - cacheTime) / (1000 * 60 * 60);
-                
-                if (ageHours < 24) { // Use cache if less than 24 hours old for instant loading
-                    return data.efforts;
-                }
-            }
+            const efforts = await this.effortStore.load(window.segmentData.id, window.athleteId);
+            return efforts.length > 0 ? efforts : null;
         } catch (error) {
             console.warn('Error reading cached efforts:', error);
+            return null;
         }
-        return null;
     }
     
-    setCachedEfforts(efforts) {
-        try {
-            const cacheKey = `efforts_${window.segmentData.id}`;
-            const cacheData = {
-                efforts: efforts,
-                timestamp: new Date().toISOString()
-            };
-            localStorage.setItem(cacheKey, JSON.stringify(cacheData));
-            
-            // Store individual efforts in IndexedDB for permanent storage
-            if (window.indexedDB) {
-                const request = indexedDB.open('stravaCache', 1);
-                
-                request.onupgradeneeded = (event) => {
-                    const db = event.target.result;
-                    if (!db.objectStoreNames.contains('efforts')) {
-                        db.createObjectStore('efforts', { keyPath: 'id' });
-                    }
-                };
-                
-                request.onsuccess = (event) => {
-                    const db = event.target.result;
-                    const transaction = db.transaction(['efforts'], 'readwrite');
-                    const store = transaction.objectStore('efforts');
-                    
-                    efforts.forEach(effort => {
-                        store.put(effort);
-                    });
-                };
-            }
-        } catch (error) {
-            console.warn('Error caching efforts:', error);
-        }
+    /**
+     * Merge efforts into the IndexedDB store; only new or changed efforts are written.
+     * Runs in the background so it never delays rendering.
+     */
+    setCachedEfforts(efforts, { replace = true } = {}) {
+        if (!this.effortStore) return;
+        const plainEfforts = efforts.map(toPlainEffort);
+        this.effortStore.merge(window.segmentData.id, window.athleteId, plainEfforts, { replace })
+            .catch(error => console.warn('Error caching efforts:', error));
     }
     
     showRefreshIndicator() {
@@ -0,0 +1,149 @@
+// Virtual-scrolling table body: only the visible window (plus overscan) is in the DOM.
+
+class VirtualTable {
+    /**
+     * @param {Object} options
+     * @param {HTMLElement} options.viewport  scrolling container around the table
+     * @param {HTMLElement} options.tbody     table body to render into
+     * @param {number} options.columns        column count (for spacer/message rows)
+     * @param {Function} options.renderRow    (tr, item) => void, fills a pooled row
+     * @param {number} [options.rowHeight]    initial row height estimate in px
+     * @param {number} [options.overscan]     extra rows rendered above and below
+     */
+    constructor({ viewport, tbody, columns, renderRow, rowHeight = 28, overscan = 8 }) {
+        this.viewport = viewport;
+        this.tbody = tbody;
+        this.columns = columns;
+        this.renderRow = renderRow;
+        this.rowHeight = rowHeight;
+        this.overscan = overscan;
+        this.items = [];
+        this.pool = [];
+        this.generation = 0;
+        this._measured = false;
+        this._frame = null;
+
+        this.topSpacer = this._spacerRow();
+        this.bottomSpacer = this._spacerRow();
+        this.messageRow = null;
+
+        this.viewport.addEventListener('scroll', () => this._schedule(), { passive: true });
+        window.addEventListener('resize', () => this._schedule());
+    }
+
+    /** Replace the rows; visible rows are repainted, everything else stays virtual. */
+    setItems(items) {
+        this.items = items;
+        this.generation++;
+        this._clearMessage();
+        const maxScroll = Math.max(0, items.length * this.rowHeight - this.viewport.clientHeight);
+        if (this.viewport.scrollTop > maxScroll) this.viewport.scrollTop = maxScroll;
+        this.render();
+    }
+
+    /** Repaint visible rows after a change that does not alter the item list (e.g. selection). */
+    refresh() {
+        this.generation++;
+        this.render();
+    }
+
+    /** Show a single full-width message row instead of data rows. */
+    showMessage(html) {
+        this.items = [];
+        this.generation++;
+        this.tbody.replaceChildren();
+        this.messageRow = document.createElement('tr');
+        const cell = document.createElement('td');
+        cell.colSpan = this.columns;
+        cell.className = 'px-6 py-10 text-center text-sm text-gray-500';
+        cell.innerHTML = html;
+        this.messageRow.appendChild(cell);
+        this.tbody.appendChild(this.messageRow);
+    }
+
+    render() {
+        this._frame = null;
+        if (this.messageRow) return;
+
+        const total = this.items.length;
+        const viewportHeight = this.viewport.clientHeight || this.rowHeight * 20;
+        const scrollTop = this.viewport.scrollTop;
+        const first = Math.max(0, Math.floor(scrollTop / this.rowHeight) - this.overscan);
+        const visible = Math.ceil(viewportHeight / this.rowHeight) + 2 * this.overscan;
+        const last = Math.min(total, first + visible);
+        const needed = last - first;
+
+        if (this.pool.length < needed) {
+            // Slots are assigned by item position modulo pool size, so a changed
+            // pool size invalidates every slot.
+            while (this.pool.length < needed) this.pool.push(this._dataRow());
+            this.pool.forEach(tr => { tr._item = undefined; });
+        }
+
+        // Ring-buffer slots: scrolling by n rows repaints only the n rows that came into view.
+        const size = this.pool.length;
+        const rows = [this.topSpacer];
+        for (let k = 0; k < needed; k++) {
+            const tr = this.pool[(first + k) % size];
+            const item = this.items[first + k];
+            if (tr._item !== item || tr._generation !== this.generation) {
+                this.renderRow(tr, item);
+                tr._item = item;
+                tr._generation = this.generation;
+            }
+            rows.push(tr);
+        }
+        rows.push(this.bottomSpacer);
+
+        this.topSpacer.firstChild.style.height = `${first * this.rowHeight}px`;
+        this.bottomSpacer.firstChild.style.height = `${(total - last) * this.rowHeight}px`;
+        this._sync(rows);
+
+        if (!this._measured && needed > 0) {
+            const height = rows[1].getBoundingClientRect().height;
+            if (height > 0) {
+                this._measured = true;
+                if (Math.abs(height - this.rowHeight) > 0.5) {
+                    this.rowHeight = height;
+                    this.render();
+                }
+            }
+        }
+    }
+
+    _sync(rows) {
+        // Only touch the DOM where the row sequence actually changed.
+        const children = this.tbody.children;
+        let same = children.length === rows.length;
+        for (let i = 0; same && i < rows.length; i++) same = children[i] === rows[i];
+        if (!same) this.tbody.replaceChildren(...rows);
+    }
+
+    _schedule() {
+        if (this._frame !== null) return;
+        this._frame = requestAnimationFrame(() => this.render());
+    }
+
+    _clearMessage() {
+        if (this.messageRow) {
+            this.messageRow.remove();
+            this.messageRow = null;
+        }
+    }
+
+    _spacerRow() {
+        const tr = document.createElement('tr');
+        tr.className = 'virtual-spacer';
+        tr.setAttribute('aria-hidden', 'true');
+        const td = document.createElement('td');
+        td.colSpan = this.columns;
+        tr.appendChild(td);
+        return tr;
+    }
+
+    _dataRow() {
+        const tr = document.createElement('tr');
+        for (let i = 0; i < this.columns; i++) tr.appendChild(document.createElement('td'));
+        return tr;
+    }
+}
@@ -1,27 +1,100 @@
 import json
+import math
 import os
 import sqlite3
+import time
 from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from dates import iso_to_epoch
+from query_stats import ProfiledConnection, QueryProfiler
+
+# Metrics summarised by get_effort_stats, with the direction that counts as "best".
+STATS_METRICS = {
+    "elapsed_time": "min",
+    "average_heartrate": None,
+    "average_watts": "max",
+    "vam": "max",
+    "efficiency": "max",
+}
+STATS_PERCENTILES = (10, 25, 50, 75, 90)
+STATS_HISTOGRAM_METRICS = ("elapsed_time", "average_heartrate", "average_watts")
+
+# Rollup metrics as (column prefix, SQL expression over efforts); zero HR/power/VAM count as missing.
+ROLLUP_METRICS = (
+    ("time", "elapsed_time"),
+    ("hr", "NULLIF(average_heartrate, 0)"),
+    ("watts", "NULLIF(average_watts, 0)"),
+    ("ef", "efficiency"),
+    ("vam", "NULLIF(vam, 0)"),
+)
+# Period start (ISO date) for an effort: the Monday of its local week, the first of its local month.
+ROLLUP_PERIODS = {
+    "week": "date(local_date, '-6 days', 'weekday 1')",
+    "month": "substr(local_date, 1, 7) || '-01'",
+}
+# Columns after (segment_id, athlete_id, start_epoch) in idx_efforts_segment_athlete_epoch, so that
+# date-windowed reads of these columns (stats, rollups, fitness) are answered from the index alone.
+EFFORT_COVERING_COLUMNS = (
+    "local_date",
+    "bike_id",
+    "bike_name",
+    "elapsed_time",
+    "average_heartrate",
+    "average_watts",
+    "normalized_watts",
+    "efficiency",
+    "vam",
+)
+ROLLUP_METRIC_COLUMNS = ",\n".join(
+    f"{name}_n INTEGER NOT NULL DEFAULT 0, {name}_sum REAL NOT NULL DEFAULT 0, "
+    f"{name}_sumsq REAL NOT NULL DEFAULT 0, {name}_min REAL, {name}_max REAL"
+    for name, _ in ROLLUP_METRICS
+)
 
 
 class StravaRepository:
-    def __init__(self, db_path: str = "data/strava.db"):
+    def __init__(self, db_path: str = "data/strava.db", query_profiler: Optional[QueryProfiler] = None):
         self.db_path = Path(db_path)
+        # Opt-in per-statement timing and query plans (query_stats.py).
+        self.query_profiler = query_profiler
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Called with (segment_id, athlete_id) after efforts change; None means "any".
+        self.efforts_changed_listeners: List[Callable[[Optional[int], Optional[int]], None]] = []
+        # Called with (seconds, statement count) when a connection block ends.
+        self.connection_listeners: List[Callable[[float, int], None]] = []
         self._initialize()
 
     @contextmanager
     def _connect(self):
-        conn = sqlite3.connect(self.db_path)
+        if self.query_profiler is not None:
+            conn = sqlite3.connect(self.db_path, factory=ProfiledConnection)
+            conn.profiler = self.query_profiler
+        else:
+            conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        statements = 0
+
+        def count_statement(sql: str) -> None:
+            nonlocal statements
+            if not sql.startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+                statements += 1
+
+        if self.connection_listeners:
+            conn.set_trace_callback(count_statement)
+        started = time.perf_counter()
         try:
             yield conn
             conn.commit()
         finally:
+            if self.query_profiler is not None:
+                conn.finish_statements()
             conn.close()
+            elapsed = time.perf_counter() - started
+            for listener in self.connection_listeners:
+                listener(elapsed, statements)
 
     def _initialize(self) -> None:
         with self._connect() as conn:
@@ -62,6 +135,8 @@ class StravaRepository:
                     activity_id INTEGER NOT NULL,
                     athlete_id INTEGER NOT NULL,
                     start_date TEXT,
+                    start_epoch INTEGER,
+                    local_date TEXT,
                     bike_id TEXT,
                     bike_name TEXT,
                     elapsed_time INTEGER,
@@ -86,6 +161,39 @@ class StravaRepository:
                 CREATE INDEX IF NOT EXISTS idx_efforts_activity
                 ON efforts(activity_id);
 
+                CREATE TABLE IF NOT EXISTS gear (
+                    id TEXT PRIMARY KEY,
+                    athlete_id INTEGER,
+                    name TEXT,
+                    brand_name TEXT,
+                    model_name TEXT,
+                    is_primary INTEGER NOT NULL DEFAULT 0,
+                    retired INTEGER NOT NULL DEFAULT 0,
+                    distance REAL,
+                    raw_json TEXT,
+                    updated_at TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS streams (
+                    activity_id INTEGER PRIMARY KEY,
+                    athlete_id INTEGER NOT NULL,
+                    point_count INTEGER NOT NULL DEFAULT 0,
+                    time BLOB,
+                    watts BLOB,
+                    heartrate BLOB,
+                    distance BLOB,
+                    latlng BLOB,
+                    updated_at TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS effort_versions (
+                    segment_id INTEGER NOT NULL,
+                    athlete_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (segment_id, athlete_id)
+                );
+
                 CREATE TABLE IF NOT EXISTS sync_state (
                     segment_id INTEGER NOT NULL,
                     athlete_id INTEGER NOT NULL,
@@ -94,6 +202,36 @@ class StravaRepository:
                     updated_at TEXT NOT NULL,
                     PRIMARY KEY (segment_id, athlete_id)
                 );
+
+                -- Activities Strava answered 403/404 for; kept out of the enrichment backlog.
+                CREATE TABLE IF NOT EXISTS unavailable_activities (
+                    id INTEGER PRIMARY KEY,
+                    athlete_id INTEGER NOT NULL,
+                    status_code INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS athlete_tokens (
+                    athlete_id INTEGER PRIMARY KEY,
+                    access_token TEXT,
+                    refresh_token TEXT NOT NULL,
+                    expires_at INTEGER,
+                    updated_at TEXT NOT NULL
+                );
+                """
+            )
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS effort_rollups (
+                    segment_id INTEGER NOT NULL,
+                    athlete_id INTEGER NOT NULL,
+                    period TEXT NOT NULL,
+                    period_start TEXT NOT NULL,
+                    bike_id TEXT NOT NULL DEFAULT '',
+                    effort_count INTEGER NOT NULL DEFAULT 0,
+                    {ROLLUP_METRIC_COLUMNS},
+                    PRIMARY KEY (segment_id, athlete_id, period, period_start, bike_id)
+                )
                 """
             )
         activity_alters = [
@@ -106,16 +244,43 @@ class StravaRepository:
             "ALTER TABLE efforts ADD COLUMN bike_name TEXT",
             "ALTER TABLE efforts ADD COLUMN normalized_watts REAL",
             "ALTER TABLE efforts ADD COLUMN efficiency REAL",
+            "ALTER TABLE efforts ADD COLUMN start_index INTEGER",
+            "ALTER TABLE efforts ADD COLUMN end_index INTEGER",
+            "ALTER TABLE efforts ADD COLUMN hr_drift_pct REAL",
+            "ALTER TABLE efforts ADD COLUMN time_in_zones TEXT",
+            "ALTER TABLE efforts ADD COLUMN start_epoch INTEGER",
+            "ALTER TABLE efforts ADD COLUMN local_date TEXT",
         ]
+        stream_alters = ["ALTER TABLE streams ADD COLUMN latlng BLOB"]
 
         with self._connect() as conn:
-            for sql in activity_alters + effort_alters:
+            for sql in activity_alters + effort_alters + stream_alters:
                 try:
                     conn.execute(sql)
                 except sqlite3.OperationalError:
                     pass
         # Backfill bike info from already cached Strava activity payload.
         with self._connect() as conn:
+            # Typed dates for rows stored before start_epoch/local_date existed. Rollups group by
+            # local_date, so they are rebuilt once the column has been filled.
+            backfilled = conn.execute(
+                """
+                UPDATE efforts
+                SET
+                    start_epoch = CAST(strftime('%s', start_date) AS INTEGER),
+                    local_date = substr(COALESCE(json_extract(raw_json, '$.start_date_local'), start_date), 1, 10)
+                WHERE start_epoch IS NULL AND start_date IS NOT NULL
+                """
+            ).rowcount
+            # Locally matched efforts (negative ids) stored with export-file sample positions.
+            conn.execute("UPDATE efforts SET start_index = NULL, end_index = NULL WHERE id < 0 AND start_index IS NOT NULL")
+            conn.execute("DROP INDEX IF EXISTS idx_efforts_segment_athlete_date")
+            conn.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS idx_efforts_segment_athlete_epoch
+                ON efforts(segment_id, athlete_id, start_epoch, {", ".join(EFFORT_COVERING_COLUMNS)})
+                """
+            )
             conn.execute(
                 """
                 UPDATE activities
@@ -178,11 +343,93 @@ class StravaRepository:
                    OR efficiency IS NULL
                 """
             )
+            # Seed the gear table from gear objects embedded in cached activity payloads.
+            conn.execute(
+                """
+                INSERT INTO gear (id, athlete_id, name, raw_json, updated_at)
+                SELECT
+                    json_extract(raw_json, '$.gear.id'),
+                    athlete_id,
+                    json_extract(raw_json, '$.gear.name'),
+                    json_extract(raw_json, '$.gear'),
+                    ?
+                FROM activities
+                WHERE json_extract(raw_json, '$.gear.id') IS NOT NULL
+                  AND json_extract(raw_json, '$.gear.name') IS NOT NULL
+                ON CONFLICT(id) DO NOTHING
+                """,
+                (self._now_iso(),),
+            )
+            self._backfill_gear_names(conn)
+            # Databases created before rollups existed get them built once.
+            has_rollups = conn.execute("SELECT 1 FROM effort_rollups LIMIT 1").fetchone()
+            has_efforts = conn.execute("SELECT 1 FROM efforts LIMIT 1").fetchone()
+            if has_efforts and (backfilled or not has_rollups):
+                self._rebuild_rollups(conn)
+
+    @staticmethod
+    def _backfill_gear_names(conn: sqlite3.Connection) -> None:
+        """Replace missing and placeholder ("Bike <gear_id>") bike names with resolved gear names."""
+        for table in ("activities", "efforts"):
+            conn.execute(
+                f"""
+                UPDATE {table}
+                SET bike_name = (SELECT g.name FROM gear g WHERE g.id = {table}.bike_id)
+                WHERE bike_id IS NOT NULL
+                  AND (bike_name IS NULL OR TRIM(bike_name) = '' OR bike_name = 'Bike ' || bike_id)
+                  AND EXISTS (SELECT 1 FROM gear g WHERE g.id = {table}.bike_id AND g.name IS NOT NULL)
+                """
+            )
 
     @staticmethod
     def _now_iso() -> str:
         return datetime.now(timezone.utc).isoformat()
 
+    def _bump_efforts_version(
+        self,
+        conn: sqlite3.Connection,
+        segment_id: Optional[int] = None,
+        athlete_id: Optional[int] = None,
+    ) -> None:
+        """Advance the data version read by response caches; None bumps every matching scope."""
+        now = self._now_iso()
+        if segment_id is not None and athlete_id is not None:
+            conn.execute(
+                """
+                INSERT INTO effort_versions (segment_id, athlete_id, version, updated_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(segment_id, athlete_id) DO UPDATE SET
+                    version=effort_versions.version + 1,
+                    updated_at=excluded.updated_at
+                """,
+                (segment_id, athlete_id, now),
+            )
+        elif athlete_id is not None:
+            conn.execute(
+                "UPDATE effort_versions SET version = version + 1, updated_at = ? WHERE athlete_id = ?",
+                (now, athlete_id),
+            )
+        else:
+            conn.execute("UPDATE effort_versions SET version = version + 1, updated_at = ?", (now,))
+        for listener in self.efforts_changed_listeners:
+            listener(segment_id, athlete_id)
+
+    def get_efforts_version(self, segment_id: int, athlete_id: int) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version FROM effort_versions WHERE segment_id = ? AND athlete_id = ?",
+                (segment_id, athlete_id),
+            ).fetchone()
+        return row["version"] if row else 0
+
+    def get_efforts_versions(self, athlete_id: int) -> Dict[int, int]:
+        """{segment_id: data version} for every segment the athlete has efforts versions on."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT segment_id, version FROM effort_versions WHERE athlete_id = ?", (athlete_id,)
+            ).fetchall()
+        return {row["segment_id"]: row["version"] for row in rows}
+
     def upsert_segment(self, segment: Dict) -> None:
         now = self._now_iso()
         with self._connect() as conn:
@@ -226,21 +473,32 @@ class StravaRepository:
                 return None
             return dict(row)
 
+    def get_segment_payload(self, segment_id: int) -> Optional[Dict]:
+        """The stored /segments/{id} response, including its map polyline."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT raw_json FROM segments WHERE id = ?", (segment_id,)).fetchone()
+        if not row or not row["raw_json"]:
+            return None
+        return json.loads(row["raw_json"])
+
     def upsert_activities(self, athlete_id: int, activities: Dict[int, Dict]) -> None:
         if not activities:
             return
 
         now = self._now_iso()
         rows = []
+        gear_items = []
         for activity in activities.values():
+            gear = activity.get("gear") or {}
+            if gear.get("id") and gear.get("name"):
+                gear_items.append(gear)
             rows.append(
                 (
                     activity.get("id"),
                     athlete_id,
                     activity.get("name"),
                     activity.get("gear_id"),
-                    activity.get("gear", {}).get("name")
-                    or (f"Bike {activity.get('gear_id')}" if activity.get("gear_id") else None),
+                    gear.get("name"),
                     activity.get("start_date"),
                     activity.get("average_heartrate"),
                     activity.get("max_heartrate"),
@@ -281,6 +539,94 @@ class StravaRepository:
                 rows,
             )
 
+        if gear_items:
+            self.upsert_gear(athlete_id, gear_items)
+
+    def get_activity_ids(self, athlete_id: int) -> Set[int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM activities WHERE athlete_id = ?", (athlete_id,)).fetchall()
+        return {row["id"] for row in rows}
+
+    def get_gear_ids_by_name(self, athlete_id: int) -> Dict[str, str]:
+        """Gear name -> gear id for the athlete's named gear (bulk exports name gear but give no id)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, name FROM gear WHERE athlete_id = ? AND name IS NOT NULL ORDER BY retired DESC, updated_at",
+                (athlete_id,),
+            ).fetchall()
+        return {row["name"]: row["id"] for row in rows}
+
+    def upsert_gear(self, athlete_id: int, gear_items: List[Dict]) -> None:
+        """Store gear from /gear/{id}, the athlete profile or activity payloads, keyed by gear_id.
+
+        Items without a name are kept as resolution attempts so the same unknown
+        gear id is not requested again on every sync.
+        """
+        rows = []
+        for gear in gear_items:
+            if not gear.get("id"):
+                continue
+            rows.append(
+                (
+                    str(gear.get("id")),
+                    athlete_id,
+                    gear.get("name") or gear.get("nickname"),
+                    gear.get("brand_name"),
+                    gear.get("model_name"),
+                    1 if gear.get("primary") else 0,
+                    1 if gear.get("retired") else 0,
+                    gear.get("distance"),
+                    json.dumps(gear),
+                    self._now_iso(),
+                )
+            )
+        if not rows:
+            return
+
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO gear (
+                    id, athlete_id, name, brand_name, model_name, is_primary, retired, distance, raw_json, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    athlete_id=excluded.athlete_id,
+                    name=COALESCE(excluded.name, gear.name),
+                    brand_name=COALESCE(excluded.brand_name, gear.brand_name),
+                    model_name=COALESCE(excluded.model_name, gear.model_name),
+                    is_primary=excluded.is_primary,
+                    retired=excluded.retired,
+                    distance=COALESCE(excluded.distance, gear.distance),
+                    raw_json=excluded.raw_json,
+                    updated_at=excluded.updated_at
+                WHERE gear.raw_json IS NOT excluded.raw_json
+                """,
+                rows,
+            )
+            if conn.total_changes:
+                self._backfill_gear_names(conn)
+                self._bump_efforts_version(conn, athlete_id=athlete_id)
+
+    def get_unresolved_gear_ids(self, athlete_id: int, limit: int = 100) -> List[str]:
+        """Gear ids referenced by the athlete's activities with no gear row yet, most recently used first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT a.bike_id, MAX(a.start_date) AS last_used
+                FROM activities a
+                LEFT JOIN gear g ON g.id = a.bike_id
+                WHERE a.athlete_id = ?
+                  AND a.bike_id IS NOT NULL
+                  AND g.id IS NULL
+                GROUP BY a.bike_id
+                ORDER BY last_used DESC
+                LIMIT ?
+                """,
+                (athlete_id, limit),
+            ).fetchall()
+        return [row["bike_id"] for row in rows]
+
     def upsert_efforts(self, segment_id: int, athlete_id: int, efforts: List[Dict]) -> None:
         now = self._now_iso()
         if not efforts:
@@ -293,6 +639,8 @@ class StravaRepository:
                 effort.get("activity_id"),
                 athlete_id,
                 effort.get("start_date"),
+                iso_to_epoch(effort.get("start_date")),
+                (effort.get("start_date_local") or effort.get("start_date") or "")[:10] or None,
                 effort.get("bike_id"),
                 effort.get("bike_name"),
                 effort.get("elapsed_time"),
@@ -305,26 +653,41 @@ class StravaRepository:
                 effort.get("efficiency"),
                 effort.get("vam"),
                 effort.get("name", "Untitled"),
+                effort.get("start_index"),
+                effort.get("end_index"),
                 json.dumps(effort),
                 now,
             )
             for effort in efforts
         ]
 
+        effort_ids = [effort.get("id") for effort in efforts]
+        fetched_activity_ids = sorted(
+            {effort.get("activity_id") for effort in efforts if (effort.get("id") or 0) > 0 and effort.get("activity_id")}
+        )
         with self._connect() as conn:
+            # Efforts detected locally from GPS tracks (negative ids) give way to Strava's own for the same activity.
+            superseded = self._locally_matched_effort_ids(conn, segment_id, athlete_id, fetched_activity_ids)
+            effort_ids += superseded
+            before = self._rollup_snapshot(conn, effort_ids)
+            for offset in range(0, len(superseded), 500):
+                chunk = superseded[offset : offset + 500]
+                conn.execute(f"DELETE FROM efforts WHERE id IN ({','.join('?' for _ in chunk)})", chunk)
             conn.executemany(
                 """
                 INSERT INTO efforts (
-                    id, segment_id, activity_id, athlete_id, start_date, bike_id, bike_name, elapsed_time,
-                    moving_time, distance, average_heartrate, max_heartrate, average_watts,
-                    normalized_watts, efficiency, vam, name, raw_json, synced_at
+                    id, segment_id, activity_id, athlete_id, start_date, start_epoch, local_date, bike_id, bike_name,
+                    elapsed_time, moving_time, distance, average_heartrate, max_heartrate, average_watts,
+                    normalized_watts, efficiency, vam, name, start_index, end_index, raw_json, synced_at
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(id) DO UPDATE SET
                     segment_id=excluded.segment_id,
                     activity_id=excluded.activity_id,
                     athlete_id=excluded.athlete_id,
                     start_date=excluded.start_date,
+                    start_epoch=excluded.start_epoch,
+                    local_date=excluded.local_date,
                     bike_id=COALESCE(excluded.bike_id, efforts.bike_id),
                     bike_name=COALESCE(excluded.bike_name, efforts.bike_name),
                     elapsed_time=excluded.elapsed_time,
@@ -337,11 +700,61 @@ class StravaRepository:
                     efficiency=COALESCE(excluded.efficiency, efforts.efficiency),
                     vam=excluded.vam,
                     name=excluded.name,
+                    start_index=COALESCE(excluded.start_index, efforts.start_index),
+                    end_index=COALESCE(excluded.end_index, efforts.end_index),
                     raw_json=excluded.raw_json,
                     synced_at=excluded.synced_at
+                WHERE efforts.raw_json IS NOT excluded.raw_json
                 """,
                 rows,
             )
+            if conn.total_changes:
+                self._apply_rollup_changes(conn, before, self._rollup_snapshot(conn, effort_ids))
+                self._bump_efforts_version(conn, segment_id, athlete_id)
+
+    def _locally_matched_effort_ids(
+        self, conn: sqlite3.Connection, segment_id: int, athlete_id: int, activity_ids: List[int]
+    ) -> List[int]:
+        matched: List[int] = []
+        for offset in range(0, len(activity_ids), 500):
+            chunk = activity_ids[offset : offset + 500]
+            rows = conn.execute(
+                f"""
+                SELECT id FROM efforts
+                WHERE activity_id IN ({",".join("?" for _ in chunk)}) AND segment_id = ? AND athlete_id = ? AND id < 0
+                """,
+                (*chunk, segment_id, athlete_id),
+            ).fetchall()
+            matched.extend(row["id"] for row in rows)
+        return matched
+
+    def get_fetched_effort_activity_ids(self, segment_id: int, athlete_id: int) -> Set[int]:
+        """Activities with an effort on the segment reported by Strava (not detected locally)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT activity_id FROM efforts WHERE segment_id = ? AND athlete_id = ? AND id > 0",
+                (segment_id, athlete_id),
+            ).fetchall()
+        return {row["activity_id"] for row in rows}
+
+    def get_existing_effort_ids(self, effort_ids: List[int]) -> Set[int]:
+        if not effort_ids:
+            return set()
+
+        placeholders = ",".join("?" for _ in effort_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM efforts WHERE id IN ({placeholders})",
+                effort_ids,
+            ).fetchall()
+        return {row["id"] for row in rows}
+
+    def count_efforts(self, segment_id: int, athlete_id: int) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) AS c FROM efforts WHERE segment_id = ? AND athlete_id = ?",
+                (segment_id, athlete_id),
+            ).fetchone()["c"]
 
     def get_activities_by_ids(self, activity_ids: List[int]) -> Dict[int, Dict]:
         if not activity_ids:
@@ -352,34 +765,160 @@ class StravaRepository:
             rows = conn.execute(
                 f"""
                 SELECT
-                    id, name, bike_id, bike_name, start_date, average_heartrate, max_heartrate, average_watts,
-                    weighted_average_watts,
-                    moving_time, elapsed_time, distance
-                FROM activities
-                WHERE id IN ({placeholders})
+                    a.id, a.name, a.bike_id, COALESCE(g.name, a.bike_name) AS bike_name, a.start_date,
+                    a.average_heartrate, a.max_heartrate, a.average_watts,
+                    a.weighted_average_watts,
+                    a.moving_time, a.elapsed_time, a.distance
+                FROM activities a
+                LEFT JOIN gear g ON g.id = a.bike_id
+                WHERE a.id IN ({placeholders})
                 """,
                 activity_ids,
             ).fetchall()
 
         return {row["id"]: dict(row) for row in rows}
 
-    def get_missing_bike_activity_ids(self, segment_id: int, athlete_id: int, limit: int = 100) -> List[int]:
+    def get_missing_bike_activity_ids(
+        self,
+        segment_id: int,
+        athlete_id: int,
+        limit: int = 100,
+        window: Optional[Tuple[int, int]] = None,
+    ) -> List[int]:
+        """Activities whose gear_id is still unknown because they were never fetched.
+
+        This is the enrichment backlog: activities with an effort inside `window`
+        (start and end epoch seconds) come first, then the most recent ones.
+        Activities that are stored but only lack a bike name are resolved through
+        the gear table instead of refetching the whole activity; activities marked
+        unavailable are left out.
+        """
+        window_start, window_end = window or (None, None)
         with self._connect() as conn:
             rows = conn.execute(
                 """
-                SELECT DISTINCT e.activity_id
+                SELECT
+                    e.activity_id,
+                    MAX(e.start_epoch >= ? AND e.start_epoch < ?) AS in_window,
+                    MAX(e.start_epoch) AS last_effort
                 FROM efforts e
                 LEFT JOIN activities a ON a.id = e.activity_id
+                LEFT JOIN unavailable_activities u ON u.id = e.activity_id
                 WHERE e.segment_id = ?
                   AND e.athlete_id = ?
-                  AND (a.id IS NULL OR a.bike_name IS NULL OR TRIM(a.bike_name) = '')
-                ORDER BY e.start_date DESC
+                  AND a.id IS NULL
+                  AND u.id IS NULL
+                GROUP BY e.activity_id
+                ORDER BY in_window DESC, last_effort DESC
                 LIMIT ?
                 """,
-                (segment_id, athlete_id, limit),
+                (window_start, window_end, segment_id, athlete_id, limit),
             ).fetchall()
         return [row["activity_id"] for row in rows]
 
+    def mark_activities_unavailable(self, athlete_id: int, status_codes: Dict[int, int]) -> None:
+        """Record activities Strava refused (403) or no longer has (404), with the status it answered."""
+        if not status_codes:
+            return
+        now = self._now_iso()
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO unavailable_activities (id, athlete_id, status_code, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    status_code=excluded.status_code,
+                    updated_at=excluded.updated_at
+                """,
+                [(activity_id, athlete_id, status, now) for activity_id, status in status_codes.items()],
+            )
+
+    def count_missing_activities(
+        self, segment_id: int, athlete_id: int, window: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, int]:
+        """Size of the enrichment backlog, overall and inside `window` (epoch seconds)."""
+        window_start, window_end = window or (None, None)
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT
+                    COUNT(DISTINCT e.activity_id) AS total,
+                    COUNT(DISTINCT CASE WHEN e.start_epoch >= ? AND e.start_epoch < ? THEN e.activity_id END)
+                        AS in_window
+                FROM efforts e
+                LEFT JOIN activities a ON a.id = e.activity_id
+                LEFT JOIN unavailable_activities u ON u.id = e.activity_id
+                WHERE e.segment_id = ? AND e.athlete_id = ? AND a.id IS NULL AND u.id IS NULL
+                """,
+                (window_start, window_end, segment_id, athlete_id),
+            ).fetchone()
+        return {"total": row["total"], "in_window": row["in_window"]}
+
+    def apply_activities_to_efforts(self, athlete_id: int, activity_ids: List[int]) -> int:
+        """
+        Copy bike, activity name and normalized power from stored activities onto
+        their efforts (on every segment), keeping rollups and data versions in step.
+        Returns the number of effort rows changed.
+        """
+        if not activity_ids:
+            return 0
+        placeholders = ",".join("?" for _ in activity_ids)
+        with self._connect() as conn:
+            activities = conn.execute(
+                f"SELECT id, name, bike_id, bike_name, weighted_average_watts FROM activities WHERE id IN ({placeholders})",
+                activity_ids,
+            ).fetchall()
+            if not activities:
+                return 0
+            found = [row["id"] for row in activities]
+            effort_rows = conn.execute(
+                f"""
+                SELECT id, segment_id FROM efforts
+                WHERE athlete_id = ? AND activity_id IN ({",".join("?" for _ in found)})
+                """,
+                (athlete_id, *found),
+            ).fetchall()
+            effort_ids = [row["id"] for row in effort_rows]
+            before = self._rollup_snapshot(conn, effort_ids)
+            changes_before = conn.total_changes
+            conn.executemany(
+                """
+                UPDATE efforts
+                SET
+                    bike_id = COALESCE(:bike_id, bike_id),
+                    bike_name = COALESCE(:bike_name, bike_name),
+                    normalized_watts = COALESCE(normalized_watts, :normalized_watts),
+                    name = COALESCE(:name, name)
+                WHERE athlete_id = :athlete_id
+                  AND activity_id = :activity_id
+                  AND (
+                      bike_id IS NOT COALESCE(:bike_id, bike_id)
+                      OR bike_name IS NOT COALESCE(:bike_name, bike_name)
+                      OR normalized_watts IS NOT COALESCE(normalized_watts, :normalized_watts)
+                      OR name IS NOT COALESCE(:name, name)
+                  )
+                """,
+                [
+                    {
+                        "bike_id": row["bike_id"],
+                        "bike_name": row["bike_name"] or (f"Bike {row['bike_id']}" if row["bike_id"] else None),
+                        "normalized_watts": row["weighted_average_watts"],
+                        "name": row["name"],
+                        "athlete_id": athlete_id,
+                        "activity_id": row["id"],
+                    }
+                    for row in activities
+                ],
+            )
+            changed = conn.total_changes - changes_before
+            if not changed:
+                return 0
+            self._backfill_gear_names(conn)
+            self._apply_rollup_changes(conn, before, self._rollup_snapshot(conn, effort_ids))
+            for segment_id in sorted({row["segment_id"] for row in effort_rows}):
+                self._bump_efforts_version(conn, segment_id, athlete_id)
+        return changed
+
     def has_effort_for_activity(self, segment_id: int, athlete_id: int, activity_id: int) -> bool:
         with self._connect() as conn:
             row = conn.execute(
@@ -393,6 +932,143 @@ class StravaRepository:
             ).fetchone()
         return row is not None
 
+    def upsert_streams(
+        self,
+        activity_id: int,
+        athlete_id: int,
+        blobs: Dict[str, Optional[bytes]],
+        point_count: int,
+    ) -> None:
+        """Store encoded stream series (see streams.encode_streams); empty blobs mark activities without streams."""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO streams (
+                    activity_id, athlete_id, point_count, time, watts, heartrate, distance, latlng, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(activity_id) DO UPDATE SET
+                    athlete_id=excluded.athlete_id,
+                    point_count=excluded.point_count,
+                    time=excluded.time,
+                    watts=excluded.watts,
+                    heartrate=excluded.heartrate,
+                    distance=excluded.distance,
+                    latlng=excluded.latlng,
+                    updated_at=excluded.updated_at
+                """,
+                (
+                    activity_id,
+                    athlete_id,
+                    point_count,
+                    blobs.get("time"),
+                    blobs.get("watts"),
+                    blobs.get("heartrate"),
+                    blobs.get("distance"),
+                    blobs.get("latlng"),
+                    self._now_iso(),
+                ),
+            )
+
+    def get_streams(self, activity_id: int) -> Optional[Dict[str, Optional[bytes]]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT point_count, time, watts, heartrate, distance, latlng
+                FROM streams
+                WHERE activity_id = ?
+                """,
+                (activity_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_activity_tracks(self, athlete_id: int) -> List[Dict]:
+        """
+        Stored streams with positions, and their activity's start_date, for matching
+        segments locally. Streams stored before latlng was fetched have none.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT s.activity_id, a.start_date, s.time, s.watts, s.heartrate, s.distance, s.latlng
+                FROM streams s
+                LEFT JOIN activities a ON a.id = s.activity_id
+                WHERE s.athlete_id = ? AND s.latlng IS NOT NULL
+                ORDER BY s.activity_id
+                """,
+                (athlete_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_activity_ids_missing_streams(self, segment_id: int, athlete_id: int, limit: int = 10) -> List[int]:
+        """Most recent activities with sliceable efforts on this segment whose streams are not stored yet."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT e.activity_id, MAX(e.start_date) AS last_effort
+                FROM efforts e
+                LEFT JOIN streams s ON s.activity_id = e.activity_id
+                WHERE e.segment_id = ?
+                  AND e.athlete_id = ?
+                  AND e.start_index IS NOT NULL
+                  AND e.end_index IS NOT NULL
+                  AND s.activity_id IS NULL
+                GROUP BY e.activity_id
+                ORDER BY last_effort DESC
+                LIMIT ?
+                """,
+                (segment_id, athlete_id, limit),
+            ).fetchall()
+        return [row["activity_id"] for row in rows]
+
+    def get_effort_indices_for_activity(self, activity_id: int) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, segment_id, athlete_id, start_index, end_index
+                FROM efforts
+                WHERE activity_id = ? AND start_index IS NOT NULL AND end_index IS NOT NULL
+                """,
+                (activity_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def update_effort_stream_metrics(self, metrics_by_effort: Dict[int, Dict]) -> None:
+        """Persist stream-derived metrics; stream NP replaces the approximated normalized_watts."""
+        if not metrics_by_effort:
+            return
+        rows = [
+            (
+                metrics.get("normalized_watts"),
+                metrics.get("hr_drift_pct"),
+                json.dumps(metrics["time_in_zones"]) if metrics.get("time_in_zones") is not None else None,
+                effort_id,
+            )
+            for effort_id, metrics in metrics_by_effort.items()
+        ]
+        placeholders = ",".join("?" for _ in metrics_by_effort)
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                UPDATE efforts
+                SET normalized_watts = COALESCE(?, normalized_watts),
+                    hr_drift_pct = ?,
+                    time_in_zones = ?
+                WHERE id = ?
+                """,
+                rows,
+            )
+            scopes = conn.execute(
+                f"""
+                SELECT DISTINCT segment_id, athlete_id
+                FROM efforts
+                WHERE id IN ({placeholders})
+                """,
+                list(metrics_by_effort),
+            ).fetchall()
+            for scope in scopes:
+                self._bump_efforts_version(conn, scope["segment_id"], scope["athlete_id"])
+
     def get_sync_state(self, segment_id: int, athlete_id: int) -> Dict:
         with self._connect() as conn:
             row = conn.execute(
@@ -434,33 +1110,533 @@ class StravaRepository:
                 (segment_id, athlete_id, next_page, 1 if full_sync_completed else 0, now),
             )
 
+    def get_synced_segment_ids(self, athlete_id: int) -> List[int]:
+        """Segments the athlete has synced or has efforts on."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT segment_id FROM sync_state WHERE athlete_id = ?
+                UNION
+                SELECT DISTINCT segment_id FROM efforts WHERE athlete_id = ?
+                ORDER BY segment_id
+                """,
+                (athlete_id, athlete_id),
+            ).fetchall()
+        return [row["segment_id"] for row in rows]
+
+    def upsert_athlete_tokens(
+        self,
+        athlete_id: int,
+        access_token: Optional[str],
+        refresh_token: str,
+        expires_at: Optional[int],
+    ) -> None:
+        """Keep the athlete's latest OAuth tokens so syncs can run without a browser session."""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO athlete_tokens (athlete_id, access_token, refresh_token, expires_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(athlete_id) DO UPDATE SET
+                    access_token=excluded.access_token,
+                    refresh_token=excluded.refresh_token,
+                    expires_at=excluded.expires_at,
+                    updated_at=excluded.updated_at
+                """,
+                (athlete_id, access_token, refresh_token, expires_at, self._now_iso()),
+            )
+
+    def get_athlete_tokens(self, athlete_ids: Optional[Sequence[int]] = None) -> List[Dict]:
+        sql = "SELECT athlete_id, access_token, refresh_token, expires_at, updated_at FROM athlete_tokens"
+        params: List = []
+        if athlete_ids:
+            sql += f" WHERE athlete_id IN ({', '.join('?' for _ in athlete_ids)})"
+            params = list(athlete_ids)
+        with self._connect() as conn:
+            rows = conn.execute(sql + " ORDER BY athlete_id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_athlete_tokens(self, athlete_id: int) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM athlete_tokens WHERE athlete_id = ?", (athlete_id,))
+
     def get_efforts(self, segment_id: int, athlete_id: int) -> List[Dict]:
         with self._connect() as conn:
             rows = conn.execute(
                 """
                 SELECT
-                    id, start_date, bike_id, bike_name, elapsed_time, moving_time, distance,
-                    average_heartrate, max_heartrate, average_watts, normalized_watts, efficiency, vam, name, activity_id
-                FROM efforts
-                WHERE segment_id = ? AND athlete_id = ?
-                ORDER BY start_date DESC
+                    e.id, e.start_date, e.start_epoch, e.local_date, e.bike_id, COALESCE(g.name, e.bike_name) AS bike_name,
+                    e.elapsed_time, e.moving_time, e.distance,
+                    e.average_heartrate, e.max_heartrate, e.average_watts, e.normalized_watts, e.efficiency, e.vam,
+                    e.name, e.activity_id, e.hr_drift_pct, e.time_in_zones
+                FROM efforts e
+                LEFT JOIN gear g ON g.id = e.bike_id
+                WHERE e.segment_id = ? AND e.athlete_id = ?
+                ORDER BY e.start_epoch DESC
                 """,
                 (segment_id, athlete_id),
             ).fetchall()
 
-            return [dict(row) for row in rows]
+        efforts = [dict(row) for row in rows]
+        for effort in efforts:
+            if effort["time_in_zones"] is not None:
+                effort["time_in_zones"] = json.loads(effort["time_in_zones"])
+        return efforts
+
+    def get_fitness_columns(self, athlete_id: int, segment_ids: Optional[List[int]] = None) -> Dict[str, list]:
+        """
+        One list per fitness.FITNESS_COLUMNS field for an athlete's efforts,
+        on every segment or only on segment_ids.
+        """
+        fields = ("segment_id", "start_epoch", "average_heartrate", "average_watts", "normalized_watts", "efficiency")
+        clauses = ""
+        params: List = [athlete_id]
+        if segment_ids is not None:
+            if not segment_ids:
+                return {field: [] for field in fields}
+            clauses = f" AND segment_id IN ({','.join('?' for _ in segment_ids)})"
+            params.extend(segment_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(fields)} FROM efforts WHERE athlete_id = ?{clauses}",
+                params,
+            ).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * len(fields)
+        return {field: list(values) for field, values in zip(fields, columns)}
+
+    def get_segment_names(self, segment_ids: List[int]) -> Dict[int, Optional[str]]:
+        if not segment_ids:
+            return {}
+        placeholders = ",".join("?" for _ in segment_ids)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT id, name FROM segments WHERE id IN ({placeholders})", segment_ids).fetchall()
+        return {row["id"]: row["name"] for row in rows}
+
+    def iter_efforts_for_segments(
+        self,
+        athlete_id: int,
+        segment_ids: List[int],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        page_size: int = 1000,
+    ) -> Iterator[Dict]:
+        """
+        Yield one athlete's efforts on several segments, ordered by segment id
+        then start date. Rows are read in keyset pages of page_size along the
+        (segment_id, athlete_id, start_epoch) index, each on its own connection,
+        so no read transaction stays open while the caller consumes them.
+        """
+        clauses = ""
+        bounds: List = []
+        if start_date:
+            clauses += " AND e.start_epoch >= CAST(strftime('%s', ?) AS INTEGER)"
+            bounds.append(start_date)
+        if end_date:
+            clauses += " AND e.start_epoch < CAST(strftime('%s', ?, '+1 day') AS INTEGER)"
+            bounds.append(end_date)
+        sql = f"""
+            SELECT
+                e.segment_id, e.id, e.activity_id, e.start_date, e.start_epoch,
+                COALESCE(g.name, e.bike_name) AS bike_name,
+                e.elapsed_time, e.average_heartrate, e.average_watts, e.efficiency, e.vam
+            FROM efforts e
+            LEFT JOIN gear g ON g.id = e.bike_id
+            WHERE e.segment_id = ? AND e.athlete_id = ?{clauses} AND (e.start_epoch, e.id) > (?, ?)
+            ORDER BY e.start_epoch, e.id
+            LIMIT ?
+        """
+        for segment_id in sorted(set(segment_ids)):
+            after = (-1 << 62, -1 << 62)
+            while True:
+                with self._connect() as conn:
+                    rows = conn.execute(sql, (segment_id, athlete_id, *bounds, *after, page_size)).fetchall()
+                for row in rows:
+                    yield dict(row)
+                if len(rows) < page_size:
+                    break
+                after = (rows[-1]["start_epoch"], rows[-1]["id"])
+
+    @staticmethod
+    def _effort_filter_sql(filters: Dict) -> tuple:
+        """WHERE fragments for the analyzer filters; missing HR/power never match an active range."""
+        clauses = []
+        params: List = []
+        for column, low, high in (
+            ("e.average_heartrate", "min_hr", "max_hr"),
+            ("e.average_watts", "min_power", "max_power"),
+        ):
+            if filters.get(low) is None and filters.get(high) is None:
+                continue
+            clauses.append(f"{column} IS NOT NULL AND {column} != 0")
+            if filters.get(low) is not None:
+                clauses.append(f"{column} >= ?")
+                params.append(filters[low])
+            if filters.get(high) is not None:
+                clauses.append(f"{column} <= ?")
+                params.append(filters[high])
+        if filters.get("start_date"):
+            clauses.append("e.start_epoch >= CAST(strftime('%s', ?) AS INTEGER)")
+            params.append(filters["start_date"])
+        if filters.get("end_date"):
+            clauses.append("e.start_epoch < CAST(strftime('%s', ?, '+1 day') AS INTEGER)")
+            params.append(filters["end_date"])
+        if filters.get("bike"):
+            clauses.append("COALESCE(g.name, e.bike_name, 'Unknown') = ?")
+            params.append(filters["bike"])
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def get_effort_stats(self, segment_id: int, athlete_id: int, filters: Optional[Dict] = None, bins: int = 20) -> Dict:
+        """
+        Summary statistics for the filtered efforts in one statement: per-metric
+        count/min/max/mean/percentiles, per-bike and per-month breakdowns and
+        equal-width histograms. Zero HR, power and VAM count as missing, as in the UI.
+        """
+        filter_sql, filter_params = self._effort_filter_sql(filters or {})
+        bins = max(1, int(bins))
+        metrics = list(STATS_METRICS)
+        ranked = " UNION ALL ".join(
+            f"SELECT '{m}' AS name, {m} AS v, ROW_NUMBER() OVER (ORDER BY {m}) AS rn, COUNT(*) OVER () AS n "
+            f"FROM f WHERE {m} IS NOT NULL"
+            for m in metrics
+        )
+        summaries = " UNION ALL ".join(
+            f"SELECT 'metric', '{m}', NULL, COUNT({m}), MIN({m}), MAX({m}), AVG({m}), NULL, NULL FROM f"
+            for m in metrics
+        )
+        histogram_values = " UNION ALL ".join(
+            f"SELECT '{m}' AS name, {m} AS v, MIN({m}) OVER () AS lo, MAX({m}) OVER () AS hi "
+            f"FROM f WHERE {m} IS NOT NULL"
+            for m in STATS_HISTOGRAM_METRICS
+        )
+        percentiles = " UNION ALL ".join(f"SELECT {p}" for p in STATS_PERCENTILES)
+        group_columns = (
+            "COUNT(*), MIN(elapsed_time), AVG(elapsed_time), AVG(average_heartrate), AVG(average_watts), AVG(vam)"
+        )
+
+        sql = f"""
+            WITH f AS MATERIALIZED (
+                SELECT
+                    substr(e.local_date, 1, 7) AS month,
+                    COALESCE(g.name, e.bike_name, 'Unknown') AS bike,
+                    e.elapsed_time,
+                    NULLIF(e.average_heartrate, 0) AS average_heartrate,
+                    NULLIF(e.average_watts, 0) AS average_watts,
+                    NULLIF(e.vam, 0) AS vam,
+                    e.efficiency
+                FROM efforts e
+                LEFT JOIN gear g ON g.id = e.bike_id
+                WHERE e.segment_id = ? AND e.athlete_id = ?{filter_sql}
+            ),
+            ranked AS ({ranked}),
+            pct(p) AS ({percentiles}),
+            hist AS ({histogram_values})
+            SELECT 'total' AS kind, NULL AS name, NULL AS bucket, COUNT(*) AS n,
+                   NULL AS a, NULL AS b, NULL AS c, NULL AS d, NULL AS e
+            FROM f
+            UNION ALL {summaries}
+            UNION ALL
+            SELECT 'percentile', r.name, pct.p, r.n, r.v, NULL, NULL, NULL, NULL
+            FROM ranked r JOIN pct ON r.rn = MAX(1, (pct.p * r.n + 99) / 100)
+            UNION ALL
+            SELECT 'bike', bike, NULL, {group_columns} FROM f GROUP BY bike
+            UNION ALL
+            SELECT 'month', month, NULL, {group_columns} FROM f WHERE month IS NOT NULL GROUP BY month
+            UNION ALL
+            SELECT 'histogram', name,
+                   CASE WHEN hi = lo THEN 0 ELSE MIN(CAST((v - lo) * ? / (hi - lo) AS INTEGER), ? - 1) END AS bucket,
+                   COUNT(*), NULL, NULL, NULL, NULL, NULL
+            FROM hist GROUP BY name, bucket
+        """
+        with self._connect() as conn:
+            rows = conn.execute(sql, (segment_id, athlete_id, *filter_params, bins, bins)).fetchall()
+
+        def rounded(value, digits=1):
+            return round(value, digits) if value is not None else None
+
+        result: Dict = {
+            "count": 0,
+            "metrics": {
+                m: {"count": 0, "min": None, "max": None, "mean": None, "best": None, "percentiles": {}}
+                for m in metrics
+            },
+            "by_bike": [],
+            "by_month": [],
+            "histograms": {m: {"min": None, "max": None, "bins": [0] * bins} for m in STATS_HISTOGRAM_METRICS},
+        }
+        for row in rows:
+            kind, name = row["kind"], row["name"]
+            digits = 3 if name == "efficiency" else 1
+            if kind == "total":
+                result["count"] = row["n"]
+            elif kind == "metric":
+                metric = result["metrics"][name]
+                metric.update(count=row["n"], min=row["a"], max=row["b"], mean=rounded(row["c"], digits))
+                if STATS_METRICS[name] is not None:
+                    metric["best"] = row["a"] if STATS_METRICS[name] == "min" else row["b"]
+                if name in result["histograms"]:
+                    result["histograms"][name].update(min=row["a"], max=row["b"])
+            elif kind == "percentile":
+                result["metrics"][name]["percentiles"][f"p{row['bucket']}"] = row["a"]
+            elif kind in ("bike", "month"):
+                result["by_bike" if kind == "bike" else "by_month"].append(
+                    {
+                        kind: name,
+                        "count": row["n"],
+                        "best_time": row["a"],
+                        "mean_time": rounded(row["b"]),
+                        "mean_heartrate": rounded(row["c"]),
+                        "mean_watts": rounded(row["d"]),
+                        "mean_vam": rounded(row["e"]),
+                    }
+                )
+            elif kind == "histogram":
+                result["histograms"][name]["bins"][row["bucket"]] = row["n"]
+
+        result["by_bike"].sort(key=lambda group: (-group["count"], group["bike"]))
+        result["by_month"].sort(key=lambda group: group["month"])
+        return result
+
+    def _rollup_snapshot(self, conn: sqlite3.Connection, effort_ids: List[int]) -> Dict[int, Dict]:
+        """Rollup keys and metric values of the given efforts as currently stored."""
+        snapshot: Dict[int, Dict] = {}
+        periods = ", ".join(f"{expr} AS {period}_start" for period, expr in ROLLUP_PERIODS.items())
+        metrics = ", ".join(f"{expr} AS {name}" for name, expr in ROLLUP_METRICS)
+        for offset in range(0, len(effort_ids), 500):
+            chunk = effort_ids[offset : offset + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            rows = conn.execute(
+                f"""
+                SELECT id, segment_id, athlete_id, COALESCE(bike_id, '') AS bike_id, {periods}, {metrics}
+                FROM efforts
+                WHERE id IN ({placeholders}) AND local_date IS NOT NULL
+                """,
+                chunk,
+            ).fetchall()
+            snapshot.update((row["id"], dict(row)) for row in rows)
+        return snapshot
+
+    def _apply_rollup_changes(self, conn: sqlite3.Connection, before: Dict[int, Dict], after: Dict[int, Dict]) -> None:
+        """
+        Move changed efforts between rollup rows: subtract the old values, add the new ones.
+        Counts and sums are updated in place. Min/max cannot be decremented, so a
+        group whose stored min or max was among the removed values has them
+        recomputed from its efforts; other groups keep theirs.
+        """
+        deltas: Dict[tuple, Dict] = {}
+        # Per group and metric, the [lowest, highest] value removed from it.
+        removed: Dict[tuple, Dict[str, List]] = {}
+        for effort_id in before.keys() | after.keys():
+            old, new = before.get(effort_id), after.get(effort_id)
+            if old == new:
+                continue
+            for row, sign in ((old, -1), (new, 1)):
+                if row is None:
+                    continue
+                for period in ROLLUP_PERIODS:
+                    key = (row["segment_id"], row["athlete_id"], period, row[f"{period}_start"], row["bike_id"])
+                    delta = deltas.setdefault(
+                        key,
+                        {"effort_count": 0, **{name: [0, 0.0, 0.0, None, None] for name, _ in ROLLUP_METRICS}},
+                    )
+                    delta["effort_count"] += sign
+                    for name, _ in ROLLUP_METRICS:
+                        value = row[name]
+                        if value is None:
+                            continue
+                        acc = delta[name]
+                        acc[0] += sign
+                        acc[1] += sign * value
+                        acc[2] += sign * value * value
+                        if sign > 0:
+                            acc[3] = value if acc[3] is None else min(acc[3], value)
+                            acc[4] = value if acc[4] is None else max(acc[4], value)
+                        else:
+                            bounds = removed.setdefault(key, {}).setdefault(name, [value, value])
+                            bounds[0], bounds[1] = min(bounds[0], value), max(bounds[1], value)
+
+        names = [name for name, _ in ROLLUP_METRICS]
+        key_sql = "segment_id = ? AND athlete_id = ? AND period = ? AND period_start = ? AND bike_id = ?"
+        # Read before this batch's values are merged in, which can move the stored extremes.
+        stale = set()
+        for key, bounds in removed.items():
+            stored = conn.execute(
+                f"SELECT {', '.join(f'{name}_min, {name}_max' for name in bounds)} FROM effort_rollups WHERE {key_sql}",
+                key,
+            ).fetchone()
+            if stored is not None and any(
+                (stored[f"{name}_min"] is not None and low <= stored[f"{name}_min"])
+                or (stored[f"{name}_max"] is not None and high >= stored[f"{name}_max"])
+                for name, (low, high) in bounds.items()
+            ):
+                stale.add(key)
+        columns = ["effort_count"] + [f"{name}_{part}" for name in names for part in ("n", "sum", "sumsq", "min", "max")]
+        updates = ["effort_count = effort_rollups.effort_count + excluded.effort_count"]
+        for name in names:
+            for part in ("n", "sum", "sumsq"):
+                updates.append(f"{name}_{part} = effort_rollups.{name}_{part} + excluded.{name}_{part}")
+            updates.append(
+                f"{name}_min = min(COALESCE(effort_rollups.{name}_min, excluded.{name}_min), "
+                f"COALESCE(excluded.{name}_min, effort_rollups.{name}_min))"
+            )
+            updates.append(
+                f"{name}_max = max(COALESCE(effort_rollups.{name}_max, excluded.{name}_max), "
+                f"COALESCE(excluded.{name}_max, effort_rollups.{name}_max))"
+            )
+        conn.executemany(
+            f"""
+            INSERT INTO effort_rollups (segment_id, athlete_id, period, period_start, bike_id, {", ".join(columns)})
+            VALUES ({", ".join("?" for _ in range(5 + len(columns)))})
+            ON CONFLICT(segment_id, athlete_id, period, period_start, bike_id) DO UPDATE SET
+                {", ".join(updates)}
+            """,
+            [
+                (*key, delta["effort_count"], *(value for name in names for value in delta[name]))
+                for key, delta in deltas.items()
+            ],
+        )
+
+        conn.executemany(f"DELETE FROM effort_rollups WHERE {key_sql} AND effort_count <= 0", list(deltas))
+        for key in stale:
+            segment_id, athlete_id, period, period_start, bike_id = key
+            extremes = ", ".join(f"MIN({expr}), MAX({expr})" for _, expr in ROLLUP_METRICS)
+            row = conn.execute(
+                f"""
+                SELECT {extremes}
+                FROM efforts
+                WHERE segment_id = ? AND athlete_id = ? AND COALESCE(bike_id, '') = ?
+                  AND local_date IS NOT NULL AND {ROLLUP_PERIODS[period]} = ?
+                """,
+                (segment_id, athlete_id, bike_id, period_start),
+            ).fetchone()
+            assignments = ", ".join(f"{name}_min = ?, {name}_max = ?" for name in names)
+            conn.execute(f"UPDATE effort_rollups SET {assignments} WHERE {key_sql}", (*tuple(row), *key))
+
+    def _rebuild_rollups(
+        self, conn: sqlite3.Connection, segment_id: Optional[int] = None, athlete_id: Optional[int] = None
+    ) -> int:
+        scope_sql = ""
+        params: List = []
+        if segment_id is not None:
+            scope_sql += " AND segment_id = ?"
+            params.append(segment_id)
+        if athlete_id is not None:
+            scope_sql += " AND athlete_id = ?"
+            params.append(athlete_id)
+        conn.execute(f"DELETE FROM effort_rollups WHERE 1 = 1{scope_sql}", params)
+
+        names = [name for name, _ in ROLLUP_METRICS]
+        columns = ["effort_count"] + [f"{name}_{part}" for name in names for part in ("n", "sum", "sumsq", "min", "max")]
+        aggregates = ", ".join(
+            f"COUNT({expr}), COALESCE(SUM({expr}), 0), COALESCE(SUM({expr} * {expr}), 0), MIN({expr}), MAX({expr})"
+            for _, expr in ROLLUP_METRICS
+        )
+        selects = " UNION ALL ".join(
+            f"""
+            SELECT segment_id, athlete_id, '{period}', {expr}, COALESCE(bike_id, ''), COUNT(*), {aggregates}
+            FROM efforts
+            WHERE local_date IS NOT NULL{scope_sql}
+            GROUP BY segment_id, athlete_id, {expr}, COALESCE(bike_id, '')
+            """
+            for period, expr in ROLLUP_PERIODS.items()
+        )
+        cursor = conn.execute(
+            f"""
+            INSERT INTO effort_rollups (segment_id, athlete_id, period, period_start, bike_id, {", ".join(columns)})
+            {selects}
+            """,
+            params * len(ROLLUP_PERIODS),
+        )
+        return cursor.rowcount
+
+    def rebuild_rollups(self, segment_id: Optional[int] = None, athlete_id: Optional[int] = None) -> int:
+        """Recompute rollups from the efforts table (all scopes by default); returns rows written."""
+        with self._connect() as conn:
+            return self._rebuild_rollups(conn, segment_id, athlete_id)
+
+    def get_rollups(
+        self,
+        segment_id: int,
+        athlete_id: int,
+        period: str = "month",
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        by_bike: bool = False,
+    ) -> List[Dict]:
+        """Trend series from the rollup table: per period (and bike), count plus mean/std/min/max per metric."""
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"period must be one of: {', '.join(ROLLUP_PERIODS)}")
+        clauses = ["r.segment_id = ?", "r.athlete_id = ?", "r.period = ?"]
+        params: List = [segment_id, athlete_id, period]
+        if start_date:
+            clauses.append("r.period_start >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("r.period_start <= ?")
+            params.append(end_date)
+        names = [name for name, _ in ROLLUP_METRICS]
+        aggregates = ", ".join(
+            f"SUM(r.{name}_n) AS {name}_n, SUM(r.{name}_sum) AS {name}_sum, SUM(r.{name}_sumsq) AS {name}_sumsq, "
+            f"MIN(r.{name}_min) AS {name}_min, MAX(r.{name}_max) AS {name}_max"
+            for name in names
+        )
+        bike_columns = (
+            ", r.bike_id, COALESCE(g.name, CASE WHEN r.bike_id != '' THEN 'Bike ' || r.bike_id END, 'Unknown') AS bike_name"
+            if by_bike
+            else ""
+        )
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT r.period_start{bike_columns}, SUM(r.effort_count) AS effort_count, {aggregates}
+                FROM effort_rollups r
+                LEFT JOIN gear g ON g.id = r.bike_id
+                WHERE {" AND ".join(clauses)}
+                GROUP BY r.period_start{", r.bike_id" if by_bike else ""}
+                ORDER BY r.period_start{", bike_name" if by_bike else ""}
+                """,
+                params,
+            ).fetchall()
+
+        series = []
+        for row in rows:
+            point = {"period_start": row["period_start"], "count": row["effort_count"]}
+            if by_bike:
+                point["bike_id"] = row["bike_id"] or None
+                point["bike_name"] = row["bike_name"]
+            for name in names:
+                n = row[f"{name}_n"]
+                mean = row[f"{name}_sum"] / n if n else None
+                std = math.sqrt(max(row[f"{name}_sumsq"] / n - mean * mean, 0.0)) if n else None
+                digits = 3 if name == "ef" else 1
+                point[name] = {
+                    "n": n,
+                    "mean": round(mean, digits) if mean is not None else None,
+                    "std": round(std, digits) if std is not None else None,
+                    "min": row[f"{name}_min"],
+                    "max": row[f"{name}_max"],
+                }
+            series.append(point)
+        return series
 
     def clear_all(self) -> None:
         with self._connect() as conn:
             conn.execute("DELETE FROM efforts")
+            conn.execute("DELETE FROM effort_rollups")
+            conn.execute("DELETE FROM streams")
             conn.execute("DELETE FROM activities")
+            conn.execute("DELETE FROM unavailable_activities")
             conn.execute("DELETE FROM segments")
+            conn.execute("DELETE FROM gear")
             conn.execute("DELETE FROM sync_state")
+            # Versions are kept (and advanced) so cached payloads of the wiped data never match again.
+            self._bump_efforts_version(conn)
 
     def stats(self, segment_id: Optional[int] = None, athlete_id: Optional[int] = None) -> Dict:
         with self._connect() as conn:
             segment_count = conn.execute("SELECT COUNT(*) AS c FROM segments").fetchone()["c"]
             activity_count = conn.execute("SELECT COUNT(*) AS c FROM activities").fetchone()["c"]
+            gear_count = conn.execute("SELECT COUNT(*) AS c FROM gear").fetchone()["c"]
+            stream_count = conn.execute("SELECT COUNT(*) AS c FROM streams WHERE point_count > 0").fetchone()["c"]
             effort_count = conn.execute("SELECT COUNT(*) AS c FROM efforts").fetchone()["c"]
             segment_effort_count = None
             segment_activity_count = None
@@ -518,7 +1694,8 @@ class StravaRepository:
             "by_type": {
                 "segment": segment_count,
                 "activity": activity_count,
-                "streams": 0,
+                "gear": gear_count,
+                "streams": stream_count,
                 "efforts": effort_count,
             },
             "total_size": size,
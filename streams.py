@@ -0,0 +1,232 @@
+"""
+Activity stream storage and per-effort stream metrics.
+
+Streams from /activities/{id}/streams are stored as compact blobs: each series
+is delta-encoded into a typed array (array module), serialised little-endian
+and zlib-compressed. A typical ride of 10k points takes a few KB per series
+instead of the ~100 KB of its JSON form.
+
+The latlng series (pairs of degrees) is stored as its latitude column
+followed by its longitude column, in microdegrees offset to be non-negative,
+so segment_matcher can detect efforts in stored activities without fetching
+them again.
+
+Effort metrics are computed from the stream slice [start_index, end_index]
+of each segment effort rather than approximated from segment averages.
+"""
+
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+STREAM_KEYS = ("time", "watts", "heartrate", "distance", "latlng")
+
+# Series key -> array typecode of the stored deltas.
+STREAM_TYPECODES = {
+    "time": "i",
+    "watts": "h",
+    "heartrate": "h",
+    "distance": "f",
+    "latlng": "i",
+}
+
+# latlng is stored as round((degrees + LATLNG_OFFSET) * LATLNG_SCALE): exact to about 0.1 m.
+LATLNG_SCALE = 1e6
+LATLNG_OFFSET = 180.0
+
+# Lower HR bound (bpm) of each zone, Z1 first.
+DEFAULT_HR_ZONES = (0, 120, 140, 155, 170)
+
+NP_WINDOW_SECONDS = 30
+
+_INT16_MIN, _INT16_MAX = -32768, 32767
+
+# Stored value of a missing integer sample; decoded as NaN. Blobs written
+# before missing samples were kept hold 0 for them instead.
+MISSING_SAMPLE = -1
+
+
+def _forward_fill(data: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    index = np.where(missing, 0, np.arange(len(data)))
+    np.maximum.accumulate(index, out=index)
+    return np.nan_to_num(data[index], nan=0.0)
+
+
+def encode_series(key: str, values: Sequence) -> bytes:
+    """
+    Delta-encode one stream series into a compressed typed-array blob.
+    Missing (None) samples survive the round trip: float series store a NaN
+    delta, integer series (all non-negative) store MISSING_SAMPLE.
+    """
+    typecode = STREAM_TYPECODES[key]
+    if key == "latlng":
+        pairs = np.asarray([v if v else (np.nan, np.nan) for v in values], dtype=np.float64).reshape(-1, 2)
+        data = (pairs.T.ravel() + LATLNG_OFFSET) * LATLNG_SCALE
+    else:
+        data = np.asarray([v if v is not None else np.nan for v in values], dtype=np.float64)
+    missing = np.isnan(data)
+    if typecode == "f":
+        # Deltas between the present samples; a missing sample's delta is NaN and adds nothing.
+        filled = _forward_fill(data, missing)
+        deltas = np.diff(filled, prepend=0.0)
+        deltas[missing] = np.nan
+        packed = array("f", deltas.astype(np.float32).tobytes())
+    else:
+        integers = np.where(missing, MISSING_SAMPLE, np.maximum(np.rint(np.nan_to_num(data)), 0)).astype(np.int64)
+        deltas = np.diff(integers, prepend=0)
+        if typecode == "h":
+            deltas = np.clip(deltas, _INT16_MIN, _INT16_MAX)
+        packed = array(typecode, deltas.astype(np.int16 if typecode == "h" else np.int32).tobytes())
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return zlib.compress(packed.tobytes(), 6)
+
+
+def decode_series(key: str, blob: Optional[bytes]) -> Optional[np.ndarray]:
+    """Inverse of encode_series; returns float64 values ((n, 2) for latlng) or None when the series is absent."""
+    if not blob:
+        return None
+    typecode = STREAM_TYPECODES[key]
+    dtype = {"i": "<i4", "h": "<i2", "f": "<f4"}[typecode]
+    deltas = np.frombuffer(zlib.decompress(blob), dtype=dtype)
+    if typecode == "f":
+        values = np.nancumsum(deltas, dtype=np.float64)
+        values[np.isnan(deltas)] = np.nan
+        return values
+    values = np.cumsum(deltas, dtype=np.float64)
+    values[values == MISSING_SAMPLE] = np.nan
+    if key == "latlng":
+        return (values / LATLNG_SCALE - LATLNG_OFFSET).reshape(2, -1).T
+    return values
+
+
+def encode_streams(payload: Dict) -> Tuple[Dict[str, Optional[bytes]], int]:
+    """Encode a key_by_type /streams response. Returns (blobs by key, point count)."""
+    blobs: Dict[str, Optional[bytes]] = {}
+    point_count = 0
+    for key in STREAM_KEYS:
+        series = (payload or {}).get(key) or {}
+        values = series.get("data") if isinstance(series, dict) else None
+        if not values:
+            blobs[key] = None
+            continue
+        blobs[key] = encode_series(key, values)
+        point_count = max(point_count, len(values))
+    return blobs, point_count
+
+
+def decode_streams(blobs: Dict[str, Optional[bytes]]) -> Dict[str, np.ndarray]:
+    decoded = {}
+    for key in STREAM_KEYS:
+        values = decode_series(key, blobs.get(key))
+        if values is not None:
+            decoded[key] = values
+    return decoded
+
+
+def _resample_1hz(time: np.ndarray, values: np.ndarray) -> np.ndarray:
+    if len(time) < 2:
+        return values
+    grid = np.arange(time[0], time[-1] + 1)
+    return np.interp(grid, time, values)
+
+
+def normalized_power(watts: np.ndarray, time: Optional[np.ndarray] = None) -> Optional[float]:
+    """NP = 4th root of the mean of the 4th power of the 30 s rolling average power."""
+    if watts is None or len(watts) == 0:
+        return None
+    present = np.isfinite(watts)
+    if not present.any():
+        return None
+    if time is not None and len(time) == len(watts):
+        # Dropouts are interpolated over rather than counted as 0 W.
+        series = _resample_1hz(time[present], watts[present])
+    else:
+        series = watts[present]
+    if len(series) < NP_WINDOW_SECONDS:
+        return float(np.mean(series))
+    cumulative = np.cumsum(np.insert(series, 0, 0.0))
+    rolling = (cumulative[NP_WINDOW_SECONDS:] - cumulative[:-NP_WINDOW_SECONDS]) / NP_WINDOW_SECONDS
+    return float(np.mean(rolling ** 4) ** 0.25)
+
+
+def _nanmean(values: np.ndarray) -> Optional[float]:
+    values = values[np.isfinite(values)]
+    return float(values.mean()) if len(values) else None
+
+
+def hr_drift_pct(watts: Optional[np.ndarray], heartrate: np.ndarray, time: np.ndarray) -> Optional[float]:
+    """Within-effort Pw:Hr drift: (EF_first_half - EF_second_half) / EF_first_half * 100.
+
+    Halves are split by elapsed time. Without power, the drift is the change in
+    average HR between the halves.
+    """
+    if heartrate is None or time is None or len(time) < 4:
+        return None
+    midpoint = time[0] + (time[-1] - time[0]) / 2
+    first = time <= midpoint
+    second = ~first
+    if not first.any() or not second.any():
+        return None
+
+    hr_first = _nanmean(heartrate[first])
+    hr_second = _nanmean(heartrate[second])
+    if hr_first is None or hr_second is None or hr_first <= 0 or hr_second <= 0:
+        return None
+    if watts is None:
+        return round((hr_second - hr_first) / hr_first * 100, 1)
+
+    watts_first, watts_second = _nanmean(watts[first]), _nanmean(watts[second])
+    if watts_first is None or watts_second is None:
+        return None
+    ef_first = watts_first / hr_first
+    ef_second = watts_second / hr_second
+    if ef_first <= 0:
+        return None
+    return round((ef_first - ef_second) / ef_first * 100, 1)
+
+
+def time_in_zones(heartrate: np.ndarray, time: np.ndarray, zones: Sequence[float] = DEFAULT_HR_ZONES) -> List[int]:
+    """
+    Seconds spent in each HR zone; each sample owns the interval until the
+    next sample. Intervals starting at a missing HR sample are not counted.
+    """
+    if heartrate is None or time is None or len(time) < 2:
+        return [0] * len(zones)
+    present = np.isfinite(heartrate[:-1])
+    durations = np.diff(time)[present]
+    zone_index = np.searchsorted(np.asarray(zones, dtype=np.float64), heartrate[:-1][present], side="right") - 1
+    zone_index = np.clip(zone_index, 0, len(zones) - 1)
+    seconds = np.bincount(zone_index, weights=durations, minlength=len(zones))
+    return [int(round(s)) for s in seconds]
+
+
+def compute_effort_metrics(
+    streams: Dict[str, np.ndarray],
+    start_index: Optional[int],
+    end_index: Optional[int],
+    zones: Sequence[float] = DEFAULT_HR_ZONES,
+) -> Optional[Dict]:
+    """Normalized power, HR drift and time-in-zone for one effort's stream slice."""
+    time = streams.get("time")
+    if time is None or start_index is None or end_index is None:
+        return None
+    if start_index < 0 or end_index >= len(time) or end_index <= start_index:
+        return None
+
+    window = slice(start_index, end_index + 1)
+    time_slice = time[window]
+    watts = streams.get("watts")
+    heartrate = streams.get("heartrate")
+    watts_slice = watts[window] if watts is not None and len(watts) == len(time) else None
+    hr_slice = heartrate[window] if heartrate is not None and len(heartrate) == len(time) else None
+
+    np_watts = normalized_power(watts_slice, time_slice) if watts_slice is not None else None
+    return {
+        "normalized_watts": round(np_watts, 1) if np_watts is not None else None,
+        "hr_drift_pct": hr_drift_pct(watts_slice, hr_slice, time_slice) if hr_slice is not None else None,
+        "time_in_zones": time_in_zones(hr_slice, time_slice, zones) if hr_slice is not None else None,
+    }
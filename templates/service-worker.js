@@ -0,0 +1,172 @@
+// Service worker: precached static assets, stale-while-revalidate efforts, offline pages.
+// Rendered by the /service-worker.js route; any static asset change yields a new
+// ASSET_VERSION, which installs a new worker and retires the old caches.
+
+const ASSET_VERSION = {{ asset_version | tojson }};
+const PRECACHE_URLS = {{ precache_urls | tojson }};
+
+const STATIC_CACHE = `static-${ASSET_VERSION}`;
+const CDN_CACHE = 'cdn-v1';
+// One efforts cache per athlete (`efforts-v2-<athlete id>`), named from the
+// ?athlete= parameter the analyzer sends; the server rejects a mismatch.
+const EFFORTS_CACHE_PREFIX = 'efforts-v2-';
+const PAGES_CACHE = 'pages-v1';
+const CURRENT_CACHES = [STATIC_CACHE, CDN_CACHE, PAGES_CACHE];
+const CDN_HOSTS = ['cdnjs.cloudflare.com'];
+const EFFORTS_PATH = /^\/segment\/\d+\/efforts$/;
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => !isCurrentCache(key)).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (request.method === 'GET' && CDN_HOSTS.includes(url.hostname)) {
+            event.respondWith(staleWhileRevalidate(CDN_CACHE, request));
+        }
+        return;
+    }
+
+    // Data belonging to the session must not outlive it.
+    if ((request.method === 'POST' && url.pathname === '/db/clear') || url.pathname === '/logout') {
+        event.respondWith(fetch(request).then((response) => {
+            if (response.ok || response.type === 'opaqueredirect' || response.redirected) {
+                return caches.keys()
+                    .then(keys => Promise.all(
+                        keys.filter(key => key.startsWith(EFFORTS_CACHE_PREFIX) || key === PAGES_CACHE).map(key => caches.delete(key))
+                    ))
+                    .then(() => response);
+            }
+            return response;
+        }));
+        return;
+    }
+
+    if (request.method !== 'GET') return;
+
+    if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheFirst(STATIC_CACHE, request));
+    } else if (EFFORTS_PATH.test(url.pathname)) {
+        const cacheName = effortsCacheName(url);
+        if (!cacheName) return;
+        if (url.searchParams.get('refresh') === 'true') {
+            event.respondWith(refreshEfforts(cacheName, request, url));
+        } else {
+            event.respondWith(effortsStaleWhileRevalidate(cacheName, event, request));
+        }
+    } else if (request.mode === 'navigate') {
+        event.respondWith(networkFirst(PAGES_CACHE, request));
+    }
+});
+
+function isCurrentCache(key) {
+    return CURRENT_CACHES.includes(key) || key.startsWith(EFFORTS_CACHE_PREFIX);
+}
+
+/** Efforts requests without an athlete are not cached, so no athlete is served another's data. */
+function effortsCacheName(url) {
+    const athlete = url.searchParams.get('athlete');
+    return /^\d+$/.test(athlete || '') ? `${EFFORTS_CACHE_PREFIX}${athlete}` : null;
+}
+
+async function cacheFirst(cacheName, request) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request, { ignoreSearch: true });
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok) cache.put(request, response.clone());
+    return response;
+}
+
+async function staleWhileRevalidate(cacheName, request) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const network = fetch(request).then((response) => {
+        if (response.ok || response.type === 'opaque') cache.put(request, response.clone());
+        return response;
+    });
+    if (cached) {
+        network.catch(() => {});
+        return cached;
+    }
+    return network;
+}
+
+async function networkFirst(cacheName, request) {
+    const cache = await caches.open(cacheName);
+    try {
+        const response = await fetch(request);
+        if (response.ok && !response.redirected) cache.put(request, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+/**
+ * Serve the cached efforts immediately and revalidate with If-None-Match.
+ * An unchanged dataset costs one 304; a changed one replaces the cache entry
+ * and tells open pages to reload their data.
+ */
+async function effortsStaleWhileRevalidate(cacheName, event, request) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const revalidation = revalidateEfforts(cache, request, cached);
+    if (cached) {
+        event.waitUntil(revalidation.catch(() => {}));
+        return cached;
+    }
+    return revalidation;
+}
+
+async function revalidateEfforts(cache, request, cached) {
+    const headers = new Headers(request.headers);
+    const etag = cached?.headers.get('ETag');
+    if (etag) headers.set('If-None-Match', etag);
+
+    const response = await fetch(request.url, { headers, credentials: 'same-origin', cache: 'no-store' });
+    if (response.status === 304 && cached) return cached;
+    if (response.ok) {
+        await cache.put(request, response.clone());
+        if (cached) await notifyEffortsUpdated(request.url);
+    }
+    return response;
+}
+
+/**
+ * A forced refresh always goes to the network; its result also becomes the
+ * cached copy of the plain efforts URL.
+ */
+async function refreshEfforts(cacheName, request, url) {
+    const response = await fetch(request);
+    if (response.ok) {
+        const plainUrl = new URL(url);
+        plainUrl.searchParams.delete('refresh');
+        const cache = await caches.open(cacheName);
+        await cache.put(plainUrl.toString(), response.clone());
+    }
+    return response;
+}
+
+async function notifyEffortsUpdated(url) {
+    const segmentId = new URL(url).pathname.split('/')[2];
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage({ type: 'efforts-updated', segmentId, url }));
+}
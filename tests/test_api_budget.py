@@ -0,0 +1,162 @@
+"""Unit tests for the fair-share Strava API budget."""
+
+import threading
+
+import pytest
+
+import api_budget
+from api_budget import BACKGROUND, INTERACTIVE, ApiBudget, BudgetExceeded, BudgetScope
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _budget(clock, **kwargs) -> ApiBudget:
+    options = {"short_limit": 20, "daily_limit": 1000, "interactive_reserve": 0.25, "max_wait_seconds": 0}
+    options.update(kwargs)
+    return ApiBudget(clock=clock, **options)
+
+
+def _take(budget: ApiBudget, scope: BudgetScope) -> int:
+    taken = 0
+    while True:
+        try:
+            budget.acquire(scope, timeout=0)
+        except BudgetExceeded:
+            return taken
+        taken += 1
+
+
+class TestApiBudget:
+    def test_background_keeps_the_interactive_reserve(self):
+        clock = FakeClock()
+        budget = _budget(clock)
+
+        # Half of the 15 background calls wait for other athletes until the window's last 90 s.
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 7
+        clock.now += 810
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 8
+        assert _take(budget, BudgetScope("athlete:2", 11, INTERACTIVE)) == 5
+
+        with pytest.raises(BudgetExceeded) as excinfo:
+            budget.acquire(BudgetScope("athlete:2", 11, INTERACTIVE))
+        assert excinfo.value.reason == "15-minute limit reached"
+        assert 0 < excinfo.value.retry_after <= 900
+
+    def test_background_calls_are_shared_between_athletes(self):
+        clock = FakeClock()
+        budget = _budget(clock)
+        budget.acquire(BudgetScope("athlete:1", 10, BACKGROUND))
+        budget.acquire(BudgetScope("athlete:2", 20, BACKGROUND, weight=2.0))
+
+        # 15 background calls per window, split 1:2 with one share held back for a newcomer.
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 2
+        with pytest.raises(BudgetExceeded) as excinfo:
+            budget.acquire(BudgetScope("athlete:1", 10, BACKGROUND))
+        assert excinfo.value.reason == "fair share of background calls used"
+        assert _take(budget, BudgetScope("athlete:2", 20, BACKGROUND, weight=2.0)) == 6
+
+        # Near the end of the window the held-back share is released: a third and two thirds.
+        clock.now += 810
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 2
+        assert _take(budget, BudgetScope("athlete:2", 20, BACKGROUND, weight=2.0)) == 3
+        # Interactive calls still get the reserve.
+        assert _take(budget, BudgetScope("athlete:1", 10, INTERACTIVE)) == 5
+
+    def test_first_athlete_cannot_drain_the_pool_before_others_arrive(self):
+        clock = FakeClock()
+        budget = _budget(clock)
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 7
+
+        # Athlete 2 arrives later in the window and still gets a share.
+        clock.now += 300
+        assert _take(budget, BudgetScope("athlete:2", 20, BACKGROUND)) == 5
+
+        # Both are known demand in the next window, before athlete 2 makes a call there.
+        clock.now += 600
+        assert budget.snapshot()["tenants"]["athlete:1"]["background_share"] == 5
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 5
+
+    def test_window_rollover_restores_the_budget(self):
+        clock = FakeClock()
+        budget = _budget(clock)
+        _take(budget, BudgetScope("athlete:1", 10, INTERACTIVE))
+
+        clock.now += 900
+        budget.acquire(BudgetScope("athlete:1", 10, INTERACTIVE))
+
+        snapshot = budget.snapshot()
+        assert snapshot["short_used"] == 1
+        assert snapshot["daily_used"] == 21
+        assert snapshot["tenants"]["athlete:1"]["total_calls"] == {INTERACTIVE: 21, BACKGROUND: 0}
+        assert snapshot["tenants"]["athlete:1"]["denied"] == 1
+
+    def test_strava_headers_override_local_counts(self):
+        budget = _budget(FakeClock())
+        budget.observe_headers({"X-RateLimit-Limit": "200,2000", "X-RateLimit-Usage": "10,50"})
+        budget.observe_headers({"X-ReadRateLimit-Limit": "100,1000", "X-ReadRateLimit-Usage": "99,400"})
+
+        snapshot = budget.snapshot()
+        assert (snapshot["short_limit"], snapshot["daily_limit"]) == (100, 1000)
+        assert (snapshot["short_used"], snapshot["daily_used"]) == (99, 400)
+        budget.acquire(BudgetScope("athlete:1", None, INTERACTIVE))
+        with pytest.raises(BudgetExceeded):
+            budget.acquire(BudgetScope("athlete:1", None, INTERACTIVE))
+
+    def test_max_window_calls_caps_this_process(self):
+        budget = _budget(FakeClock(), short_limit=100, max_window_calls=10)
+        budget.acquire(BudgetScope("athlete:2", 20, BACKGROUND))
+
+        assert _take(budget, BudgetScope("athlete:1", 10, BACKGROUND)) == 3
+        assert _take(budget, BudgetScope("athlete:2", 20, BACKGROUND)) == 2
+        assert _take(budget, BudgetScope("athlete:3", 30, INTERACTIVE)) == 4
+        with pytest.raises(BudgetExceeded) as excinfo:
+            budget.acquire(BudgetScope("athlete:3", 30, INTERACTIVE))
+        assert excinfo.value.reason == "this process's per-window call budget is spent"
+
+    def test_waiters_are_served_interactive_first_then_fairly(self):
+        clock = FakeClock(1_700_000_099.0)
+        budget = _budget(clock, short_limit=2, interactive_reserve=0.0, max_wait_seconds=5)
+        _take(budget, BudgetScope("athlete:1", 10, INTERACTIVE))
+        granted, denied = [], []
+
+        def request(scope):
+            try:
+                budget.acquire(scope)
+                granted.append(f"{scope.tenant}/{scope.priority}")
+            except BudgetExceeded:
+                denied.append(f"{scope.tenant}/{scope.priority}")
+
+        scopes = [
+            BudgetScope("athlete:1", 10, BACKGROUND),
+            BudgetScope("athlete:1", 10, BACKGROUND),
+            BudgetScope("athlete:2", 20, BACKGROUND),
+            BudgetScope("athlete:3", 30, INTERACTIVE),
+        ]
+        threads = [threading.Thread(target=request, args=(scope,)) for scope in scopes]
+        for thread in threads:
+            thread.start()
+        while budget.snapshot()["waiting"] < len(threads):
+            pass
+
+        # The next window has two calls: the interactive one, then athlete 2, who has not used any yet.
+        clock.now += 1
+        for thread in threads:
+            thread.join(5)
+
+        assert sorted(granted) == ["athlete:2/background", "athlete:3/interactive"]
+        assert denied == ["athlete:1/background", "athlete:1/background"]
+
+
+class TestBudgetScope:
+    def test_nested_scopes_inherit_unset_fields(self):
+        with api_budget.scope(tenant="athlete:5", segment_id=12):
+            with api_budget.scope(priority=BACKGROUND):
+                assert api_budget.current_scope() == BudgetScope("athlete:5", 12, BACKGROUND)
+            assert api_budget.current_scope().priority == INTERACTIVE
+        assert api_budget.current_scope().tenant == "app"
@@ -0,0 +1,285 @@
+"""Route tests for the Flask app, against a scratch database and without Strava calls."""
+
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# app opens its repository at import time; keep it away from data/.
+_db_dir = tempfile.mkdtemp(prefix="strava-test-")
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+os.environ["STRAVA_DB_PATH"] = os.path.join(_db_dir, "strava.db")
+
+import app as app_module  # noqa: E402
+import profiling  # noqa: E402
+from payload_cache import PayloadCache  # noqa: E402
+from storage import StravaRepository  # noqa: E402
+
+ATHLETE_ID = 7
+SEGMENT_ID = 900
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repo = StravaRepository(str(tmp_path / "strava.db"))
+    cache = PayloadCache()
+    repo.efforts_changed_listeners.append(cache.invalidate)
+    monkeypatch.setattr(app_module, "repository", repo)
+    monkeypatch.setattr(app_module, "efforts_payload_cache", cache)
+    # Serve what is stored instead of syncing with Strava first.
+    monkeypatch.setattr(app_module, "get_cooldown_remaining_seconds", lambda segment_id, athlete_id: 60)
+    return repo
+
+
+@pytest.fixture
+def client(repo):
+    with app_module.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["access_token"] = "token"
+            session["athlete_id"] = ATHLETE_ID
+        yield client
+
+
+def _effort(effort_id: int, start_date: str) -> dict:
+    return {"id": effort_id, "activity_id": effort_id, "start_date": start_date, "elapsed_time": 300}
+
+
+class TestSegmentEfforts:
+    def test_efforts_of_the_session_athlete(self, repo, client):
+        repo.upsert_efforts(SEGMENT_ID, ATHLETE_ID, [_effort(1, "2024-01-01T10:00:00Z")])
+
+        response = client.get(f"/segment/{SEGMENT_ID}/efforts?athlete={ATHLETE_ID}")
+
+        assert response.status_code == 200
+        assert [effort["id"] for effort in response.get_json()] == [1]
+
+    def test_efforts_for_another_athlete_are_refused(self, repo, client):
+        repo.upsert_efforts(SEGMENT_ID, ATHLETE_ID, [_effort(1, "2024-01-01T10:00:00Z")])
+
+        response = client.get(f"/segment/{SEGMENT_ID}/efforts?athlete=8")
+
+        assert response.status_code == 403
+        assert response.get_json()["needs_reload"] is True
+
+
+class TestApiBudgetRefusals:
+    @pytest.fixture
+    def refused(self, repo, monkeypatch):
+        def strava_get(path, params=None):
+            raise app_module.ApiBudgetDeferred(app_module.api_budget.BudgetExceeded(12.3, "15-minute limit reached"))
+
+        monkeypatch.setattr(app_module, "strava_get", strava_get)
+        monkeypatch.setattr(app_module, "get_cooldown_remaining_seconds", lambda segment_id, athlete_id: 0)
+        monkeypatch.setattr(app_module, "rate_limit_cooldowns", {})
+
+    def test_sync_reports_the_budget_wait_without_a_cooldown(self, refused, client):
+        response = client.post(f"/segment/{SEGMENT_ID}/sync")
+
+        assert response.status_code == 429
+        assert response.get_json()["retry_after_seconds"] == 13
+        assert app_module.rate_limit_cooldowns == {}
+
+    def test_efforts_fall_back_to_stored_rows_without_a_cooldown(self, refused, repo, client):
+        response = client.get(f"/segment/{SEGMENT_ID}/efforts?athlete={ATHLETE_ID}&refresh=true")
+        assert response.status_code == 429 and response.get_json()["retry_after_seconds"] == 13
+
+        repo.upsert_efforts(SEGMENT_ID, ATHLETE_ID, [_effort(1, "2024-01-01T10:00:00Z")])
+        response = client.get(f"/segment/{SEGMENT_ID}/efforts?athlete={ATHLETE_ID}&refresh=true")
+        assert response.status_code == 200 and [effort["id"] for effort in response.get_json()] == [1]
+        assert app_module.rate_limit_cooldowns == {}
+
+
+class TestStaticAssetManifest:
+    @pytest.fixture
+    def static_dir(self, tmp_path, monkeypatch):
+        static = tmp_path / "static"
+        (static / "js").mkdir(parents=True)
+        (static / "js" / "a.js").write_text("one")
+        (static / "style.css").write_text("body {}")
+        monkeypatch.setattr(app_module.app, "static_folder", str(static))
+        monkeypatch.setattr(app_module, "_static_manifest", {})
+        return static
+
+    def _manifest(self):
+        with app_module.app.test_request_context():
+            return app_module.static_asset_manifest()
+
+    def test_hashes_only_when_files_change(self, static_dir, monkeypatch):
+        hashes = []
+        sha1 = app_module.hashlib.sha1
+        monkeypatch.setattr(app_module.hashlib, "sha1", lambda *args: hashes.append(1) or sha1(*args))
+
+        version, urls = self._manifest()
+        assert self._manifest() == (version, urls)
+        assert len(hashes) == 1
+        assert sorted(urls) == ["/static/js/a.js", "/static/style.css"]
+
+        (static_dir / "js" / "a.js").write_text("two!")
+        changed, _ = self._manifest()
+        assert changed != version and len(hashes) == 2
+
+
+class TestSegmentComparison:
+    @pytest.fixture
+    def seeded(self, repo):
+        repo.upsert_segment({"id": 10, "name": "Climb"})
+        repo.upsert_efforts(
+            10,
+            ATHLETE_ID,
+            [dict(_effort(100 + i, f"2025-03-{1 + i:02d}T08:00:00Z"), average_heartrate=140.0) for i in range(5)],
+        )
+        repo.upsert_efforts(11, ATHLETE_ID, [dict(_effort(200, "2025-03-02T08:00:00Z"), elapsed_time=0)])
+        return repo
+
+    def _compare(self, client, query):
+        response = client.get(f"/segments/compare?{query}")
+        assert response.status_code == 200
+        chunks = list(response.response)
+        return chunks, json.loads(b"".join(chunks))
+
+    def test_streams_in_chunks(self, seeded, client, monkeypatch):
+        monkeypatch.setattr(app_module, "COMPARE_FLUSH_BYTES", 1)
+
+        chunks, document = self._compare(client, "segment_ids=10,11,12")
+
+        assert len(chunks) > 2
+        assert [segment["segment_id"] for segment in document["segments"]] == [10, 11]
+        assert document["segments"][0]["name"] == "Climb"
+        assert len(document["segments"][0]["efforts"]) == 5
+        assert document["segments_without_efforts"] == [12]
+        assert (document["effort_rows"], document["truncated"]) == (6, False)
+        # A zero is a value, not a missing one.
+        assert document["segments"][1]["summary"]["mean_time"] == 0
+
+    def test_truncates_series_but_not_summaries(self, seeded, client):
+        _, document = self._compare(client, "segment_ids=10&segment_ids=11&max_efforts=3")
+
+        assert (document["effort_rows"], document["truncated"]) == (3, True)
+        assert [len(segment["efforts"]) for segment in document["segments"]] == [3, 0]
+        assert [segment["summary"]["count"] for segment in document["segments"]] == [5, 1]
+
+    def test_no_efforts(self, repo, client):
+        _, document = self._compare(client, "segment_ids=10")
+
+        assert document["segments"] == [] and document["segments_without_efforts"] == [10]
+
+
+class TestAdminProfiling:
+    @pytest.fixture
+    def admin(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(app_module, "ADMIN_ATHLETE_IDS", {ATHLETE_ID})
+        monkeypatch.setattr(app_module, "PROFILE_DIR", str(tmp_path / "profiles"))
+
+    @pytest.mark.parametrize("path", ["/admin/profiles", "/admin/profiles/x.pstats", "/admin/query-stats"])
+    def test_non_admins_are_refused(self, client, path):
+        assert client.get(path).status_code == 403
+
+    def test_non_admin_requests_are_not_profiled(self, client):
+        response = client.get("/admin/profiles?profile=1")
+
+        assert response.status_code == 403 and "X-Profile-Id" not in response.headers
+
+    def test_concurrent_profile_is_refused(self, admin, client, tmp_path):
+        assert "X-Profile-Id" in client.get("/admin/profiles?profile=1").headers
+
+        running = profiling.RequestProfile(str(tmp_path), "GET", "/elsewhere", ATHLETE_ID)
+        running.start()
+        try:
+            assert client.get("/admin/profiles?profile=1").status_code == 409
+        finally:
+            running.stop()
+        assert client.get("/admin/profiles").status_code == 200
+
+
+class TestEnrichmentBacklog:
+    def test_unavailable_activities_are_not_fetched_again(self, repo, monkeypatch):
+        repo.upsert_efforts(
+            SEGMENT_ID, ATHLETE_ID, [_effort(effort_id, f"2025-03-0{effort_id}T08:00:00Z") for effort_id in (1, 2, 3)]
+        )
+        requested = []
+
+        def strava_get(path, params=None):
+            activity_id = int(path.rsplit("/", 1)[1])
+            requested.append(activity_id)
+            if activity_id == 2:
+                raise app_module.StravaAPIError(404, "Record Not Found")
+            if activity_id == 3:
+                raise app_module.StravaAPIError(403, "Forbidden")
+            return {"id": activity_id, "name": "Ride", "gear_id": "b1", "start_date": "2025-03-01T08:00:00Z"}
+
+        monkeypatch.setattr(app_module, "strava_get", strava_get)
+
+        assert app_module.enrich_activity_backlog(SEGMENT_ID, ATHLETE_ID) == (1, False)
+        assert sorted(requested) == [1, 2, 3]
+
+        assert app_module.enrich_activity_backlog(SEGMENT_ID, ATHLETE_ID) == (0, False)
+        assert len(requested) == 3
+        assert repo.count_missing_activities(SEGMENT_ID, ATHLETE_ID)["total"] == 0
+
+
+    def test_background_job_uses_its_own_copy_of_the_tokens(self, repo, monkeypatch):
+        repo.upsert_efforts(SEGMENT_ID, ATHLETE_ID, [_effort(1, "2025-03-01T08:00:00Z")])
+        monkeypatch.setattr(app_module, "get_cooldown_remaining_seconds", lambda segment_id, athlete_id: 0)
+        monkeypatch.setattr(app_module, "enrichment_scheduler", app_module.enrichment.EnrichmentScheduler())
+        calls = []
+
+        def strava_get(path, params=None):
+            calls.append((app_module.has_request_context(), app_module.current_credentials().access_token))
+            # What a token refresh does: the new tokens go to the job's credentials, not the browser session.
+            app_module.save_credentials(app_module.StravaCredentials(ATHLETE_ID, "refreshed", "refresh-2"))
+            return {"id": 1, "name": "Ride", "gear_id": "b1", "start_date": "2025-03-01T08:00:00Z"}
+
+        monkeypatch.setattr(app_module, "strava_get", strava_get)
+        with app_module.app.test_request_context():
+            app_module.session.update(access_token="token", refresh_token="refresh", athlete_id=ATHLETE_ID)
+            assert app_module.schedule_enrichment(SEGMENT_ID, ATHLETE_ID)
+            app_module.enrichment_scheduler.join()
+
+            assert app_module.session["access_token"] == "token"
+        assert calls and calls[0] == (False, "token")
+        assert repo.get_athlete_tokens()[0]["access_token"] == "refreshed"
+
+
+class TestAthleteTokens:
+    def test_logout_deletes_stored_tokens(self, repo, client):
+        repo.upsert_athlete_tokens(ATHLETE_ID, "access", "refresh", None)
+        repo.upsert_athlete_tokens(8, "access-8", "refresh-8", None)
+
+        response = client.get("/logout")
+
+        assert response.status_code == 302
+        assert [row["athlete_id"] for row in repo.get_athlete_tokens()] == [8]
+        with client.session_transaction() as session:
+            assert "access_token" not in session
+
+
+class TestBulkSyncSegment:
+    def test_complete_only_once_the_backlog_is_empty(self, repo, monkeypatch):
+        repo.upsert_efforts(
+            SEGMENT_ID, ATHLETE_ID, [_effort(1, "2025-03-01T08:00:00Z"), _effort(2, "2025-03-02T08:00:00Z")]
+        )
+        repo.upsert_sync_state(SEGMENT_ID, ATHLETE_ID, next_page=1, full_sync_completed=True)
+        enrich = {"per_run": 1}
+
+        def sync_segment_batch(segment_id, athlete_id):
+            missing = repo.get_missing_bike_activity_ids(segment_id, athlete_id, limit=enrich["per_run"])
+            repo.upsert_activities(athlete_id, {activity_id: {"id": activity_id, "name": "Ride"} for activity_id in missing})
+            return repo.get_efforts(segment_id, athlete_id)
+
+        monkeypatch.setattr(app_module, "sync_segment_batch", sync_segment_batch)
+        job = app_module.bulk_sync.SyncJob(ATHLETE_ID, SEGMENT_ID)
+        credentials = app_module.StravaCredentials(ATHLETE_ID, "access", "refresh")
+
+        progress = app_module.bulk_sync_segment(job, credentials)
+        assert (progress.completed, progress.backlog) == (False, 1)
+
+        enrich["per_run"] = 0
+        with pytest.raises(app_module.bulk_sync.RetryLater):
+            app_module.bulk_sync_segment(job, credentials)
+
+        enrich["per_run"] = 1
+        progress = app_module.bulk_sync_segment(job, credentials)
+        assert (progress.completed, progress.backlog) == (True, 0)
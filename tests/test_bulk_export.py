@@ -0,0 +1,186 @@
+"""Unit tests for the Strava bulk-export importer."""
+
+import gzip
+import struct
+import zipfile
+
+import numpy as np
+import pytest
+
+from bulk_export import (
+    FIT_EPOCH_OFFSET,
+    import_archive,
+    parse_activities_csv,
+    parse_activity_file,
+    parse_fit,
+    summarize_track,
+)
+from storage import StravaRepository
+
+START = 1_704_103_200  # 2024-01-01T10:00:00Z
+
+
+def _fit_file(points, compressed_from: int = None) -> bytes:
+    """A FIT file with one record definition (timestamp, lat, lng, distance, heart_rate, power)."""
+    definition = struct.pack("<BBBHB", 0x40, 0, 0, 20, 6) + bytes(
+        [253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 5, 4, 0x86, 3, 1, 0x02, 7, 2, 0x84]
+    )
+    # Second local type without timestamp, for compressed-timestamp records.
+    compressed_definition = struct.pack("<BBBHB", 0x41, 0, 0, 20, 2) + bytes([3, 1, 0x02, 7, 2, 0x84])
+    body = definition + compressed_definition
+    for index, (offset, lat, lng, distance, heartrate, watts) in enumerate(points):
+        if compressed_from is not None and index >= compressed_from:
+            timestamp = START - FIT_EPOCH_OFFSET + offset
+            body += struct.pack("<BBH", 0x80 | (1 << 5) | (timestamp & 0x1F), heartrate, watts)
+            continue
+        body += struct.pack(
+            "<BIiiIBH",
+            0x00,
+            START - FIT_EPOCH_OFFSET + offset,
+            round(lat * 2**31 / 180),
+            round(lng * 2**31 / 180),
+            round(distance * 100),
+            heartrate,
+            0xFFFF if watts is None else watts,
+        )
+    header = struct.pack("<BBHI4s", 12, 0x10, 2100, len(body), b".FIT")
+    return header + body + b"\x00\x00"
+
+
+GPX = b"""<?xml version="1.0"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">
+  <metadata><time>2020-01-01T00:00:00Z</time></metadata>
+  <trk><trkseg>
+    <trkpt lat="45.0" lon="6.0"><ele>700</ele><time>2024-01-01T10:00:00Z</time>
+      <extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>120</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions></trkpt>
+    <trkpt lat="45.001" lon="6.0"><ele>705</ele><time>2024-01-01T10:00:20Z</time>
+      <extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>140</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions></trkpt>
+  </trkseg></trk>
+</gpx>"""
+
+TCX = b"""  <?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">
+  <Activities><Activity Sport="Biking"><Lap StartTime="2024-01-01T10:00:00Z">
+    <AverageHeartRateBpm><Value>99</Value></AverageHeartRateBpm>
+    <Track>
+      <Trackpoint><Time>2024-01-01T10:00:00Z</Time><DistanceMeters>0</DistanceMeters>
+        <HeartRateBpm><Value>130</Value></HeartRateBpm>
+        <Extensions><TPX xmlns="http://www.garmin.com/xmlschemas/ActivityExtension/v2"><Watts>200</Watts></TPX></Extensions></Trackpoint>
+      <Trackpoint><Time>2024-01-01T10:01:00Z</Time><DistanceMeters>500</DistanceMeters>
+        <HeartRateBpm><Value>150</Value></HeartRateBpm>
+        <Extensions><TPX xmlns="http://www.garmin.com/xmlschemas/ActivityExtension/v2"><Watts>300</Watts></TPX></Extensions></Trackpoint>
+    </Track>
+  </Lap></Activity></Activities>
+</TrainingCenterDatabase>"""
+
+CSV_HEADER = (
+    "Activity ID,Activity Date,Activity Name,Activity Type,Elapsed Time,Distance,Max Heart Rate,"
+    "Activity Gear,Filename,Elapsed Time,Moving Time,Distance,Max Heart Rate,Average Heart Rate,"
+    "Average Watts,Weighted Average Power"
+)
+
+
+class TestParsers:
+    def test_fit_records_including_compressed_timestamps(self):
+        points = [
+            (0, 45.0, 6.0, 0.0, 120, 200),
+            (1, 45.0001, 6.0, 8.0, 122, 210),
+            (2, 45.0002, 6.0, 16.0, 125, None),
+            (3, 0, 0, 0, 130, 250),
+        ]
+        track = parse_fit(_fit_file(points, compressed_from=3))
+
+        assert list(track.time - START) == [0, 1, 2, 3]
+        assert track.lat[1] == pytest.approx(45.0001, abs=1e-6)
+        assert np.isnan(track.lat[3]) and np.isnan(track.watts[2])
+        assert list(track.heartrate) == [120, 122, 125, 130]
+        assert track.distance[2] == pytest.approx(16.0)
+
+    def test_gpx_and_gzipped_tcx(self):
+        gpx = parse_activity_file("activities/1.gpx", GPX)
+        assert list(gpx.time - START) == [0, 20]
+        assert list(gpx.heartrate) == [120, 140]
+        assert list(gpx.altitude) == [700, 705]
+
+        tcx = parse_activity_file("activities/2.tcx.gz", gzip.compress(TCX))
+        assert list(tcx.watts) == [200, 300]
+        assert list(tcx.heartrate) == [130, 150]
+
+        summary = summarize_track(gpx)
+        assert summary["start_date"] == "2024-01-01T10:00:00Z"
+        assert summary["distance"] == pytest.approx(111.2, abs=0.5)
+        assert summary["average_heartrate"] == 130
+        assert "average_watts" not in summary
+
+    def test_csv_uses_the_last_of_repeated_columns(self):
+        text = CSV_HEADER + "\n" + (
+            '11,"Jan 1, 2024, 10:00:00 AM",Morning Ride,Ride,3600,"30.5",170,Tarmac,activities/11.fit.gz,'
+            "3600.0,3500.0,30512.3,171.0,140.5,210.0,235.0\n"
+        )
+        [activity] = parse_activities_csv(text)
+
+        assert activity["id"] == 11
+        assert activity["start_date"] == "2024-01-01T10:00:00Z"
+        assert activity["distance"] == 30512.3
+        assert (activity["elapsed_time"], activity["moving_time"]) == (3600, 3500)
+        assert (activity["max_heartrate"], activity["average_heartrate"]) == (171.0, 140.5)
+        assert activity["weighted_average_watts"] == 235.0
+        assert activity["gear_name"] == "Tarmac"
+
+
+class TestImportArchive:
+    def _archive(self, tmp_path):
+        rows = [
+            '21,"Jan 1, 2024, 10:00:00 AM",Hill repeats,Ride,60,"0.5",,Tarmac,activities/21.tcx.gz,60,,500,,,,',
+            '22,"Jan 2, 2024, 10:00:00 AM",Easy spin,Ride,20,"0.1",140,Old bike,activities/22.gpx,20,20,111,140,135,,',
+            '23,"Jan 3, 2024, 10:00:00 AM",Already fetched,Ride,10,"1",,,,,,,,,,',
+            '24,"Jan 4, 2024, 10:00:00 AM",Broken file,Ride,10,"1",,,activities/24.fit,,,,,,,',
+        ]
+        path = tmp_path / "export.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("profile.csv", "Athlete ID,First Name\n7,Ann\n")
+            archive.writestr("activities.csv", CSV_HEADER + "\n" + "\n".join(rows) + "\n")
+            archive.writestr("activities/21.tcx.gz", gzip.compress(TCX))
+            archive.writestr("activities/22.gpx", GPX)
+            archive.writestr("activities/24.fit", b"not a fit file")
+        return str(path)
+
+    def test_imports_activities_and_enriches_stored_efforts(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        repo.upsert_gear(7, [{"id": "b1", "name": "Tarmac"}])
+        repo.upsert_activities(7, {23: {"id": 23, "name": "From the API", "start_date": "2024-01-03T10:00:00Z"}})
+        repo.upsert_efforts(
+            10,
+            7,
+            [{"id": 500, "activity_id": 21, "start_date": "2024-01-01T10:00:10Z", "elapsed_time": 30, "name": "Ride"}],
+        )
+        messages = []
+
+        result = import_archive(self._archive(tmp_path), repo, workers=1, chunk_size=2, progress=messages.append)
+
+        assert (result.athlete_id, result.activities, result.skipped) == (7, 3, 1)
+        assert (result.files_parsed, result.files_failed, result.efforts_updated) == (2, 1, 1)
+        assert messages[-1] == "stored 3/3 activities"
+        assert repo.get_missing_bike_activity_ids(10, 7) == []
+
+        [effort] = repo.get_efforts(10, 7)
+        assert (effort["name"], effort["bike_id"], effort["bike_name"]) == ("Hill repeats", "b1", "Tarmac")
+
+        with repo._connect() as conn:
+            rows = {
+                row["id"]: dict(row)
+                for row in conn.execute(
+                    "SELECT id, name, bike_id, bike_name, average_watts, weighted_average_watts, average_heartrate FROM activities"
+                )
+            }
+        assert rows[21]["average_watts"] == 250.0 and rows[21]["weighted_average_watts"] == pytest.approx(250, abs=30)
+        assert rows[22]["average_heartrate"] == 135.0  # activities.csv wins over the file's mean of 130
+        assert (rows[22]["bike_id"], rows[22]["bike_name"]) == (None, "Old bike")
+        assert rows[23]["name"] == "From the API"
+
+    def test_parses_files_on_a_process_pool(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+
+        result = import_archive(self._archive(tmp_path), repo, workers=2)
+
+        assert (result.activities, result.files_parsed, result.files_failed) == (4, 2, 1)
@@ -0,0 +1,57 @@
+"""Unit tests for the headless bulk sync runner."""
+
+from bulk_sync import COMPLETE, FAILED, PARTIAL, BulkSync, RetryLater, SyncJob, SyncProgress, summarize
+
+
+class FakeSegmentSync:
+    """Completes a segment after `runs_needed` calls; raises RetryLater on the calls listed in `deferred`."""
+
+    def __init__(self, runs_needed: int, deferred=()):
+        self.runs_needed = runs_needed
+        self.deferred = set(deferred)
+        self.calls = {}
+
+    def __call__(self, job: SyncJob) -> SyncProgress:
+        call = self.calls[job] = self.calls.get(job, 0) + 1
+        if job.segment_id == 99:
+            raise RuntimeError("segment not found")
+        if call in self.deferred:
+            raise RetryLater(30, "API budget spent")
+        done = call - len([n for n in self.deferred if n < call])
+        return SyncProgress(completed=done >= self.runs_needed, next_page=1 + done * 25, efforts=done * 5000)
+
+
+class TestBulkSync:
+    def test_runs_each_segment_until_complete_waiting_for_the_budget(self):
+        sync = FakeSegmentSync(runs_needed=2, deferred={2})
+        sleeps, messages = [], []
+        runner = BulkSync(sync, concurrency=2, sleep=sleeps.append, progress=messages.append)
+
+        results = runner.run([SyncJob(1, 10), SyncJob(2, 10), SyncJob(1, 99)])
+
+        assert [result.status for result in results] == [COMPLETE, COMPLETE, FAILED]
+        assert [result.runs for result in results[:2]] == [3, 3]
+        assert results[0].efforts == 10000 and results[0].waited_seconds == 30
+        assert results[2].error == "segment not found"
+        assert sleeps == [30, 30]
+        assert sum(message.startswith("[") for message in messages) == 3
+
+        summary = summarize(results, api_calls=12)
+        assert summary.splitlines()[0] == "3 segment syncs: 2 complete, 0 partial, 1 failed"
+        assert "Strava API calls: 12" in summary
+        assert "segment=99 failed" in summary
+
+    def test_without_waiting_a_spent_budget_leaves_the_segment_partial(self):
+        runner = BulkSync(FakeSegmentSync(runs_needed=3, deferred={2}), wait=False, progress=lambda message: None)
+
+        [result] = runner.run([SyncJob(1, 10)])
+
+        assert (result.status, result.runs, result.next_page) == (PARTIAL, 2, 26)
+        assert result.error == "API budget spent"
+
+    def test_max_runs_bounds_each_segment(self):
+        runner = BulkSync(FakeSegmentSync(runs_needed=10), max_runs=4, progress=lambda message: None)
+
+        [result] = runner.run([SyncJob(1, 10)])
+
+        assert (result.status, result.runs, result.efforts) == (PARTIAL, 4, 20000)
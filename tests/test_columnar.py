@@ -0,0 +1,74 @@
+"""Unit tests for the columnar efforts wire format."""
+
+from columnar import from_columnar, to_columnar
+from dates import iso_to_epoch
+from storage import StravaRepository
+
+
+def _efforts():
+    return [
+        {
+            "id": 2,
+            "activity_id": 20,
+            "start_date": "2025-03-02T08:30:00Z",
+            "bike_id": "b1",
+            "bike_name": "Tarmac",
+            "elapsed_time": 310,
+            "average_heartrate": 141.2,
+            "average_watts": None,
+            "name": "Lunch Ride",
+            "time_in_zones": [0, 30, 200, 80, 0],
+        },
+        {
+            "id": 1,
+            "activity_id": 10,
+            "start_date": "2025-03-01T08:30:00Z",
+            "bike_id": "b1",
+            "bike_name": "Tarmac",
+            "elapsed_time": 300,
+            "average_heartrate": 135.0,
+            "average_watts": 250.0,
+            "name": "Morning Ride",
+        },
+        {
+            "id": 3,
+            "activity_id": 30,
+            "start_date": None,
+            "bike_id": None,
+            "bike_name": None,
+            "elapsed_time": 305,
+            "name": None,
+            "time_in_zones": None,
+        },
+    ]
+
+
+class TestColumnar:
+    def test_dictionary_encodes_bikes(self):
+        payload = to_columnar(_efforts())
+        assert payload["count"] == 3
+        assert payload["dictionaries"]["bike_name"] == ["Tarmac", None]
+        assert payload["columns"]["bike_name"] == [0, 0, 1]
+
+    def test_dates_are_epoch_seconds(self):
+        payload = to_columnar(_efforts())
+        assert payload["columns"]["start_date"] == [1740904200, 1740817800, None]
+        assert iso_to_epoch("not a date") is None
+
+    def test_round_trip(self):
+        decoded = from_columnar(to_columnar(_efforts()))
+        for original, restored in zip(_efforts(), decoded):
+            for field, value in original.items():
+                assert restored[field] == value
+
+    def test_carries_every_field_of_stored_rows(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        repo.upsert_efforts(10, 7, [{**_efforts()[0], "start_date_local": "2025-03-02T09:30:00Z"}])
+        repo.update_effort_stream_metrics({2: {"normalized_watts": 260.0, "hr_drift_pct": 3.5, "time_in_zones": [0, 30, 200, 80, 0]}})
+        [row] = repo.get_efforts(10, 7)
+        row["decoupling_pct"] = 1.2
+
+        [decoded] = from_columnar(to_columnar([row]))
+
+        assert {field: decoded.get(field) for field in row} == row
+        assert (decoded["start_epoch"], decoded["local_date"]) == (1740904200, "2025-03-02")
@@ -0,0 +1,47 @@
+"""Unit tests for the background enrichment scheduler."""
+
+import threading
+
+from enrichment import EnrichmentScheduler
+
+
+class TestEnrichmentScheduler:
+    def test_one_job_per_key_until_it_finishes(self):
+        scheduler = EnrichmentScheduler()
+        release = threading.Event()
+        runs = []
+
+        def job(name):
+            def run():
+                release.wait(5)
+                runs.append(name)
+
+            return run
+
+        assert scheduler.submit((10, 7), job("first"))
+        assert not scheduler.submit((10, 7), job("duplicate"))
+        assert scheduler.submit((11, 7), job("other segment"))
+        assert scheduler.is_pending((10, 7))
+
+        release.set()
+        scheduler.join()
+
+        assert runs == ["first", "other segment"]
+        assert not scheduler.is_pending((10, 7))
+        assert scheduler.submit((10, 7), job("again"))
+        scheduler.join()
+        assert runs[-1] == "again"
+
+    def test_failing_job_does_not_stop_the_worker(self):
+        scheduler = EnrichmentScheduler()
+        runs = []
+
+        def fail():
+            raise RuntimeError("boom")
+
+        scheduler.submit("a", fail)
+        scheduler.submit("b", lambda: runs.append("b"))
+        scheduler.join()
+
+        assert runs == ["b"]
+        assert not scheduler.is_pending("a")
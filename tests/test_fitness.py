@@ -0,0 +1,124 @@
+"""Unit tests for the athlete-wide fitness index."""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from dates import iso_to_epoch
+from fitness import FitnessIndex, columns_to_arrays, compute_fitness_index, segment_baselines
+from readiness import compute_baseline, get_ef, is_z2_strict
+from storage import StravaRepository
+
+
+def _day(days_ago: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime("%Y-%m-%dT08:00:00Z")
+
+
+def _effort(effort_id, activity_id, days_ago, hr, watts, **extra):
+    effort = {
+        "id": effort_id,
+        "activity_id": activity_id,
+        "start_date": _day(days_ago),
+        "elapsed_time": 300,
+        "average_heartrate": hr,
+        "average_watts": watts,
+    }
+    effort.update(extra)
+    return effort
+
+
+def _columns(segment_efforts):
+    rows = [(segment_id, effort) for segment_id, efforts in segment_efforts.items() for effort in efforts]
+    return {
+        "segment_id": [segment_id for segment_id, _ in rows],
+        "start_epoch": [iso_to_epoch(effort.get("start_date")) for _, effort in rows],
+        "average_heartrate": [effort.get("average_heartrate") for _, effort in rows],
+        "average_watts": [effort.get("average_watts") for _, effort in rows],
+        "normalized_watts": [effort.get("normalized_watts") for _, effort in rows],
+        "efficiency": [effort.get("efficiency") for _, effort in rows],
+    }
+
+
+SEGMENTS = {
+    10: [_effort(i, i, i * 3, 135, 200 + 7 * i) for i in range(1, 15)]
+    + [_effort(50, 50, 2, 150, 400), _effort(51, 51, 200, 134, 500)],
+    11: [_effort(100 + i, 100 + i, i * 5, 133, 180 + i, normalized_watts=190 + 2 * i) for i in range(1, 5)]
+    + [_effort(110, 110, 4, 0, 200), _effort(111, 111, 6, 136, None)],
+    12: [_effort(200, 200, 300, 135, 250)],
+}
+
+
+class TestFitnessIndex:
+    def test_baselines_match_compute_baseline(self):
+        today = np.datetime64(datetime.now(timezone.utc).date(), "D")
+        segment_ids, baselines = segment_baselines(columns_to_arrays(_columns(SEGMENTS)), today)
+
+        expected = {
+            segment_id: compute_baseline(efforts)["baseline"]
+            for segment_id, efforts in SEGMENTS.items()
+            if compute_baseline(efforts)["baseline"] is not None
+        }
+        assert list(segment_ids) == sorted(expected)
+        assert np.allclose(baselines, [expected[segment_id] for segment_id in segment_ids])
+
+    def test_daily_series_averages_readiness_across_segments(self):
+        result = compute_fitness_index(columns_to_arrays(_columns(SEGMENTS)), rolling_days=7)
+        assert result["segments_with_baseline"] == 2
+
+        baselines = {segment_id: compute_baseline(efforts)["baseline"] for segment_id, efforts in SEGMENTS.items()}
+        by_day = {}
+        for segment_id, efforts in SEGMENTS.items():
+            for effort in efforts:
+                ef = get_ef(effort)
+                if baselines[segment_id] and is_z2_strict(effort)["valid"] and ef:
+                    by_day.setdefault(effort["start_date"][:10], []).append((ef / baselines[segment_id] - 1) * 100)
+
+        assert result["scored_efforts"] == sum(len(values) for values in by_day.values())
+        assert [point["date"] for point in result["series"]] == sorted(by_day)
+        for point in result["series"]:
+            values = by_day[point["date"]]
+            assert point["count"] == len(values)
+            assert point["forme_pct"] == round(sum(values) / len(values), 1)
+
+        # The 7-day window on the last day covers every effort of the past week.
+        last = result["series"][-1]
+        window = [v for day, values in by_day.items() if day > str(np.datetime64(last["date"]) - 7) for v in values]
+        assert last["rolling_pct"] == round(sum(window) / len(window), 1)
+
+    def test_incremental_refresh_reloads_only_changed_segments(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        for segment_id, efforts in SEGMENTS.items():
+            repo.upsert_efforts(segment_id, 7, efforts)
+
+        loads = []
+
+        def load(athlete_id, segment_ids):
+            loads.append(segment_ids)
+            return repo.get_fitness_columns(athlete_id, segment_ids)
+
+        index = FitnessIndex(load, repo.get_efforts_versions)
+        first = index.get(7)
+        assert index.get(7) is first
+
+        repo.upsert_efforts(11, 7, [_effort(120, 120, 1, 135, 260)])
+        refreshed = index.get(7)
+        assert loads == [None, [11]]
+        assert refreshed["scored_efforts"] == first["scored_efforts"] + 1
+
+        expected = compute_fitness_index(columns_to_arrays(repo.get_fitness_columns(7)))
+        assert refreshed == expected
+
+    def test_sees_writes_from_another_repository(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        for segment_id, efforts in SEGMENTS.items():
+            repo.upsert_efforts(segment_id, 7, efforts)
+        index = FitnessIndex(repo.get_fitness_columns, repo.get_efforts_versions)
+        first = index.get(7)
+
+        # Another worker or a CLI command writing to the same database.
+        other = StravaRepository(str(tmp_path / "strava.db"))
+        other.upsert_efforts(11, 7, [_effort(120, 120, 1, 135, 260)])
+
+        assert index.get(7)["scored_efforts"] == first["scored_efforts"] + 1
+        other.clear_all()
+        assert index.get(7)["scored_efforts"] == 0
@@ -0,0 +1,82 @@
+"""Unit tests for the request timing breakdown and Prometheus rendering."""
+
+from flask import Flask
+
+import metrics
+from storage import StravaRepository
+
+
+class TestRegistry:
+    def test_counter_and_histogram_render_in_text_format(self):
+        registry = metrics.Registry()
+        calls = registry.counter("calls_total", "Calls.", ("endpoint",))
+        latency = registry.histogram("latency_seconds", "Latency.", ("endpoint",), buckets=(0.1, 1.0))
+        calls.inc(endpoint="/a")
+        calls.inc(2, endpoint="/a")
+        latency.observe(0.05, endpoint="/a")
+        latency.observe(0.5, endpoint="/a")
+        latency.observe(3.0, endpoint="/a")
+
+        text = registry.render()
+
+        assert "# TYPE calls_total counter" in text
+        assert 'calls_total{endpoint="/a"} 3' in text
+        assert 'latency_seconds_bucket{endpoint="/a",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{endpoint="/a",le="1"} 2' in text
+        assert 'latency_seconds_bucket{endpoint="/a",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{endpoint="/a"} 3' in text
+        assert latency.count(endpoint="/a") == 3
+
+    def test_strava_endpoint_collapses_ids(self):
+        assert metrics.strava_endpoint("/segments/123/all_efforts") == "/segments/{id}/all_efforts"
+        assert metrics.strava_endpoint("/activities/9") == "/activities/{id}"
+        assert metrics.strava_endpoint("/athlete") == "/athlete"
+
+
+class TestServerTiming:
+    def test_components_reported_in_header_and_histograms(self):
+        app = Flask(__name__)
+
+        @app.before_request
+        def start():
+            metrics.start_request()
+
+        @app.after_request
+        def finish(response):
+            return metrics.finish_request(response, "/test-timing", "GET")
+
+        @app.route("/test-timing")
+        def handler():
+            metrics.record_strava_call("/segments/1/all_efforts", 200, 0.02)
+            metrics.record_db(0.003, 4)
+            with metrics.timed("serialize"):
+                pass
+            return "ok"
+
+        before = metrics.HTTP_REQUEST_SECONDS.count(route="/test-timing", method="GET", status=200)
+        response = app.test_client().get("/test-timing")
+
+        timing = response.headers["Server-Timing"]
+        assert 'strava;dur=20.0;desc="1 calls"' in timing
+        assert 'db;dur=3.0;desc="4 queries"' in timing
+        assert "serialize;dur=" in timing
+        assert "analytics" not in timing
+        assert "total;dur=" in timing
+        assert metrics.HTTP_REQUEST_SECONDS.count(route="/test-timing", method="GET", status=200) == before + 1
+
+    def test_record_outside_request_is_a_no_op(self):
+        metrics.record("db", 1.0)
+
+
+class TestConnectionListeners:
+    def test_listener_receives_statement_count(self, tmp_path):
+        repository = StravaRepository(str(tmp_path / "metrics.db"))
+        seen = []
+        repository.connection_listeners.append(lambda seconds, statements: seen.append((seconds, statements)))
+
+        repository.get_sync_state(1, 2)
+
+        assert len(seen) == 1
+        seconds, statements = seen[0]
+        assert seconds >= 0
+        assert statements == 1
@@ -0,0 +1,64 @@
+"""Unit tests for the serialised payload cache."""
+
+import gzip
+import json
+
+from payload_cache import PayloadCache, dumps, negotiate_encoding
+
+
+class TestNegotiateEncoding:
+    def test_identity_without_header(self):
+        assert negotiate_encoding(None) is None
+        assert negotiate_encoding("") is None
+
+    def test_gzip(self):
+        assert negotiate_encoding("gzip, deflate") == "gzip"
+
+    def test_q_zero_is_refused(self):
+        assert negotiate_encoding("gzip;q=0, identity") is None
+
+    def test_wildcard(self):
+        assert negotiate_encoding("*") is not None
+
+
+class TestPayloadCache:
+    def test_hit_requires_matching_version(self):
+        cache = PayloadCache()
+        cache.put((1, 7, "json"), 3, b"[]")
+        assert cache.get((1, 7, "json"), 3).body == b"[]"
+        assert cache.get((1, 7, "json"), 4) is None
+
+    def test_lru_bound(self):
+        cache = PayloadCache(max_entries=2)
+        for segment_id in range(3):
+            cache.put((segment_id, 7, "json"), 1, b"[]")
+        assert cache.get((0, 7, "json"), 1) is None
+        assert cache.get((2, 7, "json"), 1) is not None
+
+    def test_invalidate_scope(self):
+        cache = PayloadCache()
+        cache.put((1, 7, "json"), 1, b"[]")
+        cache.put((2, 7, "json"), 1, b"[]")
+        cache.invalidate(1, 7)
+        assert cache.get((1, 7, "json"), 1) is None
+        assert cache.get((2, 7, "json"), 1) is not None
+
+    def test_gzip_bytes_decode_to_body(self):
+        body = dumps([{"id": i, "bike_name": "Tarmac"} for i in range(500)])
+        entry = PayloadCache().put((1, 7, "json"), 1, body)
+        encoded, encoding = entry.encoded("gzip")
+        assert encoding == "gzip"
+        assert len(encoded) < len(body) / 5
+        assert json.loads(gzip.decompress(encoded)) == json.loads(body)
+
+    def test_small_bodies_are_not_compressed(self):
+        entry = PayloadCache().put((1, 7, "json"), 1, b"[]")
+        assert entry.encoded("gzip") == (b"[]", None)
+
+    def test_etag_follows_content_not_version(self):
+        cache = PayloadCache()
+        first = cache.put((1, 7, "json"), 1, b'[{"id": 1}]')
+        same = cache.put((1, 7, "json"), 2, b'[{"id": 1}]')
+        changed = cache.put((1, 7, "json"), 3, b'[{"id": 2}]')
+        assert first.etag == same.etag
+        assert changed.etag != first.etag
@@ -0,0 +1,67 @@
+"""Unit tests for per-request profiling."""
+
+import pstats
+import time
+
+import pytest
+
+from profiling import ProfilerBusy, RequestProfile, list_profiles, prune_profiles
+
+
+def _busy_loop(seconds: float) -> int:
+    total = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestRequestProfile:
+    def test_writes_pstats_collapsed_stacks_and_metadata(self, tmp_path):
+        profile = RequestProfile(str(tmp_path), "GET", "/segment/12/efforts", 5, interval=0.001)
+        profile.start()
+        _busy_loop(0.05)
+        meta = profile.stop(200)
+
+        assert meta["status"] == 200
+        assert meta["samples"] > 0
+        stats = pstats.Stats(str(tmp_path / f"{profile.id}.pstats"))
+        assert any(function == "_busy_loop" for _, _, function in stats.stats)
+        collapsed = (tmp_path / f"{profile.id}.collapsed").read_text().splitlines()
+        assert any("_busy_loop (test_profiling.py:" in line for line in collapsed)
+        stack, count = collapsed[0].rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+        listed = list_profiles(str(tmp_path))
+        assert [entry["id"] for entry in listed] == [profile.id]
+        assert "segment-12-efforts" in profile.id
+        assert listed[0]["files"] == [f"{profile.id}.pstats", f"{profile.id}.collapsed"]
+
+    def test_one_profile_at_a_time(self, tmp_path):
+        first = RequestProfile(str(tmp_path), "GET", "/a", 5)
+        first.start()
+        try:
+            with pytest.raises(ProfilerBusy):
+                RequestProfile(str(tmp_path), "GET", "/b", 5).start()
+        finally:
+            first.stop(200)
+
+        second = RequestProfile(str(tmp_path), "GET", "/b", 5)
+        second.start()
+        second.stop(200)
+
+    def test_prune_keeps_the_newest_profiles(self, tmp_path):
+        for stem in ("20240101-000000-a", "20240102-000000-b", "20240103-000000-c"):
+            for suffix in (".json", ".pstats", ".collapsed"):
+                (tmp_path / f"{stem}{suffix}").write_text("{}")
+
+        prune_profiles(tmp_path, keep=2)
+
+        assert sorted(path.name for path in tmp_path.glob("*.json")) == [
+            "20240102-000000-b.json",
+            "20240103-000000-c.json",
+        ]
+        assert not (tmp_path / "20240101-000000-a.pstats").exists()
+
+    def test_missing_directory_lists_nothing(self, tmp_path):
+        assert list_profiles(str(tmp_path / "missing")) == []
@@ -0,0 +1,74 @@
+"""Unit tests for the opt-in statement profiler."""
+
+import logging
+
+from query_stats import QueryProfiler, normalize_sql
+from storage import StravaRepository
+from tests.test_storage import _effort
+
+
+def _profiled_repo(tmp_path, slow_ms=100.0):
+    profiler = QueryProfiler(slow_ms=slow_ms)
+    repo = StravaRepository(str(tmp_path / "strava.db"), query_profiler=profiler)
+    repo.upsert_efforts(10, 1, [_effort(i, 100 + i, f"2024-01-{i:02d}T08:00:00Z") for i in range(1, 6)])
+    profiler.reset()
+    return repo, profiler
+
+
+def _entry(profiler, fragment):
+    matches = [entry for entry in profiler.snapshot(limit=1000)["statements"] if fragment in entry["sql"]]
+    assert len(matches) == 1, [entry["sql"] for entry in profiler.snapshot(limit=1000)["statements"]]
+    return matches[0]
+
+
+class TestQueryProfiler:
+    def test_statements_are_aggregated_with_rows_and_plans(self, tmp_path):
+        repo, profiler = _profiled_repo(tmp_path)
+
+        assert len(repo.get_efforts(10, 1)) == 5
+        repo.get_efforts(10, 1)
+        repo.stats(10, 1)
+
+        efforts = _entry(profiler, "COALESCE(g.name, e.bike_name) AS bike_name, e.elapsed_time, e.moving_time")
+        assert efforts["count"] == 2
+        assert efforts["rows"] == 10
+        assert efforts["plan"]
+        # A single fetchone() is still recorded once the connection block ends.
+        count = _entry(profiler, "SELECT COUNT(*) AS c FROM efforts WHERE segment_id")
+        assert count["count"] == 1
+        assert count["rows"] == 1
+        assert any("USING" in line for line in count["plan"])
+        assert _entry(profiler, "SELECT COUNT(*) AS c FROM gear")["full_scan"]
+
+    def test_slow_statements_are_logged_with_their_plan(self, tmp_path, caplog):
+        repo, profiler = _profiled_repo(tmp_path, slow_ms=0)
+
+        with caplog.at_level(logging.WARNING, logger="query_stats"):
+            repo.get_missing_bike_activity_ids(10, 1)
+
+        messages = [record.getMessage() for record in caplog.records]
+        assert any("Slow query" in message and "LEFT JOIN activities" in message and "plan:" in message for message in messages)
+        assert _entry(profiler, "LEFT JOIN activities")["slow_count"] == 1
+
+    def test_connection_keeps_only_unfinished_cursors(self, tmp_path):
+        repo, profiler = _profiled_repo(tmp_path)
+
+        with repo._connect() as conn:
+            for _ in range(50):
+                conn.execute("SELECT id FROM efforts WHERE id > 0").fetchall()
+                conn.execute("UPDATE efforts SET name = name WHERE id = 1")
+            assert not conn._unfinished
+            conn.execute("SELECT id FROM efforts ORDER BY id").fetchone()
+            assert len(conn._unfinished) == 1
+
+        assert _entry(profiler, "SELECT id FROM efforts ORDER BY id")["count"] == 1
+        assert _entry(profiler, "SELECT id FROM efforts WHERE id > 0")["count"] == 50
+
+    def test_profiling_is_off_by_default(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        assert repo.query_profiler is None
+        with repo._connect() as conn:
+            assert type(conn).__name__ == "Connection"
+
+    def test_normalize_sql_collapses_whitespace(self):
+        assert normalize_sql("\n  SELECT a,\n   b  FROM t\n") == "SELECT a, b FROM t"
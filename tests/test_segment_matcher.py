@@ -0,0 +1,225 @@
+"""Unit tests for offline segment-effort detection."""
+
+import math
+import zipfile
+
+import numpy as np
+import pytest
+
+from bulk_export import EARTH_RADIUS_M, Track
+from segment_matcher import (
+    SegmentGeometry,
+    decode_polyline,
+    local_effort_id,
+    match_archive,
+    match_stored_activities,
+    match_track,
+    track_from_streams,
+)
+from storage import StravaRepository
+from streams import decode_streams, encode_streams
+
+START = 1_704_103_200  # 2024-01-01T10:00:00Z
+SEGMENT_ID = 900
+
+
+def _latlng(x, y) -> tuple:
+    """Point(s) `x` metres east and `y` metres north of 45N 6E."""
+    return 45.0 + np.degrees(y / EARTH_RADIUS_M), 6.0 + np.degrees(x / (EARTH_RADIUS_M * math.cos(math.radians(45.0))))
+
+
+def _encode_polyline(points) -> str:
+    encoded, previous = [], (0, 0)
+    for point in points:
+        current = (round(point[0] * 1e5), round(point[1] * 1e5))
+        for value, last in zip(current, previous):
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                encoded.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            encoded.append(chr(delta + 63))
+        previous = current
+    return "".join(encoded)
+
+
+# 500 m north, then 500 m east.
+SEGMENT = {
+    "id": SEGMENT_ID,
+    "name": "Corner climb",
+    "distance": 1000.0,
+    "map": {"polyline": _encode_polyline([_latlng(0, 0), _latlng(0, 500), _latlng(500, 500)])},
+}
+
+
+def _track(waypoints, speed: float = 7.0, heartrate: float = 150.0, watts: float = 200.0, noise: float = 0.0) -> Track:
+    """A 1 Hz track riding through `waypoints` (metres east/north) at `speed` m/s."""
+    waypoints = np.asarray(waypoints, dtype=float)
+    cumulative = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(waypoints, axis=0).T))])
+    along = np.arange(0.0, cumulative[-1], speed)
+    x = np.interp(along, cumulative, waypoints[:, 0])
+    y = np.interp(along, cumulative, waypoints[:, 1])
+    if noise:
+        rng = np.random.default_rng(1)
+        x, y = x + rng.normal(0, noise, len(x)), y + rng.normal(0, noise, len(y))
+    lat, lng = _latlng(x, y)
+    count = len(along)
+    return Track(
+        time=START + np.arange(count, dtype=float),
+        lat=np.asarray(lat),
+        lng=np.asarray(lng),
+        altitude=np.full(count, np.nan),
+        distance=np.full(count, np.nan),
+        heartrate=np.full(count, heartrate),
+        watts=np.full(count, watts),
+    )
+
+
+RIDE_THROUGH = [(0, -200), (0, 500), (700, 500)]
+
+
+class TestPolyline:
+    def test_decodes_the_reference_example(self):
+        points = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+        assert points == pytest.approx(np.array([[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]))
+
+    def test_rejects_truncated_input(self):
+        with pytest.raises(ValueError):
+            decode_polyline("_p~iF~ps|U_")
+
+    def test_geometry_falls_back_to_start_and_end(self):
+        geometry = SegmentGeometry.from_segment({"id": 1, "start_latlng": _latlng(0, 0), "end_latlng": _latlng(0, 300)})
+
+        assert geometry.length == pytest.approx(300, abs=0.5)
+        assert geometry.start_direction == pytest.approx([0, 1], abs=1e-6)
+        with pytest.raises(ValueError):
+            SegmentGeometry.from_segment({"id": 2})
+
+
+class TestMatchTrack:
+    geometry = SegmentGeometry.from_segment(SEGMENT)
+
+    def test_single_traversal(self):
+        [effort] = match_track(self.geometry, _track(RIDE_THROUGH), activity_id=31)
+
+        # The start gate is crossed 200 m (28.6 s) in, the 1000 m segment takes 142.9 s.
+        assert effort["start_date"] == "2024-01-01T10:00:29Z"
+        assert effort["elapsed_time"] == 143
+        assert effort["moving_time"] == 143
+        assert effort["distance"] == pytest.approx(1000, abs=3)
+        assert (effort["start_index"], effort["end_index"]) == (None, None)
+        assert (effort["average_heartrate"], effort["max_heartrate"]) == (150.0, 150.0)
+        assert (effort["average_watts"], effort["weighted_average_watts"], effort["device_watts"]) == (200.0, 200.0, True)
+        assert effort["activity"] == {"id": 31} and effort["segment"] == {"id": SEGMENT_ID}
+        assert effort["id"] == local_effort_id(SEGMENT_ID, 31, START + 200 / 7) < 0
+
+    def test_laps_with_gps_noise(self):
+        laps = RIDE_THROUGH + [(700, -200), (0, -200), (0, 500), (700, 500)]
+
+        efforts = match_track(self.geometry, _track(laps, noise=4.0), activity_id=31)
+
+        assert len(efforts) == 2
+        assert efforts[0]["start_date"] < efforts[1]["start_date"]
+        assert [effort["elapsed_time"] for effort in efforts] == [pytest.approx(143, abs=2)] * 2
+
+    def test_shortcuts_wrong_way_and_distant_tracks_do_not_match(self):
+        shortcut = [(0, -200), (0, 100), (500, 500), (700, 500)]
+        reverse = RIDE_THROUGH[::-1]
+        elsewhere = [(5000, 5000), (6000, 6000)]
+
+        for waypoints in (shortcut, reverse, elsewhere):
+            assert match_track(self.geometry, _track(waypoints), activity_id=31) == []
+
+    def test_missing_sensors_and_positions(self):
+        track = _track(RIDE_THROUGH, heartrate=np.nan, watts=np.nan)
+        track.lat[100:105] = np.nan
+
+        [effort] = match_track(self.geometry, track, activity_id=31)
+
+        assert effort["elapsed_time"] == 143
+        assert effort["average_heartrate"] is None and effort["average_watts"] is None
+        assert effort["device_watts"] is None
+
+
+def _stream_payload(track: Track) -> dict:
+    return {
+        "time": {"data": (track.time - START).tolist()},
+        "latlng": {"data": np.column_stack([track.lat, track.lng]).tolist()},
+        "heartrate": {"data": track.heartrate.tolist()},
+    }
+
+
+class TestStoredStreams:
+    def test_track_from_decoded_streams(self):
+        blobs, _ = encode_streams(_stream_payload(_track(RIDE_THROUGH)))
+
+        [effort] = match_track(TestMatchTrack.geometry, track_from_streams(decode_streams(blobs), START), activity_id=31)
+
+        assert effort["start_date"] == "2024-01-01T10:00:29Z" and effort["elapsed_time"] == 143
+        assert effort["average_heartrate"] == 150.0 and effort["average_watts"] is None
+
+    def test_matches_stored_activities_not_already_matched_by_strava(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        repo.upsert_segment(SEGMENT)
+        repo.upsert_efforts(SEGMENT_ID, 7, [{"id": 500, "activity_id": 32, "start_date": "2024-01-01T10:00:29Z"}])
+        repo.upsert_activities(
+            7, {activity_id: {"id": activity_id, "name": "Ride", "start_date": "2024-01-01T10:00:00Z"} for activity_id in (31, 32)}
+        )
+        for activity_id in (31, 32, 33):
+            blobs, point_count = encode_streams(_stream_payload(_track(RIDE_THROUGH)))
+            repo.upsert_streams(activity_id, 7, blobs, point_count)
+        repo.upsert_streams(34, 7, {"time": None}, 0)
+
+        result = match_stored_activities(repo, [SEGMENT_ID], 7)
+
+        assert (result.files_scanned, result.skipped, result.undated) == (1, 1, 1)
+        [effort] = result.efforts[SEGMENT_ID]
+        assert effort["activity"] == {"id": 31} and effort["elapsed_time"] == 143
+        assert result.activities[31]["name"] == "Ride"
+
+
+def _gpx(track: Track) -> str:
+    points = "".join(
+        f'<trkpt lat="{lat:.7f}" lon="{lng:.7f}"><time>{np.datetime_as_string(np.datetime64(int(t), "s"))}Z</time></trkpt>'
+        for t, lat, lng in zip(track.time, track.lat, track.lng)
+    )
+    return f'<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>{points}</trkseg></trk></gpx>'
+
+
+class TestMatchArchive:
+    def _archive(self, tmp_path):
+        rows = [
+            "31,Morning ride,Tarmac,activities/31.gpx",
+            "32,Already on Strava,,activities/32.gpx",
+            "33,Somewhere else,,activities/33.gpx",
+            "34,No file,,",
+        ]
+        path = tmp_path / "export.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("profile.csv", "Athlete ID\n7\n")
+            archive.writestr("activities.csv", "Activity ID,Activity Name,Activity Gear,Filename\n" + "\n".join(rows) + "\n")
+            archive.writestr("activities/31.gpx", _gpx(_track(RIDE_THROUGH)))
+            archive.writestr("activities/32.gpx", _gpx(_track(RIDE_THROUGH)))
+            archive.writestr("activities/33.gpx", _gpx(_track([(5000, 5000), (6000, 6000)])))
+        return str(path)
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_matches_files_not_already_matched_by_strava(self, tmp_path, workers):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        repo.upsert_segment(SEGMENT)
+        repo.upsert_gear(7, [{"id": "b1", "name": "Tarmac"}])
+        repo.upsert_efforts(SEGMENT_ID, 7, [{"id": 500, "activity_id": 32, "start_date": "2024-01-01T10:00:29Z"}])
+
+        result = match_archive(self._archive(tmp_path), repo, [SEGMENT_ID], workers=workers)
+
+        assert (result.athlete_id, result.files_scanned, result.files_failed, result.skipped) == (7, 2, 0, 1)
+        [effort] = result.efforts[SEGMENT_ID]
+        assert effort["activity"] == {"id": 31} and effort["elapsed_time"] == 143
+        assert result.activities[31]["gear"] == {"id": "b1", "name": "Tarmac"}
+
+    def test_segments_must_be_stored(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+
+        with pytest.raises(ValueError, match="not stored"):
+            match_archive(self._archive(tmp_path), repo, [SEGMENT_ID])
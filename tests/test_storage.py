@@ -0,0 +1,398 @@
+"""Unit tests for the SQLite repository."""
+
+import pytest
+
+from query_stats import QueryProfiler
+from storage import StravaRepository
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return StravaRepository(str(tmp_path / "strava.db"))
+
+
+def _effort(effort_id: int, activity_id: int, start_date: str, **extra) -> dict:
+    effort = {
+        "id": effort_id,
+        "activity_id": activity_id,
+        "start_date": start_date,
+        "elapsed_time": 300,
+        "moving_time": 300,
+        "distance": 1000.0,
+        "average_heartrate": 135.0,
+        "average_watts": 250.0,
+        "name": f"Activity {activity_id}",
+    }
+    effort.update(extra)
+    return effort
+
+
+class TestGear:
+    def test_placeholder_names_replaced_by_gear_lookup(self, repo):
+        repo.upsert_activities(7, {1: {"id": 1, "gear_id": "b123", "start_date": "2025-01-01T10:00:00Z"}})
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-01-01T10:00:00Z", bike_id="b123", bike_name="Bike b123")])
+        assert repo.get_unresolved_gear_ids(7) == ["b123"]
+
+        repo.upsert_gear(7, [{"id": "b123", "name": "Tarmac", "primary": True}])
+
+        assert repo.get_unresolved_gear_ids(7) == []
+        assert repo.get_efforts(10, 7)[0]["bike_name"] == "Tarmac"
+        assert repo.get_activities_by_ids([1])[1]["bike_name"] == "Tarmac"
+
+    def test_activity_payload_gear_is_cached(self, repo):
+        repo.upsert_activities(
+            7,
+            {1: {"id": 1, "gear_id": "b9", "gear": {"id": "b9", "name": "Gravel"}, "start_date": "2025-01-01"}},
+        )
+        assert repo.get_unresolved_gear_ids(7) == []
+        assert repo.stats()["by_type"]["gear"] == 1
+
+    def test_nameless_gear_is_not_requested_again(self, repo):
+        repo.upsert_activities(7, {1: {"id": 1, "gear_id": "b404", "start_date": "2025-01-01"}})
+        repo.upsert_gear(7, [{"id": "b404"}])
+        assert repo.get_unresolved_gear_ids(7) == []
+
+    def test_only_unfetched_activities_need_a_refresh(self, repo):
+        repo.upsert_activities(7, {1: {"id": 1, "gear_id": "b1", "start_date": "2025-01-01"}})
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2025-01-01T10:00:00Z"),
+                _effort(101, 2, "2025-01-02T10:00:00Z"),
+            ],
+        )
+        assert repo.get_missing_bike_activity_ids(10, 7) == [2]
+
+
+class TestEnrichmentBacklog:
+    def _seed(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2023-05-01T10:00:00Z"),
+                _effort(101, 2, "2024-06-01T10:00:00Z"),
+                _effort(102, 3, "2025-02-01T10:00:00Z"),
+                _effort(103, 4, "2025-03-01T10:00:00Z"),
+            ],
+        )
+
+    def test_window_first_then_most_recent(self, repo):
+        self._seed(repo)
+        window = (1672531200, 1704067200)  # 2023
+
+        assert repo.get_missing_bike_activity_ids(10, 7) == [4, 3, 2, 1]
+        assert repo.get_missing_bike_activity_ids(10, 7, window=window) == [1, 4, 3, 2]
+        assert repo.count_missing_activities(10, 7, window) == {"total": 4, "in_window": 1}
+
+    def test_stored_activities_are_applied_to_efforts(self, repo):
+        self._seed(repo)
+        repo.upsert_activities(
+            7,
+            {3: {"id": 3, "name": "Morning ride", "gear_id": "b1", "gear": {"id": "b1", "name": "Tarmac"}, "weighted_average_watts": 260}},
+        )
+        version = repo.get_efforts_version(10, 7)
+
+        assert repo.apply_activities_to_efforts(7, [3]) == 1
+        assert repo.apply_activities_to_efforts(7, [3]) == 0
+
+        effort = next(effort for effort in repo.get_efforts(10, 7) if effort["id"] == 102)
+        assert (effort["name"], effort["bike_id"], effort["bike_name"], effort["normalized_watts"]) == (
+            "Morning ride",
+            "b1",
+            "Tarmac",
+            260,
+        )
+        assert repo.get_efforts_version(10, 7) == version + 1
+        assert repo.get_missing_bike_activity_ids(10, 7) == [4, 2, 1]
+        # Rollups moved the effort to its bike's group exactly as a rebuild would.
+        incremental = TestRollups()._rollup_rows(repo)
+        repo.rebuild_rollups()
+        assert incremental == TestRollups()._rollup_rows(repo)
+        assert any(row["bike_id"] == "b1" for row in incremental)
+
+
+class TestAthleteTokens:
+    def test_tokens_are_upserted_per_athlete(self, repo):
+        repo.upsert_athlete_tokens(7, "access-1", "refresh-1", 1700000000)
+        repo.upsert_athlete_tokens(8, None, "refresh-8", None)
+        repo.upsert_athlete_tokens(7, "access-2", "refresh-2", 1700021600)
+
+        rows = repo.get_athlete_tokens()
+        assert [(row["athlete_id"], row["access_token"], row["refresh_token"]) for row in rows] == [
+            (7, "access-2", "refresh-2"),
+            (8, None, "refresh-8"),
+        ]
+        assert [row["athlete_id"] for row in repo.get_athlete_tokens([8, 9])] == [8]
+
+        repo.delete_athlete_tokens(8)
+        assert [row["athlete_id"] for row in repo.get_athlete_tokens()] == [7]
+
+    def test_synced_segments_include_sync_state_and_efforts(self, repo):
+        repo.upsert_sync_state(30, 7, next_page=4, full_sync_completed=False)
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2024-01-01T10:00:00Z")])
+        repo.upsert_efforts(20, 8, [_effort(200, 2, "2024-01-01T10:00:00Z")])
+
+        assert repo.get_synced_segment_ids(7) == [10, 30]
+
+
+class TestStreams:
+    def test_stream_metrics_are_returned_with_efforts(self, repo):
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-01-01T10:00:00Z", start_index=5, end_index=50)])
+        assert repo.get_activity_ids_missing_streams(10, 7) == [1]
+
+        repo.upsert_streams(1, 7, {"time": b"x"}, 60)
+        repo.update_effort_stream_metrics(
+            {100: {"normalized_watts": 262.5, "hr_drift_pct": 1.2, "time_in_zones": [0, 10, 35, 0, 0]}}
+        )
+
+        effort = repo.get_efforts(10, 7)[0]
+        assert effort["normalized_watts"] == 262.5
+        assert effort["time_in_zones"] == [0, 10, 35, 0, 0]
+        assert repo.get_activity_ids_missing_streams(10, 7) == []
+        assert repo.stats()["by_type"]["streams"] == 1
+
+    def test_locally_matched_efforts_lose_file_sample_positions(self, tmp_path):
+        repo = StravaRepository(str(tmp_path / "strava.db"))
+        repo.upsert_efforts(10, 7, [_effort(-5, 1, "2025-01-01T10:00:00Z", start_index=29, end_index=171)])
+        assert repo.get_activity_ids_missing_streams(10, 7) == [1]
+
+        reopened = StravaRepository(str(tmp_path / "strava.db"))
+
+        assert reopened.get_activity_ids_missing_streams(10, 7) == []
+
+
+class TestEffortsVersion:
+    def test_version_only_advances_on_real_changes(self, repo):
+        effort = _effort(100, 1, "2025-01-01T10:00:00Z")
+        repo.upsert_efforts(10, 7, [effort])
+        assert repo.get_efforts_version(10, 7) == 1
+
+        repo.upsert_efforts(10, 7, [dict(effort)])
+        assert repo.get_efforts_version(10, 7) == 1
+
+        repo.upsert_efforts(10, 7, [dict(effort, elapsed_time=290)])
+        assert repo.get_efforts_version(10, 7) == 2
+
+    def test_clear_all_never_reuses_a_version(self, repo):
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-01-01T10:00:00Z")])
+        repo.clear_all()
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-01-01T10:00:00Z")])
+        assert repo.get_efforts_version(10, 7) == 3
+
+    def test_listeners_are_notified(self, repo):
+        calls = []
+        repo.efforts_changed_listeners.append(lambda segment_id, athlete_id: calls.append((segment_id, athlete_id)))
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-01-01T10:00:00Z")])
+        assert calls == [(10, 7)]
+
+
+class TestEffortStats:
+    def _seed(self, repo):
+        efforts = [
+            _effort(100 + i, i, f"2025-0{1 + i % 3}-10T08:00:00Z", elapsed_time=300 + i, average_watts=200.0 + i,
+                    average_heartrate=None if i == 0 else 130.0 + i, bike_name="Tarmac" if i % 2 else "Gravel")
+            for i in range(10)
+        ]
+        repo.upsert_efforts(10, 7, efforts)
+
+    def test_summary_breakdowns_and_histogram(self, repo):
+        self._seed(repo)
+        stats = repo.get_effort_stats(10, 7, bins=5)
+
+        assert stats["count"] == 10
+        elapsed = stats["metrics"]["elapsed_time"]
+        assert (elapsed["best"], elapsed["max"], elapsed["mean"]) == (300, 309, 304.5)
+        assert elapsed["percentiles"]["p50"] == 304
+        assert elapsed["percentiles"]["p90"] == 308
+        assert stats["metrics"]["average_heartrate"]["count"] == 9
+        assert {group["bike"]: group["count"] for group in stats["by_bike"]} == {"Tarmac": 5, "Gravel": 5}
+        assert [group["month"] for group in stats["by_month"]] == ["2025-01", "2025-02", "2025-03"]
+        assert sum(stats["histograms"]["elapsed_time"]["bins"]) == 10
+        assert stats["histograms"]["elapsed_time"]["bins"][-1] > 0
+
+    def test_filters_match_the_analyzer(self, repo):
+        self._seed(repo)
+        stats = repo.get_effort_stats(
+            10, 7, {"min_hr": 130, "end_date": "2025-02-10", "bike": "Tarmac"}
+        )
+        # Effort 0 has no HR; March efforts are after end_date; odd ids ride the Tarmac.
+        assert stats["count"] == 4
+        assert stats["metrics"]["elapsed_time"]["best"] == 301
+
+
+class TestRollups:
+    def _rollup_rows(self, repo):
+        with repo._connect() as conn:
+            rows = conn.execute("SELECT * FROM effort_rollups ORDER BY segment_id, period, period_start, bike_id")
+            return [{k: (round(v, 6) if isinstance(v, float) else v) for k, v in dict(row).items()} for row in rows]
+
+    def test_incremental_updates_match_a_rebuild(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2025-03-03T08:00:00Z", bike_id="b1", elapsed_time=300),
+                _effort(101, 2, "2025-03-05T08:00:00Z", bike_id="b1", elapsed_time=280),
+                _effort(102, 3, "2025-03-20T08:00:00Z", bike_id="b2", elapsed_time=310, average_heartrate=0),
+            ],
+        )
+        # Edit the fastest effort (drops the group minimum) and move another to a new month.
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(101, 2, "2025-03-05T08:00:00Z", bike_id="b1", elapsed_time=320),
+                _effort(102, 3, "2025-04-02T08:00:00Z", bike_id="b2", elapsed_time=310, average_heartrate=0),
+            ],
+        )
+        incremental = self._rollup_rows(repo)
+
+        repo.rebuild_rollups()
+        assert incremental == self._rollup_rows(repo)
+
+    def test_extremes_recomputed_only_when_removed(self, tmp_path):
+        profiler = QueryProfiler()
+        repo = StravaRepository(str(tmp_path / "profiled.db"), query_profiler=profiler)
+
+        def recomputes():
+            return sum(entry["count"] for entry in profiler.snapshot()["statements"] if "SELECT MIN(" in entry["sql"])
+
+        middle = dict(elapsed_time=300, average_heartrate=135.0, average_watts=250.0)
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2025-03-03T08:00:00Z", elapsed_time=280, average_heartrate=130.0, average_watts=240.0),
+                _effort(101, 2, "2025-03-04T08:00:00Z", **middle),
+                _effort(102, 3, "2025-03-05T08:00:00Z", elapsed_time=310, average_heartrate=140.0, average_watts=260.0),
+            ],
+        )
+        # Every value removed from the week and month groups lies strictly inside their range.
+        repo.upsert_efforts(10, 7, [_effort(101, 2, "2025-03-04T08:00:00Z", **{**middle, "elapsed_time": 305})])
+        assert recomputes() == 0
+
+        # The week's and month's fastest time is removed.
+        repo.upsert_efforts(
+            10,
+            7,
+            [_effort(100, 1, "2025-03-03T08:00:00Z", elapsed_time=320, average_heartrate=130.0, average_watts=240.0)],
+        )
+        assert recomputes() == 2
+
+        incremental = self._rollup_rows(repo)
+        repo.rebuild_rollups()
+        assert incremental == self._rollup_rows(repo)
+        assert repo.get_rollups(10, 7, period="week")[0]["time"]["min"] == 305
+
+    def test_strava_efforts_replace_locally_matched_ones(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(-5, 1, "2025-03-03T08:00:00Z", elapsed_time=301),
+                _effort(-6, 2, "2025-03-05T08:00:00Z", elapsed_time=290),
+            ],
+        )
+        assert repo.get_fetched_effort_activity_ids(10, 7) == set()
+
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-03-03T08:00:00Z", elapsed_time=300)])
+
+        assert sorted(effort["id"] for effort in repo.get_efforts(10, 7)) == [-6, 100]
+        assert repo.get_fetched_effort_activity_ids(10, 7) == {1}
+        incremental = self._rollup_rows(repo)
+        repo.rebuild_rollups()
+        assert incremental == self._rollup_rows(repo)
+
+    def test_trend_series(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2025-03-03T08:00:00Z", elapsed_time=300),
+                _effort(101, 2, "2025-03-09T08:00:00Z", elapsed_time=280),
+                _effort(102, 3, "2025-03-10T08:00:00Z", elapsed_time=310),
+            ],
+        )
+        weeks = repo.get_rollups(10, 7, period="week")
+        assert [(week["period_start"], week["count"]) for week in weeks] == [("2025-03-03", 2), ("2025-03-10", 1)]
+        assert weeks[0]["time"] == {"n": 2, "mean": 290.0, "std": 10.0, "min": 280, "max": 300}
+
+        months = repo.get_rollups(10, 7, period="month")
+        assert months[0]["count"] == 3
+        assert months[0]["hr"]["mean"] == 135.0
+
+
+class TestTypedDates:
+    def test_upsert_fills_epoch_and_local_date(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [
+                _effort(100, 1, "2025-03-02T23:30:00Z", start_date_local="2025-03-03T00:30:00Z"),
+                _effort(101, 2, "2025-03-05T08:00:00Z"),
+            ],
+        )
+        efforts = {effort["id"]: effort for effort in repo.get_efforts(10, 7)}
+
+        assert efforts[100]["start_epoch"] == 1740958200
+        assert efforts[100]["local_date"] == "2025-03-03"
+        assert efforts[101]["local_date"] == "2025-03-05"
+        # Weekly rollups follow the local date: Monday 2025-03-03 for both.
+        weeks = repo.get_rollups(10, 7, period="week")
+        assert [(week["period_start"], week["count"]) for week in weeks] == [("2025-03-03", 2)]
+
+    def test_existing_rows_are_backfilled(self, tmp_path):
+        db_path = str(tmp_path / "strava.db")
+        repo = StravaRepository(db_path)
+        repo.upsert_efforts(10, 7, [_effort(100, 1, "2025-03-03T08:00:00Z")])
+        with repo._connect() as conn:
+            conn.execute("UPDATE efforts SET start_epoch = NULL, local_date = NULL")
+
+        reopened = StravaRepository(db_path)
+
+        effort = reopened.get_efforts(10, 7)[0]
+        assert (effort["start_epoch"], effort["local_date"]) == (1740988800, "2025-03-03")
+        assert reopened.get_rollups(10, 7, period="month")[0]["count"] == 1
+
+    def test_date_windows_are_covering_index_range_scans(self, repo):
+        with repo._connect() as conn:
+            plan = conn.execute(
+                """
+                EXPLAIN QUERY PLAN
+                SELECT local_date, elapsed_time, average_heartrate, average_watts, efficiency
+                FROM efforts
+                WHERE segment_id = ? AND athlete_id = ? AND start_epoch >= ? AND start_epoch < ?
+                """,
+                (10, 7, 0, 1),
+            ).fetchall()
+        assert "COVERING INDEX idx_efforts_segment_athlete_epoch" in plan[0]["detail"]
+        assert "start_epoch>?" in plan[0]["detail"]
+
+    def test_date_filters_use_utc_day_bounds(self, repo):
+        repo.upsert_efforts(
+            10,
+            7,
+            [_effort(100, 1, "2025-03-01T23:59:00Z"), _effort(101, 2, "2025-03-02T00:00:00Z"), _effort(102, 3, "2025-03-03T00:00:00Z")],
+        )
+        stats = repo.get_effort_stats(10, 7, {"start_date": "2025-03-02", "end_date": "2025-03-02"})
+        assert stats["count"] == 1
+
+
+class TestSegmentComparison:
+    def test_efforts_for_several_segments_in_one_pass(self, repo):
+        repo.upsert_segment({"id": 10, "name": "Climb"})
+        repo.upsert_efforts(10, 7, [_effort(101, 2, "2025-03-09T08:00:00Z"), _effort(100, 1, "2025-03-03T08:00:00Z")])
+        repo.upsert_efforts(11, 7, [_effort(200, 1, "2025-03-03T08:30:00Z")])
+        repo.upsert_efforts(12, 7, [_effort(300, 1, "2025-03-03T09:00:00Z")])
+        repo.upsert_efforts(10, 8, [_effort(400, 5, "2025-03-04T08:00:00Z")])
+
+        rows = list(repo.iter_efforts_for_segments(7, [11, 10]))
+        assert [(row["segment_id"], row["id"]) for row in rows] == [(10, 100), (10, 101), (11, 200)]
+        paged = repo.iter_efforts_for_segments(7, [11, 10], page_size=1)
+        assert [row["id"] for row in paged] == [100, 101, 200]
+
+        ranged = repo.iter_efforts_for_segments(7, [10, 11], start_date="2025-03-05", end_date="2025-03-31")
+        assert [row["id"] for row in ranged] == [101]
+        assert repo.get_segment_names([10, 11]) == {10: "Climb"}
@@ -0,0 +1,115 @@
+"""Unit tests for stream encoding and per-effort stream metrics."""
+
+import json
+
+import numpy as np
+
+from streams import (
+    compute_effort_metrics,
+    decode_series,
+    decode_streams,
+    encode_series,
+    encode_streams,
+    hr_drift_pct,
+    normalized_power,
+    time_in_zones,
+)
+
+
+class TestCodec:
+    def test_integer_round_trip(self):
+        values = [0, 1, 2, 5, 6, 7, 300, 301]
+        assert decode_series("time", encode_series("time", values)).tolist() == values
+
+    def test_none_samples_decode_to_nan(self):
+        watts = decode_series("watts", encode_series("watts", [200, None, 0, None, 210]))
+        assert np.isnan(watts).tolist() == [False, True, False, True, False]
+        assert watts[[0, 2, 4]].tolist() == [200, 0, 210]
+
+        distance = decode_series("distance", encode_series("distance", [0.0, 8.5, None, 25.5]))
+        assert np.isnan(distance[2])
+        assert distance[[0, 1, 3]].tolist() == [0.0, 8.5, 25.5]
+
+    def test_distance_round_trip_is_close(self):
+        values = list(np.cumsum(np.full(5000, 8.3)))
+        decoded = decode_series("distance", encode_series("distance", values))
+        assert np.max(np.abs(decoded - values)) < 0.05
+
+    def test_latlng_round_trip(self):
+        points = [[45.0 + i * 5e-5, -122.0 - i * 3e-5] for i in range(1000)]
+        points[10] = None
+
+        decoded = decode_series("latlng", encode_series("latlng", points))
+
+        assert decoded.shape == (1000, 2)
+        assert np.isnan(decoded[10]).all()
+        expected = np.array([point or [np.nan, np.nan] for point in points])
+        assert np.nanmax(np.abs(decoded - expected)) <= 5e-7
+
+    def test_missing_series_decodes_to_none(self):
+        assert decode_series("watts", None) is None
+
+    def test_compact_compared_to_json(self):
+        rng = np.random.default_rng(1)
+        n = 10000
+        payload = {
+            "time": {"data": list(range(n))},
+            "watts": {"data": [int(w) for w in rng.normal(220, 30, n)]},
+            "heartrate": {"data": [int(h) for h in 130 + np.cumsum(rng.integers(-1, 2, n)) % 20]},
+            "distance": {"data": [round(d, 1) for d in np.cumsum(np.full(n, 7.5))]},
+            "latlng": {"data": np.column_stack([45 + np.cumsum(rng.normal(5e-5, 1e-5, n)), np.full(n, 6.0)]).round(6).tolist()},
+        }
+        blobs, point_count = encode_streams(payload)
+        assert point_count == n
+        assert sum(len(b) for b in blobs.values()) * 4 < len(json.dumps(payload))
+        assert decode_streams(blobs)["time"][-1] == n - 1
+
+
+class TestMetrics:
+    def test_normalized_power_constant(self):
+        watts = np.full(120, 250.0)
+        assert abs(normalized_power(watts, np.arange(120.0)) - 250) < 1e-9
+
+    def test_normalized_power_above_average_for_variable_effort(self):
+        watts = np.tile(np.concatenate([np.full(60, 400.0), np.full(60, 100.0)]), 5)
+        assert normalized_power(watts, np.arange(len(watts), dtype=float)) > np.mean(watts)
+
+    def test_normalized_power_resamples_gaps(self):
+        time = np.array([0.0, 10.0, 20.0, 60.0])
+        watts = np.array([200.0, 200.0, 200.0, 200.0])
+        assert abs(normalized_power(watts, time) - 200) < 1e-9
+
+    def test_missing_samples_do_not_bias_metrics(self):
+        time = np.arange(100, dtype=float)
+        watts = np.full(100, 250.0)
+        watts[40:60] = np.nan
+        hr = np.full(100, 140.0)
+        hr[::2] = np.nan
+
+        assert abs(normalized_power(watts, time) - 250) < 1e-9
+        assert hr_drift_pct(watts, hr, time) == 0.0
+        assert time_in_zones(hr, time, (0, 120, 140, 155)) == [0, 0, 49, 0]
+
+    def test_hr_drift_positive_when_hr_rises_at_same_power(self):
+        time = np.arange(100, dtype=float)
+        watts = np.full(100, 250.0)
+        hr = np.concatenate([np.full(50, 130.0), np.full(50, 140.0)])
+        drift = hr_drift_pct(watts, hr, time)
+        assert drift == round((250 / 130 - 250 / 140) / (250 / 130) * 100, 1)
+
+    def test_time_in_zones(self):
+        time = np.arange(5, dtype=float)
+        hr = np.array([100.0, 125.0, 145.0, 145.0, 160.0])
+        assert time_in_zones(hr, time, (0, 120, 140, 155)) == [1, 1, 2, 0]
+
+    def test_effort_slice(self):
+        time = np.arange(200, dtype=float)
+        watts = np.concatenate([np.full(100, 100.0), np.full(100, 300.0)])
+        hr = np.full(200, 135.0)
+        metrics = compute_effort_metrics({"time": time, "watts": watts, "heartrate": hr}, 100, 199)
+        assert metrics["normalized_watts"] == 300.0
+        assert metrics["hr_drift_pct"] == 0.0
+        assert sum(metrics["time_in_zones"]) == 99
+
+    def test_invalid_slice(self):
+        assert compute_effort_metrics({"time": np.arange(10.0)}, 5, 50) is None